@@ -2,10 +2,54 @@ from src.core import Device, Parameter
 import ADwin
 from ADwin import ADwinError
 from src.core.adbasic_compiler import ADbasicCompiler
+from src.core.ring_buffer import RingBuffer
 from pathlib import Path
+import ctypes
 import os
+import threading
+import time
 #from ctypes import *
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Union, Callable
+import numpy as np
+
+# the analog inputs and outputs of the ADwin Gold II map -10 V..+10 V to 16 bit digits 0..65535
+_DIGITS_MAX = 65535
+_VOLTS_MIN = -10.0
+_VOLTS_SPAN = 20.0
+
+# numpy type of each kind of Data_# array
+_ARRAY_DTYPES = {'int': np.int32, 'float': np.float32, 'float64': np.float64}
+# ADwin driver call that reads each kind of Data_# array
+_ARRAY_READERS = {'int': 'GetData_Long', 'float': 'GetData_Float', 'float64': 'GetData_Double'}
+# ADwin driver call that reads each kind of FIFO array
+_FIFO_READERS = {'int': 'GetFifo_Long', 'float': 'GetFifo_Float', 'float64': 'GetFifo_Double'}
+
+
+def digits_to_volts(digits, invalid=np.nan) -> np.ndarray:
+    '''
+    Converts ADwin 16 bit digits to volts, for whole arrays at once.
+    Args:
+        digits: digit or array of digits (0 to 65535)
+        invalid: value returned for digits outside 0 to 65535
+    Returns:
+        np.ndarray: volts between -10 and +10 V
+    '''
+    digits = np.asarray(digits, dtype=np.float64)
+    volts = digits * _VOLTS_SPAN / _DIGITS_MAX + _VOLTS_MIN
+    return np.where((digits >= 0) & (digits <= _DIGITS_MAX), volts, invalid)
+
+
+def volts_to_digits(volts) -> np.ndarray:
+    '''
+    Converts volts to ADwin 16 bit digits, for whole arrays at once. Volts are limited to -10 to +10 V and the digits
+    are truncated, like int() does.
+    Args:
+        volts: voltage or array of voltages
+    Returns:
+        np.ndarray: int32 digits between 0 and 65535
+    '''
+    volts = np.clip(np.asarray(volts, dtype=np.float64), _VOLTS_MIN, _VOLTS_MIN + _VOLTS_SPAN)
+    return ((volts - _VOLTS_MIN) * _DIGITS_MAX / _VOLTS_SPAN).astype(np.int32)
 
 
 class AdwinGoldDevice(Device):
@@ -15,6 +59,13 @@ class AdwinGoldDevice(Device):
     The processor and priority can be changed for each process and is left to the user writing the ADbasic script.
     '''
 
+    # driver object whose calls are timed when the device is instrumented, see src/core/device_stats.py
+    _DRIVER_ATTRIBUTES = ('adw',)
+    # loading and starting/stopping a process are sent on every update, see src/core/settings_cache.py. So is the delay:
+    # loading a process resets it to the delay compiled into the binary, an unchanged delay is not set on the ADwin
+    _CACHE_SETTINGS = True
+    _UNCACHED_SETTINGS = ('load', 'delay', 'running')
+
     _DEFAULT_SETTINGS = Parameter([
         Parameter('process_1',[
             Parameter('load','',str,'Filename to load (should end with .__1 for process 1). Input empty string to clear process'),
@@ -71,6 +122,9 @@ class AdwinGoldDevice(Device):
     def __init__(self, name=None, settings=None, boot=True, num_devices=1):
         super(AdwinGoldDevice, self).__init__(name, settings)
 
+        #the driver is not thread safe: every call of self.adw holds this lock, so that a FifoStream draining in its
+        #thread and the experiment thread do not interleave their calls
+        self._adw_lock = threading.RLock()
         self.adw = ADwin.ADwin(DeviceNo=num_devices, raiseExceptions=1)
         #boots the ADwin which resets processes and global variables. Input boot = False if ADwin is already initilized
         if boot:
@@ -93,7 +147,8 @@ class AdwinGoldDevice(Device):
         if self._settings_initialized:
             for key, value in settings.items():
                 process_number = int(key.split('_')[-1]) #gets number after '_' in process_# key
-                for param, param_value in value.items():
+                #loading resets the delay to the one of the binary, so a delay given with the load is set after it
+                for param, param_value in sorted(value.items(), key=lambda item: item[0] != 'load'):
                     if param == 'load':
                         if param_value == '' or param_value == ' ':   #will clear the process if load is updated to be empty
                             self.clear_process(process_number)
@@ -101,7 +156,8 @@ class AdwinGoldDevice(Device):
                             self.load_process(param_value)  #loads binary file ex. 'D:/PyCharmProjects/.../test_process.TB2'
                             #may want to add some way to make sure a process isnt loaded over another as it can cause memory fragmenting
                     elif param == 'delay':
-                        self.adw.Set_Processdelay(process_number, param_value)
+                        with self._adw_lock:
+                            self.adw.Set_Processdelay(process_number, param_value)
                     elif param == 'running':
                         if param_value == True:
                             self.start_process(process_number)
@@ -121,7 +177,8 @@ class AdwinGoldDevice(Device):
 
         Note: Path handling is now cross-platform compatible using pathlib.Path
         '''
-        self.adw.Load_Process(filepath)
+        with self._adw_lock:
+            self.adw.Load_Process(filepath)
 
     def clear_process(self, number):
         '''
@@ -129,7 +186,8 @@ class AdwinGoldDevice(Device):
         Args:
             number: number corresponding to process defined in file path ex. test_process.TB2 is process 2
         '''
-        self.adw.Clear_Process(number)
+        with self._adw_lock:
+            self.adw.Clear_Process(number)
 
 
     def start_process(self, number):
@@ -139,7 +197,8 @@ class AdwinGoldDevice(Device):
         Args:
             number: number corresponding to process defined in file path ex. test_process.TB3 is process 3
         '''
-        self.adw.Start_Process(number)
+        with self._adw_lock:
+            self.adw.Start_Process(number)
 
     def stop_process(self, number):
         '''
@@ -148,7 +207,8 @@ class AdwinGoldDevice(Device):
         Args:
             number: number corresponding to process defined in file path ex. test_process.TB4 is process 4
         '''
-        self.adw.Stop_Process(number)
+        with self._adw_lock:
+            self.adw.Stop_Process(number)
 
     def close(self):
         '''
@@ -168,7 +228,8 @@ class AdwinGoldDevice(Device):
         value = int(value)
         if (Par_id < 1) or (Par_id > 80):
             raise KeyError
-        self.adw.Set_Par(Par_id, value)
+        with self._adw_lock:
+            self.adw.Set_Par(Par_id, value)
 
     def set_float_var(self, FPar_id, value):
         '''
@@ -180,7 +241,8 @@ class AdwinGoldDevice(Device):
         value = float(value)
         if (FPar_id < 1) or (FPar_id > 80):
             raise KeyError
-        self.adw.Set_FPar(FPar_id, value)
+        with self._adw_lock:
+            self.adw.Set_FPar(FPar_id, value)
 
     def get_int_var(self, Par_id):
         '''
@@ -192,7 +254,8 @@ class AdwinGoldDevice(Device):
         '''
         if (Par_id < 1) or (Par_id > 80):
             raise KeyError
-        return self.adw.Get_Par(Par_id)
+        with self._adw_lock:
+            return self.adw.Get_Par(Par_id)
 
     def get_float_var(self, FPar_id):
         '''
@@ -204,7 +267,8 @@ class AdwinGoldDevice(Device):
         '''
         if (FPar_id < 1) or (FPar_id > 80):
             raise KeyError
-        return self.adw.Get_FPar(FPar_id)
+        with self._adw_lock:
+            return self.adw.Get_FPar(FPar_id)
 
     def get_int_data(self, Data_id, length=100):
         '''
@@ -258,6 +322,168 @@ class AdwinGoldDevice(Device):
             raise KeyError
         return self.read_probes('str_array', Data_id, length)
 
+    def get_int_data_np(self, Data_id, length=100, start=1, out=None):
+        '''
+        Gets integer data array from Data_# as numpy array
+        Args:
+            Data_id: index of data array (range Data_1 to Data_10)
+            length: number of elements to read (default 100)
+            start: index of the first element to read
+            out: optional preallocated array to read into, e.g. a buffer reused for every line of a scan
+        Returns:
+            np.ndarray: int32 values, a view of the array returned by the ADwin driver or the first length elements of out
+        '''
+        return self._read_array_np('int', Data_id, length, start, out)
+
+    def get_float_data_np(self, Data_id, length=100, start=1, out=None):
+        '''
+        Gets float data array from Data_# as numpy array
+        Args:
+            Data_id: index of data array (range Data_1 to Data_10)
+            length: number of elements to read (default 100)
+            start: index of the first element to read
+            out: optional preallocated array to read into
+        Returns:
+            np.ndarray: float32 values, a view of the array returned by the ADwin driver or the first length elements of out
+        '''
+        return self._read_array_np('float', Data_id, length, start, out)
+
+    def get_float64_data_np(self, Data_id, length=100, start=1, out=None):
+        '''
+        Gets 64-bit float data array from Data_# as numpy array
+        Args:
+            Data_id: index of data array (range Data_1 to Data_10)
+            length: number of elements to read (default 100)
+            start: index of the first element to read
+            out: optional preallocated array to read into
+        Returns:
+            np.ndarray: float64 values, a view of the array returned by the ADwin driver or the first length elements of out
+        '''
+        return self._read_array_np('float64', Data_id, length, start, out)
+
+    def read_many(self, data: Optional[Dict[int, Any]] = None, pars: Iterable[int] = (), fpars: Iterable[int] = (),
+                  out: Optional[Dict[int, np.ndarray]] = None) -> Dict[str, Dict]:
+        '''
+        Reads several Data_# arrays and global parameters in one call. All Par_# are read with one Get_Par_All and all
+        FPar_# with one Get_FPar_All, before the arrays.
+        Args:
+            data: {Data_id: length} for integer arrays or {Data_id: (length, 'int'|'float'|'float64')}
+            pars: indices of the Par_# to read
+            fpars: indices of the FPar_# to read
+            out: optional {Data_id: preallocated array} to read the arrays into
+        Returns:
+            dict: {'pars': {Par_id: int}, 'fpars': {FPar_id: float}, 'data': {Data_id: np.ndarray}}
+        '''
+        result = {'pars': {}, 'fpars': {}, 'data': {}}
+        pars, fpars = list(pars), list(fpars)
+        for Par_id in pars + fpars:
+            if (Par_id < 1) or (Par_id > 80):
+                raise KeyError
+        with self._adw_lock:
+            if pars:
+                values = self.adw.Get_Par_All()
+                result['pars'] = {Par_id: int(values[Par_id - 1]) for Par_id in pars}
+            if fpars:
+                values = self.adw.Get_FPar_All()
+                result['fpars'] = {FPar_id: float(values[FPar_id - 1]) for FPar_id in fpars}
+            out = out or {}
+            for Data_id, spec in (data or {}).items():
+                length, kind = (spec, 'int') if isinstance(spec, (int, np.integer)) else spec
+                result['data'][Data_id] = self._read_array_np(kind, Data_id, length, 1, out.get(Data_id))
+        return result
+
+    def wait_for(self, condition: Callable[[Dict[int, int]], bool], pars: Iterable[int] = (), timeout: float = 10.0,
+                 heartbeat_par: Optional[int] = None, expected: Optional[float] = None, stall_timeout: float = 1.0,
+                 min_interval: float = 1e-3, max_interval: float = 0.05) -> Dict[str, Any]:
+        '''
+        Polls global parameters until condition is met. Each poll reads all watched Par_# with one Get_Par_All. If the
+        expected completion time is known, polls are sparse before it and tight around it; otherwise (and once it has
+        passed) the interval grows from min_interval to max_interval. Failed reads are tolerated and counted.
+        Args:
+            condition: called with {Par_id: value} of the watched Pars after every poll, the wait ends when it returns True
+            pars: indices of the Par_# passed to condition
+            timeout: maximum time to wait in seconds
+            heartbeat_par: index of a Par_# the ADbasic process increments every event; the wait ends with status
+                'stalled' if it does not change for stall_timeout seconds
+            expected: expected time in seconds until condition is met, e.g. number of points * (settle + dwell)
+            stall_timeout: time in seconds without heartbeat change after which the process is considered stalled
+            min_interval: shortest time between polls in seconds
+            max_interval: longest time between polls in seconds
+        Returns:
+            dict: {'status': 'done' | 'timeout' | 'stalled', 'pars': {Par_id: int} of the last successful poll,
+            'elapsed': seconds waited, 'polls': number of polls, 'errors': number of failed polls}
+        '''
+        watched = list(dict.fromkeys(list(pars) + ([heartbeat_par] if heartbeat_par is not None else [])))
+        result = {'status': 'timeout', 'pars': {}, 'elapsed': 0.0, 'polls': 0, 'errors': 0}
+        interval = min_interval
+        t0 = time.perf_counter()
+        last_beat = None
+        last_beat_time = t0
+        while True:
+            now = time.perf_counter()
+            try:
+                values = self.read_many(pars=watched)['pars']
+            except ADwinError:
+                result['errors'] += 1
+                values = None
+            result['polls'] += 1
+            result['elapsed'] = now - t0
+            if values is not None:
+                result['pars'] = values
+                if condition(values):
+                    result['status'] = 'done'
+                    return result
+                if heartbeat_par is not None and values[heartbeat_par] != last_beat:
+                    last_beat, last_beat_time = values[heartbeat_par], now
+            if heartbeat_par is not None and now - last_beat_time > stall_timeout:
+                result['status'] = 'stalled'
+                return result
+            if now - t0 >= timeout:
+                return result
+
+            if expected is not None and now - t0 < expected:
+                # sleep half of the remaining expected time, so the polls get denser towards the expected completion
+                delay = min(max((expected - (now - t0)) / 2, min_interval), max_interval)
+            else:
+                delay = interval
+                interval = min(interval * 1.5, max_interval)
+            time.sleep(min(delay, max(timeout - (time.perf_counter() - t0), 0.0)))
+
+    def _read_array_np(self, kind, Data_id, length, start, out):
+        if (Data_id < 1) or (Data_id > 10):
+            raise KeyError
+        with self._adw_lock:
+            reader = getattr(self.adw, _ARRAY_READERS[kind])
+            values = self._as_numpy(reader(Data_id, start, length), _ARRAY_DTYPES[kind])
+        if out is None:
+            return values
+        out = out[:len(values)]
+        out[...] = values
+        return out
+
+    @staticmethod
+    def _as_numpy(values, dtype) -> np.ndarray:
+        '''
+        Wraps what the ADwin driver returns (a ctypes array, a numpy array or a list, depending on the driver version)
+        as numpy array, without copying if it already holds the right type
+        '''
+        if isinstance(values, ctypes.Array):
+            values = np.ctypeslib.as_array(values)
+        return np.asarray(values, dtype=dtype)
+
+    def fifo_stream(self, fifo_id, kind='int', **kwargs):
+        '''
+        Creates a FifoStream that drains the FIFO array Data_{fifo_id} in a background thread. Use it as context manager
+        or call start() and stop().
+        Args:
+            fifo_id: number of the Data_# array declared as FIFO in the ADbasic process
+            kind: 'int', 'float' or 'float64'
+            **kwargs: capacity, target_chunk, min_interval, max_interval, see FifoStream
+        Returns:
+            FifoStream
+        '''
+        return FifoStream(self, fifo_id, kind, **kwargs)
+
     def get_data_length(self, Data_id):
         '''
         Gets the length of a data array
@@ -280,21 +506,24 @@ class AdwinGoldDevice(Device):
         '''
         if (process_id < 1) or (process_id > 10):
             raise KeyError
-        raw_value = self.adw.Process_Status(process_id)
+        with self._adw_lock:
+            raw_value = self.adw.Process_Status(process_id)
         return self._internal_to_status(raw_value)
 
     def reboot_adwin(self,num_devices=1):
-        new_adw_handle = None
-        try:
-            # boots with T11 processor. 3.333.. ns minimum time resolution for low and high priority processes
-            new_adw_handle = ADwin.ADwin(DeviceNo=num_devices, raiseExceptions=1)
-            btl = new_adw_handle.ADwindir + 'ADwin11.btl'
-            new_adw_handle.Boot(btl)
-        except ADwinError as e:
-            print('Issue rebooting ADwin: ', e)
-            raise
-        if new_adw_handle is not None:
-            self.adw = new_adw_handle
+        with self._adw_lock:
+            new_adw_handle = None
+            try:
+                # boots with T11 processor. 3.333.. ns minimum time resolution for low and high priority processes
+                new_adw_handle = ADwin.ADwin(DeviceNo=num_devices, raiseExceptions=1)
+                btl = new_adw_handle.ADwindir + 'ADwin11.btl'
+                new_adw_handle.Boot(btl)
+            except ADwinError as e:
+                print('Issue rebooting ADwin: ', e)
+                raise
+            if new_adw_handle is not None:
+                self.adw = new_adw_handle
+                self.invalidate_settings_cache()    #a rebooted ADwin has no processes and default delays
 
     def compile_and_load_process(self, source_file: str, process_number: Optional[int] = None, 
                                 auto_start: bool = False, verbose: bool = False,
@@ -421,55 +650,56 @@ class AdwinGoldDevice(Device):
         assert(self._settings_initialized)
         assert key in list(self._PROBES.keys())
         value = None #parameters are different from probes. Setting value=none fixes error when trying to return value befor defining
-        if key == 'array_length':   #only gets length of Data_# arrays
-            value = self.adw.Data_Length(id)
-
-        elif key == 'int_var':
-            value = self.adw.Get_Par(id)
-        elif key == 'float_var':
-            value = self.adw.Get_FPar(id)
-        elif key == 'float64_var':
-            value = self.adw.Get_FPar_Double(id)
-
-        elif key == 'all_ints':
-            value = self.adw.Get_Par_All()
-        elif key == 'all_floats':
-            value = self.adw.Get_FPar_All()
-        elif key == 'all_float64s':
-            value = self.adw.Get_FPar_All_Double()
-
-        elif key == 'int_array':
-            value = self.adw.GetData_Long(id, 1 ,length)
-        elif key == 'float_array':
-            value = self.adw.GetData_Float(id, 1, length)
-        elif key == 'float64_array':
-            value = self.adw.GetData_Double(id, 1, length)
-        elif key == 'str_array':
-            value = self.adw.GetData_String(id, length)
-
-        #can use read_probes('fifo_full') to get how many elements are in a Fifo array
-        elif key == 'int_fifo':
-            value = self.adw.GetFifo_Long(id, 1, length)
-        elif key == 'float_fifo':
-            value = self.adw.GetFifo_Float(id, 1, length)
-        elif key == 'float_64_fifo':
-            value = self.adw.GetFifo_Double(id, 1, length)
-        elif key == 'fifo_empty':
-            value = self.adw.Fifo_Empty(id)
-        elif key == 'fifo_full':
-            value = self.adw.Fifo_Full(id)
-
-        elif key == 'str_length':
-            value = self.adw.String_Length(id)
-        elif key == 'process_delay':
-            value = self.adw.Get_Processdelay(id)
-        elif key == 'process_status':
-            rawvalue = self.adw.Process_Status(id)
-            value = self._internal_to_status(rawvalue)
-        elif key == 'last_error':
-            value = self.adw.Get_Error_Text(self.adw.Get_Last_Error())
-        elif key == 'workload':
-            value = self.adw.Workload()
+        with self._adw_lock:
+            if key == 'array_length':   #only gets length of Data_# arrays
+                value = self.adw.Data_Length(id)
+
+            elif key == 'int_var':
+                value = self.adw.Get_Par(id)
+            elif key == 'float_var':
+                value = self.adw.Get_FPar(id)
+            elif key == 'float64_var':
+                value = self.adw.Get_FPar_Double(id)
+
+            elif key == 'all_ints':
+                value = self.adw.Get_Par_All()
+            elif key == 'all_floats':
+                value = self.adw.Get_FPar_All()
+            elif key == 'all_float64s':
+                value = self.adw.Get_FPar_All_Double()
+
+            elif key == 'int_array':
+                value = self.adw.GetData_Long(id, 1 ,length)
+            elif key == 'float_array':
+                value = self.adw.GetData_Float(id, 1, length)
+            elif key == 'float64_array':
+                value = self.adw.GetData_Double(id, 1, length)
+            elif key == 'str_array':
+                value = self.adw.GetData_String(id, length)
+
+            #can use read_probes('fifo_full') to get how many elements are in a Fifo array
+            elif key == 'int_fifo':
+                value = self.adw.GetFifo_Long(id, 1, length)
+            elif key == 'float_fifo':
+                value = self.adw.GetFifo_Float(id, 1, length)
+            elif key == 'float_64_fifo':
+                value = self.adw.GetFifo_Double(id, 1, length)
+            elif key == 'fifo_empty':
+                value = self.adw.Fifo_Empty(id)
+            elif key == 'fifo_full':
+                value = self.adw.Fifo_Full(id)
+
+            elif key == 'str_length':
+                value = self.adw.String_Length(id)
+            elif key == 'process_delay':
+                value = self.adw.Get_Processdelay(id)
+            elif key == 'process_status':
+                rawvalue = self.adw.Process_Status(id)
+                value = self._internal_to_status(rawvalue)
+            elif key == 'last_error':
+                value = self.adw.Get_Error_Text(self.adw.Get_Last_Error())
+            elif key == 'workload':
+                value = self.adw.Workload()
 
         return value
 
@@ -502,11 +732,12 @@ class AdwinGoldDevice(Device):
 
     @property
     def is_connected(self):
-        try:
-            self.adw.Test_Version()     #arbitrary query to test for a response
-            return True
-        except ADwinError:
-            return False
+        with self._adw_lock:
+            try:
+                self.adw.Test_Version()     #arbitrary query to test for a response
+                return True
+            except ADwinError:
+                return False
 
     def _internal_to_status(self, value):
         '''
@@ -517,4 +748,106 @@ class AdwinGoldDevice(Device):
         elif value == 1:
             return 'Running'
         else:
-            return 'Being stopped'
\ No newline at end of file
+            return 'Being stopped'
+
+class FifoStream(RingBuffer):
+    '''
+    Drains a FIFO Data_# array of the ADwin in a background thread into a numpy ring buffer, so that an ADbasic process
+    can acquire continuously while Python processes the data, without idle time between batches.
+
+    The poll interval adapts so that each read returns about target_chunk values: it shrinks while the FIFO fills faster
+    and grows while it fills slower. Reads that find the ADwin FIFO full are counted in adwin_overruns, since the ADbasic
+    process may have lost values. Each consumer (a RingConsumer) reads at its own pace; values it did not read before
+    the ring buffer wrapped around are skipped and counted in its overruns.
+
+    Usage:
+        with adwin.fifo_stream(1, capacity=100000) as stream:
+            consumer = stream.consumer()
+            while not done:
+                counts = consumer.read(timeout=0.1)
+    '''
+
+    def __init__(self, device, fifo_id, kind='int', capacity=1 << 20, target_chunk=1024, min_interval=1e-4,
+                 max_interval=0.1):
+        '''
+        Args:
+            device: AdwinGoldDevice (or any object with the ADwin driver as attribute adw); the reads of the stream hold
+                the lock of an AdwinGoldDevice, so the device can be used from other threads while the stream runs
+            fifo_id: number of the Data_# array that the ADbasic process declares as FIFO
+            kind: 'int', 'float' or 'float64', the type of the FIFO array
+            capacity: number of values the ring buffer holds
+            target_chunk: number of values to read per poll, the poll interval is adapted to it
+            min_interval: shortest time between polls in seconds
+            max_interval: longest time between polls in seconds
+        '''
+        super().__init__(capacity, _ARRAY_DTYPES[kind])
+        self.device = device
+        self._adw_lock = getattr(device, '_adw_lock', None) or threading.RLock()
+        self.fifo_id = fifo_id
+        self.kind = kind
+        self.target_chunk = target_chunk
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(1e-3, min_interval), max_interval)
+        self.adwin_overruns = 0
+        self.error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''starts the background thread'''
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f'FifoStream-{self.fifo_id}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        '''stops the background thread after a final read of the FIFO'''
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                self._adapt(self._drain())
+                self._stop_event.wait(self.interval)
+            self._drain()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._notify()
+
+    def _drain(self):
+        '''reads what is in the ADwin FIFO into the ring buffer and returns the number of values read'''
+        with self._adw_lock:
+            adw = self.device.adw
+            available = int(adw.Fifo_Full(self.fifo_id))
+            if available <= 0:
+                return 0
+            if int(adw.Fifo_Empty(self.fifo_id)) == 0:
+                self.adwin_overruns += 1
+            available = min(available, self.capacity)
+            values = AdwinGoldDevice._as_numpy(getattr(adw, _FIFO_READERS[self.kind])(self.fifo_id, available),
+                                               self.buffer.dtype)
+        self._write(values)
+        return len(values)
+
+    def _adapt(self, n):
+        if n > 2 * self.target_chunk:
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif n < self.target_chunk / 2:
+            self.interval = min(self.max_interval, self.interval * 1.5)
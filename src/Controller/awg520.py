@@ -13,8 +13,15 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import hashlib
+import json
+import os
+import queue
+import select
 import socket
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import numpy as np
 import logging
 from pathlib import Path
@@ -47,51 +54,337 @@ _us = 1.0e-6  # Microseconds
 _ns = 1.0e-9  # Nanoseconds
 
 
+class WaveformManifest:
+    """
+    Local record of the content (SHA-256 and size) of the files uploaded to an AWG520, stored as JSON. The FTP server
+    of the AWG cannot hash files, so the manifest is what tells an unchanged waveform apart from a new one. It is
+    reconciled with the file listing of the AWG before every upload, files that are gone from the AWG are forgotten.
+    """
+    VERSION = 1
+
+    def __init__(self, manifest_file):
+        self.manifest_file = Path(manifest_file)
+        self.files = {}
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def file_digest(path) -> dict:
+        """
+        Returns: SHA-256 hash and size of a local file
+        """
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1 << 20), b''):
+                sha256.update(block)
+                size += len(block)
+        return {'sha256': sha256.hexdigest(), 'size': size}
+
+    def load(self):
+        """reads the manifest file, an unreadable or outdated file gives an empty manifest"""
+        self.files = {}
+        if not self.manifest_file.exists():
+            return
+        try:
+            with open(self.manifest_file, 'r') as infile:
+                content = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if content.get('version') == self.VERSION:
+            self.files = content.get('files', {})
+
+    def save(self):
+        """writes the manifest file if it changed; the file is replaced atomically"""
+        if not self._dirty:
+            return
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'version': self.VERSION, 'files': self.files}, outfile)
+        os.replace(tmp_file, self.manifest_file)
+        self._dirty = False
+
+    def matches(self, remote_name: str, digest: dict) -> bool:
+        """True if remote_name on the AWG has the content described by digest"""
+        return self.files.get(remote_name) == digest
+
+    def record(self, remote_name: str, digest: dict):
+        self.files[remote_name] = digest
+        self._dirty = True
+
+    def forget(self, remote_name: str):
+        if self.files.pop(remote_name, None) is not None:
+            self._dirty = True
+
+    def sync(self, remote_files):
+        """forgets the files that are no longer listed on the AWG"""
+        remote_files = set(remote_files)
+        for remote_name in [name for name in self.files if name not in remote_files]:
+            self.forget(remote_name)
+
+
+class BatchResult:
+    """
+    Yielded by AWG520Driver.batch. sent is None while the batch (or the batch it is nested in) is open, then True if
+    all its commands reached the AWG (and completed, for batch(wait=True)) and False if sending failed.
+    """
+
+    def __init__(self):
+        self.sent = None
+
+    def __bool__(self):
+        return bool(self.sent)
+
+
 class AWG520Driver:
     """
     Low-level service for Tektronix AWG520. Handles SCPI commands over TCP and file transfers over FTP.
     """
     def __init__(self, ip_address: str, scpi_port: int = _PORT,
-                 ftp_port: int = _FTP_PORT, ftp_user: str = 'usr', ftp_pass: str = 'pw'):
+                 ftp_port: int = _FTP_PORT, ftp_user: str = 'usr', ftp_pass: str = 'pw', manifest_file=None):
         self.addr = (ip_address, scpi_port)
         self.ftp_port = ftp_port
         self.ftp_user = ftp_user
         self.ftp_pass = ftp_pass
+        # record of the uploaded files, defaults to awg520_<ip address>_manifest.json in the default save location
+        self.manifest_file = manifest_file
+        self._manifest = None
         self.logger = logging.getLogger(__name__)
+        # persistent SCPI connection, opened on the first command and reopened if the instrument drops it
+        self._sock = None
+        self._rx_buffer = b''
+        self._lock = threading.RLock()
+        # commands collected inside batch(), None while not batching
+        self._pending = None
+        self._wait_after_batch = False
+        self._batch_result = None
         self._connect_ftp()
 
     def _connect_ftp(self):
         try:
-            self.ftp = FTP()
-            self.ftp.connect(self.addr[0], self.ftp_port)
-            self.ftp.login(self.ftp_user, self.ftp_pass)
+            self.ftp = self._open_ftp()
             self.logger.info('AWG520 FTP login successful')
         except Exception as e:
             self.logger.error(f'FTP connection failed: {e}')
             raise
 
+    def _open_ftp(self) -> FTP:
+        """opens and logs in a new FTP session"""
+        ftp = FTP()
+        ftp.connect(self.addr[0], self.ftp_port)
+        ftp.login(self.ftp_user, self.ftp_pass)
+        return ftp
+
+    @property
+    def manifest(self) -> WaveformManifest:
+        if self._manifest is None:
+            manifest_file = self.manifest_file
+            if manifest_file is None:
+                from src.config_paths import DEFAULT_BASE
+                manifest_file = DEFAULT_BASE / f'awg520_{self.addr[0]}_manifest.json'
+            self._manifest = WaveformManifest(manifest_file)
+        return self._manifest
+
     def send_command(self, cmd: str, query: bool = False, timeout: float = 5.0):
         """
-        Send a SCPI command over TCP. If query=True, return the response string.
+        Send a SCPI command over the persistent TCP connection. If query=True, return the response string.
+        Inside batch() a command is collected and sent with the next query or at the end of the batch.
+
+        Returns: the response for a query, True for a command that was sent or collected, None if it failed. Whether
+            collected commands were sent is the result of the batch, see batch()
         """
-        if not cmd.endswith('\n'):
-            cmd += '\n'
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(timeout)
-                s.connect(self.addr)
-                self.logger.debug(f"SCPI >>> {cmd.strip()}")
-                s.sendall(cmd.encode())
+        cmd = cmd.strip()
+        with self._lock:
+            if self._pending is not None and not query:
+                self._pending.append(cmd)
+                return True
+            try:
                 if query:
-                    reply = b''
-                    while not reply.endswith(b'\n'):
-                        reply += s.recv(1024)
-                    text = reply.decode().strip()
-                    self.logger.debug(f"SCPI <<< {text}")
-                    return text
-        except Exception as e:
-            self.logger.error(f"SCPI command failed: {e}")
-            return None
+                    return self._transact(self._take_pending() + [cmd], 1, timeout)[0]
+                self._exchange(cmd, 0, timeout)
+                return True
+            except Exception as e:
+                self.logger.error(f"SCPI command failed: {e}")
+                self._batch_failed()
+                self.close()
+                return None
+
+    def query_many(self, cmds, timeout: float = 5.0):
+        """
+        Send several queries on one line and read all responses in one round trip. Commands collected by batch()
+        go out on the same line.
+
+        Args:
+            cmds: list of queries, e.g. ['AWGC:FG1:FREQ?', 'AWGC:FG1:VOLT?']
+            timeout: socket timeout in seconds
+
+        Returns: list of the responses in the order of cmds, None if the exchange failed
+        """
+        cmds = [cmd.strip() for cmd in cmds]
+        with self._lock:
+            try:
+                return self._transact(self._take_pending() + cmds, len(cmds), timeout)
+            except Exception as e:
+                self.logger.error(f"SCPI query failed: {e}")
+                self._batch_failed()
+                self.close()
+                return None
+
+    @contextmanager
+    def batch(self, wait: bool = False):
+        """
+        Collects the commands sent inside the with block and sends them as one line, together with the next query
+        or at the end of the block. Other threads wait until the batch is done. Batches can be nested, the commands
+        go out at the end of the outermost one. If the block raises, the collected commands are discarded.
+
+        Args:
+            wait: end the batch with *OPC?, i.e. return only once the AWG has completed the commands
+
+        Yields: the BatchResult of the outermost batch, e.g. return result.sent after the with block
+        """
+        with self._lock:
+            if self._pending is not None:
+                yield self._batch_result
+                self._wait_after_batch = self._wait_after_batch or wait
+                return
+            self._pending = []
+            self._wait_after_batch = wait
+            result = self._batch_result = BatchResult()
+            try:
+                yield result
+            except BaseException:
+                self._pending = None
+                self._batch_result = None
+                raise
+            try:
+                sent = True
+                if self._wait_after_batch:
+                    sent = self.wait_for_completion()
+                pending = self._take_pending()
+            finally:
+                self._pending = None
+                self._batch_result = None
+            if pending:
+                sent = self.send_command(self._join(pending)) is True and sent
+            # a query inside the batch that failed took the commands before it along
+            result.sent = bool(sent) and result.sent is not False
+
+    def wait_for_completion(self, timeout: float = 30.0) -> bool:
+        """
+        Blocks until the AWG has completed all pending operations (*OPC?), instead of sleeping a fixed time.
+
+        Args:
+            timeout: time in seconds to wait for the answer, e.g. while a sequence is loaded
+
+        Returns: True if the AWG reported completion
+        """
+        return self.send_command('*OPC?', query=True, timeout=timeout) == '1'
+
+    def close(self):
+        """Closes the SCPI connection, the next command opens a new one."""
+        with self._lock:
+            if self._sock is not None:
+                try:
+                    self._sock.close()
+                except OSError:
+                    pass
+            self._sock = None
+            self._rx_buffer = b''
+
+    def _batch_failed(self):
+        if self._batch_result is not None:
+            self._batch_result.sent = False
+
+    def _take_pending(self) -> list:
+        if not self._pending:
+            return []
+        pending = list(self._pending)
+        del self._pending[:]
+        return pending
+
+    @staticmethod
+    def _join(cmds) -> str:
+        """
+        Joins commands to one program message. After a ';' the AWG parses a header relative to the node of the header
+        before it (IEEE 488.2 path rules), so every header but the first one and the common (*) ones starts from the
+        root with ':', e.g. 'SOUR1:MARK1:VOLT:LOW 1.0;:SOUR1:MARK1:VOLT:HIGH 1.0'
+        """
+        return ';'.join([cmds[0]] + [cmd if cmd.startswith((':', '*')) else ':' + cmd for cmd in cmds[1:]])
+
+    def _transact(self, cmds, count: int, timeout: float) -> list:
+        """
+        Writes cmds as one line and reads the responses of the queries among them, which the AWG returns on one line
+        separated by ';'
+
+        Args:
+            cmds: commands, the last count of them are queries
+            count: number of responses to read
+            timeout: socket timeout in seconds
+
+        Returns: list of count responses
+        """
+        text = self._exchange(self._join(cmds), count, timeout)
+        if count == 1:
+            return [text]
+        responses = text.split(';')
+        if len(responses) != count:
+            raise RuntimeError(f'expected {count} responses, got {text!r}')
+        return responses
+
+    def _exchange(self, line: str, count: int, timeout: float):
+        """
+        Sends one line and, if it contains queries, reads the response line. A connection that was dropped by the
+        instrument is reopened and the line is sent once more.
+        """
+        for attempt in range(2):
+            try:
+                sock = self._connection(timeout)
+                self.logger.debug(f"SCPI >>> {line}")
+                sock.sendall((line + '\n').encode())
+                if not count:
+                    return None
+                text = self._read_line(sock)
+                self.logger.debug(f"SCPI <<< {text}")
+                return text
+            except (ConnectionError, socket.timeout) as e:
+                self.close()
+                if attempt or isinstance(e, socket.timeout):
+                    raise
+                self.logger.info(f"SCPI connection lost ({e}), reconnecting")
+
+    def _connection(self, timeout: float) -> socket.socket:
+        if self._sock is not None and not self._is_alive():
+            self.close()
+        if self._sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(self.addr)
+            except OSError:
+                sock.close()
+                raise
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+        self._sock.settimeout(timeout)
+        return self._sock
+
+    def _is_alive(self) -> bool:
+        """False if the instrument has closed the connection, checked without blocking before every write"""
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            return not readable or self._sock.recv(1, socket.MSG_PEEK) != b''
+        except (OSError, ValueError):
+            return False
+
+    def _read_line(self, sock: socket.socket) -> str:
+        while b'\n' not in self._rx_buffer:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionResetError('connection closed by the AWG520')
+            self._rx_buffer += data
+        line, self._rx_buffer = self._rx_buffer.split(b'\n', 1)
+        return line.decode().strip()
 
     # --- Clock configuration ---
     def set_clock_external(self):
@@ -114,36 +407,46 @@ class AWG520Driver:
 
     def setup_sequence(self, seqfilename: str, enable_iq: bool = False):
         """
-        High-level setup: clocks, enhanced mode, load sequence, set voltages.
-        """
-        self.set_ref_clock_external()
-        time.sleep(0.1)
-        self.set_enhanced_run_mode()
-        time.sleep(0.1)
-        # load sequence on both channels
-        for ch in (1, 2):
-            self.send_command(f'SOUR{ch}:FUNC:USER "{seqfilename}","MAIN"')
-            time.sleep(0.1)
-        # set default voltages and markers
-        for ch in (1, 2):
-            self.send_command(f'SOUR{ch}:VOLT:AMPL 1000mV')
-            time.sleep(0.1)
-            self.send_command(f'SOUR{ch}:VOLT:OFFS 0mV')
-            time.sleep(0.1)
-            for m in (1, 2):
-                self.send_command(f'SOUR{ch}:MARK{m}:VOLT:LOW 0')
-                time.sleep(0.05)
-                self.send_command(f'SOUR{ch}:MARK{m}:VOLT:HIGH 2.0')
-                time.sleep(0.05)
-        # output state
-        if enable_iq:
-            self.send_command('OUTP1:STAT ON')
-            time.sleep(0.1)
-            self.send_command('OUTP2:STAT ON')
-            time.sleep(0.1)
-        else:
+        High-level setup: clocks, enhanced mode, load sequence, set voltages. See configure().
+        """
+        self.configure(seqfilename, enable_iq=enable_iq)
+
+    def configure(self, seqfilename: str, enable_iq: bool = False, amplitude: str = '1000mV', offset: str = '0mV',
+                  marker_low: float = 0, marker_high: float = 2.0) -> bool:
+        """
+        Applies external reference clock, enhanced run mode, the sequence on both channels, output voltages, marker
+        levels and output state in one batched exchange, and waits until the AWG has completed it.
+
+        Args:
+            seqfilename: name of the sequence file on the AWG
+            enable_iq: if True, turns on the outputs of both channels, otherwise only CH1
+            amplitude: output amplitude of both channels
+            offset: output offset of both channels
+            marker_low: low level of all markers in volts
+            marker_high: high level of all markers in volts
+
+        Returns:
+            bool: True if the AWG reported completion
+        """
+        with self.batch():
+            self.set_ref_clock_external()
+            self.set_enhanced_run_mode()
+            # load sequence on both channels, the following commands wait until it is loaded
+            for ch in (1, 2):
+                self.send_command(f'SOUR{ch}:FUNC:USER "{seqfilename}","MAIN"')
+            self.send_command('*WAI')
+            # set default voltages and markers
+            for ch in (1, 2):
+                self.send_command(f'SOUR{ch}:VOLT:AMPL {amplitude}')
+                self.send_command(f'SOUR{ch}:VOLT:OFFS {offset}')
+                for m in (1, 2):
+                    self.send_command(f'SOUR{ch}:MARK{m}:VOLT:LOW {marker_low}')
+                    self.send_command(f'SOUR{ch}:MARK{m}:VOLT:HIGH {marker_high}')
+            # output state
             self.send_command('OUTP1:STAT ON')
-            time.sleep(0.1)
+            if enable_iq:
+                self.send_command('OUTP2:STAT ON')
+            return self.wait_for_completion()
 
     def run(self):
         return self.send_command('AWGC:RUN')
@@ -167,13 +470,12 @@ class AWG520Driver:
         This effectively enables the laser by setting the marker to a high voltage level.
         """
         self.logger.info("Turning on CH1 Marker 2 (laser control)")
-        # Set low level to 2V to turn on the laser
-        result1 = self.send_command('SOUR1:MARK2:VOLT:LOW 2.0')
-        time.sleep(0.05)
-        # Set high level to 2V as well to ensure consistent output
-        result2 = self.send_command('SOUR1:MARK2:VOLT:HIGH 2.0')
-        time.sleep(0.05)
-        return result1 and result2
+        with self.batch() as batch:
+            # Set low level to 2V to turn on the laser
+            self.send_command('SOUR1:MARK2:VOLT:LOW 2.0')
+            # Set high level to 2V as well to ensure consistent output
+            self.send_command('SOUR1:MARK2:VOLT:HIGH 2.0')
+        return batch.sent
 
     def set_ch1_marker2_laser_off(self):
         """
@@ -181,13 +483,12 @@ class AWG520Driver:
         This effectively disables the laser by setting the marker to a low voltage level.
         """
         self.logger.info("Turning off CH1 Marker 2 (laser control)")
-        # Set low level to 0V to turn off the laser
-        result1 = self.send_command('SOUR1:MARK2:VOLT:LOW 0.0')
-        time.sleep(0.05)
-        # Set high level to 0V as well to ensure consistent output
-        result2 = self.send_command('SOUR1:MARK2:VOLT:HIGH 0.0')
-        time.sleep(0.05)
-        return result1 and result2
+        with self.batch() as batch:
+            # Set low level to 0V to turn off the laser
+            self.send_command('SOUR1:MARK2:VOLT:LOW 0.0')
+            # Set high level to 0V as well to ensure consistent output
+            self.send_command('SOUR1:MARK2:VOLT:HIGH 0.0')
+        return batch.sent
 
     def set_ch1_marker2_voltage(self, low_voltage: float, high_voltage: float = None):
         """
@@ -202,14 +503,13 @@ class AWG520Driver:
         
         self.logger.info(f"Setting CH1 Marker 2 voltage: LOW={low_voltage}V, HIGH={high_voltage}V")
         
-        # Set low level
-        result1 = self.send_command(f'SOUR1:MARK2:VOLT:LOW {low_voltage}')
-        time.sleep(0.05)
-        # Set high level
-        result2 = self.send_command(f'SOUR1:MARK2:VOLT:HIGH {high_voltage}')
-        time.sleep(0.05)
+        with self.batch() as batch:
+            # Set low level
+            self.send_command(f'SOUR1:MARK2:VOLT:LOW {low_voltage}')
+            # Set high level
+            self.send_command(f'SOUR1:MARK2:VOLT:HIGH {high_voltage}')
         
-        return result1 and result2
+        return batch.sent
 
     def get_ch1_marker2_voltage(self):
         """
@@ -220,9 +520,7 @@ class AWG520Driver:
         """
         try:
             low_v = self.send_command('SOUR1:MARK2:VOLT:LOW?', query=True)
-            time.sleep(0.05)
             high_v = self.send_command('SOUR1:MARK2:VOLT:HIGH?', query=True)
-            time.sleep(0.05)
             
             if low_v is not None and high_v is not None:
                 return (float(low_v), float(high_v))
@@ -263,12 +561,11 @@ class AWG520Driver:
         
         self.logger.info(f"Setting CH1 Marker 1 voltage: LOW={low_voltage}V, HIGH={high_voltage}V")
         
-        result1 = self.send_command(f'SOUR1:MARK1:VOLT:LOW {low_voltage}')
-        time.sleep(0.05)
-        result2 = self.send_command(f'SOUR1:MARK1:VOLT:HIGH {high_voltage}')
-        time.sleep(0.05)
+        with self.batch() as batch:
+            self.send_command(f'SOUR1:MARK1:VOLT:LOW {low_voltage}')
+            self.send_command(f'SOUR1:MARK1:VOLT:HIGH {high_voltage}')
         
-        return result1 and result2
+        return batch.sent
 
     def get_ch1_marker1_voltage(self):
         """
@@ -279,9 +576,7 @@ class AWG520Driver:
         """
         try:
             low_v = self.send_command('SOUR1:MARK1:VOLT:LOW?', query=True)
-            time.sleep(0.05)
             high_v = self.send_command('SOUR1:MARK1:VOLT:HIGH?', query=True)
-            time.sleep(0.05)
             
             if low_v is not None and high_v is not None:
                 return (float(low_v), float(high_v))
@@ -304,12 +599,11 @@ class AWG520Driver:
         
         self.logger.info(f"Setting CH2 Marker 1 voltage: LOW={low_voltage}V, HIGH={high_voltage}V")
         
-        result1 = self.send_command(f'SOUR2:MARK1:VOLT:LOW {low_voltage}')
-        time.sleep(0.05)
-        result2 = self.send_command(f'SOUR2:MARK1:VOLT:HIGH {high_voltage}')
-        time.sleep(0.05)
+        with self.batch() as batch:
+            self.send_command(f'SOUR2:MARK1:VOLT:LOW {low_voltage}')
+            self.send_command(f'SOUR2:MARK1:VOLT:HIGH {high_voltage}')
         
-        return result1 and result2
+        return batch.sent
 
     def get_ch2_marker1_voltage(self):
         """
@@ -320,9 +614,7 @@ class AWG520Driver:
         """
         try:
             low_v = self.send_command('SOUR2:MARK1:VOLT:LOW?', query=True)
-            time.sleep(0.05)
             high_v = self.send_command('SOUR2:MARK1:VOLT:HIGH?', query=True)
-            time.sleep(0.05)
             
             if low_v is not None and high_v is not None:
                 return (float(low_v), float(high_v))
@@ -345,12 +637,11 @@ class AWG520Driver:
         
         self.logger.info(f"Setting CH2 Marker 2 voltage: LOW={low_voltage}V, HIGH={high_voltage}V")
         
-        result1 = self.send_command(f'SOUR2:MARK2:VOLT:LOW {low_voltage}')
-        time.sleep(0.05)
-        result2 = self.send_command(f'SOUR2:MARK2:VOLT:HIGH {high_voltage}')
-        time.sleep(0.05)
+        with self.batch() as batch:
+            self.send_command(f'SOUR2:MARK2:VOLT:LOW {low_voltage}')
+            self.send_command(f'SOUR2:MARK2:VOLT:HIGH {high_voltage}')
         
-        return result1 and result2
+        return batch.sent
 
     def get_ch2_marker2_voltage(self):
         """
@@ -361,9 +652,7 @@ class AWG520Driver:
         """
         try:
             low_v = self.send_command('SOUR2:MARK2:VOLT:LOW?', query=True)
-            time.sleep(0.05)
             high_v = self.send_command('SOUR2:MARK2:VOLT:HIGH?', query=True)
-            time.sleep(0.05)
             
             if low_v is not None and high_v is not None:
                 return (float(low_v), float(high_v))
@@ -419,48 +708,34 @@ class AWG520Driver:
         - Configures CH1 Marker 1 for MW control
         - Generates 10MHz sine waves on CH1 and optionally CH2
         - For IQ mode: CH1 = sine, CH2 = cosine (90° phase shift)
+
+        All commands are sent in one batch that ends with *OPC?.
+
+        Returns:
+            bool: True if the AWG reported completion
         """
         self.logger.info(f"Turning on MW with 10MHz {'IQ modulation' if enable_iq else 'single channel'}")
         
-        # Setup external reference clock (Rubidium lab clock)
-        self.set_ref_clock_external()
-        time.sleep(0.1)
-        
-        # Configure CH1 Marker 1 for MW control
-        result1 = self.send_command('SOUR1:MARK1:VOLT:LOW 2.0')
-        time.sleep(0.05)
-        
-        if enable_iq:
-            # Configure both channels for IQ modulation
+        with self.batch():
+            # Setup external reference clock (Rubidium lab clock)
+            self.set_ref_clock_external()
+
+            # Configure CH1 Marker 1 for MW control
+            self.send_command('SOUR1:MARK1:VOLT:LOW 2.0')
+
             # CH1: Sine wave at 10MHz
-            result2 = self.send_command('AWGC:FG1:FUNC SIN')
-            time.sleep(0.05)
-            result3 = self.send_command('AWGC:FG1:FREQ 10MHz')
-            time.sleep(0.05)
-            result4 = self.send_command('AWGC:FG1:VOLT 2.0')
-            time.sleep(0.05)
-            
-            # CH2: Cosine wave at 10MHz (90° phase shift)
-            result5 = self.send_command('AWGC:FG2:FUNC SIN')
-            time.sleep(0.05)
-            result6 = self.send_command('AWGC:FG2:FREQ 10MHz')
-            time.sleep(0.05)
-            result7 = self.send_command('AWGC:FG2:PHAS 90DEG')
-            time.sleep(0.05)
-            result8 = self.send_command('AWGC:FG2:VOLT 2.0')
-            time.sleep(0.05)
-            
-            return all([result1, result2, result3, result4, result5, result6, result7, result8])
-        else:
-            # Configure only CH1 for single channel output
-            result2 = self.send_command('AWGC:FG1:FUNC SIN')
-            time.sleep(0.05)
-            result3 = self.send_command('AWGC:FG1:FREQ 10MHz')
-            time.sleep(0.05)
-            result4 = self.send_command('AWGC:FG1:VOLT 2.0')
-            time.sleep(0.05)
-            
-            return all([result1, result2, result3, result4])
+            self.send_command('AWGC:FG1:FUNC SIN')
+            self.send_command('AWGC:FG1:FREQ 10MHz')
+            self.send_command('AWGC:FG1:VOLT 2.0')
+
+            if enable_iq:
+                # CH2: Cosine wave at 10MHz (90° phase shift)
+                self.send_command('AWGC:FG2:FUNC SIN')
+                self.send_command('AWGC:FG2:FREQ 10MHz')
+                self.send_command('AWGC:FG2:PHAS 90DEG')
+                self.send_command('AWGC:FG2:VOLT 2.0')
+
+            return self.wait_for_completion()
 
     def mw_off_sb10MHz(self, enable_iq=False):
         """
@@ -471,27 +746,19 @@ class AWG520Driver:
                             If False, turns off only CH1.
         
         Note: This function assumes mw_on_sb10MHz was called previously.
+
+        Returns:
+            bool: True if the AWG reported completion
         """
         self.logger.info(f"Turning off MW {'IQ modulation' if enable_iq else 'single channel'}")
         
-        # Turn off CH1 Marker 1 MW control
-        result1 = self.send_command('SOUR1:MARK1:VOLT:HIGH 0.0')
-        time.sleep(0.05)
-        
-        if enable_iq:
-            # Turn off both channels
-            result2 = self.send_command('AWGC:FG1:VOLT 0.0')
-            time.sleep(0.05)
-            result3 = self.send_command('AWGC:FG2:VOLT 0.0')
-            time.sleep(0.05)
-            
-            return all([result1, result2, result3])
-        else:
-            # Turn off only CH1
-            result2 = self.send_command('AWGC:FG1:VOLT 0.0')
-            time.sleep(0.05)
-            
-            return all([result1, result2])
+        with self.batch():
+            # Turn off CH1 Marker 1 MW control
+            self.send_command('SOUR1:MARK1:VOLT:HIGH 0.0')
+            self.send_command('AWGC:FG1:VOLT 0.0')
+            if enable_iq:
+                self.send_command('AWGC:FG2:VOLT 0.0')
+            return self.wait_for_completion()
 
     def set_function_generator(self, channel, function='SIN', frequency='10MHz', 
                              voltage=2.0, phase=0.0, enable=True):
@@ -507,7 +774,7 @@ class AWG520Driver:
             enable (bool): If True, sets voltage to specified value, if False sets to 0V
         
         Returns:
-            bool: True if all commands succeeded, False otherwise
+            bool: True if all commands were sent, False otherwise; None inside another batch, whose result tells
         """
         if channel not in [1, 2]:
             self.logger.error(f"Invalid channel: {channel}. Must be 1 or 2.")
@@ -515,27 +782,22 @@ class AWG520Driver:
         
         self.logger.info(f"Setting FG{channel}: {function} at {frequency}, {voltage}V, {phase}°")
         
-        # Set function type
-        result1 = self.send_command(f'AWGC:FG{channel}:FUNC {function}')
-        time.sleep(0.05)
-        
-        # Set frequency
-        result2 = self.send_command(f'AWGC:FG{channel}:FREQ {frequency}')
-        time.sleep(0.05)
-        
-        # Set phase
-        if phase != 0.0:
-            result3 = self.send_command(f'AWGC:FG{channel}:PHAS {phase}DEG')
-            time.sleep(0.05)
-        else:
-            result3 = True
-        
-        # Set voltage
-        voltage_set = voltage if enable else 0.0
-        result4 = self.send_command(f'AWGC:FG{channel}:VOLT {voltage_set}')
-        time.sleep(0.05)
+        with self.batch() as batch:
+            # Set function type
+            self.send_command(f'AWGC:FG{channel}:FUNC {function}')
+
+            # Set frequency
+            self.send_command(f'AWGC:FG{channel}:FREQ {frequency}')
+
+            # Set phase
+            if phase != 0.0:
+                self.send_command(f'AWGC:FG{channel}:PHAS {phase}DEG')
+
+            # Set voltage
+            voltage_set = voltage if enable else 0.0
+            self.send_command(f'AWGC:FG{channel}:VOLT {voltage_set}')
         
-        return all([result1, result2, result3, result4])
+        return batch.sent
 
     def get_function_generator_status(self, channel):
         """
@@ -552,17 +814,12 @@ class AWG520Driver:
             return None
         
         try:
-            # Query all parameters
-            function = self.send_command(f'AWGC:FG{channel}:FUNC?', query=True)
-            time.sleep(0.05)
-            frequency = self.send_command(f'AWGC:FG{channel}:FREQ?', query=True)
-            time.sleep(0.05)
-            voltage = self.send_command(f'AWGC:FG{channel}:VOLT?', query=True)
-            time.sleep(0.05)
-            phase = self.send_command(f'AWGC:FG{channel}:PHAS?', query=True)
-            time.sleep(0.05)
+            # Query all parameters in one round trip
+            responses = self.query_many([f'AWGC:FG{channel}:FUNC?', f'AWGC:FG{channel}:FREQ?',
+                                         f'AWGC:FG{channel}:VOLT?', f'AWGC:FG{channel}:PHAS?'])
             
-            if all([function, frequency, voltage, phase]):
+            if responses is not None and all(responses):
+                function, frequency, voltage, phase = responses
                 return {
                     'function': function,
                     'frequency': frequency,
@@ -589,13 +846,15 @@ class AWG520Driver:
         """
         self.logger.info(f"Enabling I/Q modulation at {frequency}, {voltage}V")
         
-        # Configure CH1 for I (sine wave, 0° phase)
-        result1 = self.set_function_generator(1, 'SIN', frequency, voltage, 0.0, True)
-        
-        # Configure CH2 for Q (sine wave, 90° phase)
-        result2 = self.set_function_generator(2, 'SIN', frequency, voltage, 90.0, True)
-        
-        return result1 and result2
+        with self.batch():
+            # Configure CH1 for I (sine wave, 0° phase)
+            self.set_function_generator(1, 'SIN', frequency, voltage, 0.0, True)
+
+            # Configure CH2 for Q (sine wave, 90° phase)
+            self.set_function_generator(2, 'SIN', frequency, voltage, 90.0, True)
+
+            # the commands go out with *OPC?, its answer tells if they were sent and completed
+            return self.wait_for_completion()
 
     def disable_iq_modulation(self):
         """
@@ -607,12 +866,10 @@ class AWG520Driver:
         self.logger.info("Disabling I/Q modulation")
         
         # Turn off both channels
-        result1 = self.send_command('AWGC:FG1:VOLT 0.0')
-        time.sleep(0.05)
-        result2 = self.send_command('AWGC:FG2:VOLT 0.0')
-        time.sleep(0.05)
-        
-        return result1 and result2
+        with self.batch():
+            self.send_command('AWGC:FG1:VOLT 0.0')
+            self.send_command('AWGC:FG2:VOLT 0.0')
+            return self.wait_for_completion()
 
     # --- File operations via FTP ---
     def list_files(self):
@@ -624,6 +881,9 @@ class AWG520Driver:
 
     def upload_file(self, local_path: str, remote_name: str) -> bool:
         try:
+            # the file is overwritten without being hashed, so the manifest no longer knows its content
+            self.manifest.forget(remote_name)
+            self.manifest.save()
             with open(local_path, 'rb') as f:
                 self.ftp.storbinary(f'STOR {remote_name}', f)
             self.logger.info(f"FTP upload: {local_path} -> {remote_name}")
@@ -632,6 +892,92 @@ class AWG520Driver:
             self.logger.error(f"FTP upload failed: {e}")
             return False
 
+    def upload_files(self, files, workers: int = 3, progress=None, force: bool = False) -> dict:
+        """
+        Uploads several files over a pool of concurrent FTP sessions. Files that the manifest records with the same
+        content and that are still listed on the AWG are skipped.
+
+        Args:
+            files: local paths, uploaded under their file name, or (local_path, remote_name) pairs
+            workers: maximum number of concurrent FTP sessions
+            progress: optional callable progress(done, total, remote_name), called after every file, uploaded or not
+            force: upload all files, regardless of the manifest
+
+        Returns:
+            dict: lists of the remote names that were 'uploaded', 'skipped' and that 'failed'
+        """
+        pairs = []
+        for entry in files:
+            if isinstance(entry, (str, Path)):
+                pairs.append((str(entry), Path(entry).name))
+            else:
+                pairs.append((str(entry[0]), entry[1]))
+
+        manifest = self.manifest
+        remote_files = set(self.list_files())
+        manifest.sync(remote_files)
+
+        result = {'uploaded': [], 'skipped': [], 'failed': []}
+        total = len(pairs)
+        done = 0
+        todo = []
+        for local_path, remote_name in pairs:
+            digest = manifest.file_digest(local_path)
+            if not force and remote_name in remote_files and manifest.matches(remote_name, digest):
+                result['skipped'].append(remote_name)
+                done += 1
+                if progress is not None:
+                    progress(done, total, remote_name)
+            else:
+                # until the upload succeeds, the content of the file on the AWG is unknown
+                manifest.forget(remote_name)
+                todo.append((local_path, remote_name, digest))
+
+        sessions = queue.Queue()
+
+        def upload(local_path, remote_name):
+            try:
+                ftp = sessions.get_nowait()
+            except queue.Empty:
+                ftp = self._open_ftp()
+            try:
+                with open(local_path, 'rb') as f:
+                    ftp.storbinary(f'STOR {remote_name}', f)
+            except Exception:
+                # the session may be unusable, do not hand it to the next upload
+                ftp.close()
+                raise
+            sessions.put(ftp)
+
+        try:
+            if todo:
+                with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as executor:
+                    futures = {executor.submit(upload, local_path, remote_name): (local_path, remote_name, digest)
+                               for local_path, remote_name, digest in todo}
+                    for future in as_completed(futures):
+                        local_path, remote_name, digest = futures[future]
+                        try:
+                            future.result()
+                            manifest.record(remote_name, digest)
+                            result['uploaded'].append(remote_name)
+                            self.logger.info(f"FTP upload: {local_path} -> {remote_name}")
+                        except Exception as e:
+                            result['failed'].append(remote_name)
+                            self.logger.error(f"FTP upload of {remote_name} failed: {e}")
+                        done += 1
+                        if progress is not None:
+                            progress(done, total, remote_name)
+        finally:
+            while not sessions.empty():
+                try:
+                    sessions.get_nowait().quit()
+                except Exception:
+                    pass
+            manifest.save()
+        self.logger.info(f"FTP upload: {len(result['uploaded'])} uploaded, {len(result['skipped'])} unchanged, "
+                         f"{len(result['failed'])} failed")
+        return result
+
     def download_file(self, filename: str, local_path: str) -> bool:
         try:
             with open(local_path, 'wb') as f:
@@ -659,6 +1005,8 @@ class AWG520Driver:
             if filename == 'parameter.dat':
                 raise ValueError('Cannot delete protected file')
             self.ftp.delete(filename)
+            self.manifest.forget(filename)
+            self.manifest.save()
             self.logger.info(f"FTP delete: {filename}")
             return True
         except Exception as e:
@@ -687,6 +1035,7 @@ class AWG520Driver:
             self.ftp.quit()
         except:
             pass
+        self.close()
 
 class FileTransferWorker(QObject):
     """Worker object to perform FTP transfers in a separate thread."""
@@ -699,13 +1048,38 @@ class FileTransferWorker(QObject):
         self.remote_name = remote_name
 
     def run(self):
-        """Uploads the file and emits finished signal when done."""
-        success = self.driver.upload_file(self.local_path, self.remote_name)
-        self.finished.emit(success, self.remote_name)
+        """Uploads the file unless the AWG has it unchanged and emits finished signal when done."""
+        result = self.driver.upload_files([(self.local_path, self.remote_name)], workers=1)
+        # an unchanged file that was skipped is on the AWG as well
+        self.finished.emit(not result['failed'], self.remote_name)
+
+class WaveformUploadWorker(QObject):
+    """Worker object to upload several files over concurrent FTP sessions in a separate thread."""
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(dict)
 
-class AWG520Device(Device):
+    def __init__(self, driver: AWG520Driver, files, workers: int = 3):
+        super().__init__()
+        self.driver = driver
+        self.files = list(files)
+        self.workers = workers
+
+    def run(self):
+        """Uploads the files that changed, emits progress after every file and finished with the result."""
+        result = self.driver.upload_files(self.files, workers=self.workers, progress=self.progress.emit)
+        self.finished.emit(result)
+
+class AWG520Device(Device, QObject):
     """Device wrapper for Tektronix AWG520 using your Device framework."""
+    # QObject so that the signals below can be connected and emitted
     file_transfer_completed = pyqtSignal(bool, str)
+    # files done, total files, remote name of the last file
+    upload_progress = pyqtSignal(int, int, str)
+    # lists of the remote names that were 'uploaded', 'skipped' and that 'failed'
+    waveforms_uploaded = pyqtSignal(dict)
+
+    # driver object whose calls are timed when the device is instrumented, see src/core/device_stats.py
+    _DRIVER_ATTRIBUTES = ('driver',)
 
     _DEFAULT_SETTINGS = Parameter([
         Parameter('ip_address', _IP_ADDRESS,str,'IP address of the AWG520'),
@@ -714,7 +1088,8 @@ class AWG520Device(Device):
         Parameter('ftp_user', 'usr',str, 'FTP username for the AWG520'),
         Parameter('ftp_pass','pw',str, 'FTP password for the AWG520'),
         Parameter('seq_file', 'scan.seq', str, 'Sequence file to upload to the AWG520'),
-        Parameter('enable_iq', False, bool, 'Enable I/Q output on the AWG520')
+        Parameter('enable_iq', False, bool, 'Enable I/Q output on the AWG520'),
+        Parameter('upload_workers', 3, int, 'Number of concurrent FTP sessions for waveform uploads')
     ])
 
 
@@ -723,6 +1098,7 @@ class AWG520Device(Device):
     }
 
     def __init__(self, name=None, settings=None):
+        QObject.__init__(self)
         super().__init__(name=name, settings=settings)
         self.logger = logging.getLogger(__name__)
         cfg = self.settings
@@ -735,6 +1111,8 @@ class AWG520Device(Device):
         )
         self._ftp_thread = None
         self._ftp_worker = None
+        self._upload_thread = None
+        self._upload_worker = None
         # Test connection and set connection status
         self._test_connection()
     
@@ -787,16 +1165,15 @@ class AWG520Device(Device):
             
         cfg = self.settings
         seq = cfg['seq_file']
-        self.driver.set_ref_clock(1, 'EXT')
-        self.driver.set_ref_clock(2, 'EXT')
-        time.sleep(0.1)
-        self.driver.send_command('AWGC:RMOD ENH')
-        time.sleep(0.1)
+        with self.driver.batch(wait=True):
+            self.driver.set_ref_clock_external()
+            self.driver.set_enhanced_run_mode()
         self._start_file_transfer(seq)
         return True
 
     def _start_file_transfer(self, local_path: str):
-        remote_name = local_path
+        # the AWG lists and loads files by name, see AWG520Driver.upload_files
+        remote_name = Path(local_path).name
         self._ftp_thread = QThread()
         self._ftp_worker = FileTransferWorker(self.driver, local_path, remote_name)
         self._ftp_worker.moveToThread(self._ftp_thread)
@@ -811,17 +1188,47 @@ class AWG520Device(Device):
     def _on_file_transfer_finished(self, success: bool, remote_name: str):
         if success:
             self.logger.info(f"Upload succeeded: {remote_name}")
-            self.driver.configure_sequence(remote_name)
-            for ch in (1, 2):
-                self.driver.set_amplitude(ch)
-                self.driver.set_offset(ch)
-                self.driver.set_marker(ch, 1)
-                self.driver.set_marker(ch, 2)
+            self.driver.configure(remote_name, enable_iq=self.settings['enable_iq'])
             self.logger.info('AWG setup complete after file transfer')
         else:
             self.logger.error(f"Upload failed for {remote_name}")
         self.file_transfer_completed.emit(success, remote_name)
 
+    def upload_files(self, files, progress=None):
+        """
+        Uploads waveform and sequence files in the calling thread, e.g. the thread of an experiment, over
+        settings['upload_workers'] concurrent FTP sessions. Files that are unchanged on the AWG are skipped.
+
+        Args:
+            files: local paths, uploaded under their file name, or (local_path, remote_name) pairs
+            progress: optional callable progress(done, total, remote_name)
+
+        Returns:
+            dict: lists of the remote names that were 'uploaded', 'skipped' and that 'failed'
+        """
+        return self.driver.upload_files(files, workers=self.settings['upload_workers'], progress=progress)
+
+    def upload_waveforms(self, files):
+        """
+        Uploads waveform and sequence files in a separate thread, over settings['upload_workers'] concurrent FTP
+        sessions. Files that are unchanged on the AWG are skipped. Emits upload_progress after every file and
+        waveforms_uploaded at the end.
+
+        Args:
+            files: local paths, uploaded under their file name, or (local_path, remote_name) pairs
+        """
+        self._upload_thread = QThread()
+        self._upload_worker = WaveformUploadWorker(self.driver, files, self.settings['upload_workers'])
+        self._upload_worker.moveToThread(self._upload_thread)
+        self._upload_thread.started.connect(self._upload_worker.run)
+        self._upload_worker.progress.connect(self.upload_progress.emit)
+        self._upload_worker.finished.connect(self.waveforms_uploaded.emit)
+        self._upload_worker.finished.connect(self._upload_thread.quit)
+        self._upload_worker.finished.connect(self._upload_worker.deleteLater)
+        self._upload_thread.finished.connect(self._upload_thread.deleteLater)
+        self._upload_thread.start()
+        self.logger.info(f"Started async upload of {len(self._upload_worker.files)} files")
+
     def run_sequence(self):
         self.driver.run()
 
@@ -913,6 +1320,9 @@ class AWG520Device(Device):
         if self._ftp_thread and self._ftp_thread.isRunning():
             self._ftp_thread.quit()
             self._ftp_thread.wait()
+        if self._upload_thread and self._upload_thread.isRunning():
+            self._upload_thread.quit()
+            self._upload_thread.wait()
         if hasattr(self, 'driver'):
             self.driver.cleanup()
         self._is_connected = False
@@ -923,6 +1333,7 @@ class AWG520Device(Device):
         try:
             self.logger.info("Attempting to reconnect to AWG520...")
             # Recreate driver instance
+            self.driver.close()
             cfg = self.settings
             self.driver = AWG520Driver(
                 ip_address=cfg['ip_address'],
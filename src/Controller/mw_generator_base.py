@@ -4,6 +4,7 @@
 import socket
 import pyvisa
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
 from src.core.device import Device, Parameter  # <-- your existing base
 import logging
@@ -12,6 +13,11 @@ logger = logging.getLogger("mw_generator_base")
 
 class MicrowaveGeneratorBase(Device, ABC):
 
+    # separator to send several commands on one line, None if the instrument takes one command per line
+    COMMAND_SEPARATOR = ';'
+    # query that returns once all pending operations are complete, None if the instrument has none
+    OPC_QUERY = '*OPC?'
+
     _DEFAULT_SETTINGS = Parameter([
         Parameter('connection_type', 'LAN', ['LAN','GPIB','RS232'], 'Transport type'),
         # for LAN:
@@ -54,6 +60,10 @@ class MicrowaveGeneratorBase(Device, ABC):
     def __init__(self, name=None, settings=None):
         # Initialize _inst to None first to avoid AttributeError
         self._inst = None
+        self._sock = None
+        # commands collected inside batch(), None while not batching
+        self._pending = None
+        self._wait_after_batch = False
         super().__init__(name, settings)
         self._init_transport()
 
@@ -82,68 +92,181 @@ class MicrowaveGeneratorBase(Device, ABC):
             self._inst = None
 
     def _send(self, cmd: str):
+        """
+        sends a command, inside batch() the command is collected and sent with the next query or at the end of the batch
+        """
+        # setters that bypass update change what the probes read back
+        if vars(self).get('_probe_cache'):
+            self._probe_cache.clear()
+        if self._pending is not None:
+            self._pending.append(cmd)
+            return
+        self._write(cmd)
+
+    def _query(self, cmd: str) -> str:
+        """
+        sends a query and returns the response, commands collected by batch() go out on the same line
+        """
+        if self.settings['connection_type'] == 'LAN' and not cmd.endswith('?'):
+            cmd = cmd.strip() + '?'
+        return self._transact(self._take_pending() + [cmd], 1)[0]
+
+    def _query_many(self, cmds) -> list:
+        """
+        sends several queries and returns their responses; if the instrument allows it, all of them (and commands
+        collected by batch()) go out on one line and the responses come back in one read
+
+        Args:
+            cmds: list of queries, e.g. ['FREQ?', 'AMPR?']
+
+        Returns: list of the responses, in the order of cmds
+        """
+        cmds = list(cmds)
+        if self.COMMAND_SEPARATOR is None:
+            return [self._query(cmd) for cmd in cmds]
+        return self._transact(self._take_pending() + cmds, len(cmds))
+
+    @contextmanager
+    def batch(self, wait: bool = False):
+        """
+        collects the commands sent inside the with block and sends them together, as one line if the instrument
+        allows it. Batches can be nested, the commands go out at the end of the outermost one.
+
+        Args:
+            wait: end the batch with OPC_QUERY, i.e. return only once the instrument has completed the commands
+                  (e.g. a frequency change has settled)
+        """
+        if self._pending is not None:
+            yield
+            self._wait_after_batch = self._wait_after_batch or wait
+            return
+        self._pending = []
+        self._wait_after_batch = wait
+        try:
+            yield
+        except BaseException:
+            self._pending = None
+            raise
+        try:
+            if self._wait_after_batch:
+                self.wait_for_completion()
+            pending = self._take_pending()
+        finally:
+            self._pending = None
+        if pending:
+            self._flush(pending)
+
+    def wait_for_completion(self):
+        """
+        blocks until the instrument has completed all pending operations, using OPC_QUERY
+        """
+        if self.OPC_QUERY is not None:
+            self._query(self.OPC_QUERY)
+
+    def _take_pending(self) -> list:
+        if not self._pending:
+            return []
+        pending = list(self._pending)
+        del self._pending[:]
+        return pending
+
+    def _flush(self, cmds):
+        if self.COMMAND_SEPARATOR is None:
+            for cmd in cmds:
+                self._write(cmd)
+        else:
+            self._write(self.COMMAND_SEPARATOR.join(cmds))
+
+    def _transact(self, cmds, count: int) -> list:
+        """
+        writes cmds and reads the responses of the queries among them
+
+        Args:
+            cmds: commands, the last count of them are queries
+            count: number of responses to read
+
+        Returns: list of count responses
+        """
+        if self.COMMAND_SEPARATOR is None:
+            for cmd in cmds[:-count]:
+                self._write(cmd)
+            return [self._raw_query(cmd, 1)[0] for cmd in cmds[-count:]]
+        return self._raw_query(self.COMMAND_SEPARATOR.join(cmds), count)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.settings['socket_timeout'])
+        sock.connect(self._addr)
+        # Store socket for reuse
+        self._sock = sock
+        # the instrument may have been reset or changed while we were not connected
+        self.invalidate_settings_cache()
+        return sock
+
+    def _write(self, line: str):
+        """sends one line to the instrument"""
         if self.settings['connection_type']=='LAN':
             # Try to reuse existing socket if available
-            if hasattr(self, '_sock') and self._sock is not None:
+            if self._sock is not None:
                 try:
-                    self._sock.sendall((cmd + "\n").encode())
+                    self._sock.sendall((line + "\n").encode())
                     return
                 except (socket.error, OSError):
                     # Socket is broken, create new one
-                    try:
-                        self._sock.close()
-                    except:
-                        pass
-                    self._sock = None
-            
-            # Create new socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.settings['socket_timeout'])
-            sock.connect(self._addr)
-            sock.sendall((cmd + "\n").encode())
-            # Store socket for reuse
-            self._sock = sock
+                    self.close_connection()
+            self._connect().sendall((line + "\n").encode())
         else:  # GPIB or RS232
             if self._inst is not None:
-                self._inst.write(cmd)
+                self._inst.write(line)
             else:
                 raise RuntimeError(f"No VISA instrument available for {self.settings['connection_type']} connection")
 
-    def _query(self, cmd: str) -> str:
+    def _raw_query(self, line: str, count: int) -> list:
+        """sends one line and reads count responses, which may come on one line separated by COMMAND_SEPARATOR"""
         if self.settings['connection_type']=='LAN':
             # Try to reuse existing socket if available
-            if hasattr(self, '_sock') and self._sock is not None:
+            if self._sock is not None:
                 try:
-                    if not cmd.endswith('?'):
-                        cmd = cmd.strip() + '?'
-                    self._sock.sendall((cmd + "\n").encode())
-                    data = b''
-                    while not data.endswith(b'\n'):
-                        data += self._sock.recv(1024)
-                    return data.decode().strip()
+                    return self._lan_query(self._sock, line, count)
                 except (socket.error, OSError):
                     # Socket is broken, create new one
-                    try:
-                        self._sock.close()
-                    except:
-                        pass
-                    self._sock = None
-            
-            # Create new socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.settings['socket_timeout'])
-            sock.connect(self._addr)
-            if not cmd.endswith('?'):
-                cmd = cmd.strip() + '?'
-            sock.sendall((cmd + "\n").encode())
-            data = b''
-            while not data.endswith(b'\n'):
-                data += sock.recv(1024)
-            sock.close()
-            return data.decode().strip()
+                    self.close_connection()
+            try:
+                return self._lan_query(self._connect(), line, count)
+            except (socket.error, OSError):
+                self.close_connection()
+                raise
         else:
             # GPIB or RS232
-            return self._inst.query(cmd)
+            if self._inst is None:
+                raise RuntimeError(f"No VISA instrument available for {self.settings['connection_type']} connection")
+            response = self._inst.query(line)
+            if count == 1:
+                return [response]
+            responses = self._split_responses(response)
+            while len(responses) < count:
+                responses += self._split_responses(self._inst.read())
+            return responses
+
+    def _lan_query(self, sock, line: str, count: int) -> list:
+        sock.sendall((line + "\n").encode())
+        data = b''
+        while True:
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError(f"Connection to {self._addr} closed while waiting for a response")
+            data += chunk
+            if not data.endswith(b'\n'):
+                continue
+            if count == 1:
+                return [data.decode().strip()]
+            responses = self._split_responses(data.decode())
+            if len(responses) >= count:
+                return responses
+
+    def _split_responses(self, text: str) -> list:
+        separator = self.COMMAND_SEPARATOR or '\n'
+        return [field.strip() for line in text.strip().splitlines() for field in line.split(separator)]
 
     def test_connection(self) -> bool:
         """Test if the device is reachable with timeout."""
@@ -169,7 +292,7 @@ class MicrowaveGeneratorBase(Device, ABC):
     
     def close_connection(self):
         """Close the socket connection if it exists."""
-        if hasattr(self, '_sock') and self._sock is not None:
+        if getattr(self, '_sock', None) is not None:
             try:
                 self._sock.close()
             except:
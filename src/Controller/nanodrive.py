@@ -10,12 +10,16 @@ else:
     # On non-Windows systems, we'll use cdll for compatibility
     from ctypes import cdll as windll
 from pathlib import Path
+import time
 
 
 class MCLNanoDrive(Device):
     """
     This class implements the Mad City Labs NanoDrive. The class loads the madlib.dll library to communicate with the device.
     """
+    # driver object whose calls are timed when the device is instrumented, see src/core/device_stats.py
+    _DRIVER_ATTRIBUTES = ('DLL',)
+
     _DEFAULT_SETTINGS = Parameter([Parameter('serial',2850,[2850,2849],'serial of specific Nano Drive. Dutt labs LP100:2849 & HS3:2850 (20 bit systems)'),
                                    Parameter('x_pos',0,float,'position of x axis in microns'),
                                    Parameter('y_pos', 0, float, 'position of y axis in microns'),
@@ -59,6 +63,12 @@ class MCLNanoDrive(Device):
                                        ])
                                    ])
 
+    # actions that are sent on every update, see src/core/settings_cache.py
+    _CACHE_SETTINGS = True
+    _UNCACHED_SETTINGS = ('serial', 'load_waveform', 'pulse')
+    # probes that only change through update or are fixed by the calibration
+    _STATIC_PROBES = ('x_range', 'y_range', 'z_range', 'read_rate', 'load_rate', 'num_datapoints', 'clock_settings')
+
     def __init__(self, name=None, settings=None):
         try:            #Loads DLL file. Should be in 'binary_files' folder in 'Controller' folder that houses nanodrive.py
             dll_path = Path(__file__).parent / 'binary_files' / 'madlib.dll'
@@ -72,6 +82,10 @@ class MCLNanoDrive(Device):
         self.set_read_waveform = False  #setup status to false so that a trigger doesnt occur without a setup
         self.set_load_waveform = False
         self.set_mult_ax_waveform = False
+        #ctypes arrays reused across waveforms: the last two load waveforms (e.g. forward and backward lines of a scan) and
+        #the read array
+        self._load_arrays = []
+        self._read_array = None
 
         #set an error dictionary to see what issue device runs into
         self.mcl_error_dic = {
@@ -90,6 +104,7 @@ class MCLNanoDrive(Device):
         #Grabs all handles and controls handle corresponding to serial
         numDevices = self.DLL.MCL_GrabAllHandles()
         self.handle = c_int(self.DLL.MCL_GetHandleBySerial(c_short(self.settings['serial'])))
+        self.invalidate_settings_cache()    #new handle, nothing has been applied to it yet
         self.settings['x_pos'] = self.read_probes('x_pos')  #reads current position when initilizing handle to show correct value
         self.settings['y_pos'] = self.read_probes('y_pos')  #Note if you switch handles in GUI will not update number in box. Minimize and reopen tree to update
         self.settings['z_pos'] = self.read_probes('z_pos')
@@ -128,8 +143,7 @@ class MCLNanoDrive(Device):
                     if self.settings['num_datapoints'] != len(settings['load_waveform']):
                         print('Error: Length of waveform input list does not match number of data points')
                         raise ValueError('Length of waveform input list does not match number of data points')
-                    ArrayType = c_double * self.settings['num_datapoints']  #creates empty array of proper length
-                    wf = ArrayType(*settings['load_waveform'])              #fills array with waveform values
+                    wf = self._load_waveform_array(settings['load_waveform'])   #array of proper length filled with waveform values
                     load_rate = self._load_rate_check(self.settings['load_rate'])
                     axis = self._axis_to_internal(self.settings['axis'])
                     error = self._check_error(self.DLL.MCL_LoadWaveFormN(axis,c_uint(self.settings['num_datapoints']),load_rate,byref(wf),self.handle))
@@ -184,8 +198,7 @@ class MCLNanoDrive(Device):
                 if self.settings['num_datapoints'] != len(settings['load_waveform']):
                     print('Error: Length of waveform imput list does not match number of data points')
                     raise ValueError('Length of waveform input list does not match number of data points')
-                ArrayType = c_double * self.settings['num_datapoints']
-                wf = ArrayType(*settings['load_waveform'])
+                wf = self._load_waveform_array(settings['load_waveform'])
                 load_rate = self._load_rate_check(self.settings['load_rate'])
                 error = self._check_error(self.DLL.MCL_Setup_LoadWaveFormN(axis,c_uint(self.settings['num_datapoints']),load_rate,byref(wf),self.handle))
                 self.set_load_waveform = True    #lets trigger_load and waveform_acquisition run
@@ -212,6 +225,8 @@ class MCLNanoDrive(Device):
             axis: specific axis to move (can also specify in settings dictionary). If not specified will trigger last interacted with axis
             mult_ax_stop=True to stop multi axis waveform (input along with arbirtrary key)
         '''
+        if key != 'read_waveform' or mult_ax_stop:
+            self.invalidate_settings_cache(['x_pos', 'y_pos', 'z_pos'])    #waveforms move the stage outside of update
         if mult_ax_stop:
             error = self._check_error(self.DLL.MCL_WfmaStop(self.handle))
             return None
@@ -262,8 +277,10 @@ class MCLNanoDrive(Device):
             self.settings['num_datapoints'] = num_datapoints
 
         axis = self._axis_to_internal(self.settings['axis'])
-        ArrayType = c_double * self.settings['num_datapoints']
-        empty_wf = ArrayType()  # creates empty array for read data
+        self.invalidate_settings_cache(['x_pos', 'y_pos', 'z_pos'])    #the waveform moves the stage outside of update
+        if self._read_array is None or len(self._read_array) != self.settings['num_datapoints']:
+            self._read_array = (c_double * self.settings['num_datapoints'])()    #array for read data, reused while its length fits
+        empty_wf = self._read_array
         error = self._check_error(self.DLL.MCL_TriggerWaveformAcquisition(axis, c_uint(self.settings['num_datapoints']),byref(empty_wf), self.handle))
         return list(empty_wf)
 
@@ -435,6 +452,29 @@ class MCLNanoDrive(Device):
         if settings:
             self.update(settings)
 
+    def wait_for_position(self, x=None, y=None, z=None, tolerance=0.02, timeout=0.1, interval=1e-3):
+        """Wait until the given axes read back their target positions, e.g. after a move with update.
+
+        Args:
+            x (float, optional): X target position in micrometers
+            y (float, optional): Y target position in micrometers
+            z (float, optional): Z target position in micrometers
+            tolerance (float): Largest difference between position and target in micrometers
+            timeout (float): Maximum time to wait in seconds
+            interval (float): Time between position reads in seconds
+
+        Returns:
+            bool: True if all axes reached their targets, False if the timeout expired
+        """
+        targets = {key: value for key, value in (('x_pos', x), ('y_pos', y), ('z_pos', z)) if value is not None}
+        deadline = time.perf_counter() + timeout
+        while True:
+            if all(abs(self.read_probes(key) - value) <= tolerance for key, value in targets.items()):
+                return True
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(interval)
+
     def setup_load_waveform(self, axis, waveform):
         """Setup load waveform for specified axis.
         
@@ -609,6 +649,18 @@ class MCLNanoDrive(Device):
         else:
             raise KeyError
 
+    def _load_waveform_array(self, waveform):
+        '''
+        Returns the waveform as a ctypes array. The arrays of the last two waveforms are reused if the waveform is one of them.
+        '''
+        values = list(waveform)
+        for cached_values, array in self._load_arrays:
+            if cached_values == values:
+                return array
+        array = (c_double * len(values))(*values)
+        self._load_arrays = [(values, array)] + self._load_arrays[:1]
+        return array
+
     def _multiaxis_waveform(self, input_list, empty=False):
         '''
         Sets waveform as empty if input is 0 ie [[x_waveform], [0], [z_waveform]]
@@ -15,12 +15,14 @@
 
 from src.core import Device, Parameter
 from src.core.read_write_functions import get_config_value
+from src.core.ring_buffer import RingBuffer
 from PyQt5.QtCore import QThread
 import nidaqmx as ni
 from nidaqmx.constants import AcquisitionType, UnitsPreScaled, Edge, LineGrouping
 from nidaqmx.stream_writers import DigitalMultiChannelWriter, AnalogMultiChannelWriter,AnalogSingleChannelWriter
 from nidaqmx.stream_readers import CounterReader, AnalogMultiChannelReader,AnalogSingleChannelReader
 import numpy as np
+import threading
 import time
 
 #########################################################################################
@@ -459,13 +461,38 @@ class NIDAQ(Device):
         #data = np.zeros(task['num_samples_per_channel']) - 10
         data = np.zeros(task['sample_num']) -10
 
-        reader = CounterReader(task_handle_ctr.in_stream)
+        # the reader is created on the first read and reused, use stream_counter for continuous reads
+        reader = task.get('reader')
+        if reader is None:
+            reader = task['reader'] = CounterReader(task_handle_ctr.in_stream)
 
         samples_read = reader.read_many_sample_double(data,
                                                       number_of_samples_per_channel=task['sample_num'])
 
         return data, samples_read
 
+    def stream_counter(self, task_name, chunk=None, capacity=1 << 20, use_callbacks=True):
+        """
+        Streams a continuous counter task set up with setup_counter into a CounterStream, which holds the counts per
+        sample (not the running totals) in a ring buffer. Call it before run(task_name); stop(task_name) also closes
+        the stream.
+        Args:
+            task_name: name of a counter task set up with continuous_acquisition=True
+            chunk: number of samples per read, by default the samples of about 50 ms
+            capacity: number of counts the ring buffer holds
+            use_callbacks: read each chunk from an every-N-samples event of the driver, if the driver supports it
+        Returns:
+            CounterStream: the stream, read it with stream.consumer()
+        """
+        task = self.tasklist[task_name]
+        if 'task_handle_ctr' not in task:
+            raise ValueError('Only clocked counter tasks set up with setup_counter can be streamed')
+        if chunk is None:
+            chunk = max(1, int(task['sample_rate'] / 20))
+        stream = CounterStream(task['task_handle_ctr'], chunk, capacity=capacity, use_callbacks=use_callbacks)
+        task['stream'] = stream
+        return stream
+
     def setup_AO(self, channels, waveform, clk_source=""):
         """
         Initializes a arbitrary number of analog output channels to output an arbitrary waveform
@@ -761,6 +788,8 @@ class NIDAQ(Device):
 
         # special case counters, which create two tasks that need to be cleared
         if 'task_handle_ctr' in list(task.keys()):
+            if task.get('stream') is not None:
+                task['stream'].close()
             task_ctr = task['task_handle_ctr']
             task_ctr.stop()
             task_clk = task['task_handle']
@@ -919,6 +948,115 @@ class NIDAQ(Device):
         return device_list
 
 
+class CounterStream(RingBuffer):
+    """
+    Streams a continuous edge counting task into a ring buffer of counts per sample.
+
+    The DAQ returns running totals. Each chunk is differenced in one vectorised subtraction against the last total of
+    the previous chunk, in uint32 arithmetic so that a rollover of the 32 bit counter gives the right counts. One
+    CounterReader and one read buffer are reused for all reads. If the driver supports every-N-samples events, each
+    chunk is read in the driver callback as soon as it is acquired; otherwise poll() reads what has been acquired.
+    The first total only sets the baseline, since it includes the counts from before the first clock edge.
+
+    Usage:
+        task_name = daq.setup_counter('ctr0', 2, continuous_acquisition=True)
+        stream = daq.stream_counter(task_name)
+        consumer = stream.consumer()
+        daq.run(task_name)
+        while not done:
+            if not stream.callbacks:
+                stream.poll()
+            counts = consumer.read(timeout=0.1)
+        daq.stop(task_name)
+    """
+
+    def __init__(self, task, chunk, capacity=1 << 20, use_callbacks=True):
+        """
+        Args:
+            task: the nidaqmx counter input task
+            chunk: number of samples per read
+            capacity: number of counts the ring buffer holds
+            use_callbacks: read each chunk from an every-N-samples event, if the driver supports it
+        """
+        super().__init__(capacity, np.uint32)
+        self.task = task
+        self.chunk = int(chunk)
+        self.error = None
+        self._reader = CounterReader(task.in_stream)
+        self._raw = np.zeros(self.chunk, dtype=np.uint32)
+        self._counts = np.zeros(self.chunk, dtype=np.uint32)
+        # last running total read, None until the first sample
+        self._last = None
+        self._lock = threading.Lock()
+        self._open = True
+        # True if the driver calls back every chunk samples, otherwise poll() has to be called
+        self.callbacks = use_callbacks and self._register_callback()
+
+    @property
+    def running(self):
+        return self._open
+
+    def poll(self):
+        """
+        Reads the samples acquired so far, only needed without callbacks.
+        Returns:
+            int: number of counts added to the ring buffer
+        """
+        published = 0
+        available = self.task.in_stream.avail_samp_per_chan
+        while available > 0:
+            n = min(available, self.chunk)
+            published += self._read(n)
+            available -= n
+        return published
+
+    def close(self):
+        """reads the remaining samples and wakes up waiting consumers, the counter task has to be stopped after it"""
+        if not self._open:
+            return
+        try:
+            self.poll()
+        except ni.errors.DaqError as e:
+            self.error = e
+        self._open = False
+        self._notify()
+
+    def _register_callback(self):
+        # events can only be registered while the task is stopped, the counter still waits for the clock started by run
+        self.task.stop()
+        try:
+            self.task.register_every_n_samples_acquired_into_buffer_event(self.chunk, self._on_samples)
+            return True
+        except (ni.errors.DaqError, NotImplementedError):
+            return False
+        finally:
+            self.task.start()
+
+    def _on_samples(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        try:
+            self._read(number_of_samples)
+        except Exception as e:
+            self.error = e
+        return 0
+
+    def _read(self, n):
+        with self._lock:
+            n = self._reader.read_many_sample_uint32(self._raw[:n], number_of_samples_per_channel=n)
+            raw = self._raw[:n]
+            if n and self._last is None:
+                self._last = raw[:1].copy()
+                raw = raw[1:]
+            if len(raw) == 0:
+                return 0
+            counts = self._counts[:len(raw)]
+            # np.diff of the totals with the last total of the previous chunk prepended, without allocating
+            np.subtract(raw[:1], self._last, out=counts[:1])
+            np.subtract(raw[1:], raw[:-1], out=counts[1:])
+            self._last[0] = raw[-1]
+            self._write(counts)
+            return len(counts)
+
+
 def int_to_voltage(integer):
     """
     convert integer value to voltage
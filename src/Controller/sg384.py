@@ -81,6 +81,12 @@ class SG384Generator(MicrowaveGeneratorBase):
     
     INTERNAL_TO_SWEEP_FUNC = {v: k for k, v in SWEEP_FUNC_MAPPINGS.items()}
     
+    # probes that only change through update (or the front panel), see src/core/settings_cache.py
+    _STATIC_PROBES = ('enable_output', 'frequency', 'amplitude', 'amplitude_lo', 'power_lo', 'amplitude_rf',
+                      'power_rf', 'phase', 'enable_modulation', 'modulation_type', 'modulation_function',
+                      'pulse_modulation_function', 'dev_width', 'mod_rate', 'sweep_function', 'sweep_rate',
+                      'sweep_deviation')
+    
     # Update dispatch mapping
     UPDATE_MAPPING = {
         'frequency': 'set_frequency',
@@ -655,7 +661,15 @@ class SG384Generator(MicrowaveGeneratorBase):
         
         Note: SG384 automatically resets phase to 0° when frequency changes,
         so we must set frequency first, then other parameters, then phase last.
+        
+        The commands are sent as one batch; when the frequency changes the batch ends with *OPC?,
+        which returns once the frequency has settled.
         """
+        with self.batch(wait='frequency' in settings):
+            self._dispatch_settings(settings)
+    
+    def _dispatch_settings(self, settings: dict):
+        """Calls the setter of each setting, in the order described in _dispatch_update."""
         # Separate phase from other settings to set it last
         phase_value = None
         other_settings = {}
@@ -673,8 +687,7 @@ class SG384Generator(MicrowaveGeneratorBase):
                 method_name = self.UPDATE_MAPPING['frequency']
                 method = getattr(self, method_name)
                 method(freq_value)
-                print(f"🔧 Set frequency first: {freq_value/1e9:.3f} GHz (phase reset to 0°)")
-                time.sleep(0.1)  # Allow frequency to stabilize
+                logger.debug(f"Set frequency first: {freq_value/1e9:.3f} GHz (phase reset to 0°)")
         
         # Step 2: Set all other parameters (except phase)
         for key, value in other_settings.items():
@@ -696,7 +709,7 @@ class SG384Generator(MicrowaveGeneratorBase):
                 
                 # Call the appropriate method
                 method(value)
-                print(f"🔧 Set {key}: {value}")
+                logger.debug(f"Set {key}: {value}")
             else:
                 logger.warning(f"Unknown parameter for update: {key}")
         
@@ -706,7 +719,7 @@ class SG384Generator(MicrowaveGeneratorBase):
                 method_name = self.UPDATE_MAPPING['phase']
                 method = getattr(self, method_name)
                 method(phase_value)
-                print(f"🔧 Set phase last: {phase_value}° (after frequency stabilization)")
+                logger.debug(f"Set phase last: {phase_value}°")
             else:
                 logger.warning(f"Phase parameter not found in UPDATE_MAPPING")
     
@@ -817,9 +830,12 @@ class SG384Generator(MicrowaveGeneratorBase):
         """
         super().update(settings)
         
-        # Send commands if device is connected
-        if self.is_connected:
+        # Send commands if device is connected, an open socket saves the *IDN? round trip
+        if self.sock is not None or self.is_connected:
             self._dispatch_update(settings)
+        else:
+            # nothing reached the instrument, send these settings again next time
+            self.invalidate_settings_cache(settings.keys())
     
     @property
     def _PROBES(self):
@@ -941,47 +957,18 @@ class SG384Generator(MicrowaveGeneratorBase):
         """Check SG384 device state and any error conditions."""
         print(f"🔍 Checking SG384 device state...")
         
-        # Check for errors
-        try:
-            errors = self._query('ERR?')
-            print(f"🔍 Device errors: {errors}")
-        except Exception as e:
-            print(f"⚠️  Could not query errors: {e}")
-        
-        # Check output state
-        try:
-            output_state = self._query('ENBR?')
-            print(f"🔍 Output enabled: {output_state}")
-        except Exception as e:
-            print(f"⚠️  Could not query output state: {e}")
-        
-        # Check modulation state
+        checks = [('ERR?', 'Device errors'), ('ENBR?', 'Output enabled'), ('MODL?', 'Modulation enabled'),
+                  ('FREQ?', 'Current frequency'), ('AMPR?', 'Current amplitude'), ('PHAS?', 'Current phase')]
         try:
-            mod_state = self._query('MODL?')
-            print(f"🔍 Modulation enabled: {mod_state}")
+            # one round trip for all queries
+            responses = self._query_many([query for query, _ in checks])
         except Exception as e:
-            print(f"⚠️  Could not query modulation state: {e}")
+            print(f"⚠️  Could not query device state: {e}")
+            responses = None
         
-        # Check frequency
-        try:
-            freq = self._query('FREQ?')
-            print(f"🔍 Current frequency: {freq}")
-        except Exception as e:
-            print(f"⚠️  Could not query frequency: {e}")
-        
-        # Check amplitude
-        try:
-            amp = self._query('AMPR?')
-            print(f"🔍 Current amplitude: {amp}")
-        except Exception as e:
-            print(f"⚠️  Could not query amplitude: {e}")
-        
-        # Check phase
-        try:
-            phase = self._query('PHAS?')
-            print(f"🔍 Current phase: {phase}")
-        except Exception as e:
-            print(f"⚠️  Could not query phase: {e}")
+        if responses is not None:
+            for (_, label), response in zip(checks, responses):
+                print(f"🔍 {label}: {response}")
         
         print(f"🔍 Device state check complete.")
     
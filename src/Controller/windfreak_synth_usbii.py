@@ -13,6 +13,10 @@ class WindfreakSynthUSBII(MicrowaveGeneratorBase):
     Communicates over VISA (USB/RS232) using pyvisa.
     """
 
+    # the SynthUSBII takes one single letter command per line and has no *OPC?
+    COMMAND_SEPARATOR = None
+    OPC_QUERY = None
+
     _DEFAULT_SETTINGS = Parameter([
         # Base settings from MicrowaveGeneratorBase
         Parameter('connection_type', 'LAN', ['LAN','GPIB','RS232'], 'Transport type'),
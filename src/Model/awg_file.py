@@ -23,16 +23,21 @@ SEQ files (.seq):
       * STROBE <0|1>\r\n
 """
 import logging
-import struct
 import time
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 
 # Maximum number of samples per waveform (hardware limit)
 _WFM_MEMORY_LIMIT = 4_000_000  # 4M words as per AWG520 specification
 
+# one WFM sample: 4-byte little-endian float (analog) + 1-byte marker, packed without padding
+_WFM_RECORD = np.dtype([("analog", "<f4"), ("marker", "u1")])
+
+# number of samples converted at a time by the streaming writer
+_WFM_CHUNK_SAMPLES = 1 << 20
+
 logger = logging.getLogger("awg_file")
 
 
@@ -98,6 +103,32 @@ class AWGFile:
         except KeyError:
             raise ValueError(f"Unsupported timeres_ns: {self.timeres_ns}")
 
+    @staticmethod
+    def _padded_length(n: int) -> int:
+        """waveform length padded to a multiple of 4 samples"""
+        return n + (-n) % 4
+
+    def _make_record_array(self, iq: np.ndarray, m: np.ndarray) -> np.ndarray:
+        """
+        Build the WFM records of a waveform as a packed structured array.
+
+        Args:
+          iq:  1D float array of analog values in [-1.0,1.0]
+          m:   1D int array of marker bits (0 or 1)
+
+        Returns:
+          array of dtype _WFM_RECORD, zero-padded to a multiple of 4 samples
+        """
+        n = len(iq)
+        n_padded = self._padded_length(n)
+        if n_padded >= _WFM_MEMORY_LIMIT:
+            raise ValueError("Waveform memory limit exceeded")
+
+        records = np.zeros(n_padded, dtype=_WFM_RECORD)
+        records["analog"][:n] = iq
+        records["marker"][:n] = m
+        return records
+
     def _make_binary_record(
         self, iq: np.ndarray, m: np.ndarray
     ) -> Tuple[int, int, bytes]:
@@ -113,26 +144,8 @@ class AWGFile:
           record_size:   bytes per sample (always struct.calcsize('<fb'))
           record_bytes:  concatenated binary samples
         """
-        n = len(iq)
-        # pad waveform length to multiple of 4 samples
-        if n % 4:
-            pad = 4 - (n % 4)
-            iq = np.concatenate([iq, np.zeros(pad, dtype=iq.dtype)])
-            m  = np.concatenate([m,  np.zeros(pad, dtype=m.dtype)])
-            n += pad
-
-        if n >= _WFM_MEMORY_LIMIT:
-            raise ValueError("Waveform memory limit exceeded")
-
-        rec_size = struct.calcsize("<fb")  # 4-byte float + 1-byte marker
-        total_bytes = n * rec_size
-
-        buf = bytearray(total_bytes)
-        for i in range(n):
-            # analog I/Q data converted to 4 byte float, marker to 1 byte , both little-endian
-            struct.pack_into('<fb', buf, i*rec_size, float(iq[i]), int(m[i]))
-
-        return total_bytes, rec_size, bytes(buf)
+        records = self._make_record_array(iq, m)
+        return records.nbytes, _WFM_RECORD.itemsize, records.tobytes()
 
     def write_waveform(
         self,
@@ -145,7 +158,7 @@ class AWGFile:
         Write a single .wfm file containing analog+marker data.
 
         Args:
-          iq:      analog samples array
+          iq:      analog samples array (anything that can be sliced, e.g. a np.memmap)
           marker:  marker bits array
           name:    base filename (no extension)
           channel: channel index (1 or 2)
@@ -153,18 +166,66 @@ class AWGFile:
         Returns:
           Path to the written .wfm file
         """
+        n = len(iq)
+        chunks = (
+            (iq[start:start + _WFM_CHUNK_SAMPLES], marker[start:start + _WFM_CHUNK_SAMPLES])
+            for start in range(0, n, _WFM_CHUNK_SAMPLES)
+        )
+        return self.write_waveform_stream(chunks, n, name, channel)
+
+    def write_waveform_stream(
+        self,
+        chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+        n_samples: int,
+        name: str,
+        channel: int = 1,
+    ) -> Path:
+        """
+        Write a .wfm file from consecutive chunks of analog+marker data, so
+        that the waveform never has to be in memory as a whole.
+
+        Args:
+          chunks:    iterable of (iq, marker) array pairs
+          n_samples: total number of samples in all chunks, needed up front
+                     for the length prefix
+          name:      base filename (no extension)
+          channel:   channel index (1 or 2)
+
+        Returns:
+          Path to the written .wfm file
+        """
+        n_padded = self._padded_length(n_samples)
+        if n_padded >= _WFM_MEMORY_LIMIT:
+            raise ValueError("Waveform memory limit exceeded")
+        nbytes = n_padded * _WFM_RECORD.itemsize
+
         fname = f"{name}_{channel}.wfm"
         out = self.out_dir / fname
 
         logger.info(f"Writing waveform '{out.name}'")
-        with open(out, 'wb') as f:
-            f.write(self._wfm_header)
-            nbytes, _, payload = self._make_binary_record(iq, marker)
-            # write length prefix '#<ndigits><nbytes>'
-            prefix = f"#{len(str(nbytes))}{nbytes}".encode()
-            f.write(prefix)
-            f.write(payload)
-            f.write(self._make_trailer())
+        try:
+            with open(out, 'wb') as f:
+                f.write(self._wfm_header)
+                # write length prefix '#<ndigits><nbytes>'
+                prefix = f"#{len(str(nbytes))}{nbytes}".encode()
+                f.write(prefix)
+                written = 0
+                for iq, m in chunks:
+                    records = np.empty(len(iq), dtype=_WFM_RECORD)
+                    records["analog"] = iq
+                    records["marker"] = m
+                    written += len(records)
+                    if written > n_samples:
+                        raise ValueError(f"Chunks hold more than {n_samples} samples")
+                    f.write(records.tobytes())
+                if written != n_samples:
+                    raise ValueError(f"Chunks hold {written} samples, expected {n_samples}")
+                # pad waveform length to multiple of 4 samples
+                f.write(np.zeros(n_padded - n_samples, dtype=_WFM_RECORD).tobytes())
+                f.write(self._make_trailer())
+        except Exception:
+            out.unlink(missing_ok=True)
+            raise
 
         return out
 
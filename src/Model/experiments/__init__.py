@@ -29,6 +29,7 @@ if sys.platform.startswith('win'):
     from .nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
     from .nanodrive_adwin_confocal_scan_slow import NanodriveAdwinConfocalScanSlow
     from .nanodrive_adwin_confocal_point import NanodriveAdwinConfocalPoint
+    from .nanodrive_adwin_confocal_mosaic import NanodriveAdwinConfocalMosaicFast, NanodriveAdwinConfocalMosaicSlow
 else:
     # On non-Windows platforms, create placeholder imports to avoid import errors
     Pxi6733ReadCounter = None
@@ -43,6 +44,8 @@ else:
     NanodriveAdwinConfocalScanFast = None
     NanodriveAdwinConfocalScanSlow = None
     NanodriveAdwinConfocalPoint = None
+    NanodriveAdwinConfocalMosaicFast = None
+    NanodriveAdwinConfocalMosaicSlow = None
 
 from .deprecated.odmr_experiment import ODMRExperiment, ODMRRabiExperiment
 from .deprecated.odmr_enhanced import EnhancedODMRExperiment
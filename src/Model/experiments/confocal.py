@@ -202,6 +202,7 @@ class ConfocalScan_Fast(Experiment):
         #print(len_wf,wf)
         load_read_ratio = self.settings['time_per_pt']/2.0 #used for scaling when rates are different
         num_points_read = int(load_read_ratio*len_wf + 20) #20 is added to compensate for start warm up producing ~15 points of unwanted values
+        counts_buffer = np.empty(len_wf+20, dtype=np.int32) #reused for the count data of every line
 
         #set inital x and y and set nanodrive stage to that position
         self.nd.update({'x_pos':x_min,'y_pos':y_min-5.0,'num_datapoints':len_wf,'read_rate':2.0,'load_rate':self.settings['time_per_pt']})
@@ -266,9 +267,9 @@ class ConfocalScan_Fast(Experiment):
                 index_diff = index_diff + 1
 
             # get count data from adwin and record it
-            raw_counts = np.array(list(self.adw.read_probes('int_array', id=1, length=len_wf+20)))
+            raw_counts = self.adw.get_int_data_np(1, len_wf+20, out=counts_buffer)
             # units of count/seconds
-            count_rate = list(np.array(raw_counts) * 1e3 / self.settings['time_per_pt'])
+            count_rate = list(raw_counts * 1e3 / self.settings['time_per_pt'])
 
             crop_index = -index_mode - 1 - index_diff
             if self.settings['time_per_pt'] == 5.0:
@@ -77,61 +77,50 @@ If you want to use it make sure that the right device is defined in _DEVICES = {
         #print("counter chan is", counter_chan)
         counter_chan['sample_rate'] = sample_rate
         self.data = {'counts': deque(), 'laser_power': deque(), 'normalized_counts': deque(), 'laser_power2': deque()}
-        self.last_value = 0
         sample_num = 2
 
         task = dev_instance.setup_counter(self.settings['counter_channel'], sample_num, continuous_acquisition=True,use_external_clock=False)
 
+        # the stream differences the running totals of the counter, its first sample only sets the baseline
+        stream = dev_instance.stream_counter(task)
+        consumer = stream.consumer()
 
         # maximum number of samples if total_int_time > 0
         if self.settings['total_int_time'] > 0:
             max_samples = np.floor(self.settings['total_int_time']/self.settings['integration_time'])
 
-
-
         dev_instance.run(task)
 
-        # GD 20230803 wait for at least one clock tick to go by to start with a full clock tick of acquisition time for the first bin
-        time.sleep(self.settings['integration_time'])
-
         sample_index = 0 # keep track of samples made to know when to stop if finite integration time
 
-        while True:
-            if self._abort:
-                break
-
-
-
-            raw_data, num_read = dev_instance.read(task)
-
-            #skip first read, which gives an anomolous value
-            if num_read == 1:
-                self.last_value = raw_data[0] #update running value to last measured value to prevent count spikes
-                time.sleep(2.0 / sample_rate)
-                continue
-
-            tmp_count = 0
-            for value in raw_data:
-                new_val = ((float(value) - self.last_value) / normalization)
-                self.data['counts'].append(new_val)
-                self.last_value = value
-
-
-                tmp_count = tmp_count + 1
-
-            if self.settings['total_int_time'] > 0:
-                self.progress = sample_index/max_samples
-            else:
-                self.progress = 50.
-            self.updateProgress.emit(int(self.progress))
-
-            time.sleep(2.0 / sample_rate)
-            sample_index = sample_index + 1
-            if self.settings['total_int_time'] > 0. and sample_index >= max_samples: # if the maximum integration time is hit
-                self._abort = True # tell the experiment to abort
-
-        # clean up APD tasks
-        dev_instance.stop(task)
+        try:
+            while True:
+                if self._abort:
+                    break
+
+                if not stream.callbacks:
+                    stream.poll()
+                counts = consumer.read(timeout=self.settings['integration_time'])
+                if stream.error is not None:
+                    raise stream.error
+                if len(counts) == 0:
+                    continue
+                if self.settings['total_int_time'] > 0:
+                    counts = counts[:int(max_samples - sample_index)]
+                self.data['counts'].extend((counts / normalization).tolist())
+                sample_index = sample_index + len(counts)
+
+                if self.settings['total_int_time'] > 0:
+                    self.progress = 100. * sample_index/max_samples
+                else:
+                    self.progress = 50.
+                self.updateProgress.emit(int(self.progress))
+
+                if self.settings['total_int_time'] > 0. and sample_index >= max_samples: # if the maximum integration time is hit
+                    self._abort = True # tell the experiment to abort
+        finally:
+            # clean up APD tasks
+            dev_instance.stop(task)
 
 
         self.data['counts'] = list(self.data['counts'])
@@ -0,0 +1,233 @@
+'''
+Nanodrive ADwin Confocal Mosaic Module
+
+This module scans a large area as a mosaic of overlapping tiles, each a NanodriveAdwinConfocalScanFast (or Slow)
+scan. The tiles are stitched by the offset measured in their overlap and written into a TiledImage, a chunked HDF5
+file with a downsampled pyramid for display, so the RAM used stays within memory_budget however many tiles the
+mosaic has.
+'''
+
+import numpy as np
+import pyqtgraph as pg
+
+from src.core import Parameter, Experiment
+from src.core.tiled_image import TiledImage, overlap_offset
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+from src.Model.experiments.nanodrive_adwin_confocal_scan_slow import NanodriveAdwinConfocalScanSlow
+
+
+class NanodriveAdwinConfocalMosaicFast(Experiment):
+    '''
+    Mosaic of fast confocal scans using MCL NanoDrive and ADwin Gold II.
+
+    The area from point_a to point_b is divided into square tiles of tile_size that overlap by overlap. Each tile is
+    scanned by the sub experiment, its count image is shifted by the stitching offset measured against the tiles
+    already in the mosaic (at most max_shift pixels more than theirs) and written to the mosaic file. Only one tile and the HDF5 chunk
+    cache are held in memory; data['count_img'] is a pyramid level of at most preview_size pixels.
+
+    There is no coarse stage in this setup, so the mosaic is limited to the 0-100 um Nanodrive range.
+    '''
+
+    _DEFAULT_SETTINGS = [
+        Parameter('point_a',
+                  [Parameter('x',5.0,float,'x-coordinate start in microns'),
+                   Parameter('y',5.0,float,'y-coordinate start in microns')
+                   ]),
+        Parameter('point_b',
+                  [Parameter('x',95.0,float,'x-coordinate end in microns'),
+                   Parameter('y', 95.0, float, 'y-coordinate end in microns')
+                   ]),
+        Parameter('resolution', 1.0, [2.0,1.0,0.5,0.25,0.1,0.05,0.025,0.001], 'Resolution of each pixel in microns, passed to the tile scans'),
+        Parameter('tile_size', 20.0, float, 'Edge of a square tile in microns'),
+        Parameter('overlap', 2.0, float, 'Microns neighbouring tiles overlap; used to measure the stitching offsets'),
+        Parameter('max_shift', 3, int, 'Largest stitching offset between neighbouring tiles in pixels, 0 places the tiles at their nominal position'),
+        Parameter('pyramid_levels', 4, int, 'Number of 2x downsampled levels of the mosaic for display'),
+        Parameter('preview_size', 512, int, 'Largest side in pixels of the mosaic level shown while scanning'),
+        Parameter('memory_budget', 256.0, float, 'MB of RAM for the mosaic: one tile scan and the HDF5 chunk cache')
+    ]
+
+    _DEVICES = {}
+    _EXPERIMENTS = {'scan': NanodriveAdwinConfocalScanFast}
+
+    # bytes per pixel a tile scan holds in memory (count and raw images, data lists), used for the memory budget
+    _TILE_BYTES_PER_PIXEL = 64
+
+    def __init__(self, devices=None, experiments=None, name=None, settings=None, log_function=None, data_path=None):
+        """
+        Args:
+            experiments: {'scan': tile scan experiment}
+            name (optional): name of experiment, if empty same as class name
+            settings (optional): settings for this experiment, if empty same as default settings
+        """
+        super().__init__(name, settings=settings, sub_experiments=experiments, devices=devices, log_function=log_function, data_path=data_path)
+        self.mosaic = None
+
+    def _scan_limits(self):
+        '''
+        Returns the x_min, x_max, y_min, y_max in microns the tile scan can image
+        '''
+        scan = self.experiments['scan']
+        if isinstance(scan, NanodriveAdwinConfocalScanFast):
+            # the fast scan keeps its y overscan inside the Nanodrive range
+            overscan = scan.settings['overscan'] if scan.settings['binning'] == 'position' else 5.0
+            return 0.0, 100.0, overscan, 100.0 - overscan
+        return 0.0, 100.0, 0.0, 100.0
+
+    def _tile_grid(self):
+        '''
+        Returns the mosaic origin (x, y) in microns, the mosaic shape in pixels, the tile shape in pixels and the pixel
+        origins of the tiles along x and y. The last tile of a row or column is aligned with the end of the mosaic.
+        '''
+        step = self.settings['resolution']
+        x_lo, x_hi, y_lo, y_hi = self._scan_limits()
+        x_min = max(self.settings['point_a']['x'], x_lo)
+        y_min = max(self.settings['point_a']['y'], y_lo)
+        x_max = min(self.settings['point_b']['x'], x_hi)
+        y_max = min(self.settings['point_b']['y'], y_hi)
+        shape = (int(round((x_max - x_min) / step)) + 1, int(round((y_max - y_min) / step)) + 1)
+        if min(shape) < 1:
+            raise ValueError('point_b has to be above and to the right of point_a')
+        tile_pixels = int(round(self.settings['tile_size'] / step)) + 1
+        stride = tile_pixels - int(round(self.settings['overlap'] / step))
+        if stride < 1:
+            raise ValueError('overlap has to be smaller than tile_size')
+        tile_shape = (min(tile_pixels, shape[0]), min(tile_pixels, shape[1]))
+        origins = []
+        for n, tile in zip(shape, tile_shape):
+            count = max(int(np.ceil((n - tile) / stride)), 0) + 1
+            origins.append([min(k * stride, n - tile) for k in range(count)])
+        return (x_min, y_min), shape, tile_shape, origins
+
+    def _stitch_offset(self, tile, nominal, neighbours):
+        '''
+        Returns the (rows, cols) offset from its nominal origin that registers tile to the mosaic. The tile is first
+        moved by the mean offset of its neighbours (drift carries over from tile to tile), then by the mean of the
+        offsets measured in its overlap with each neighbour, at most max_shift pixels.
+        Args:
+            tile: count image of the tile
+            nominal: nominal (row, col) origin of the tile in the mosaic
+            neighbours: (origin, offset) of the tiles next to it already in the mosaic
+        '''
+        max_shift = self.settings['max_shift']
+        if not neighbours:
+            return 0, 0
+        prior = tuple(int(round(value)) for value in np.mean([offset for _, offset in neighbours], axis=0))
+        origin = (nominal[0] + prior[0], nominal[1] + prior[1])
+        measured = []
+        if max_shift > 0:
+            for neighbour, _ in neighbours:
+                # overlap of the tile with its neighbour, within the mosaic
+                r0, c0 = max(origin[0], neighbour[0], 0), max(origin[1], neighbour[1], 0)
+                r1 = min(min(origin[0], neighbour[0]) + tile.shape[0], self.mosaic.shape[0])
+                c1 = min(min(origin[1], neighbour[1]) + tile.shape[1], self.mosaic.shape[1])
+                # an overlap narrower than the shifts searched does not say anything about them
+                if min(r1 - r0, c1 - c0) <= 2 * max_shift:
+                    continue
+                reference = self.mosaic.read((r0, c0, r1 - r0, c1 - c0))
+                moving = tile[r0 - origin[0]:r1 - origin[0], c0 - origin[1]:c1 - origin[1]]
+                offset = overlap_offset(reference, moving, max_shift)
+                if offset is not None:
+                    measured.append(offset)
+        if measured:
+            prior = tuple(p + int(round(value)) for p, value in zip(prior, np.mean(measured, axis=0)))
+        return prior
+
+    def _function(self):
+        """
+        This is the actual function that will be executed. It uses only information that is provided in the settings property
+        will be overwritten in the __init__
+        """
+        scan = self.experiments['scan']
+        step = self.settings['resolution']
+        (x_min, y_min), shape, tile_shape, (rows, cols) = self._tile_grid()
+
+        memory_budget = self.settings['memory_budget'] * 2**20
+        tile_bytes = tile_shape[0] * tile_shape[1] * self._TILE_BYTES_PER_PIXEL
+        if tile_bytes > memory_budget / 2:
+            raise ValueError(f'a tile scan needs about {tile_bytes / 2**20:.0f} MB, more than half the memory budget; '
+                             f'use smaller tiles or a larger memory_budget')
+
+        self.data['tile_origins'] = np.zeros((len(rows) * len(cols), 2), dtype=int)
+        self.data['tile_offsets'] = np.zeros((len(rows) * len(cols), 2), dtype=int)
+        self.data['mosaic_file'] = self.filename('-mosaic.h5', create_if_not_existing=True)
+        self.mosaic = TiledImage(self.check_filename(self.data['mosaic_file']), shape,
+                                 chunk_shape=tile_shape, levels=self.settings['pyramid_levels'],
+                                 cache_bytes=memory_budget - tile_bytes)
+        self.mosaic.write_attrs(x_min=x_min, y_min=y_min, resolution=step,
+                                tile_size=self.settings['tile_size'], overlap=self.settings['overlap'])
+        preview = self.mosaic.preview_level(self.settings['preview_size'])
+        self.data['preview_level'] = preview
+        self.data['count_img'] = self.mosaic.level(preview)
+
+        placed = {}     # (i, j): origin and offset of the tiles in the mosaic
+        n = 0
+        try:
+            for i, row in enumerate(rows):
+                for j, col in enumerate(cols):
+                    if self._abort:
+                        break
+                    x0 = x_min + row * step
+                    y0 = y_min + col * step
+                    scan.settings.update({'point_a': {'x': float(x0), 'y': float(y0)},
+                                          'point_b': {'x': float(x0 + (tile_shape[0] - 1) * step),
+                                                      'y': float(y0 + (tile_shape[1] - 1) * step)},
+                                          'resolution': step})
+                    scan.run()
+                    # the tile scan may include a pixel more (np.arange) or fewer (clipped lines) than nominal
+                    tile = np.asarray(scan.data['count_img'], dtype=np.float32)[:tile_shape[0], :tile_shape[1]]
+
+                    neighbours = [placed[key] for key in ((i, j - 1), (i - 1, j)) if key in placed]
+                    offset = self._stitch_offset(tile, (row, col), neighbours)
+                    origin = (row + offset[0], col + offset[1])
+                    self.mosaic.write_tile(origin, tile)
+                    placed[(i, j)] = (origin, offset)
+                    self.data['tile_origins'][n] = origin
+                    self.data['tile_offsets'][n] = offset
+                    n += 1
+
+                    self.data['count_img'] = self.mosaic.level(preview)
+                    self.progress = 100. * n / len(self.data['tile_origins'])
+                    self.updateProgress.emit(int(self.progress))
+            self.data['tile_origins'] = self.data['tile_origins'][:n]
+            self.data['tile_offsets'] = self.data['tile_offsets'][:n]
+            self.mosaic.write_dataset('tile_origins', self.data['tile_origins'])
+            self.mosaic.write_dataset('tile_offsets', self.data['tile_offsets'])
+        finally:
+            self.mosaic.close()
+
+    def _plot(self, axes_list, data=None):
+        '''
+        Plots the displayed pyramid level of the mosaic over the scanned area
+        '''
+        if data is None:
+            data = self.data
+        if 'count_img' not in data:
+            return
+        image = np.nan_to_num(data['count_img'])
+        written = image[image > 0]
+        levels = [np.min(written), np.max(written)] if written.size > 0 else [0, 1]
+        extent = [self.settings['point_a']['x'], self.settings['point_b']['x'], self.settings['point_a']['y'],self.settings['point_b']['y']]
+        if self._plot_refresh:
+            axes_list[0].clear()
+            self.count_image = pg.ImageItem(image, interpolation='nearest')
+            self.count_image.setLevels(levels)
+            self.count_image.setRect(pg.QtCore.QRectF(extent[0], extent[2], extent[1] - extent[0], extent[3] - extent[2]))
+            axes_list[0].addItem(self.count_image)
+            axes_list[0].setAspectLocked(True)
+            axes_list[0].setLabel('left', 'y (µm)')
+            axes_list[0].setLabel('bottom', 'x (µm)')
+            axes_list[0].setTitle('Confocal Mosaic')
+        else:
+            self.count_image.setImage(image, autoLevels=False)
+            self.count_image.setLevels(levels)
+
+    def _update(self, axes_list):
+        self._plot(axes_list)
+
+
+class NanodriveAdwinConfocalMosaicSlow(NanodriveAdwinConfocalMosaicFast):
+    '''
+    Mosaic of slow (point by point) confocal scans, see NanodriveAdwinConfocalMosaicFast.
+    '''
+
+    _EXPERIMENTS = {'scan': NanodriveAdwinConfocalScanSlow}
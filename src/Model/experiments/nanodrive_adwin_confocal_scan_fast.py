@@ -10,6 +10,7 @@ The fast method uses pre-loaded waveforms and compensates for warm-up/cool-down
 movements to achieve accurate positioning while maintaining high scan rates.
 '''
 
+import time
 import numpy as np
 from pyqtgraph.exporters import ImageExporter
 from pathlib import Path
@@ -17,7 +18,8 @@ from pathlib import Path
 from src.core import Parameter, Experiment
 from src.core.helper_functions import get_configured_confocal_scans_folder
 from src.core.adwin_helpers import get_adwin_binary_path
-from time import sleep
+from src.core import tracing
+from src.core.tracing import sleep  # time.sleep that shows up as a span when tracing is on
 import pyqtgraph as pg
 
 
@@ -34,7 +36,17 @@ class NanodriveAdwinConfocalScanFast(Experiment):
 
     To get accurate counts, the loaded waveforms are extended to compensate for 
     'warm up' and 'cool down' movements. The data arrays are then manipulated 
-    to get the counts for the inputed region.
+    to get the counts for the inputed region: by default with the calibrated
+    crop offsets for 2 or 5 ms; binning 'position' places the counts on the
+    pixels with the stage positions recorded by the read waveform, which works
+    for any time_per_pt and overscan once read_delay is measured.
+
+    With z_stack enabled the scan steps z from z_min to z_max in one run,
+    reusing the waveforms and counter set up for the first plane. Every
+    finished plane is appended to a (z, x, y) dataset chunked by planes in
+    the HDF5 file of the experiment (data['stack_file']), and only the
+    current plane and the max intensity projection (data['mip']), which is
+    displayed, are kept in memory.
 
     Hardware Dependencies:
     - MCL NanoDrive: For precise sample stage positioning
@@ -53,14 +65,26 @@ class NanodriveAdwinConfocalScanFast(Experiment):
                    ]),
         Parameter('z_pos',50.0,float,'z position of nanodrive; useful for z-axis sweeps to find NVs'),
         Parameter('resolution', 1.0, [2.0,1.0,0.5,0.25,0.1,0.05,0.025,0.001], 'Resolution of each pixel in microns. Limited to give '),
-        Parameter('time_per_pt', 2.0, [2.0,5.0], 'Time in ms at each point to get counts; same as load_rate for nanodrive. Wroking values 2 or 5 ms'),
+        Parameter('time_per_pt', 2.0, float, 'Time in ms at each point to get counts; same as load_rate for nanodrive up to 5 ms. Crop binning only works with 2 or 5 ms'),
         Parameter('ending_behavior', 'return_to_origin', ['return_to_inital_pos', 'return_to_origin', 'leave_at_corner'],'Nanodrive position after scan'),
         Parameter('3D_scan',#using experiment iterator to sweep z-position can give an effective 3D scan as successive images. Useful for finding where NVs are in focal plane
                   [Parameter('enable',False,bool,'T/F to enable 3D scan'),
                          Parameter('folderpath','',str,'folder location to save images at each z-value')]),
+        Parameter('z_stack',#native 3D scan: all planes in one experiment, without the iterator and the image per z-value
+                  [Parameter('enable',False,bool,'Scan a plane at every z from z_min to z_max and stream the (z, x, y) stack to an HDF5 file'),
+                   Parameter('z_min',45.0,float,'z position of the first plane in microns'),
+                   Parameter('z_max',55.0,float,'z position of the last plane in microns'),
+                   Parameter('z_step',1.0,float,'Microns between planes')]),
         #!!! If you see horizontial lines in the confocal image, the adwin arrays likely are corrupted. The fix is to reboot the adwin. You will nuke all
         #other process, variables, and arrays in the adwin. This parameter is added to make that easy to do in the GUI.
         Parameter('reboot_adwin',False,bool,'Will reboot adwin when experiment is executed. Useful is data looks fishy'),
+        Parameter('stream_data',False,bool,'Write every finished line to an HDF5 file while scanning so large scans survive a crash'),
+        Parameter('trace',False,bool,'Record timing spans of the scan (sleeps, device calls, saving) to a -trace.json file and the log'),
+        Parameter('pipelined',True,bool,'Move the stage to the next line and set up its waveform while the counts of the last line are read and cropped'),
+        Parameter('serpentine',False,bool,'Scan odd lines from y_max down to y_min instead of returning the stage to y_min before every line'),
+        Parameter('binning','crop',['position','crop'],'crop: calibrated crop offsets for 2 or 5 ms; position: bin counts to pixels by the recorded stage positions, any time_per_pt once read_delay is set'),
+        Parameter('overscan',5.0,float,'Microns scanned before and after each line while the stage gets up to speed (position binning; crop always uses 5)'),
+        Parameter('read_delay',0.0,float,'ms between triggering the waveform acquisition and its first position reading; calibrates position binning'),
         Parameter('cropping', #nested cause it does not need changed often
                   [Parameter('crop_data',True,bool,'Current logic scans over a larger area then crops data to requested size. Added for ease of seeing full image')]),
         #clocks currently not implemented
@@ -74,6 +98,9 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         'adwin': 'adwin'
     }
     _EXPERIMENTS = {}
+    # ms the stage can take to start the waveform after the trigger (~15 read points at 2 ms were seen), recorded
+    # by the read waveform and the counter on top of the waveform itself
+    _WARM_UP = 40.0
 
     def __init__(self, devices, experiments=None, name=None, settings=None, log_function=None, data_path=None):
         """
@@ -92,8 +119,7 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         '''
         Gets paths for adbasic file and loads them onto ADwin.
         '''
-        self.adw.stop_process(2)
-        sleep(0.1)
+        self.stop_counter()
         self.adw.clear_process(2)
         
         # Use the helper function to find the binary file
@@ -118,14 +144,23 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         Cleans up adwin and moves nanodrive to specified position
         '''
         # clearing process to aviod memory fragmentation when running different experiments in GUI
-        self.adw.stop_process(2)    #neccesary if process is does not stop for some reason
-        sleep(0.1)
+        self.stop_counter()    #neccesary if process is does not stop for some reason
         self.adw.clear_process(2)
+        self.close_data_stream()
         if self.settings['ending_behavior'] == 'return_to_inital_pos':
             self.nd.update({'x_pos': self.x_inital, 'y_pos': self.y_inital})
         elif self.settings['ending_behavior'] == 'return_to_origin':
             self.nd.update({'x_pos': 0.0, 'y_pos': 0.0})
 
+    def stop_counter(self, timeout=0.1):
+        '''
+        Stops the counter process and waits until the ADwin reports it stopped, at most timeout seconds
+        '''
+        self.adw.stop_process(2)
+        deadline = time.perf_counter() + timeout
+        while self.adw.get_process_status(2) != 'Not running' and time.perf_counter() < deadline:
+            sleep(1e-3)
+
     def _function(self):
         """
         This is the actual function that will be executed. It uses only information that is provided in the settings property
@@ -138,13 +173,18 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         if self.settings['reboot_adwin'] == True:
             self.adw.reboot_adwin()
         self.setup_scan()
-        sleep(0.1)
 
-        #y scanning range is 5 to 95 to compensate for warm up time
+        time_per_pt = self.settings['time_per_pt']
+        position_binning = self.settings['binning'] == 'position'
+        if not position_binning and time_per_pt not in (2.0, 5.0):
+            raise ValueError(f'crop binning is calibrated for time_per_pt 2 or 5 ms, not {time_per_pt}; use position binning')
+        overscan = self.settings['overscan'] if position_binning else 5.0
+
+        #y scanning range leaves the overscan (5 um for cropping) to compensate for warm up time
         x_min = max(self.settings['point_a']['x'], 0.0)
-        y_min = max(self.settings['point_a']['y'], 5.0)
+        y_min = max(self.settings['point_a']['y'], overscan)
         x_max = min(self.settings['point_b']['x'], 100.0)
-        y_max = min(self.settings['point_b']['y'], 95.0)
+        y_max = min(self.settings['point_b']['y'], 100.0 - overscan)
 
         step = self.settings['resolution']
         num_points = (y_max - y_min) / step + 1
@@ -157,16 +197,36 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         x_array = np.arange(x_min, x_max + step, step)
         y_array = np.arange(y_min, y_max+step, step)
 
-        #adds point 5 um before and after
-        y_before = np.arange(y_min-5.0,y_min,step)
-        y_after = np.arange(y_max + step, y_max + 5.0 + step, step)
-        y_array_adj = np.insert(y_array, 0, y_before)
-        y_array_adj = np.append(y_array_adj, y_after)
+        if position_binning:
+            wf, load_rate = self._line_waveform(y_array, step, overscan, time_per_pt)
+            len_wf = len(wf)
+            #the read waveform and the counter record the whole waveform plus the warm up
+            line_time = len_wf*load_rate + self._WARM_UP
+            num_points_read = int(np.ceil(line_time/2.0)) + 1
+            num_counts = int(np.ceil(line_time/time_per_pt)) + 1
+        else:
+            #adds point 5 um before and after
+            y_before = np.arange(y_min-5.0,y_min,step)
+            y_after = np.arange(y_max + step, y_max + 5.0 + step, step)
+            y_array_adj = np.insert(y_array, 0, y_before)
+            y_array_adj = np.append(y_array_adj, y_after)
+            wf = y_array_adj.tolist()
+            len_wf = len(y_array_adj)
+            load_rate = time_per_pt
+            num_points_read = int(time_per_pt/2.0*len_wf + 20) #20 is added to compensate for start warm up producing ~15 points of unwanted values
+            num_counts = len_wf + 20
+        if len_wf > 6666 or num_points_read > 6666:
+            raise ValueError(f'a line needs {max(len_wf, num_points_read)} waveform points, the Nanodrive holds 6666; use a coarser resolution or shorter time_per_pt')
+        if num_counts > 999:
+            raise ValueError(f'a line needs {num_counts} counter points, One_D_Scan stores 999; use a coarser resolution or longer time_per_pt')
 
         self.x_inital = self.nd.read_probes('x_pos')
         self.y_inital = self.nd.read_probes('y_pos')
         self.z_inital = self.nd.read_probes('z_pos')
         self.settings['z_pos'] = self.z_inital
+        z_stack = self.settings['z_stack']['enable']
+        #a single plane at the current z unless a z stack is scanned
+        z_values = self._z_values() if z_stack else [None]
 
         #makes sure data is getting recorded. If still equal none after running experiment data is not being stored or not measured
         self.data['x_pos'] = None
@@ -175,123 +235,158 @@ class NanodriveAdwinConfocalScanFast(Experiment):
         self.data['count_rate'] = None
         self.data['count_img'] = None
         self.data['raw_img'] = None
-        #local lists to store data and append to global self.data lists
-        x_data = []
-        y_data = []
-        raw_count_data = []
-        count_rate_data = []
-        index_list = []
+        self.line_shifts = []   #kept across the planes of a z stack, the line offset does not depend on z
 
         # set data to zero and update to plot while experiment runs
         Nx = len(x_array)
         Ny = len(y_array)
         self.data['count_img'] = np.zeros((Nx, Ny))
-        self.data['raw_img'] = np.zeros((Nx, len(y_array_adj)+20))
+        self.data['raw_img'] = np.zeros((Nx, num_counts))
+        if z_stack:
+            #only the projection of the planes is kept in memory, the planes are streamed to the stack file
+            self.data['mip'] = np.zeros((Nx, Ny))
+            self.data['z_values'] = []
+            finished_mip = np.zeros((Nx, Ny))   #projection of the finished planes
 
         interation_num = 0 #number to track progress
-        total_interations = ((x_max - x_min)/step + 1)*((y_max - y_min)/step + 1)       #plus 1 because in total_iterations because range is inclusive ie. [0,10]
+        total_interations = ((x_max - x_min)/step + 1)*((y_max - y_min)/step + 1)*len(z_values)       #plus 1 because in total_iterations because range is inclusive ie. [0,10]
         #print('total_interations=',total_interations)
 
         #formula to set adwin to count for correct time frame. The event section is run every delay*3.3ns so the counter increments for that time then is read and clear
         #time_per_pt is in millisecond and the adwin delay time is delay_value*3.3ns
-        adwin_delay = round((self.settings['time_per_pt']*1e6) / (3.3))
+        adwin_delay = round((time_per_pt*1e6) / (3.3))
         #print('adwin delay: ',delay)
 
-        wf = list(y_array_adj)
-        len_wf = len(y_array_adj)
-        #print(len_wf,wf)
-        load_read_ratio = self.settings['time_per_pt']/2.0 #used for scaling when rates are different
-        num_points_read = int(load_read_ratio*len_wf + 20) #20 is added to compensate for start warm up producing ~15 points of unwanted values
+        load_read_ratio = time_per_pt/2.0 #used for scaling when rates are different
+        counts_buffer = np.empty(num_counts, dtype=np.int32) #reused for the count data of every line
+        #the counter has filled the num_counts points read from Data_1 this long after it started (one point margin)
+        count_time = time_per_pt*(num_counts+1)/1000
+        #serpentine scans odd lines with the reversed waveform, starting where the previous line ended
+        waveforms = [wf, wf[::-1]] if self.settings['serpentine'] else [wf]
 
         #set inital x and y and set nanodrive stage to that position
-        self.nd.update({'x_pos':x_min,'y_pos':y_min-5.0,'num_datapoints':len_wf,'read_rate':2.0,'load_rate':self.settings['time_per_pt']})
-        #load_rate is time_per_pt; 2.0ms = 5000Hz
+        self.nd.update({'x_pos':x_min,'y_pos':wf[0],'num_datapoints':len_wf,'read_rate':2.0,'load_rate':load_rate})
+        #load_rate is time_per_pt (subdivided above 5 ms); 2.0ms = 5000Hz
         self.adw.update({'process_2':{'delay':adwin_delay}})
-        sleep(0.1)  #time for stage to move to starting posiition and adwin process to initilize
 
+        if self.settings['stream_data'] or z_stack:
+            # streams must be declared before the first line is appended so the file can be read during the scan
+            stream = self.open_data_stream()
+            stream.write_attrs(x_array=x_array, y_array=y_array)
+            if self.settings['stream_data']:
+                stream.add_stream('x_pos')
+                stream.add_stream('count_rate', frame_shape=(Ny,))
+                stream.add_stream('raw_counts', frame_shape=(Ny,))
+                stream.add_stream('raw_img', frame_shape=(num_counts,))
+            if z_stack:
+                #chunks of whole planes, as many as fit the chunk size of the stream
+                stream.write_attrs(z_values=z_values)
+                stream.add_stream('count_stack', frame_shape=(Nx, Ny))
+                stream.add_stream('z_pos')
+                self.data['stack_file'] = str(stream.filename)
+
+        #The two different code lines to start counting seem to work for cropping. Honestly cant give a precise explaination, it seems to be related to
+        #hardware delay. If the time_per_pt is 5.0 starting counting before waveform set up works to within 1 pixel with numpy cropping. If the
+        #time_per_pt is 2.0 starting counting after waveform set up matches slow scan to a pixel. Sorry for a lack of explaination but this just seems to work.
+        #See data/dylan_staples/confocal_scans_w_resolution_target for images and additional details
+        #With 2.0 the waveform can therefore be set up together with the stage move to the line, with 5.0 only after the counter started.
+        #Position binning measures the delay between counter and waveform instead, so it always sets up with the move.
+        setup_with_move = position_binning or time_per_pt == 2.0
+        line_started = False    #True once the stage move (and waveform setup) of the next line was issued
+        #local lists to store data and append to global self.data lists, they hold the current plane of a z stack
+        x_data = []
+        y_data = []
+        raw_count_data = []
+        count_rate_data = []
+        index_lists = ([], [])  #end of line indices of forward and backward lines
+        self.backward_rows = {}  #backward (count rate, raw counts) rows before registration, see _register_backward_lines
+        self.backward_stream_rows = {}  #indices of the streamed rows of backward lines, rewritten once registered
 
-        for i, x in enumerate(x_array):
+        #the waveforms, counter and streams set up above are reused for every plane, only z moves between planes
+        for k, z in enumerate(z_values):
             if self._abort == True:
                 break
-            img_row = []
-            raw_img_row = []
-            x = float(x)
-
-            self.nd.update({'x_pos':x,'y_pos':y_min-5.0})     #goes to x position
-            sleep(0.1)
-            x_pos = self.nd.read_probes('x_pos')
-            x_data.append(x_pos)
-            self.data['x_pos'] = x_data     #adds x postion to data
-
-            #The two different code lines to start counting seem to work for cropping. Honestly cant give a precise explaination, it seems to be related to
-            #hardware delay. If the time_per_pt is 5.0 starting counting before waveform set up works to within 1 pixel with numpy cropping. If the
-            #time_per_pt is 2.0 starting counting after waveform set up matches slow scan to a pixel. Sorry for a lack of explaination but this just seems to work.
-            #See data/dylan_staples/confocal_scans_w_resolution_target for images and additional details
-            if self.settings['time_per_pt'] == 5.0:
-                self.adw.update({'process_2': {'running': True}})
-
-            #trigger waveform on y-axis and record position data
-            self.nd.setup(settings={'num_datapoints': len_wf, 'load_waveform': wf}, axis='y')
-            self.nd.setup(settings={'num_datapoints': num_points_read, 'read_waveform': self.nd.empty_waveform},axis='y')
-
-            #restricted load_rate and read_rate to ensure cropping works. 2ms and 5ms count times are good as smaller window for speed and a larger window if more counts are needed
-            if  self.settings['time_per_pt'] == 2.0:
-                self.adw.update({'process_2': {'running': True}})
-
-            y_pos = self.nd.waveform_acquisition(axis='y')
-            sleep(self.settings['time_per_pt']*len_wf/1000)
-
-            #want to get data only in desired range not range±5um
-            y_pos_array = np.array(y_pos)
-            # index for the points of the read array when at y_min and y_max. Scale step by load_read_ratio to get points closest to y_min & y_max
-            lower_index = np.where((y_pos_array > y_min - step / load_read_ratio) & (y_pos_array < y_min + step / load_read_ratio))[0]
-            upper_index = np.where((y_pos_array > y_max - step / load_read_ratio) & (y_pos_array < y_max + step / load_read_ratio))[0]
-            y_pos_cropped = list(y_pos_array[lower_index[0]:upper_index[0]])
-
-            #y_data.extend(y_pos_cropped)
-            y_data.append(list(y_pos))
-            self.data['y_pos'] = y_data
-            self.adw.update({'process_2':{'running':False}})
-
-            #different index for count data if read and load rates are different
-            counts_lower_index = int(lower_index[0] / load_read_ratio)
-            counts_upper_index = int(upper_index[-1] / load_read_ratio)
-            index_list.append(counts_upper_index)
-
-            #get mode of index list and difference between mode and previous value
-            index_mode = max(set(index_list), key=index_list.count)
-            index_diff = abs(counts_upper_index - index_mode)
-            # index starts at 0 so need to add 1 if there is an index difference
-            if index_diff > 0:
-                index_diff = index_diff + 1
-
-            # get count data from adwin and record it
-            raw_counts = np.array(list(self.adw.read_probes('int_array', id=1, length=len_wf+20)))
-            # units of count/seconds
-            count_rate = list(np.array(raw_counts) * 1e3 / self.settings['time_per_pt'])
-
-            crop_index = -index_mode - 1 - index_diff
-            if self.settings['time_per_pt'] == 5.0:
-                crop_index = crop_index-2
-            cropped_raw_counts = list(raw_counts[crop_index:crop_index + len(y_array)])
-            cropped_count_rate = count_rate[crop_index:crop_index + len(y_array)]
-
-            raw_count_data.append(cropped_raw_counts)
-            self.data['raw_counts'] = raw_count_data
-
-            count_rate_data.append(cropped_count_rate)
-            self.data['count_rate'] = count_rate_data
-
-            #adds count rate data to raw img and cropped count img
-            raw_img_row.extend(count_rate)
-            self.data['raw_img'][i, :] = raw_img_row
-            img_row.extend(cropped_count_rate)
-            self.data['count_img'][i, :] = img_row  # add previous scan data so image plots
-
-            # updates process bar and plots count_img so far
-            interation_num = interation_num + len(y_array)
-            self.progress = 100. * (interation_num +1) / total_interations
-            self.updateProgress.emit(self.progress)
+            if z is not None:
+                if k > 0:
+                    # the finished planes are in the stack file
+                    for plane_data in (x_data, y_data, raw_count_data, count_rate_data):
+                        plane_data.clear()
+                    self.backward_rows = {}
+                    self.backward_stream_rows = {}
+                    self.data['count_img'].fill(0)
+                    self.data['raw_img'].fill(0)
+                if not line_started:
+                    self.nd.update({'z_pos': z})
+                self.nd.wait_for_position(z=z, timeout=0.5)
+                self.settings['z_pos'] = z
+
+            for i, x in enumerate(x_array):
+                if self._abort == True:
+                    break
+                line_span = tracing.span('line', category='scan', index=i)
+                x = float(x)
+                line_wf = waveforms[i % len(waveforms)]
+                backward = line_wf is not wf
+
+                if not line_started:
+                    self._start_line(x, line_wf, len_wf, num_points_read, setup_with_move)
+                #goes to x position; completion check instead of a fixed wait, at most the 0.1 s that used to be waited
+                self.nd.wait_for_position(x=x, y=line_wf[0], timeout=0.1)
+                x_pos = self.nd.read_probes('x_pos')
+                x_data.append(x_pos)
+                self.data['x_pos'] = x_data     #adds x postion to data
+
+                if not setup_with_move:
+                    self.adw.update({'process_2': {'running': True}})
+                    counting_started = time.perf_counter()
+
+                #trigger waveform on y-axis and record position data
+                if not setup_with_move:
+                    self._setup_line_waveforms(line_wf, len_wf, num_points_read)
+
+                #restricted load_rate and read_rate to ensure cropping works. 2ms and 5ms count times are good as smaller window for speed and a larger window if more counts are needed
+                if setup_with_move:
+                    self.adw.update({'process_2': {'running': True}})
+                    counting_started = time.perf_counter()
+
+                #waveform_acquisition returns when the read waveform is done, the counter may need a few more points
+                #the first position is read read_delay after the trigger, in seconds after the counter started
+                read_offset = time.perf_counter() - counting_started + self.settings['read_delay']/1000
+                y_pos = self.nd.waveform_acquisition(axis='y')
+                remaining = counting_started + count_time - time.perf_counter()
+                if remaining > 0:
+                    sleep(remaining, name='wait_for_counts', category='acquisition')
+                self.adw.update({'process_2':{'running':False}})
+
+                # the next line's stage move and waveform setup are issued before this line is read and cropped,
+                # so the stage settles while the line is processed
+                # at the end of a plane of a z stack the first line of the next plane is started, together with the z move
+                line_started = self.settings['pipelined'] and (i + 1 < Nx or k + 1 < len(z_values)) and not self._abort
+                if line_started:
+                    if i + 1 < Nx:
+                        self._start_line(float(x_array[i + 1]), waveforms[(i + 1) % len(waveforms)], len_wf,
+                                         num_points_read, setup_with_move)
+                    else:
+                        self.nd.update({'z_pos': z_values[k + 1]})
+                        self._start_line(float(x_array[0]), wf, len_wf, num_points_read, setup_with_move)
+
+                # get count data from adwin and record it
+                raw_counts = self.adw.get_int_data_np(1, num_counts, out=counts_buffer)
+                self._process_line(i, x_pos, y_pos, raw_counts, y_array, y_min, y_max, step, load_read_ratio, read_offset,
+                                   backward, y_data, raw_count_data, count_rate_data, index_lists)
+                if z_stack:
+                    np.maximum(finished_mip[i], self.data['count_img'][i], out=self.data['mip'][i])
+
+                # updates process bar and plots count_img so far
+                interation_num = interation_num + len(y_array)
+                self.progress = 100. * (interation_num +1) / total_interations
+                self.updateProgress.emit(self.progress)
+                line_span.end()
+
+            if self.backward_rows:
+                self._register_backward_lines(count_rate_data, raw_count_data, final=True)
+            if z is not None and not self._abort:
+                self._finish_plane(z, finished_mip)
 
         #tracker to only save test image once
         self.data_collected = True
@@ -307,6 +402,225 @@ class NanodriveAdwinConfocalScanFast(Experiment):
 
         self.after_scan()
 
+    def _z_values(self):
+        '''
+        Returns the z positions of the planes of a z stack, from z_min towards z_max in steps of z_step (both included if
+        z_step divides their distance); planes outside the 0 to 100 um range of the Nanodrive are left out
+        '''
+        z_min = self.settings['z_stack']['z_min']
+        z_max = self.settings['z_stack']['z_max']
+        z_step = self.settings['z_stack']['z_step']
+        if z_step <= 0:
+            raise ValueError(f'z_step has to be positive, not {z_step}')
+        num_planes = int(np.floor(abs(z_max - z_min) / z_step + 1e-9)) + 1
+        z_values = z_min + np.sign(z_max - z_min) * z_step * np.arange(num_planes)
+        z_values = z_values[(z_values >= 0.0) & (z_values <= 100.0)]
+        if len(z_values) == 0:
+            raise ValueError(f'no plane of the z stack from {z_min} to {z_max} um is in the 0 to 100 um range')
+        return [float(z) for z in z_values]
+
+    def _finish_plane(self, z, finished_mip):
+        '''
+        Appends the finished plane at z to the stack file and adds it to the max intensity projection
+        '''
+        np.maximum(finished_mip, self.data['count_img'], out=finished_mip)
+        #the rows of backward lines were registered again at the end of the plane
+        self.data['mip'][...] = finished_mip
+        self.data_stream.append('count_stack', self.data['count_img'])
+        self.data_stream.append('z_pos', z)
+        self.data['z_values'].append(z)
+
+    def _start_line(self, x, wf, len_wf, num_points_read, setup_waveforms):
+        '''
+        Issues the stage move to the start of the line waveform wf and, if setup_waveforms, the waveform setup; neither waits
+        for the stage
+        '''
+        self.nd.update({'x_pos':x,'y_pos':wf[0]})
+        if setup_waveforms:
+            self._setup_line_waveforms(wf, len_wf, num_points_read)
+
+    def _setup_line_waveforms(self, wf, len_wf, num_points_read):
+        '''
+        Sets up the y load waveform of a line and the read waveform recording its positions
+        '''
+        self.nd.setup(settings={'num_datapoints': len_wf, 'load_waveform': wf}, axis='y')
+        self.nd.setup(settings={'num_datapoints': num_points_read, 'read_waveform': self.nd.empty_waveform},axis='y')
+
+    def _process_line(self, i, x_pos, y_pos, raw_counts, y_array, y_min, y_max, step, load_read_ratio, read_offset, backward,
+                      y_data, raw_count_data, count_rate_data, index_lists):
+        '''
+        Bins (or crops) the counts of line i to the pixels y_array and writes them into the images, data lists and data
+        stream. Backward lines of a serpentine scan are brought into the y_min to y_max order and registered to the forward
+        lines.
+        '''
+        #y_data.extend(y_pos_cropped)
+        y_data.append(list(y_pos))
+        self.data['y_pos'] = y_data
+
+        # units of count/seconds
+        count_rate = raw_counts * 1e3 / self.settings['time_per_pt']
+
+        if self.settings['binning'] == 'position':
+            cropped_raw_counts, cropped_count_rate = self._bin_line(raw_counts, y_pos, y_array, step,
+                                                                    self.settings['time_per_pt']/1000,
+                                                                    self.nd.settings['read_rate']/1000, read_offset)
+            cropped_raw_counts = list(cropped_raw_counts)
+            cropped_count_rate = list(cropped_count_rate)
+        else:
+            cropped_raw_counts, cropped_count_rate = self._crop_line(y_pos, raw_counts, count_rate, y_min, y_max, step,
+                                                                     load_read_ratio, len(y_array), backward, index_lists)
+        if backward:
+            count_rate = count_rate[::-1]
+
+        raw_count_data.append(cropped_raw_counts)
+        self.data['raw_counts'] = raw_count_data
+
+        count_rate_data.append(cropped_count_rate)
+        self.data['count_rate'] = count_rate_data
+
+        #adds count rate data to raw img and cropped count img
+        self.data['raw_img'][i, :] = count_rate
+        self.data['count_img'][i, :] = cropped_count_rate  # add previous scan data so image plots
+        if backward:
+            self.backward_rows[i] = (np.array(cropped_count_rate), np.array(cropped_raw_counts))
+            self._register_backward_lines(count_rate_data, raw_count_data, i)
+
+        if self.data_stream is not None and self.settings['stream_data']:
+            self.data_stream.append('x_pos', x_pos)
+            stream_row = self.data_stream.append('count_rate', self.data['count_img'][i, :])
+            self.data_stream.append('raw_counts', raw_count_data[i])
+            self.data_stream.append('raw_img', self.data['raw_img'][i, :])
+            if backward:
+                self.backward_stream_rows[i] = stream_row
+
+    def _crop_line(self, y_pos, raw_counts, count_rate, y_min, y_max, step, load_read_ratio, Ny, backward, index_lists):
+        '''
+        Crops the counts of a line to the requested y range with the calibrated offsets of 2 and 5 ms points. Backward lines
+        are cropped at their end (y_min) in the same way and reversed.
+        Returns:
+            cropped raw counts and count rate as lists
+        '''
+        #want to get data only in desired range not range±5um
+        y_pos_array = np.array(y_pos)
+        # index for the points of the read array when at the end of the line (y_max, or y_min for backward lines). Scale
+        # step by load_read_ratio to get points closest to the end
+        y_end = y_min if backward else y_max
+        upper_index = np.where((y_pos_array > y_end - step / load_read_ratio) & (y_pos_array < y_end + step / load_read_ratio))[0]
+
+        #different index for count data if read and load rates are different
+        counts_upper_index = int(upper_index[-1] / load_read_ratio)
+        index_list = index_lists[int(backward)]
+        index_list.append(counts_upper_index)
+
+        #get mode of index list and difference between mode and previous value
+        index_mode = max(set(index_list), key=index_list.count)
+        index_diff = abs(counts_upper_index - index_mode)
+        # index starts at 0 so need to add 1 if there is an index difference
+        if index_diff > 0:
+            index_diff = index_diff + 1
+
+        crop_index = -index_mode - 1 - index_diff
+        if self.settings['time_per_pt'] == 5.0:
+            crop_index = crop_index-2
+        cropped_raw_counts = list(raw_counts[crop_index:crop_index + Ny])
+        cropped_count_rate = list(count_rate[crop_index:crop_index + Ny])
+        if backward:
+            cropped_raw_counts.reverse()
+            cropped_count_rate.reverse()
+        return cropped_raw_counts, cropped_count_rate
+
+    @staticmethod
+    def _bin_line(raw_counts, y_pos, y_array, step, count_period, read_period, read_offset):
+        '''
+        Resamples the counts of a line onto the pixels y_array by the recorded stage positions, for either scan direction.
+        Counter point j counts from j*count_period to (j+1)*count_period after the counter started and read point k is the
+        stage position read_offset + k*read_period after it (all in seconds); each counter point is placed at the position
+        in its middle. If every pixel holds two or more points (short time_per_pt) their counts are summed with
+        np.bincount, otherwise the counts of a counter point are interpolated at the pixels.
+        Returns:
+            np.ndarray: counts of the pixels, the bincount sums or the interpolated counts per counter point
+            np.ndarray: count rate of the pixels in counts/s
+        '''
+        counts = np.asarray(raw_counts, dtype=float)
+        Ny = len(y_array)
+        times = (np.arange(len(counts)) + 0.5) * count_period
+        read_times = read_offset + np.arange(len(y_pos)) * read_period
+        #points before the first or after the last position reading have no known position
+        known = (times >= read_times[0]) & (times <= read_times[-1])
+        if not np.any(known):
+            return np.zeros(Ny), np.zeros(Ny)
+        positions = np.interp(times[known], read_times, y_pos)
+        counts = counts[known]
+        pixels = np.rint((positions - y_array[0]) / step).astype(int)
+        inside = (pixels >= 0) & (pixels < Ny)
+        occupancy = np.bincount(pixels[inside], minlength=Ny)
+        if np.all(occupancy >= 2):
+            summed = np.bincount(pixels[inside], weights=counts[inside], minlength=Ny)
+            return summed, summed / (occupancy * count_period)
+        order = np.argsort(positions, kind='stable')
+        interpolated = np.interp(y_array, positions[order], counts[order])
+        return interpolated, interpolated / count_period
+
+    @staticmethod
+    def _line_waveform(y_array, step, overscan, time_per_pt):
+        '''
+        Returns the y load waveform of a line, running from overscan before to overscan after the pixels y_array, and its
+        load rate in ms. Points are a pixel apart and loaded every time_per_pt; above the 5 ms the Nanodrive loads at most
+        every pixel is split into several points.
+        '''
+        substeps = int(np.ceil(time_per_pt / 5.0))
+        load_rate = time_per_pt / substeps
+        if load_rate < 1/6:
+            raise ValueError(f'time_per_pt {time_per_pt} ms is below the 1/6 ms the Nanodrive loads waveform points at')
+        num = int(round((len(y_array) - 1 + 2 * overscan / step) * substeps)) + 1
+        wf = np.linspace(y_array[0] - overscan, y_array[-1] + overscan, num)
+        return np.clip(wf, 0.0, 100.0).tolist(), load_rate
+
+    def _register_backward_lines(self, count_rate_data, raw_count_data, i=None, final=False):
+        '''
+        Shifts backward lines by the sub-pixel offset between forward and backward lines. The offset of backward line i is
+        measured against the forward line before it, and the median of all offsets so far is applied to line i (or, if
+        final, to all backward lines, whose rows in the data stream are rewritten as well). The count rate and the raw
+        counts are shifted alike; raw_img keeps the counts as acquired.
+        '''
+        if i is not None:
+            shift = self._line_shift(self.data['count_img'][i - 1, :], self.backward_rows[i][0])
+            if shift is not None:
+                self.line_shifts.append(shift)
+        shift = float(np.median(self.line_shifts)) if self.line_shifts else 0.0
+        self.data['line_shift'] = shift
+        pixels = np.arange(self.data['count_img'].shape[1])
+        for j in (self.backward_rows if final else [i]):
+            row, raw_row = (np.interp(pixels + shift, pixels, values) for values in self.backward_rows[j])
+            self.data['count_img'][j, :] = row
+            count_rate_data[j] = list(row)
+            raw_count_data[j] = list(raw_row)
+            if final and j in self.backward_stream_rows:
+                self.data_stream.replace('count_rate', self.backward_stream_rows[j], row)
+                self.data_stream.replace('raw_counts', self.backward_stream_rows[j], raw_row)
+
+    @staticmethod
+    def _line_shift(forward, backward, max_shift=3):
+        '''
+        Returns the shift in pixels so that backward[j + shift] matches forward[j], from the peak of their cross-correlation
+        refined with a parabola; None if the lines have no common structure.
+        '''
+        forward = forward - np.mean(forward)
+        backward = backward - np.mean(backward)
+        n = len(forward)
+        lags = np.arange(-max_shift, max_shift + 1)
+        correlation = np.array([np.dot(forward[max(0, -lag):n - max(0, lag)], backward[max(0, lag):n + min(0, lag)])
+                                / (n - abs(lag)) for lag in lags])
+        k = int(np.argmax(correlation))
+        if correlation[k] <= 0:
+            return None
+        shift = float(lags[k])
+        if 0 < k < len(lags) - 1:
+            curvature = correlation[k - 1] - 2 * correlation[k] + correlation[k + 1]
+            if curvature < 0:
+                shift += 0.5 * (correlation[k - 1] - correlation[k + 1]) / curvature
+        return shift
+
     def _plot(self, axes_list, data=None):
         '''
         This function plots the data. It is triggered when the updateProgress signal is emited and when after the _function is executed.
@@ -317,7 +631,7 @@ class NanodriveAdwinConfocalScanFast(Experiment):
             Creates a new image and ImageItem. Optionally create colorbar
             '''
             axes_list[0].clear()
-            self.count_image = pg.ImageItem(data['count_img'], interpolation='nearest')
+            self.count_image = pg.ImageItem(image, interpolation='nearest')
             self.count_image.setLevels(levels)
             self.count_image.setRect(pg.QtCore.QRectF(extent[0], extent[2], extent[1] - extent[0], extent[3] - extent[2]))
             axes_list[0].addItem(self.count_image)
@@ -325,7 +639,7 @@ class NanodriveAdwinConfocalScanFast(Experiment):
             axes_list[0].setAspectLocked(True)
             axes_list[0].setLabel('left', 'y (µm)')
             axes_list[0].setLabel('bottom', 'x (µm)')
-            axes_list[0].setTitle(f"Confocal Scan with z = {self.settings['z_pos']:.2f}")
+            axes_list[0].setTitle(title)
 
             if add_colobar:
                 self.colorbar = pg.ColorBarItem(values=(levels[0], levels[1]), label='counts/sec', colorMap='viridis')
@@ -343,12 +657,19 @@ class NanodriveAdwinConfocalScanFast(Experiment):
             except KeyError:
                 data['count_img'] = self.data['count_img']
                 non_zero_values = data['count_img'][data['count_img'] > 0]
+            #a z stack shows the max intensity projection of the planes scanned so far
+            image = data['count_img']
+            title = f"Confocal Scan with z = {self.settings['z_pos']:.2f}"
+            if self.settings['z_stack']['enable'] and data.get('mip') is not None:
+                image = data['mip']
+                non_zero_values = image[image > 0]
+                title = f"Max Intensity Projection of z = {self.settings['z_stack']['z_min']:.2f} to {self.settings['z_stack']['z_max']:.2f}"
             if non_zero_values.size > 0:
                 min = np.min(non_zero_values)
             else: #if else to aviod ValueError
                 min = 0
 
-            levels = [min, np.max(data['count_img'])]
+            levels = [min, np.max(image)]
             extent = [self.settings['point_a']['x'], self.settings['point_b']['x'], self.settings['point_a']['y'],self.settings['point_b']['y']]
 
             if self._plot_refresh == True:
@@ -356,7 +677,7 @@ class NanodriveAdwinConfocalScanFast(Experiment):
                 create_img()
             else:
                 try:
-                    self.count_image.setImage(data['count_img'], autoLevels=False)
+                    self.count_image.setImage(image, autoLevels=False)
                     self.count_image.setLevels(levels)
                     self.colorbar.setLevels(levels)
 
@@ -382,9 +703,12 @@ class NanodriveAdwinConfocalScanFast(Experiment):
                     create_img(add_colobar=False)
 
     def _update(self,axes_list):
-        self.count_image.setImage(self.data['count_img'], autoLevels=False)
-        self.count_image.setLevels([np.min(self.data['count_img']), np.max(self.data['count_img'])])
-        self.colorbar.setLevels([np.min(self.data['count_img']), np.max(self.data['count_img'])])
+        image = self.data['count_img']
+        if self.settings['z_stack']['enable'] and self.data.get('mip') is not None:
+            image = self.data['mip']
+        self.count_image.setImage(image, autoLevels=False)
+        self.count_image.setLevels([np.min(image), np.max(image)])
+        self.colorbar.setLevels([np.min(image), np.max(image)])
 
     def correct_step(self, old_step):
         '''
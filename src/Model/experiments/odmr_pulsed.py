@@ -137,6 +137,8 @@ class ODMRPulsedExperiment(Experiment):
         
         # Output paths
         self.output_dir = self.get_output_dir("odmr_pulsed_output")
+        # waveform and sequence files written by generate_awg_files, uploaded by upload_awg_files
+        self.awg_files = []
         
         self.logger.info("ODMR Pulsed Experiment initialized")
     
@@ -266,6 +268,7 @@ class ODMRPulsedExperiment(Experiment):
             
             # Generate waveforms for each sequence using the proper pipeline
             waveform_files = []
+            self.awg_files = []
             for i, sequence in enumerate(self.scan_sequences):
                 # Use AWG520SequenceOptimizer to properly optimize the sequence
                 optimized_sequence = self.awg_optimizer.optimize_sequence_for_awg520(sequence)
@@ -323,13 +326,33 @@ class ODMRPulsedExperiment(Experiment):
                 )
                 
                 self.logger.info(f"Generated sequence file: {seq_path}")
+                waveform_files.append(seq_path)
             
+            self.awg_files = waveform_files
             return True
             
         except Exception as e:
             self.logger.error(f"Error generating AWG files: {e}")
             return False
     
+    def upload_awg_files(self) -> bool:
+        """
+        Upload the files of generate_awg_files to the AWG520 over concurrent FTP sessions. Waveforms that the AWG
+        already has unchanged (e.g. those of the scan points a new sweep shares with the last one) are skipped.
+        
+        Returns:
+            True if all files are on the AWG520 or there is no AWG520 to upload to
+        """
+        if 'awg520' not in self.devices:
+            self.logger.warning("No AWG520 device, AWG files are not uploaded")
+            return True
+        result = self.devices['awg520'].upload_files(self.awg_files)
+        self.logger.info(f"Uploaded {len(result['uploaded'])} AWG files, {len(result['skipped'])} unchanged")
+        if result['failed']:
+            self.logger.error(f"Upload of AWG files failed: {result['failed']}")
+            return False
+        return True
+    
     def show_sequence_preview(self, num_points: int = 10) -> None:
         """
         Show sequence preview window with first N scan points.
@@ -436,6 +459,10 @@ class ODMRPulsedExperiment(Experiment):
             if not self.generate_awg_files():
                 return {'success': False, 'error': 'Failed to generate AWG files'}
             
+            # Step 3b: Upload the files that changed since the last upload to the AWG520
+            if not self.upload_awg_files():
+                return {'success': False, 'error': 'Failed to upload AWG files'}
+            
             # Step 4: Setup ADwin for photon counting
             if not self._setup_adwin_counting():
                 return {'success': False, 'error': 'Failed to setup ADwin counting'}
@@ -549,24 +576,21 @@ class ODMRPulsedExperiment(Experiment):
             total_counts = []
             
             # Collect data for each sequence point
+            # Each point takes at least repetitions * (2 * count_time + reset_time), the AWG520 triggers the events
+            min_point_time = self.repetitions_per_point * (2 * self.count_time + self.reset_time) * 1e-9
             for i in range(len(self.scan_sequences)):
                 # Wait for ADwin to complete counting for this sequence point
-                # The measure_protocol.bas process will increment Par_10 when done
-                max_wait_time = 10.0  # seconds
-                wait_time = 0.0
-                while wait_time < max_wait_time:
-                    scan_point = adwin.get_parameter(10)  # Current scan point
-                    if scan_point > i:
-                        break
-                    time.sleep(0.1)
-                    wait_time += 0.1
+                # The measure_protocol.bas process will increment Par_10 when done,
+                # the counts of the point are read in the same poll
+                point = adwin.wait_for(lambda pars: pars[10] > i, pars=[1, 2, 10], timeout=10.0,
+                                       expected=min_point_time)
                 
-                if wait_time >= max_wait_time:
+                if point['status'] != 'done':
                     self.logger.warning(f"Timeout waiting for scan point {i}")
                 
-                # Read accumulated counts from ADwin
-                signal_count = adwin.get_parameter(1)  # Par_1: signal counts
-                reference_count = adwin.get_parameter(2)  # Par_2: reference counts
+                # Accumulated counts from ADwin
+                signal_count = point['pars'][1]  # Par_1: signal counts
+                reference_count = point['pars'][2]  # Par_2: reference counts
                 total_count = signal_count + reference_count
                 
                 signal_counts.append(signal_count)
@@ -19,7 +19,7 @@ import time
 from src.core.experiment import Experiment
 from src.core.parameter import Parameter
 from src.Controller.sg384 import SG384Generator
-from src.Controller.adwin_gold import AdwinGoldDevice
+from src.Controller.adwin_gold import AdwinGoldDevice, digits_to_volts
 from src.Controller.nanodrive import MCLNanoDrive
 from src.core.adwin_helpers import setup_adwin_for_odmr, read_adwin_odmr_data
 
@@ -65,7 +65,9 @@ class ODMRSweepContinuousExperiment(Experiment):
             Parameter('integration_time', 0.001, float, 'Integration time per point in seconds', units='s'),
             Parameter('averages', 10, int, 'Number of sweep averages'),
             Parameter('settle_time', 0.01, float, 'Settle time between sweeps', units='s'),
-            Parameter('bidirectional', True, bool, 'Enable bidirectional sweeps (doubles acquisition efficiency)')
+            Parameter('bidirectional', True, bool, 'Enable bidirectional sweeps (doubles acquisition efficiency)'),
+            Parameter('double_buffered', False, bool,
+                      'Run sweeps back to back on the ADwin, alternating two buffers, and read each while the next runs')
         ]),
         Parameter('laser', [
             Parameter('power', 1.0, float, 'Laser power in mW', units='mW'),
@@ -114,6 +116,7 @@ class ODMRSweepContinuousExperiment(Experiment):
         self.counts_averaged = None
         self.voltages = None
         self.sweep_time = None
+        self.duty_cycle = None
         
         # Initialize analysis results
         self.fit_parameters = None
@@ -234,6 +237,7 @@ class ODMRSweepContinuousExperiment(Experiment):
         self.integration_time_us = int(self.settings['acquisition']['integration_time'] * 1e6)
         self.settle_time_us = int(self.settings['acquisition']['settle_time'] * 1e6)
         self.bidirectional = self.settings['acquisition'].get('bidirectional', True)
+        self.double_buffered = self.settings['acquisition'].get('double_buffered', False)
         
         # Debug: Print conversion details
         self.log(f"🔍 DEBUG - Parameter conversions:")
@@ -241,6 +245,7 @@ class ODMRSweepContinuousExperiment(Experiment):
         self.log(f"   settle_time: {self.settings['acquisition']['settle_time']} s → {self.settle_time_us} µs")
         self.log(f"   num_steps: {self.num_steps}")
         self.log(f"   bidirectional: {self.bidirectional}")
+        self.log(f"   double_buffered: {self.double_buffered}")
         
         # Set parameters BEFORE loading/starting process (like debug script)
         self.log("⚙️  Setting ADwin parameters...")
@@ -292,6 +297,12 @@ class ODMRSweepContinuousExperiment(Experiment):
             self.log(f"🔍 Setting FPar_2 (VMAX) = {vmax} V")
             self.adwin.set_float_var(2, vmax)
             
+            if self.double_buffered:
+                # Par_7: number of sweeps the ping-pong process runs after one START
+                n_sweeps = self.settings['acquisition']['averages']
+                self.log(f"🔍 Setting Par_7 (N_SWEEPS) = {n_sweeps}")
+                self.adwin.set_int_var(7, n_sweeps)
+            
             self.log("✅ All parameters set successfully!")
             self.log(f"   Par_1 (N_STEPS): {self.num_steps}")
             self.log(f"   Par_2 (SETTLE_US): {self.settle_time_us} µs")
@@ -306,8 +317,13 @@ class ODMRSweepContinuousExperiment(Experiment):
             self.log(f"❌ Error setting ADwin parameters: {e}")
             raise RuntimeError(f"Failed to set ADwin parameters: {e}")
         
-        # Load ODMR Sweep Counter script (use debug version for now)
-        sweep_binary_path = get_adwin_binary_path('ODMR_Sweep_Counter_Debug.TB1')
+        # Load ODMR Sweep Counter script (use debug version for now, the ping-pong version for double buffering)
+        if self.double_buffered:
+            sweep_binary_path = get_adwin_binary_path('ODMR_Sweep_Counter_PingPong.TB1')
+            expected_signature = 7778
+        else:
+            sweep_binary_path = get_adwin_binary_path('ODMR_Sweep_Counter_Debug.TB1')
+            expected_signature = 7777
         self.log(f"📁 Loading TB1: {sweep_binary_path}")
         self.adwin.update({
             'process_1': {
@@ -330,8 +346,8 @@ class ODMRSweepContinuousExperiment(Experiment):
         
         # Check signature
         signature = self.adwin.get_int_var(80)
-        if signature != 7777:
-            self.log(f"❌ Wrong signature! Expected 7777, got {signature}")
+        if signature != expected_signature:
+            self.log(f"❌ Wrong signature! Expected {expected_signature}, got {signature}")
             raise RuntimeError("Wrong ADwin script loaded")
         
         self.log(f"✅ ADwin process started correctly (signature: {signature})")
@@ -474,6 +490,10 @@ class ODMRSweepContinuousExperiment(Experiment):
     
     def _run_sweep_averages(self):
         """Run multiple sweep averages."""
+        if self.settings['acquisition'].get('double_buffered', False):
+            self._run_sweep_averages_double_buffered()
+            return
+        
         averages = self.settings['acquisition']['averages']
         settle_time = self.settings['acquisition']['settle_time']
         
@@ -522,6 +542,80 @@ class ODMRSweepContinuousExperiment(Experiment):
         
         self.log("Sweep averages completed")
     
+    def _run_sweep_averages_double_buffered(self):
+        """Run multiple sweep averages with the ping-pong ADwin process (ODMR_Sweep_Counter_PingPong).
+        
+        The ADwin runs the sweeps back to back, alternating between Data_1/Data_2 and Data_3/Data_4, so sweep k is
+        read and accumulated while sweep k+1 runs. Par_23 counts the finished sweeps and Python acknowledges the
+        sweeps it has read in Par_24; the ADwin only waits (Par_27, µs) if the next buffer has not been read yet.
+        The settle time of the first step replaces the settle time between sweeps.
+        """
+        averages = self.settings['acquisition']['averages']
+        integration_time = self.settings['acquisition']['integration_time']
+        settle_time = self.settings['acquisition']['settle_time']
+        
+        self.log(f"Starting double-buffered sweep averages: {averages} sweeps")
+        
+        n_steps = self.num_steps
+        half = n_steps - 1
+        n_points = 2 * n_steps - 2
+        sweep_time = n_points * (settle_time + integration_time)
+        timeout = max(5.0, sweep_time * 10)
+        
+        # (counts, DAC digits) arrays of sweeps 1, 3, 5, ... and 2, 4, 6, ...
+        buffers = ((1, 2), (3, 4))
+        counts = np.empty(n_points, dtype=np.int32)
+        digits = np.empty(n_points, dtype=np.int32)
+        counts_sum = np.zeros(n_points, dtype=np.int64)
+        volts_sum = np.zeros(n_points)
+        
+        # Reset the handshake, then arm the run (Par_7 = number of sweeps, set in _setup_adwin_sweep)
+        self.adwin.set_int_var(23, 0)  # finished sweeps
+        self.adwin.set_int_var(24, 0)  # sweeps read
+        self.adwin.set_int_var(10, 1)  # Par_10 = START
+        
+        t0 = time.perf_counter()
+        next_ready = t0 + sweep_time
+        n_read = 0
+        wait_us = 0
+        for avg in range(averages):
+            t_wait = time.perf_counter()
+            ready = self.adwin.wait_for(lambda pars: pars[23] > avg, pars=[23, 27], timeout=timeout,
+                                        heartbeat_par=25, expected=max(next_ready - t_wait, 0.0))
+            if ready['status'] != 'done':
+                self.log(f"❌ Sweep {avg + 1}/{averages}: {ready['status']} after {ready['elapsed']:.2f}s")
+                self.adwin.set_int_var(10, 0)  # stop the run
+                break
+            next_ready = max(next_ready, t_wait + ready['elapsed']) + sweep_time
+            wait_us = ready['pars'][27]
+            
+            count_id, digit_id = buffers[avg % 2]
+            self.adwin.read_many({count_id: n_points, digit_id: n_points}, out={count_id: counts, digit_id: digits})
+            self.adwin.set_int_var(24, avg + 1)  # buffer can be reused
+            
+            counts_sum += counts
+            volts_sum += digits_to_volts(digits, invalid=0.0)
+            n_read += 1
+        
+        elapsed = time.perf_counter() - t0
+        # Share of the run the ADwin was sweeping rather than waiting for Python
+        self.duty_cycle = min(max(1.0 - wait_us * 1e-6 / elapsed, 0.0), 1.0) if elapsed > 0 else 1.0
+        
+        if n_read:
+            mean_counts = counts_sum / n_read
+            mean_volts = volts_sum / n_read
+        else:
+            mean_counts = np.zeros(n_points)
+            mean_volts = np.zeros(n_points)
+        
+        self.counts_forward = mean_counts[:half]
+        self.counts_reverse = mean_counts[half:]
+        self.counts_averaged = (self.counts_forward + self.counts_reverse) / 2
+        self.voltages = mean_volts[:half]  # Use forward voltage for main voltage array
+        
+        self.log(f"Sweep averages completed: {n_read}/{averages} sweeps in {elapsed:.2f}s, "
+                 f"ADwin duty cycle {self.duty_cycle:.1%}")
+    
     def _run_single_sweep(self):
         """Run a single frequency sweep (following debug script pattern exactly).
         
@@ -541,21 +635,11 @@ class ODMRSweepContinuousExperiment(Experiment):
         # Wait for heartbeat to start advancing (like debug script)
         self.log("⏳ Waiting for ADwin heartbeat to start...")
         initial_hb = self.adwin.get_int_var(25)
-        start_time = time.time()
-        
-        while time.time() - start_time < 1.0:  # Wait up to 1 second
-            try:
-                current_hb = self.adwin.get_int_var(25)
-                if current_hb > initial_hb:
-                    self.log(f"✅ ADwin heartbeat advancing: {initial_hb} → {current_hb}")
-                    break
-                time.sleep(0.01)  # 10ms polling
-            except Exception as e:
-                self.log(f"⚠️  Transient Get_Par error (tolerated): {e}")
-                time.sleep(0.01)
-        else:
+        started = self.adwin.wait_for(lambda pars: pars[25] > initial_hb, pars=[25], timeout=1.0)
+        if started['status'] != 'done':
             self.log("❌ ADwin heartbeat not advancing after 1s - process not running!")
             return np.zeros(2 * actual_steps), np.zeros(2 * actual_steps)
+        self.log(f"✅ ADwin heartbeat advancing: {initial_hb} → {started['pars'][25]}")
         
         # Clear any stale ready flags first (like debug script)
         self.log("🧹 Clearing any stale ready flags...")
@@ -574,36 +658,19 @@ class ODMRSweepContinuousExperiment(Experiment):
         self.log(f"⏳ Waiting for Par_20 == 1 (sweep ready)…")
         self.log(f"   Expected {expected_points} points, timeout: {timeout:.1f}s")
         
-        t0 = time.time()
-        last_hb = self.adwin.get_int_var(25)
-        
-        while True:
-            try:
-                ready = self.adwin.get_int_var(20)  # ready flag
-                hb = self.adwin.get_int_var(25)     # heartbeat
-                state = self.adwin.get_int_var(26)  # current state
-                elapsed = time.time() - t0
-                
-                if ready == 1:
-                    self.log(f"✅ Sweep ready after {elapsed:.2f}s!")
-                    break
-                    
-                # Check if heartbeat is still advancing (after 100ms grace period)
-                if hb <= last_hb and elapsed > 0.1:
-                    self.log(f"⚠️  Heartbeat stalled at {hb}!")
-                    
-                last_hb = hb
-                time.sleep(0.05)
-            except Exception as e:
-                self.log(f"⚠️  Transient Get_Par error (tolerated): {e}")
-                time.sleep(0.05)  # Continue polling despite error
-
-            if elapsed > timeout:
-                self.log(f"❌ Timeout after {elapsed:.1f}s (expected ~{expected_points * per_point_s:.1f}s)")
-                return np.zeros(2 * actual_steps), np.zeros(2 * actual_steps)
+        # Par_20 = ready flag, Par_21 = number of points, Par_25 = heartbeat
+        ready = self.adwin.wait_for(lambda pars: pars[20] == 1, pars=[20, 21], timeout=timeout, heartbeat_par=25,
+                                    expected=expected_points * per_point_s)
+        if ready['status'] == 'stalled':
+            self.log(f"❌ Heartbeat stalled at {ready['pars'].get(25)} after {ready['elapsed']:.2f}s!")
+            return np.zeros(2 * actual_steps), np.zeros(2 * actual_steps)
+        if ready['status'] == 'timeout':
+            self.log(f"❌ Timeout after {ready['elapsed']:.1f}s (expected ~{expected_points * per_point_s:.1f}s)")
+            return np.zeros(2 * actual_steps), np.zeros(2 * actual_steps)
+        self.log(f"✅ Sweep ready after {ready['elapsed']:.2f}s!")
         
         # Read arrays (like debug script)
-        n_points = self.adwin.get_int_var(21)
+        n_points = ready['pars'][21]
         if n_points <= 0:
             self.log("❌ n_points <= 0 — nothing to read.")
             return np.zeros(2 * actual_steps), np.zeros(2 * actual_steps)
@@ -612,18 +679,12 @@ class ODMRSweepContinuousExperiment(Experiment):
         
         # Read the data arrays
         try:
-            counts = self.adwin.read_probes('int_array', 1, n_points)  # Data_1
-            dac_digits = self.adwin.read_probes('int_array', 2, n_points)  # Data_2
-            
-            # Compute volts from DAC digits
-            volts = []
-            for d in dac_digits:
-                d_int = int(d)
-                if 0 <= d_int <= 65535:
-                    volt = (d_int * 20.0 / 65535.0) - 10.0
-                    volts.append(volt)
-                else:
-                    volts.append(0.0)  # Invalid digit
+            arrays = self.adwin.read_many({1: n_points, 2: n_points})['data']
+            counts = arrays[1]  # Data_1
+            dac_digits = arrays[2]  # Data_2
+            
+            # Compute volts from DAC digits, invalid digits give 0 V
+            volts = digits_to_volts(dac_digits, invalid=0.0)
             
             self.log(f"✅ Read {len(counts)} counts, {len(volts)} volts")
             
@@ -671,53 +732,41 @@ class ODMRSweepContinuousExperiment(Experiment):
     
     def _monitor_sweep_progress(self, total_wait_time: float):
         """Monitor ADwin state during sweep execution."""
-        start_time = time.time()
-        last_heartbeat = None
+        state_names = {
+            255: "IDLE", 10: "PREP", 20: "PREPARE", 30: "ISSUE_STEP",
+            31: "SETTLE", 32: "OPEN_WINDOW", 33: "DWELL", 34: "CLOSE_WINDOW",
+            35: "NEXT_STEP", 70: "READY"
+        }
         last_state = None
-        check_interval = 0.5  # Check every 500ms
         
-        self.log("🔍 Monitoring ADwin sweep progress...")
+        def sweep_ready(pars):
+            nonlocal last_state
+            # Log state changes
+            current_state = pars[26]
+            if last_state is not None and current_state != last_state:
+                state_name = state_names.get(current_state, f"UNKNOWN({current_state})")
+                self.log(f"   State: {current_state} ({state_name})")
+            last_state = current_state
+            return pars[20] == 1
         
-        while time.time() - start_time < total_wait_time:
-            try:
-                # Check heartbeat
-                current_heartbeat = self.adwin.get_int_var(25)
-                if last_heartbeat is not None and current_heartbeat == last_heartbeat:
-                    self.log(f"⚠️  Warning: ADwin heartbeat not advancing ({current_heartbeat})")
-                last_heartbeat = current_heartbeat
-                
-                # Check state
-                current_state = self.adwin.get_int_var(26)
-                if last_state is not None and current_state != last_state:
-                    state_names = {
-                        255: "IDLE", 10: "PREP", 20: "PREPARE", 30: "ISSUE_STEP",
-                        31: "SETTLE", 32: "OPEN_WINDOW", 33: "DWELL", 34: "CLOSE_WINDOW",
-                        35: "NEXT_STEP", 70: "READY"
-                    }
-                    state_name = state_names.get(current_state, f"UNKNOWN({current_state})")
-                    self.log(f"   State: {current_state} ({state_name})")
-                last_state = current_state
-                
-                # Check if ready (sweep complete)
-                ready_flag = self.adwin.get_int_var(20)
-                if ready_flag == 1:
-                    elapsed = time.time() - start_time
-                    self.log(f"✅ Sweep completed early at {elapsed:.2f}s (expected {total_wait_time:.2f}s)")
-                    break
-                    
-            except Exception as e:
-                self.log(f"⚠️  Error monitoring ADwin: {e}")
-            
-            time.sleep(check_interval)
+        self.log("🔍 Monitoring ADwin sweep progress...")
         
-        # Final status check
-        try:
-            final_heartbeat = self.adwin.get_int_var(25)
-            final_state = self.adwin.get_int_var(26)
-            final_ready = self.adwin.get_int_var(20)
-            self.log(f"🔍 Final status: heartbeat={final_heartbeat}, state={final_state}, ready={final_ready}")
-        except Exception as e:
-            self.log(f"⚠️  Could not get final ADwin status: {e}")
+        # Par_20 = ready flag, Par_25 = heartbeat, Par_26 = current state
+        status = self.adwin.wait_for(sweep_ready, pars=[20, 26], timeout=total_wait_time, heartbeat_par=25,
+                                     expected=total_wait_time)
+        if status['status'] == 'done':
+            self.log(f"✅ Sweep completed early at {status['elapsed']:.2f}s (expected {total_wait_time:.2f}s)")
+        elif status['status'] == 'stalled':
+            self.log(f"⚠️  Warning: ADwin heartbeat not advancing ({status['pars'].get(25)})")
+        if status['errors']:
+            self.log(f"⚠️  {status['errors']} errors monitoring ADwin")
+        
+        # Final status
+        if status['pars']:
+            pars = status['pars']
+            self.log(f"🔍 Final status: heartbeat={pars[25]}, state={pars[26]}, ready={pars[20]}")
+        else:
+            self.log("⚠️  Could not get final ADwin status")
     
     def _smooth_data(self, data: np.ndarray) -> np.ndarray:
         """Apply Savitzky-Golay smoothing to the data."""
@@ -809,6 +858,7 @@ class ODMRSweepContinuousExperiment(Experiment):
         self.data['counts_averaged'] = self.counts_averaged
         self.data['voltages'] = self.voltages
         self.data['sweep_time'] = self.sweep_time
+        self.data['duty_cycle'] = self.duty_cycle
         self.data['num_steps'] = self.num_steps
         self.data['fit_parameters'] = self.fit_parameters
         self.data['resonance_frequencies'] = self.resonance_frequencies
@@ -27,7 +27,7 @@ import time
 from src.core.experiment import Experiment
 from src.core.parameter import Parameter
 from src.Controller.sg384 import SG384Generator
-from src.Controller.adwin_gold import AdwinGoldDevice
+from src.Controller.adwin_gold import AdwinGoldDevice, digits_to_volts, volts_to_digits
 from src.Controller.nanodrive import MCLNanoDrive
 from src.core.adwin_helpers import setup_adwin_for_odmr, read_adwin_odmr_data
 
@@ -390,10 +390,7 @@ class ODMRSweepContinuousMultiExperiment(Experiment):
             custom_volts.append(val)
         
         # Convert to DAC digits
-        custom_digits = []
-        for v in custom_volts:
-            digit = int((v + 10.0) * 65535.0 / 20.0)
-            custom_digits.append(digit)
+        custom_digits = volts_to_digits(custom_volts).tolist()
         
         # Pad to 1000 elements
         while len(custom_digits) < 1000:
@@ -585,21 +582,11 @@ class ODMRSweepContinuousMultiExperiment(Experiment):
         # Wait for heartbeat to start advancing
         self.log("⏳ Waiting for ADwin heartbeat to start...")
         initial_hb = self.adwin.get_int_var(25)
-        start_time = time.time()
-        
-        while time.time() - start_time < 1.0:  # Wait up to 1 second
-            try:
-                current_hb = self.adwin.get_int_var(25)
-                if current_hb > initial_hb:
-                    self.log(f"✅ ADwin heartbeat advancing: {initial_hb} → {current_hb}")
-                    break
-                time.sleep(0.01)  # 10ms polling
-            except Exception as e:
-                self.log(f"⚠️  Transient Get_Par error (tolerated): {e}")
-                time.sleep(0.01)
-        else:
+        started = self.adwin.wait_for(lambda pars: pars[25] > initial_hb, pars=[25], timeout=1.0)
+        if started['status'] != 'done':
             self.log("❌ ADwin heartbeat not advancing after 1s - process not running!")
             return np.zeros(self.n_points), np.zeros(self.n_points)
+        self.log(f"✅ ADwin heartbeat advancing: {initial_hb} → {started['pars'][25]}")
         
         # Clear any stale ready flags first
         self.log("🧹 Clearing any stale ready flags...")
@@ -617,36 +604,19 @@ class ODMRSweepContinuousMultiExperiment(Experiment):
         self.log(f"⏳ Waiting for Par_20 == 1 (sweep ready)…")
         self.log(f"   Expected {self.n_points} points, timeout: {timeout:.1f}s")
         
-        t0 = time.time()
-        last_hb = self.adwin.get_int_var(25)
-        
-        while True:
-            try:
-                ready = self.adwin.get_int_var(20)  # ready flag
-                hb = self.adwin.get_int_var(25)     # heartbeat
-                state = self.adwin.get_int_var(26)  # current state
-                elapsed = time.time() - t0
-                
-                if ready == 1:
-                    self.log(f"✅ Sweep ready after {elapsed:.2f}s!")
-                    break
-                    
-                # Check if heartbeat is still advancing (after 100ms grace period)
-                if hb <= last_hb and elapsed > 0.1:
-                    self.log(f"⚠️  Heartbeat stalled at {hb}!")
-                    
-                last_hb = hb
-                time.sleep(0.05)
-            except Exception as e:
-                self.log(f"⚠️  Transient Get_Par error (tolerated): {e}")
-                time.sleep(0.05)  # Continue polling despite error
-
-            if elapsed > timeout:
-                self.log(f"❌ Timeout after {elapsed:.1f}s (expected ~{self.n_points * per_point_s:.1f}s)")
-                return np.zeros(self.n_points), np.zeros(self.n_points)
+        # Par_20 = ready flag, Par_21 = number of points, Par_25 = heartbeat
+        ready = self.adwin.wait_for(lambda pars: pars[20] == 1, pars=[20, 21], timeout=timeout, heartbeat_par=25,
+                                    expected=self.n_points * per_point_s)
+        if ready['status'] == 'stalled':
+            self.log(f"❌ Heartbeat stalled at {ready['pars'].get(25)} after {ready['elapsed']:.2f}s!")
+            return np.zeros(self.n_points), np.zeros(self.n_points)
+        if ready['status'] == 'timeout':
+            self.log(f"❌ Timeout after {ready['elapsed']:.1f}s (expected ~{self.n_points * per_point_s:.1f}s)")
+            return np.zeros(self.n_points), np.zeros(self.n_points)
+        self.log(f"✅ Sweep ready after {ready['elapsed']:.2f}s!")
         
         # Read arrays
-        n_points = self.adwin.get_int_var(21)
+        n_points = ready['pars'][21]
         if n_points <= 0:
             self.log("❌ n_points <= 0 — nothing to read.")
             return np.zeros(self.n_points), np.zeros(self.n_points)
@@ -655,18 +625,12 @@ class ODMRSweepContinuousMultiExperiment(Experiment):
         
         # Read the data arrays
         try:
-            counts = self.adwin.read_probes('int_array', 1, n_points)  # Data_1
-            dac_digits = self.adwin.read_probes('int_array', 2, n_points)  # Data_2
-            
-            # Compute volts from DAC digits
-            volts = []
-            for d in dac_digits:
-                d_int = int(d)
-                if 0 <= d_int <= 65535:
-                    volt = (d_int * 20.0 / 65535.0) - 10.0
-                    volts.append(volt)
-                else:
-                    volts.append(0.0)  # Invalid digit
+            arrays = self.adwin.read_many({1: n_points, 2: n_points})['data']
+            counts = arrays[1]  # Data_1
+            dac_digits = arrays[2]  # Data_2
+            
+            # Compute volts from DAC digits, invalid digits give 0 V
+            volts = digits_to_volts(dac_digits, invalid=0.0)
             
             self.log(f"✅ Read {len(counts)} counts, {len(volts)} volts")
             
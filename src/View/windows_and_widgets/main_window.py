@@ -20,7 +20,7 @@ import pyqtgraph as pg
 
 from src.core import Parameter, Device, Experiment, Probe
 from src.core.experiment_iterator import ExperimentIterator
-from src.core.read_probes import ReadProbes
+from src.core.read_probes import ReadProbes, CALL_STATS_PROBE
 from src.View.windows_and_widgets import AQuISSQTreeItem, LoadDialog, LoadDialogProbes, ExportDialog, PyQtgraphWidget, PyQtCoordinatesBar
 from src.Model.experiments.select_points import SelectPoints
 from src.core.read_write_functions import load_aqs_file
@@ -1242,8 +1242,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                         self.log('Can\'t plot, No probe selected. Select probe and try again!')
                     else:
                         device = item.parent().name
-                        self.probe_to_plot = self.probes[device][item.name]
-                        gui_logger.info(f"Probe plot enabled for {item.name} on device {device}")
+                        self.probe_to_plot = self.probes[device].get(item.name)
+                        if self.probe_to_plot is None:
+                            # e.g. the call latency entry of an instrumented device
+                            gui_logger.warning(f"Can't plot {item.name}, it is not a probe")
+                            self.log(f'Can\'t plot {item.name}, it is not a probe')
+                        else:
+                            gui_logger.info(f"Probe plot enabled for {item.name} on device {device}")
                 else:
                     gui_logger.warning("Can't plot, No probe selected. Select probe and try again!")
                     self.log('Can\'t plot, No probe selected. Select probe and try again!')
@@ -2206,7 +2211,8 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
 
         if self.chk_probe_log.isChecked():
-            data = ','.join(list(np.array([[str(p) for p in list(p_dict.values())] for instr, p_dict in new_values.items()]).flatten()))
+            data = ','.join(list(np.array([[str(p) for name, p in p_dict.items() if name != CALL_STATS_PROBE]
+                                           for instr, p_dict in new_values.items()]).flatten()))
             self.probe_file.write('{:s}\n'.format(data))
 
     def update_experiment_from_item(self, item):
@@ -1,5 +1,18 @@
 # project level imports to be shared by all modules
 
-import pint
-# create the unit registry here so that all modules can share it
-ur = pint.UnitRegistry()
\ No newline at end of file
+import threading
+
+_ur_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # the unit registry that all modules share (from src import ur) is created on first use, building it takes a
+    # few hundred milliseconds of every import of src otherwise
+    if name == 'ur':
+        global ur
+        with _ur_lock:
+            if 'ur' not in globals():
+                import pint
+                ur = pint.UnitRegistry()
+        return ur
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,216 @@
+"""
+Background Save Pipeline
+
+This module provides a bounded save queue that writes experiment data (CSV, .mat and the -info.txt log) on a
+worker thread, so that Experiment.run does not block on file export. This matters most inside an
+ExperimentIterator, where the export time of every sweep point otherwise keeps the hardware idle.
+
+The plot images are still exported on the experiment thread because they need the live plot functions of the
+experiment; only a snapshot of the data, settings and log is handed to the worker.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import copy
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+
+class SaveJob:
+    """
+    Snapshot of everything needed to write the files of one experiment run. Filenames are resolved when the job
+    is created because the tag and start time of an experiment change as soon as the next run starts.
+    """
+
+    def __init__(self, experiment, data, settings, log_data, filenames: Dict[str, str], result_cubes=None):
+        self.experiment = experiment
+        self.name = experiment.name
+        self.data = data
+        self.settings = settings
+        self.log_data = log_data
+        self.filenames = filenames
+        self.result_cubes = result_cubes  # sweep grids of an ExperimentIterator, see src/core/result_cube.py
+        self.timings = {}  # format -> seconds spent writing
+
+    @classmethod
+    def from_experiment(cls, experiment):
+        """
+        takes an immutable snapshot of the data, settings, log and result cubes of the experiment
+        """
+        filenames = {
+            'data': experiment.filename('.csv'),
+            'matlab': experiment.filename('.mat'),
+            'log': experiment.filename('-info.txt'),
+        }
+        return cls(experiment, copy.deepcopy(experiment.data), copy.deepcopy(experiment.settings),
+                   list(experiment.log_data), filenames,
+                   result_cubes=copy.deepcopy(getattr(experiment, 'result_cubes', None)) or None)
+
+
+class BackgroundSaver:
+    """
+    Bounded queue with a single worker thread that writes the data files of experiments.
+
+    submit() blocks when max_queue jobs are already waiting (backpressure), so a fast sweep cannot pile up an
+    unbounded amount of data in memory. wait() blocks until every submitted job has been written.
+
+    Usage:
+        saver = BackgroundSaver(max_queue=4)
+        experiment.background_saver = saver  # Experiment.run now submits instead of saving
+        ...
+        saver.wait()
+        saver.close()
+    """
+
+    FORMATS = ['data', 'matlab', 'log']
+
+    def __init__(self, max_queue: int = 4, log_function: Optional[Callable[[str], None]] = None,
+                 formats: Optional[List[str]] = None):
+        """
+        Args:
+            max_queue: maximum number of jobs waiting to be written before submit blocks
+            log_function: function that takes a string, used to report timings and errors; defaults to print
+            formats: subset of FORMATS to write
+        """
+        self.max_queue = max(int(max_queue), 1)
+        self.log_function = log_function
+        self.formats = list(self.FORMATS if formats is None else formats)
+        for fmt in self.formats:
+            if fmt not in self.FORMATS:
+                raise ValueError(f'unknown save format {fmt}, expected one of {self.FORMATS}')
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self.errors = []  # list of (experiment name, exception)
+        self.completed = []  # list of (experiment name, {format: seconds})
+        self.blocked_time = 0.0  # total time submit waited because the queue was full
+
+        self._worker = threading.Thread(target=self._run, name='BackgroundSaver', daemon=True)
+        self._closed = False
+        self._worker.start()
+
+    def log(self, string):
+        if self.log_function is None:
+            print(string)
+        else:
+            self.log_function(string)
+
+    @property
+    def pending(self) -> int:
+        """number of jobs submitted but not yet written"""
+        return self._queue.unfinished_tasks
+
+    def submit(self, experiment, timeout: Optional[float] = None) -> SaveJob:
+        """
+        snapshots the experiment and queues it for writing. Blocks while the queue is full.
+        Args:
+            experiment: experiment that just finished running
+            timeout: maximum time in s to wait for a free slot, None waits forever
+
+        Returns: the queued SaveJob
+        """
+        if self._closed:
+            raise RuntimeError('BackgroundSaver has been closed')
+        job = SaveJob.from_experiment(experiment)
+        start = time.perf_counter()
+        try:
+            self._queue.put(job, block=True, timeout=timeout)
+        except queue.Full:
+            raise TimeoutError(f'save queue still full after {timeout} s, could not queue {job.name}')
+        finally:
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.blocked_time += waited
+        if waited > 0.01:
+            self.log('save queue full: waited {:.3f} s to queue {:s}'.format(waited, job.name))
+        return job
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        blocks until all submitted jobs have been written
+        Args:
+            timeout: maximum time in s to wait, None waits forever
+
+        Returns: True if the queue has been drained, False on timeout
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.perf_counter() + timeout
+        while self._queue.unfinished_tasks > 0:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        writes the remaining jobs and stops the worker thread
+        """
+        if self._closed:
+            return
+        self.wait(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns: total write time per format over all completed jobs
+        """
+        totals = {fmt: 0.0 for fmt in self.formats}
+        with self._lock:
+            for _, timings in self.completed:
+                for fmt, seconds in timings.items():
+                    totals[fmt] += seconds
+        return totals
+
+    def _write(self, job: SaveJob):
+        experiment = job.experiment
+        for filename in job.filenames.values():
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        for fmt in self.formats:
+            if fmt == 'log':
+                continue  # written last so that it contains the timings
+            start = time.perf_counter()
+            if fmt == 'data':
+                experiment.save_data(job.filenames['data'], data=job.data)
+            elif fmt == 'matlab':
+                cubes = {'result_cubes': job.result_cubes} if job.result_cubes else {}
+                experiment.save_data_to_matlab(job.filenames['matlab'], data=job.data, settings=job.settings, **cubes)
+            job.timings[fmt] = time.perf_counter() - start
+
+        timing_str = ', '.join('{:s}: {:.3f} s'.format(fmt, seconds) for fmt, seconds in job.timings.items())
+        if 'log' in self.formats:
+            start = time.perf_counter()
+            job.log_data.append('background save timings: ' + timing_str)
+            experiment.save_log(job.filenames['log'], log_data=job.log_data)
+            job.timings['log'] = time.perf_counter() - start
+        self.log('saved {:s} ({:s})'.format(job.name, timing_str))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            try:
+                self._write(job)
+                with self._lock:
+                    self.completed.append((job.name, dict(job.timings)))
+            except Exception as err:
+                with self._lock:
+                    self.errors.append((job.name, err))
+                self.log('background save of {:s} failed: {:s}'.format(job.name, str(err)))
+                self.log(traceback.format_exc())
+            finally:
+                # drop the references to the data as soon as it has been written
+                job.data = None
+                job.experiment = None
+                self._queue.task_done()
@@ -0,0 +1,301 @@
+"""
+Headless Batch Runner
+
+Runs a queue of experiments back to back in one process, without the GUI. Devices are created once from the lab
+config (DeviceConfigManager.load_devices_from_config) and kept connected for the whole queue, the experiments of
+every job are loaded from an .aqs file with Experiment.load_and_append and executed on the calling thread. Progress
+is reported as one JSON object per line, to stdout or to a file, so that overnight runs can be followed with
+`tail -f` or parsed afterwards.
+
+A queue file is a JSON list of jobs (or {"jobs": [...]}). A job is either the path of an .aqs file or a dictionary:
+
+    {"file": "confocal.aqs",            # .aqs file with the experiments of the job
+     "experiments": ["confocal"],       # optional, names of the experiments in the file to run, default all
+     "settings": {"point_a": {...}},    # optional, settings updates applied to every experiment of the job
+     "repeat": 3,                       # optional, number of times the job is run
+     "name": "overnight_confocal"}      # optional, name of the job in the progress output
+
+Relative file names are resolved relative to the queue file.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import datetime
+import json
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from src.core.device import Device
+from src.core.experiment import Experiment
+from src.core.read_write_functions import load_aqs_file
+
+
+class ProgressReporter:
+    """
+    Writes progress events as JSON lines. Every event has the keys 'time' (ISO format) and 'event', see
+    BatchRunner for the events and their fields.
+    """
+
+    def __init__(self, target=None):
+        """
+        Args:
+            target: file name or open text stream to write to, defaults to stdout
+        """
+        self._owns_stream = isinstance(target, (str, Path))
+        if self._owns_stream:
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            self.stream = open(target, 'a')
+        else:
+            self.stream = target if target is not None else sys.stdout
+
+    def emit(self, event: str, **fields):
+        record = {'time': datetime.datetime.now().isoformat(timespec='milliseconds'), 'event': event}
+        record.update(fields)
+        self.stream.write(json.dumps(record, default=str) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self._owns_stream:
+            self.stream.close()
+
+
+class BatchJob:
+    """
+    One entry of the queue, see the module docstring for the fields.
+    """
+
+    def __init__(self, file, experiments: Optional[List[str]] = None, settings: Optional[Dict] = None,
+                 repeat: int = 1, name: Optional[str] = None):
+        self.file = Path(file)
+        self.experiments = experiments
+        self.settings = settings or {}
+        self.repeat = int(repeat)
+        self.name = name or self.file.stem
+
+    @classmethod
+    def from_spec(cls, spec: Union[str, Dict], base_dir=None) -> 'BatchJob':
+        """
+        Args:
+            spec: path of an .aqs file or a job dictionary
+            base_dir: folder that relative file names are relative to
+        """
+        if isinstance(spec, (str, Path)):
+            spec = {'file': spec}
+        spec = dict(spec)
+        if 'file' not in spec:
+            raise ValueError('job {!r} has no file'.format(spec))
+        path = Path(spec.pop('file'))
+        if base_dir is not None and not path.is_absolute():
+            path = Path(base_dir) / path
+        return cls(path, **spec)
+
+    def __repr__(self):
+        return 'BatchJob({!r}, repeat={:d})'.format(str(self.file), self.repeat)
+
+
+def load_queue(queue_file) -> List[BatchJob]:
+    """
+    Args:
+        queue_file: JSON file with the list of jobs
+
+    Returns: list of BatchJob
+    """
+    queue_file = Path(queue_file)
+    with open(queue_file, 'r') as infile:
+        content = json.load(infile)
+    if isinstance(content, dict):
+        content = content.get('jobs', [])
+    return [BatchJob.from_spec(spec, base_dir=queue_file.parent) for spec in content]
+
+
+class BatchRunner:
+    """
+    Executes a queue of jobs with a shared set of devices.
+
+    Usage:
+        with BatchRunner(config_path='src/config.json', progress='overnight.jsonl') as runner:
+            results = runner.run(load_queue('overnight_queue.json'))
+
+    Events written to the progress output:
+        batch_started (jobs), devices_loaded (devices, failed), job_started (job, run, experiment),
+        progress (job, run, experiment, percent), job_finished (job, run, experiment, success, duration, data_path),
+        job_failed (job, run, experiment, error), log (experiment, message), batch_finished (succeeded, failed,
+        aborted, duration)
+    """
+
+    def __init__(self, config_path=None, devices: Optional[Dict[str, Device]] = None, progress=None,
+                 data_path=None, stop_on_error: bool = False):
+        """
+        Args:
+            config_path: config.json with the devices of the lab, see DeviceConfigManager
+            devices: already created devices, {name: instance}; if given the config is not read
+            progress: ProgressReporter, or file name / stream for the JSON lines, defaults to stdout
+            data_path: folder for the data of experiments with a relative 'path' setting
+            stop_on_error: stop the queue at the first job that fails
+        """
+        self.config_path = Path(config_path) if config_path is not None else None
+        self.devices = dict(devices) if devices is not None else None
+        self.reporter = progress if isinstance(progress, ProgressReporter) else ProgressReporter(progress)
+        self.data_path = str(data_path) if data_path is not None else None
+        self.stop_on_error = stop_on_error
+        self.current_experiment = None
+        self._abort = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def load_devices(self) -> Dict[str, Device]:
+        """
+        creates the devices of the config on first call; later calls return the same, still connected, instances
+        """
+        if self.devices is None:
+            from src.core.device_config import DeviceConfigManager
+            devices, failed = DeviceConfigManager(self.config_path).load_devices_from_config()
+            self.devices = devices
+            self.reporter.emit('devices_loaded', devices=sorted(devices), failed=failed)
+        return self.devices
+
+    def load_experiments(self, job: BatchJob) -> Dict[str, Experiment]:
+        """
+        creates the experiments of a job, reusing the devices that are already loaded
+
+        Returns: {name: experiment} in the order of job.experiments, or of the file
+        """
+        if not job.file.is_file():
+            raise FileNotFoundError('no such .aqs file: {:s}'.format(str(job.file)))
+        in_data = load_aqs_file(str(job.file))
+        experiment_dict = in_data.get('experiments', {})
+        names = job.experiments if job.experiments is not None else list(experiment_dict)
+        missing = [name for name in names if name not in experiment_dict]
+        if missing:
+            raise KeyError('experiments {:s} not found in {:s}'.format(', '.join(missing), str(job.file)))
+
+        devices = self.load_devices()
+        new_devices = {name: spec for name, spec in in_data.get('devices', {}).items() if name not in devices}
+        if new_devices:
+            devices, failed = Device.load_and_append(new_devices, devices)
+            if failed:
+                self.reporter.emit('log', experiment=job.name, message='devices not loaded: {}'.format(failed))
+            self.devices = devices
+
+        experiments, failed, self.devices = Experiment.load_and_append(
+            experiment_dict={name: experiment_dict[name] for name in names},
+            devices=self.devices, log_function=self._log_function(job.name), data_path=self.data_path)
+        if failed:
+            raise ImportError('could not load {:s}: {}'.format(', '.join(failed), failed))
+        for experiment in experiments.values():
+            experiment.settings.update(job.settings)
+        return {name: experiments[name] for name in names}
+
+    def _log_function(self, name):
+        def log(message):
+            self.reporter.emit('log', experiment=name, message=str(message))
+        return log
+
+    def run_experiment(self, experiment: Experiment, job: BatchJob, run: int) -> bool:
+        """
+        runs a single experiment on the calling thread
+
+        Returns: True if the experiment finished without error and was not stopped
+        """
+        fields = {'job': job.name, 'run': run, 'experiment': experiment.name}
+        last_percent = [None]
+
+        def on_progress(percent):
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                self.reporter.emit('progress', percent=percent, **fields)
+
+        experiment.updateProgress.connect(on_progress)
+        self.current_experiment = experiment
+        self.reporter.emit('job_started', **fields)
+        start = time.perf_counter()
+        try:
+            experiment.run()
+        except Exception as err:
+            self.reporter.emit('job_failed', error='{:s}: {:s}'.format(type(err).__name__, str(err)),
+                               traceback=traceback.format_exc(), duration=time.perf_counter() - start, **fields)
+            return False
+        finally:
+            self.current_experiment = None
+            experiment.updateProgress.disconnect(on_progress)
+
+        success = not experiment._abort
+        data_path = experiment.filename(create_if_not_existing=False) if experiment.settings['save'] else None
+        self.reporter.emit('job_finished', success=success, duration=time.perf_counter() - start,
+                           data_path=data_path, **fields)
+        return success
+
+    def run(self, jobs: List[Union[BatchJob, str, Dict]]) -> List[Dict]:
+        """
+        runs the jobs one after another
+
+        Args:
+            jobs: BatchJob instances, .aqs file names or job dictionaries
+
+        Returns: one result dictionary per experiment run, {'job', 'run', 'experiment', 'success', 'error'}
+        """
+        jobs = [job if isinstance(job, BatchJob) else BatchJob.from_spec(job) for job in jobs]
+        self._abort = False
+        results = []
+        batch_start = time.perf_counter()
+        self.reporter.emit('batch_started', jobs=[job.name for job in jobs])
+        self.load_devices()
+
+        for job in jobs:
+            for run in range(job.repeat):
+                if self._abort:
+                    break
+                try:
+                    experiments = self.load_experiments(job)
+                except Exception as err:
+                    error = '{:s}: {:s}'.format(type(err).__name__, str(err))
+                    self.reporter.emit('job_failed', job=job.name, run=run, experiment=None, error=error)
+                    results.append({'job': job.name, 'run': run, 'experiment': None, 'success': False,
+                                    'error': error})
+                    experiments = {}
+                for name, experiment in experiments.items():
+                    if self._abort:
+                        break
+                    success = self.run_experiment(experiment, job, run)
+                    results.append({'job': job.name, 'run': run, 'experiment': name, 'success': success,
+                                    'error': None})
+                if self.stop_on_error and results and not results[-1]['success']:
+                    break
+            if self._abort or (self.stop_on_error and results and not results[-1]['success']):
+                break
+
+        succeeded = sum(result['success'] for result in results)
+        self.reporter.emit('batch_finished', succeeded=succeeded, failed=len(results) - succeeded,
+                           aborted=self._abort, duration=time.perf_counter() - batch_start)
+        return results
+
+    def stop(self):
+        """
+        stops the running experiment and skips the rest of the queue
+        """
+        self._abort = True
+        if self.current_experiment is not None:
+            self.current_experiment.stop()
+
+    def close(self):
+        """
+        disconnects the devices and closes the progress output
+        """
+        for name, device in (self.devices or {}).items():
+            close = getattr(device, 'close', None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as err:
+                    self.reporter.emit('log', experiment=None, message='closing {:s} failed: {}'.format(name, err))
+        self.devices = None
+        self.reporter.close()
@@ -19,6 +19,8 @@ from copy import deepcopy
 from importlib import import_module
 from src.core.helper_functions import module_name_from_path
 from src.core.read_write_functions import save_aqs_file
+from src.core.tracing import traced_method
+from src.core.settings_cache import cached_read_probes, cached_update
 
 
 class Device:
@@ -34,6 +36,28 @@ class Device:
     """
     _DEFAULT_SETTINGS = Parameter("default", 0, int, "some int parameter")
 
+    # write-through settings cache, see src/core/settings_cache.py
+    _CACHE_SETTINGS = False  # opt in per device once its action keys are listed in _UNCACHED_SETTINGS
+    _UNCACHED_SETTINGS = ()  # keys that trigger an action and are passed to update every time
+    _STATIC_PROBES = ()  # probes that only change through update, served from the cache for probe_cache_ttl
+    _PROBE_CACHE_TTL = 1.0  # s
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        records the calls of the public methods of every device as timing spans while tracing is on, see
+        src/core/tracing.py; while tracing is off the wrapper only checks a flag. update and read_probes also go
+        through the settings cache, see src/core/settings_cache.py
+        """
+        super().__init_subclass__(**kwargs)
+        if inspect.isfunction(cls.__dict__.get('update')) and not getattr(cls.update, '_settings_cached', False):
+            cls.update = cached_update(cls.__dict__['update'])
+        if (inspect.isfunction(cls.__dict__.get('read_probes'))
+                and not getattr(cls.read_probes, '_settings_cached', False)):
+            cls.read_probes = cached_read_probes(cls.__dict__['read_probes'])
+        for attribute, value in list(cls.__dict__.items()):
+            if not attribute.startswith('_') and inspect.isfunction(value) and not getattr(value, '_traced', False):
+                setattr(cls, attribute, traced_method(value))
+
     @classmethod
     def _get_base_settings(cls):
         """
@@ -69,6 +93,13 @@ class Device:
 
         self._is_connected = False  # internal flag that indicated if device is actually connected
 
+        # settings last sent to the hardware and cached probe values, see src/core/settings_cache.py
+        self._cache_settings = self._CACHE_SETTINGS
+        self._applied_settings = {}
+        self._probe_cache = {}
+        self._settings_update_depth = 0
+        self.probe_cache_ttl = self._PROBE_CACHE_TTL
+
         if settings is not None:
             self.update(settings)
 
@@ -93,6 +124,30 @@ class Device:
         """
         self._settings.update(settings)
 
+    def invalidate_settings_cache(self, keys=None):
+        """
+        forgets the settings last applied to the device, so that the next update sends them again.
+        Call it when the connection is reopened or the instrument changes state outside of update.
+        Args:
+            keys: top level settings keys to forget, all if None
+        """
+        applied = vars(self).get('_applied_settings')
+        if applied is None:
+            return
+        if keys is None:
+            applied.clear()
+        else:
+            for key in keys:
+                applied.pop(key, None)
+        self._probe_cache.clear()
+
+    def enable_settings_cache(self, enabled=True):
+        """
+        switches the settings cache of this device on or off, see src/core/settings_cache.py
+        """
+        self._cache_settings = enabled
+        self.invalidate_settings_cache()
+
     def update_and_get(self, settings):
         """
         Update device settings and return the actual values from hardware.
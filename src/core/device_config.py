@@ -7,10 +7,12 @@ for different lab environments.
 """
 
 import json
+import os
 import traceback
 from pathlib import Path
 from typing import Dict, Any, Optional, Tuple
 from .device import Device
+from .device_stats import STATS_ENV_VAR, instrument_device
 from .helper_functions import module_name_from_path
 from importlib import import_module
 
@@ -20,13 +22,16 @@ class DeviceConfigManager:
     Manages device configurations and instantiation from config files.
     """
     
-    def __init__(self, config_path: Optional[Path] = None):
+    def __init__(self, config_path: Optional[Path] = None, instrument: Optional[bool] = None):
         """
         Initialize the device config manager.
         
         Args:
             config_path: Path to config.json file. If None, will look for config.json
                         in the project root.
+            instrument: Record call latency statistics of every device (see device_stats.py).
+                        If None, the "instrument" key of each device config, the top level
+                        "instrument_devices" key or the AQUISS_DEVICE_STATS environment variable decide.
         """
         if config_path is None:
             # Look for config.json in src directory
@@ -38,6 +43,7 @@ class DeviceConfigManager:
             print(f"[INFO] Using provided config_path: {config_path}")
         
         self.config_path = config_path
+        self.instrument = instrument
         self.config = self._load_config()
     
     def _load_config(self) -> Dict[str, Any]:
@@ -158,6 +164,9 @@ class DeviceConfigManager:
             # Create device instance with settings
             device_instance = device_class(name=device_name, settings=device_settings)
             
+            if self._instrumentation_enabled(device_config):
+                instrument_device(device_instance, methods=device_config.get('instrument_methods'))
+            
             return device_instance
             
         except Exception as e:
@@ -165,6 +174,24 @@ class DeviceConfigManager:
             traceback.print_exc()
             return None
     
+    def _instrumentation_enabled(self, device_config: Dict[str, Any]) -> bool:
+        """
+        Whether the calls of a device are timed, see __init__.
+        
+        Args:
+            device_config: Device configuration dictionary
+            
+        Returns:
+            True if the device should be instrumented
+        """
+        if self.instrument is not None:
+            return self.instrument
+        if 'instrument' in device_config:
+            return bool(device_config['instrument'])
+        if 'instrument_devices' in self.config:
+            return bool(self.config['instrument_devices'])
+        return os.environ.get(STATS_ENV_VAR, '').lower() in ('1', 'true', 'yes', 'on')
+    
     def reload_config(self) -> None:
         """
         Reload the configuration from the config file.
@@ -0,0 +1,272 @@
+"""
+Device Call Statistics
+
+Opt-in instrumentation that records how often and how long the methods of a device are called: every public method,
+the low level I/O helpers (_query, _send, ...), every read_probes key and the calls into the vendor driver object of
+the device (ADwin Get_Par, NanoDrive MCL_*, ...). Each call name keeps a count, the total time and a latency
+histogram with logarithmic bins, from which percentiles are estimated without storing every call.
+
+The instrumentation is applied to a device instance in place by instrument_device; the class and isinstance checks
+are unchanged. DeviceConfigManager applies it to the devices it creates when a device config has "instrument": true,
+the config has "instrument_devices": true, or the environment variable AQUISS_DEVICE_STATS=1 is set.
+
+Usage:
+    stats = instrument_device(sg384)
+    sg384.update({'frequency': 2.87e9})
+    stats.summary()['_send']['p99']
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import functools
+import inspect
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+STATS_ENV_VAR = 'AQUISS_DEVICE_STATS'
+
+# private methods that talk to the instrument, instrumented in addition to the public methods
+IO_METHODS = ('_query', '_send', '_write', '_read', '_send_command', '_read_response')
+
+
+class LatencyHistogram:
+    """
+    Count, total, min, max and a histogram with BINS_PER_DECADE logarithmic bins between MIN_TIME and MAX_TIME.
+    """
+    BINS_PER_DECADE = 20
+    MIN_TIME = 1e-7  # s
+    MAX_TIME = 1e3  # s
+
+    def __init__(self):
+        self._decades = math.log10(self.MAX_TIME / self.MIN_TIME)
+        self.counts = np.zeros(int(round(self._decades * self.BINS_PER_DECADE)) + 2, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if seconds < self.MIN_TIME:
+            index = 0
+        else:
+            index = min(int(math.log10(seconds / self.MIN_TIME) * self.BINS_PER_DECADE) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        Args:
+            p: percentile between 0 and 100
+
+        Returns: estimate of the p-th percentile in seconds, the geometric center of the bin it falls into, limited to
+        the measured min and max; min or max for the under- and overflow bins
+        """
+        if self.count == 0:
+            return math.nan
+        rank = p / 100. * self.count
+        index = int(np.searchsorted(np.cumsum(self.counts), max(rank, 1), side='left'))
+        if index == 0:
+            return self.min
+        if index == len(self.counts) - 1:
+            return self.max
+        value = self.MIN_TIME * 10 ** ((index - 0.5) / self.BINS_PER_DECADE)
+        return min(max(value, self.min), self.max)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns: count, total, mean, min, max, p50, p90 and p99, times in seconds
+        """
+        return {'count': self.count, 'total': self.total, 'mean': self.total / self.count if self.count else math.nan,
+                'min': self.min if self.count else math.nan, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99)}
+
+
+class DeviceCallStats:
+    """
+    Latency histograms of the calls of one device, by call name.
+    """
+
+    def __init__(self, device_name: str = ''):
+        self.device_name = device_name
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(call)
+            if histogram is None:
+                histogram = self.histograms[call] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def summary(self) -> 'OrderedDict':
+        """
+        Returns: {call: LatencyHistogram.summary()}, the call with the largest total time first
+        """
+        with self._lock:
+            rows = [(call, histogram.summary()) for call, histogram in self.histograms.items()]
+        return OrderedDict(sorted(rows, key=lambda row: row[1]['total'], reverse=True))
+
+    def format_table(self) -> List[str]:
+        """
+        Returns: the summary as lines of a text table, times in ms
+        """
+        lines = ['{:<36s} {:>8s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s}'.format(
+            'call', 'count', 'total [s]', 'mean', 'p50', 'p99', 'max')]
+        for call, row in self.summary().items():
+            lines.append('{:<36s} {:>8d} {:>10.4f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+                call[:36], row['count'], row['total'], row['mean'] * 1e3, row['p50'] * 1e3, row['p99'] * 1e3,
+                row['max'] * 1e3))
+        return lines
+
+    def display_value(self, max_calls: int = 4) -> str:
+        """
+        Returns: one line for the probe tree, the calls with the largest total time as 'call mean/p99 ms (count)'
+        """
+        rows = list(self.summary().items())
+        text = ', '.join('{:s} {:.2f}/{:.2f} ms ({:d})'.format(call, row['mean'] * 1e3, row['p99'] * 1e3, row['count'])
+                         for call, row in rows[:max_calls])
+        if len(rows) > max_calls:
+            text += ', ... {:d} more'.format(len(rows) - max_calls)
+        return text
+
+
+def _timed(function, stats: DeviceCallStats, call: str):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.record(call, time.perf_counter() - start)
+    return wrapper
+
+
+def _timed_read_probes(function, stats: DeviceCallStats):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        key = args[0] if args else kwargs.get('key')
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats.record('read_probes[{}]'.format(key), time.perf_counter() - start)
+    return wrapper
+
+
+class _TimedCallable:
+    """
+    Times the calls of a function of a driver; other attributes, e.g. restype and argtypes of a ctypes function,
+    are read from and written to the function itself.
+    """
+
+    def __init__(self, function, stats: DeviceCallStats, call: str):
+        object.__setattr__(self, '__wrapped__', function)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_call', call)
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.__wrapped__(*args, **kwargs)
+        finally:
+            self._stats.record(self._call, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.__wrapped__, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.__wrapped__, name, value)
+
+
+class _DriverProxy:
+    """
+    Stands in for the vendor driver object of a device and times every call of its methods.
+    """
+
+    def __init__(self, driver, stats: DeviceCallStats):
+        object.__setattr__(self, '_driver', driver)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_wrapped', {})
+
+    def __getattr__(self, name):
+        value = getattr(self._driver, name)
+        if not callable(value) or name.startswith('__'):
+            return value
+        wrapped = self._wrapped.get(name)
+        if wrapped is None or wrapped.__wrapped__ is not value:
+            wrapped = self._wrapped[name] = _TimedCallable(value, self._stats, name)
+        return wrapped
+
+    def __setattr__(self, name, value):
+        setattr(self._driver, name, value)
+
+
+def instrument_device(device, methods: Optional[Iterable[str]] = None,
+                      drivers: Optional[Iterable[str]] = None) -> DeviceCallStats:
+    """
+    records the latency of the calls of device, see the module docstring; calling it again returns the existing stats
+
+    Args:
+        device: Device instance
+        methods: additional method names to time, e.g. private helpers that are not in IO_METHODS
+        drivers: names of attributes that hold the vendor driver object, in addition to the _DRIVER_ATTRIBUTES of the
+                 device class
+
+    Returns: the DeviceCallStats of the device, also available as device.call_stats
+    """
+    stats = get_call_stats(device)
+    if stats is not None:
+        return stats
+    stats = DeviceCallStats(vars(device).get('_name', type(device).__name__))
+
+    names = {name for name, value in inspect.getmembers(type(device), inspect.isfunction)
+             if not name.startswith('_')}
+    names.update(name for name in IO_METHODS if callable(getattr(type(device), name, None)))
+    names.update(methods or ())
+    for name in sorted(names):
+        method = getattr(device, name, None)
+        if not callable(method):
+            continue
+        wrapper = _timed_read_probes(method, stats) if name == 'read_probes' else _timed(method, stats, name)
+        # instance attributes shadow the class methods, also for calls from inside the class
+        object.__setattr__(device, name, wrapper)
+
+    for name in list(getattr(type(device), '_DRIVER_ATTRIBUTES', ())) + list(drivers or ()):
+        driver = vars(device).get(name)
+        if driver is not None and not isinstance(driver, _DriverProxy):
+            object.__setattr__(device, name, _DriverProxy(driver, stats))
+
+    object.__setattr__(device, 'call_stats', stats)
+    return stats
+
+
+def get_call_stats(device) -> Optional[DeviceCallStats]:
+    """
+    Returns: the DeviceCallStats of an instrumented device, None if the device is not instrumented
+    """
+    return vars(device).get('call_stats')
+
+
+def call_stats_summary(devices: Dict) -> Dict[str, 'OrderedDict']:
+    """
+    Args:
+        devices: {name: device instance}, as returned by DeviceConfigManager.load_devices_from_config
+
+    Returns: {device name: DeviceCallStats.summary()} of the instrumented devices
+    """
+    return {name: get_call_stats(device).summary() for name, device in devices.items()
+            if get_call_stats(device) is not None}
@@ -0,0 +1,248 @@
+"""
+Discovery Cache
+
+Finding the experiments and devices in a folder (export_default.find_exportable_in_python_files, the export dialog)
+requires importing every module, which in turn imports the vendor libraries of all controllers. This module keeps
+a persistent JSON cache of what was found in each python file: the class names, docstrings, default settings and
+the devices and subexperiments they require. An entry is valid as long as the file, and the files that define the
+base classes of its classes, are unchanged. Files are compared by modification time and size first and by their
+SHA-1 hash if those differ, so touching a file without changing it does not invalidate the cache.
+
+Modules are only imported on a cache miss, or when an experiment or device is actually created.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sys
+from importlib import import_module
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.core.helper_functions import module_name_from_path
+
+CACHE_VERSION = 1
+
+
+def file_signature(path) -> Dict:
+    """
+    Returns: modification time, size and SHA-1 hash of a file
+    """
+    stat = os.stat(path)
+    with open(path, 'rb') as infile:
+        sha1 = hashlib.sha1(infile.read()).hexdigest()
+    return {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': sha1}
+
+
+def _jsonable(value):
+    """converts settings values to something json can store, e.g. numpy scalars and arrays to python types"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _class_names(dic) -> Dict[str, str]:
+    """class names of the _DEVICES or _EXPERIMENTS of a class, empty if they are not a plain dictionary"""
+    if not isinstance(dic, dict):
+        return {}
+    return {name: getattr(cls, '__name__', str(cls)) for name, cls in dic.items()}
+
+
+def describe_class(cls) -> Dict:
+    """
+    Returns: the information about an experiment or device class that is stored in the cache
+    """
+    try:
+        default_settings = {}
+        for parameter in cls._DEFAULT_SETTINGS:
+            default_settings.update(parameter)
+        default_settings = _jsonable(default_settings)
+    except Exception:
+        default_settings = {}
+    return {
+        'class': cls.__name__,
+        'filepath': inspect.getfile(cls),
+        'info': inspect.getdoc(cls),
+        'default_settings': default_settings,
+        'required_devices': _class_names(getattr(cls, '_DEVICES', {})),
+        'required_experiments': _class_names(getattr(cls, '_EXPERIMENTS', {})),
+    }
+
+
+class DiscoveryCache:
+    """
+    Persistent cache of the experiment and device classes defined in python files.
+
+    Usage:
+        cache = DiscoveryCache()
+        classes = cache.discover('/path/to/experiment.py', Experiment)  # imports only on a miss
+        cache.save()
+    """
+
+    def __init__(self, cache_file=None):
+        """
+        Args:
+            cache_file: json file that holds the cache, defaults to discovery_cache.json in the default save location
+        """
+        if cache_file is None:
+            from src.config_paths import DEFAULT_BASE
+            cache_file = DEFAULT_BASE / 'discovery_cache.json'
+        self.cache_file = Path(cache_file)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """reads the cache file, an unreadable or outdated file gives an empty cache"""
+        self.entries = {}
+        if not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r') as infile:
+                content = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if content.get('version') == CACHE_VERSION:
+            self.entries = content.get('files', {})
+
+    def save(self):
+        """writes the cache file if it changed; the file is replaced atomically"""
+        if not self._dirty:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'version': CACHE_VERSION, 'files': self.entries}, outfile)
+        os.replace(tmp_file, self.cache_file)
+        self._dirty = False
+
+    @staticmethod
+    def _key(path) -> str:
+        return os.path.normcase(os.path.abspath(str(path)))
+
+    def _unchanged(self, path, signature) -> bool:
+        """
+        compares a file to a stored signature, updating the stored modification time if only that changed
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_mtime == signature['mtime'] and stat.st_size == signature['size']:
+            return True
+        if stat.st_size != signature['size']:
+            return False
+        if file_signature(path)['sha1'] != signature['sha1']:
+            return False
+        signature['mtime'] = stat.st_mtime
+        self._dirty = True
+        return True
+
+    def lookup(self, python_file, class_type: str) -> Optional[Dict[str, Dict]]:
+        """
+        Args:
+            python_file: path to the python file
+            class_type: name of the base class, e.g. 'Experiment' or 'Device'
+
+        Returns: the cached classes of class_type defined in python_file, or None if the cache is not valid
+        """
+        entry = self.entries.get(self._key(python_file))
+        if entry is None or class_type not in entry['classes']:
+            return None
+        for path, signature in entry['files'].items():
+            if not self._unchanged(path, signature):
+                return None
+        return entry['classes'][class_type]
+
+    def store(self, python_file, class_type: str, classes: Dict):
+        """
+        adds the classes found in python_file to the cache
+        Args:
+            python_file: path to the python file
+            class_type: name of the base class the classes were selected by
+            classes: dictionary of class objects, {name: class}
+        """
+        key = self._key(python_file)
+        files = {key: file_signature(python_file)}
+        # the default settings also depend on the base classes, and a module can import classes from other files
+        for cls in classes.values():
+            for base in cls.__mro__:
+                try:
+                    base_file = inspect.getfile(base)
+                except TypeError:
+                    continue  # builtin
+                if base_file.endswith('.py') and os.path.exists(base_file):
+                    files.setdefault(self._key(base_file), file_signature(base_file))
+
+        entry = self.entries.get(key)
+        if entry is None or entry['files'].get(key, {}).get('sha1') != files[key]['sha1']:
+            entry = {'files': {}, 'classes': {}}
+        entry['files'].update(files)
+        entry['classes'][class_type] = {name: describe_class(cls) for name, cls in classes.items()}
+        self.entries[key] = entry
+        self._dirty = True
+
+    def discover(self, python_file, base_class, exclude=(), verbose=False) -> Dict[str, Dict]:
+        """
+        finds the subclasses of base_class defined in python_file, importing the module only if the cache is not valid
+        Args:
+            python_file: path to the python file
+            base_class: e.g. Experiment or Device
+            exclude: classes that are never returned, e.g. the base classes themselves
+            verbose: print import errors
+
+        Returns: dictionary {class name: information}, see describe_class
+        """
+        class_type = base_class.__name__
+        cached = self.lookup(python_file, class_type)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        module, path = module_name_from_path(str(python_file))
+        if path not in sys.path:
+            sys.path.append(path)
+        try:
+            module = import_module(module)
+        except (ImportError, ModuleNotFoundError) as e:
+            print(e)
+            if verbose:
+                print('Could not import module', module)
+            return {}
+
+        classes = {name: obj for name, obj in inspect.getmembers(module)
+                   if inspect.isclass(obj) and issubclass(obj, base_class) and obj not in exclude}
+        self.store(python_file, class_type, classes)
+        return self.lookup(python_file, class_type) or {}
+
+    def clear(self):
+        """removes all entries"""
+        self.entries = {}
+        self._dirty = True
+
+
+_default_cache = None
+
+
+def get_discovery_cache() -> DiscoveryCache:
+    """
+    Returns: the discovery cache shared by the export tools and dialogs of this process
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DiscoveryCache()
+    return _default_cache
@@ -20,28 +20,28 @@ import traceback
 from src.core.device import Device
 from src.core.parameter import Parameter
 from src.core.read_write_functions import save_aqs_file, load_aqs_file
-from src.core.helper_functions import module_name_from_path, MatlabSaver, get_configured_data_folder, get_project_root
+from src.core.helper_functions import module_name_from_path, MatlabSaver, HDF5StreamWriter, get_configured_data_folder, get_project_root
+from src.core.lazy_import import lazy_import
+from src.core import tracing
 
 from collections import deque
 import os
 import sys
-import pandas as pd
 import glob
 import inspect
 import warnings
 import platform
 from PyQt5.QtCore import pyqtSignal, QObject, pyqtSlot
-from scipy.io import savemat
 
 import numpy as np
 from builtins import len as builtin_len
-from matplotlib.backends.backend_pdf import \
-    FigureCanvasPdf as FigureCanvas  # use this to avoid error that plotting should only be done on main thread
-from matplotlib.figure import Figure
 from importlib import import_module
 
-import pyqtgraph as pg
-from pyqtgraph.exporters import ImageExporter
+# plotting, csv and .mat export are loaded on first use, see src/core/lazy_import.py
+pd = lazy_import('pandas')
+pg = lazy_import('pyqtgraph')
+pg_exporters = lazy_import('pyqtgraph.exporters')
+sio = lazy_import('scipy.io')
 
 # cPickle module implements the same algorithm as pickle, in C instead of Python.
 # It is many times faster than the Python implementation, but does not allow the user to subclass from Pickle.
@@ -130,6 +130,13 @@ class Experiment(QObject):
 
         self.progress = None
 
+        # optional HDF5StreamWriter that experiments can append to while _function runs, see open_data_stream
+        self.data_stream = None
+        # optional BackgroundSaver that writes the data files on a worker thread instead of at the end of run
+        self.background_saver = None
+        # position in the span list of the tracer when the current run started, see src/core/tracing.py
+        self._trace_mark = None
+
         self._current_subexperiment_stage = {
             'current_subexperiment': None,
             'subexperiment_exec_count': {},
@@ -460,6 +467,25 @@ class Experiment(QObject):
         executes the experiment
         :return: boolean if execution of experiment finished succesfully
         """
+        tracer = tracing.get_tracer()
+        trace_requested = 'trace' in self.settings and self.settings['trace'] and not tracer.enabled
+        if trace_requested:
+            tracer.enable()
+        self._trace_mark = tracer.mark()
+        try:
+            with tracing.span(self.name, category='run', experiment_class=self._experiment_class):
+                self._run()
+        finally:
+            if trace_requested:
+                tracer.disable()
+        if tracer.enabled or trace_requested:
+            self._save_trace(tracer.events_since(self._trace_mark))
+        self._trace_mark = None
+
+    def _run(self):
+        """
+        the steps of run, each recorded as a timing span while tracing is on
+        """
         self.log_data.clear()
         self._plot_refresh = True  # flag that requests that plot axes are refreshed when self.plot is called next time
         self.is_running = True
@@ -490,21 +516,40 @@ class Experiment(QObject):
 
         # saves standard to disk
         if self.settings['save']:
-            self.save_aqs()
+            with tracing.span('save_aqs', category='save'):
+                self.save_aqs()
 
         self.started.emit()
 
-        self._function()
+        try:
+            with tracing.span('_function', category='experiment', experiment=self.name):
+                self._function()
+        finally:
+            # whatever has been streamed so far stays on disk, even if _function raised
+            self.close_data_stream()
         self.end_time = datetime.datetime.now()
         self.log('experiment {:s} finished at {:s} on {:s}'.format(self.name, self.end_time.strftime('%H:%M:%S'),
                                                                self.end_time.strftime('%d/%m/%y')))
 
         # saves standard to disk
         if self.settings['save']:
-            self.save_data()
-            self.save_log()
-            self.save_image_to_disk()
-            self.save_data_to_matlab()
+            if self.background_saver is not None:
+                # the images need the live plot functions; everything else is written by the saver thread
+                with tracing.span('save_image_to_disk', category='save'):
+                    self.save_image_to_disk()
+                self._append_trace_summary()
+                with tracing.span('background_submit', category='save'):
+                    self.background_saver.submit(self)
+            else:
+                with tracing.span('save_data', category='save'):
+                    self.save_data()
+                with tracing.span('save_image_to_disk', category='save'):
+                    self.save_image_to_disk()
+                with tracing.span('save_data_to_matlab', category='save'):
+                    self.save_data_to_matlab()
+                # the log is written last so that its timing summary contains the other save steps
+                self._append_trace_summary()
+                self.save_log()
 
         success = not self._abort
 
@@ -516,6 +561,28 @@ class Experiment(QObject):
         self.is_running = False
         self.finished.emit()
 
+    def _append_trace_summary(self):
+        """
+        appends the timing summary of the spans recorded so far in this run to the log, if tracing is on
+        """
+        tracer = tracing.get_tracer()
+        if not tracer.enabled or self._trace_mark is None:
+            return
+        self.log_data.append('timing summary ({:s}):'.format(self.name))
+        self.log_data.extend(tracer.format_summary(tracer.events_since(self._trace_mark)))
+
+    def _save_trace(self, events):
+        """
+        writes the spans of a run as a Chrome/Perfetto trace next to the other data files
+        """
+        if not self.settings['save'] or not events:
+            return
+        filename = self.check_filename(self.filename('-trace.json'))
+        try:
+            tracing.get_tracer().save_chrome_trace(filename, events)
+        except OSError as err:
+            self.log('could not write the timing trace {:s}: {:s}'.format(filename, str(err)))
+
     def stop(self):
         """
         stops itself and all the subexperiment
@@ -637,12 +704,44 @@ class Experiment(QObject):
 
         return dictator
 
-    def save_data(self, filename=None, data_tag=None, verbose=False):
+    def release_data(self):
+        """
+        hands the data of the last run over to the caller without copying it and starts the experiment on fresh
+        buffers, so that the next run can not overwrite the returned data. Used by ExperimentIterator to keep the
+        data of every sweep point.
+
+        Returns: the data dictionary of the last run
+        """
+        data = self.data
+        self.data = self._fresh_data(data)
+        return data
+
+    @staticmethod
+    def _fresh_data(data):
+        """
+        Args:
+            data: data of a run
+
+        Returns: new containers with the same keys as data; arrays are replaced by zeroed arrays of the same shape
+        and dtype, other values are immutable or are replaced by the experiment in each run and are kept
+        """
+        if isinstance(data, np.ndarray):
+            return np.zeros(data.shape, dtype=data.dtype)
+        elif isinstance(data, dict):
+            return {key: Experiment._fresh_data(value) for key, value in data.items()}
+        elif isinstance(data, deque):
+            return deque(maxlen=data.maxlen)
+        elif isinstance(data, list):
+            return [Experiment._fresh_data(value) for value in data]
+        return data
+
+    def save_data(self, filename=None, data_tag=None, verbose=False, data=None):
         """
         saves the experiment data to a file
         filename: target filename, if not provided, it is created from internal function
         data_tag: string, if provided save only the data that matches the tag, otherwise save all data
         verbose: if true print additional info to std out
+        data: data to save instead of self.data, e.g. a snapshot taken by the BackgroundSaver
         Returns:
 
         """
@@ -674,11 +773,14 @@ class Experiment(QObject):
         if not os.path.exists(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
 
-        # if deque object, take the last dataset, which is the most recent
-        if isinstance(self.data, deque):
-            data = self.data[-1]
-        elif isinstance(self.data, dict):
+        if data is None:
             data = self.data
+
+        # if deque object, take the last dataset, which is the most recent
+        if isinstance(data, deque):
+            data = data[-1]
+        elif isinstance(data, dict):
+            pass
         else:
             raise TypeError("experiment data variable has an invalid datatype! Must be deque or dict.")
 
@@ -744,12 +846,17 @@ class Experiment(QObject):
             else:
                 df.to_csv(filename, index=False)
 
-    def save_log(self, filename=None):
+    def save_log(self, filename=None, log_data=None):
         """
         save log to file
+        Args:
+            filename: target filename, if not provided, it is created from internal function
+            log_data: lines to save instead of self.log_data
         Returns:
 
         """
+        if log_data is None:
+            log_data = self.log_data
         if filename is None:
             filename = self.filename('-info.txt')
         filename = self.check_filename(filename)
@@ -758,7 +865,7 @@ class Experiment(QObject):
         # if len(filename.split('\\\\?\\')) == 1:
         #     filename = '\\\\?\\' + filename
         with open(filename, 'w', encoding='utf-8') as outfile:
-            for item in self.log_data:
+            for item in log_data:
                 outfile.write("%s\n" % item)
 
     def save_aqs(self, filename=None):
@@ -801,6 +908,36 @@ class Experiment(QObject):
             print(f"   - Traceback: {traceback.format_exc()}")
             raise
 
+    def open_data_stream(self, filename=None, **kwargs):
+        """
+        opens an HDF5StreamWriter that the experiment can append rows or frames to while _function is running,
+        e.g. every finished line of a scan. The settings of the experiment are written to the file and the stream
+        is closed automatically when _function returns.
+        Args:
+            filename: target filename, if not provided it is created from internal function with extension .h5
+            **kwargs: passed on to HDF5StreamWriter, e.g. compression or flush_every
+
+        Returns: the HDF5StreamWriter, also available as self.data_stream
+        """
+        if filename is None:
+            filename = self.filename('.h5', create_if_not_existing=True)
+        filename = self.check_filename(filename)
+
+        self.close_data_stream()
+        self.data_stream = HDF5StreamWriter(filename, settings=self.settings, **kwargs)
+        self.data_stream.write_attrs(experiment_class=self.__class__.__name__, tag=self.settings['tag'],
+                                     start_time=self.start_time.strftime('%y%m%d-%H_%M_%S'))
+        self.log('streaming data to {:s}'.format(str(filename)))
+        return self.data_stream
+
+    def close_data_stream(self):
+        """
+        flushes and closes the data stream if one has been opened with open_data_stream
+        """
+        if self.data_stream is not None:
+            self.data_stream.close()
+            self.data_stream = None
+
     def save_image_to_disk(self, filename_1=None, filename_2=None):
         """
         creates an image using the experiments plot function and writes it to the disk
@@ -872,10 +1009,10 @@ class Experiment(QObject):
         self.plot([graph_1, graph_2])
 
         if filename_1 is not None and not check_nonempty(graph_1):
-            exporter = ImageExporter(scene_1)
+            exporter = pg_exporters.ImageExporter(scene_1)
             exporter.export(filename_1)
         if filename_2 is not None and not check_nonempty(graph_2):
-            exporter = ImageExporter(scene_2)
+            exporter = pg_exporters.ImageExporter(scene_2)
             exporter.export(filename_2)
 
     def save(self, filename):
@@ -894,12 +1031,23 @@ class Experiment(QObject):
         with open(filename, 'w', encoding='utf-8') as outfile:
             outfile.write(pickle.dumps(self.__dict__))
 
-    def save_data_to_matlab(self, filename=None):
+    def save_data_to_matlab(self, filename=None, data=None, settings=None):
+        """
+        saves the experiment data and settings as a matlab struct
+        Args:
+            filename: target filename, if not provided, it is created from internal function
+            data: data to save instead of self.data
+            settings: settings to save instead of self.settings
+        """
+        if data is None:
+            data = self.data
+        if settings is None:
+            settings = self.settings
         if filename is None:
             filename = self.filename('.mat')
         filename = self.check_filename(filename)
 
-        tag = self.settings['tag']
+        tag = settings['tag']
         if ' ' in tag or '.' in tag or '+' in tag or '-' in tag:
             good_tag = tag.replace(' ', '_').replace('.', '_').replace('+', 'P').replace('-', 'M')
             #matlab structs cant include spaces, dots, or plus/minus so replace with other characters
@@ -910,9 +1058,9 @@ class Experiment(QObject):
         good_tag = 'data_' + good_tag
 
         mat_saver = MatlabSaver(tag=good_tag)
-        mat_saver.add_experiment_data(self.data,self.settings)
+        mat_saver.add_experiment_data(data, settings)
         structured_data = mat_saver.get_structured_data()
-        savemat(filename, structured_data)
+        sio.savemat(filename, structured_data)
 
     @staticmethod
     def load(filename, devices=None):
@@ -1585,12 +1733,13 @@ class Experiment(QObject):
         if not self.is_running:
             self._plot_refresh = True
 
-        axes_list = self.get_axes_layout(figure_list)
-        if self._plot_refresh is True:
-            self._plot(axes_list)
-            self._plot_refresh = False
-        else:
-            self._update_plot(axes_list)
+        with tracing.span(self.name, category='plot', refresh=self._plot_refresh):
+            axes_list = self.get_axes_layout(figure_list)
+            if self._plot_refresh is True:
+                self._plot(axes_list)
+                self._plot_refresh = False
+            else:
+                self._update_plot(axes_list)
 
     #changed this method
     def get_axes_layout(self, figure_list):
@@ -25,11 +25,68 @@ from src.core import helper_functions as hf
 import importlib
 from functools import reduce
 from src.core.helper_functions import MatlabSaver
-from scipy.io import savemat
+from src.core.result_cube import ResultCube, RunningStatistics
+from src.core.lazy_import import lazy_import
+from src.core import tracing
 
 import random
 from time import sleep
 
+sio = lazy_import('scipy.io')  # imported on the first .mat export
+
+
+class SettingsSnapshot(dict):
+    '''
+    Settings of one sweep point, stored as the values that differ from the settings at the start of the sweep.
+    The base settings are shared by all points of a sweep, so a point only keeps what changed, usually the tag and
+    the swept parameter. full() rebuilds the complete settings.
+    '''
+
+    def __init__(self, base, settings=None):
+        '''
+        Args:
+            base: settings at the start of the sweep, must not change afterwards
+            settings: current settings, only the values that differ from base are copied
+        '''
+        super().__init__({} if settings is None else self.difference(base, settings))
+        self.base = base
+
+    @staticmethod
+    def difference(base, settings):
+        '''
+        Returns: nested dictionary with the values of settings that are not in base or differ from base
+        '''
+        diff = {}
+        for key, value in settings.items():
+            if key not in base:
+                diff[key] = copy.deepcopy(value)
+            elif isinstance(value, dict) and isinstance(base[key], dict):
+                sub_diff = SettingsSnapshot.difference(base[key], value)
+                if sub_diff:
+                    diff[key] = sub_diff
+            else:
+                try:
+                    same = bool(np.all(base[key] == value))
+                except (TypeError, ValueError):
+                    same = False
+                if not same:
+                    diff[key] = copy.deepcopy(value)
+        return diff
+
+    def full(self):
+        '''
+        Returns: the complete settings of the sweep point as nested dictionaries
+        '''
+        def merge(base, diff):
+            merged = dict(base)
+            for key, value in diff.items():
+                if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                    merged[key] = merge(merged[key], value)
+                else:
+                    merged[key] = value
+            return merged
+        return merge(self.base, self)
+
 
 class ExperimentIterator(Experiment):
     '''
@@ -50,6 +107,7 @@ class ExperimentIterator(Experiment):
     _class_list = []  # list of current dynamically created ExperimentIterator classes
 
     ITER_TYPES = ['loop', 'sweep']
+    MAX_EXTRA_SWEEP_AXES = 2  # number of extra_sweeps axes that can be combined with sweep_param
 
     def __init__(self, experiments, name=None, settings=None, devices=None, log_function=None, data_path=None):
         """
@@ -65,6 +123,13 @@ class ExperimentIterator(Experiment):
             'subexperiment_exec_count': {}
         }
         
+        # preallocated arrays with the data of every sweep point, one ResultCube per subexperiment
+        self.result_cubes = {}
+        # variance of the data averaged by a loop, same keys as self.data
+        self.data_variance = {}
+        # number of points of the last started sweep, including all axes of multi-parameter sweeps
+        self.num_sweep_points = None
+
         # for multi iterator experiments tracks how many iterator levels there is; value equal num layers below
         self.iterator_level = self.detect_iterator_depth(self.experiments)
         print('iterator level',self.iterator_level)
@@ -116,14 +181,60 @@ class ExperimentIterator(Experiment):
     def _function(self):
         '''
         Runs either a loop or a parameter sweep over the subexperiments in the order defined by the parameter_list 'experiment_order'
+        If background_save is enabled the subexperiments hand their data to a BackgroundSaver instead of saving
+        it themselves, and the iterator waits for all files to be written before it returns.
+        '''
+        saver = self._start_background_saver()
+        try:
+            self._iterate()
+        finally:
+            self._stop_background_saver(saver)
+
+    def _start_background_saver(self):
+        '''
+        creates a BackgroundSaver and attaches it to all subexperiments if the background_save setting is enabled
+        Returns: the saver or None
+        '''
+        if not ('background_save' in self.settings and self.settings['background_save']):
+            return None
+        from src.core.background_saver import BackgroundSaver
+        saver = BackgroundSaver(max_queue=self.settings['save_queue_size'] if 'save_queue_size' in self.settings else 4,
+                                log_function=self.log)
+        for experiment in self.experiments.values():
+            experiment.background_saver = saver
+        return saver
+
+    def _stop_background_saver(self, saver):
+        '''
+        waits until the saver has written all queued data, detaches it from the subexperiments and logs the write timings
         '''
-        def get_sweep_parameters():
+        if saver is None:
+            return
+        self.log('waiting for {:d} queued saves to finish'.format(saver.pending))
+        saver.close()
+        for experiment in self.experiments.values():
+            experiment.background_saver = None
+        totals = saver.summary()
+        self.log('background save: {:d} runs written, {:s}, {:.3f} s waiting for a free slot'.format(
+            len(saver.completed), ', '.join('{:s} {:.3f} s'.format(k, v) for k, v in totals.items()), saver.blocked_time))
+        for name, err in saver.errors:
+            self.log('background save of {:s} failed: {:s}'.format(name, str(err)))
+
+    def _iterate(self):
+        '''
+        executes the loop or sweep, see _function
+        '''
+        def get_sweep_parameters(sweep_range=None):
             """
+            Args:
+                sweep_range: range of the sweep, defaults to the sweep_range setting
+
             Returns: the paramter values over which to sweep
             """
             # in both cases, param values have tolist to make sure that they are python types (ex float) rather than numpy
             # types (ex np.float64), the latter of which can cause typing issues
-            sweep_range = self.settings['sweep_range']
+            if sweep_range is None:
+                sweep_range = self.settings['sweep_range']
             param_values = np.empty(int(sweep_range['N/value_step'])).tolist()
             if self.settings['stepping_mode'] == 'N':
                 param_values = np.linspace(sweep_range['min_value'], sweep_range['max_value'],
@@ -156,18 +267,12 @@ class ExperimentIterator(Experiment):
 
                 return experiment_list, parameter_list
 
-            param_values = get_sweep_parameters()
-
-            print('GD parameters before', param_values)
-            if self.settings['sweep_range']['randomize'] == True:
-                np.random.shuffle(param_values)
-            print('GD parameters after', param_values)
-
-            for i, value in enumerate(param_values):
-                self.iterator_progress = float(i) / len(param_values)
-                previous_data = None
-
-                experiment_list, parameter_list = get_experiment_and_settings_from_str(self.settings['sweep_param'])
+            def set_sweep_parameter(sweep_param, value):
+                """
+                sets the parameter given by the path sweep_param to value
+                Returns: the name of the parameter
+                """
+                experiment_list, parameter_list = get_experiment_and_settings_from_str(sweep_param)
                 experiment = self
                 while len(experiment_list) > 0:
                     experiment = experiment.experiments[experiment_list[0]]
@@ -180,11 +285,63 @@ class ExperimentIterator(Experiment):
                                      curr_type(value))  # creates nested dictionary from list
 
                 experiment.settings.update(update_dict)
-                parameter_name = parameter_list[-1]
                 if np.abs(value) < 1000:
-                    self.log('setting parameter {:s} to {:.3g}'.format(self.settings['sweep_param'], value))
+                    self.log('setting parameter {:s} to {:.3g}'.format(sweep_param, value))
                 else:
-                    self.log('setting parameter {:s} to {:0.2e}'.format(self.settings['sweep_param'], value))
+                    self.log('setting parameter {:s} to {:0.2e}'.format(sweep_param, value))
+                return parameter_list[-1]
+
+            # the sweep_param is the first and slowest axis, enabled extra sweeps follow in order
+            sweep_mode = self.settings['sweep_mode'] if 'sweep_mode' in self.settings else 'single'
+            sweep_axes = [(self.settings['sweep_param'], get_sweep_parameters())]
+            if sweep_mode != 'single':
+                for axis in self.settings['extra_sweeps'].values():
+                    if axis['enabled']:
+                        sweep_axes.append((axis['sweep_param'], get_sweep_parameters(axis['sweep_range'])))
+
+            # grid index of each point in execution order, used as the index into the result cubes
+            grid_points = self.get_sweep_points([len(values) for _, values in sweep_axes], sweep_mode,
+                                                snake='snake' in self.settings and self.settings['snake'],
+                                                randomize=self.settings['sweep_range']['randomize'] == True)
+            if sweep_mode == 'cartesian':
+                param_values = [[sweep_axes[k][1][index[k]] for k in range(len(sweep_axes))] for index in grid_points]
+            else:
+                param_values = [[values[index[0]] for _, values in sweep_axes] for index in grid_points]
+
+            axis_names = []
+            for sweep_param, _ in sweep_axes:
+                name = get_experiment_and_settings_from_str(sweep_param)[1][-1]
+                if name in axis_names:
+                    name = sweep_param.replace('->', '_').replace('.', '_')
+                axis_names.append(name)
+            if sweep_mode == 'cartesian':
+                cube_axes = list(zip(axis_names, [values for _, values in sweep_axes]))
+                cube_coords = None
+            else:
+                cube_axes = [(axis_names[0], sweep_axes[0][1])]
+                cube_coords = {name: (axis_names[0], values) for name, (_, values) in zip(axis_names[1:], sweep_axes[1:])}
+            self.result_cubes = {name: ResultCube(cube_axes, cube_coords) for name in sorted_experiment_names}
+            self.num_sweep_points = len(grid_points)
+
+            # settings of every point are stored as the difference to these, see SettingsSnapshot
+            base_settings = {name: copy.deepcopy(experiment.settings) for name, experiment in self.experiments.items()}
+            last_data = {}
+
+            for i, (index, values) in enumerate(zip(grid_points, param_values)):
+                self.iterator_progress = float(i) / len(grid_points)
+                previous_data = None
+                point_span = tracing.span('point', category='iterator', iterator=self.name, index=list(index))
+
+                parameter_names = [set_sweep_parameter(sweep_param, value) for (sweep_param, _), value in zip(sweep_axes, values)]
+                point_tag = '_'.join('{:s}_{:0.3e}'.format(name, value) for name, value in zip(parameter_names, values))
+
+                it_level_str = f'_iterator_{self.iterator_level}'
+                if len(sweep_axes) == 1:
+                    python_scan_info_dic = {'scan_parameter'+it_level_str: parameter_names[0], 'scan_current_value'+it_level_str: values[0],
+                                            'scan_all_values'+it_level_str: [point[0] for point in param_values]}
+                else:
+                    python_scan_info_dic = {'scan_parameter'+it_level_str: ', '.join(parameter_names), 'scan_current_value'+it_level_str: list(values),
+                                            'scan_all_values'+it_level_str: param_values}
 
                 for experiment_name in sorted_experiment_names:
                     if self._abort:
@@ -205,20 +362,25 @@ class ExperimentIterator(Experiment):
                         # i+1 so first execution is mth loop, not first
                         self.log('starting {:s}'.format(experiment_name))
                         tag = self.experiments[experiment_name].settings['tag']
-                        self.experiments[experiment_name].settings['tag'] = '{:s}_{:s}_{:0.3e}'.format(tag, parameter_name,value)
-                        #ensure settings and data are deepcopys so multiple iterations dont change old values
-                        settings = copy.deepcopy(self.experiments[experiment_name].settings)
+                        self.experiments[experiment_name].settings['tag'] = '{:s}_{:s}'.format(tag, point_tag)
+                        settings = SettingsSnapshot(base_settings[experiment_name], self.experiments[experiment_name].settings)
                         self.experiments[experiment_name].run()
 
-                        it_level_str = f'_iterator_{self.iterator_level}'
-                        python_scan_info_dic = {'scan_parameter'+it_level_str:parameter_name,'scan_current_value'+it_level_str:value, 'scan_all_values'+it_level_str:list(param_values)}
-                        data = copy.deepcopy(self.experiments[experiment_name].data)
+                        # take ownership of the data so that the next point runs on fresh buffers instead of copying it
+                        data = self.experiments[experiment_name].release_data()
+                        data = self._store_in_result_cube(experiment_name, index, data)
 
                         #adds to self.data a key of the current experiment tage with a value that is a lsit of [data, settings, scan_infor] for current experiment
                         self.data[self.experiments[experiment_name].settings['tag']] = [data, settings, python_scan_info_dic]
 
                         self.experiments[experiment_name].settings['tag'] = tag
-                        previous_data = self.experiments[experiment_name].data
+                        previous_data = data
+                        last_data[experiment_name] = data
+                point_span.end()
+
+            # give the subexperiments the data of their last point back so that they can be plotted after the sweep
+            for experiment_name, data in last_data.items():
+                self.experiments[experiment_name].data = data
 
 
         elif self.iterator_type == 'loop':
@@ -229,9 +391,12 @@ class ExperimentIterator(Experiment):
                 return
 
             self.data = {}
+            # running mean and variance are updated in place, subexperiment data of different lengths is not averaged
+            statistics = RunningStatistics()
             for i in range(num_loops):
                 self.iterator_progress = float(i) / num_loops
                 previous_data = None
+                point_span = tracing.span('iteration', category='iterator', iterator=self.name, index=i)
 
                 for experiment_name in sorted_experiment_names:
                     if self._abort:
@@ -259,54 +424,88 @@ class ExperimentIterator(Experiment):
                         self.experiments[experiment_name].settings['tag'] = tag
 
                         previous_data = self.experiments[experiment_name].data
+                point_span.end()
 
+                if self._abort:
+                    break
                 # from the last experiment we take the average of the data as the data of the iterator experiment
                 if isinstance(self.experiments[experiment_name].data, dict):
                     data = self.experiments[experiment_name].data
                 elif isinstance(self.experiments[experiment_name].data, deque):
                     data = self.experiments[experiment_name].data[-1]
-                if i == 0:
-                    self.data.update(data)
-                else:
-                    if self._abort:
-                        break
+                statistics.add(data)
+                self.data = statistics.mean()
 
-                    for key in list(data.keys()):
-
-                        # can't add None values
-                        if not data[key] is None:
-                            # if subexperiment data have differnet length, e.g. fitparameters can be differet, depending on if there is one or two peaks
-                            if len(self.data[key]) != len(data[key]):
-                                print(('warning subexperiment data {:s} have different lengths'.format(key)))
-                                continue
-
-                            if isinstance(self.data[key], list):
-                                self.data[key] += np.array(data[key])
-                            elif isinstance(self.data[key], dict):
-                                self.data[key] = {x: self.data[key].get(x, 0) + data[key].get(x, 0) for x in
-                                                  list(self.data[key].keys())}
-                            else:
-                                self.data[key] += data[key]
-
-            if not self._abort and num_loops > 0:
-                # normalize data because we just kept adding the values
-                for key in list(data.keys()):
-                    if isinstance(self.data[key], list):
-                        self.data[key] = np.array(self.data[key]) / num_loops
-                    elif isinstance(self.data[key], dict):
-                        self.data[key] = {k: v / num_loops for k, v in self.data[key].items()}
-                    elif self.data[key] is None:
-                        self.log('None type in data! check code')
-                        pass
-                    elif isinstance(self.data[key], int):
-                        self.data[key] = float(self.data[
-                                                   key]) / num_loops  # if int we can not devide. Thus we convert explicitely to float
-                    else:
-                        self.data[key] = self.data[key] / num_loops
+            self.data_variance = statistics.variance()
 
         else:
             raise TypeError('wrong iterator type')
 
+    @staticmethod
+    def get_sweep_points(shape, sweep_mode='single', snake=False, randomize=False):
+        '''
+        Args:
+            shape: number of values of each sweep axis, the first axis is the slowest
+            sweep_mode: 'single' sweeps the first axis only, 'cartesian' the grid of all axes and 'zip' steps all axes
+                together, which requires them to have the same length
+            snake: for cartesian sweeps, reverse the direction of a faster axis on every other pass of the slower axes,
+                so that e.g. the z stage is stepped between frames without moving the other axes back to their start
+            randomize: shuffle the order of the points
+
+        Returns: list of the grid index of every point in execution order; a tuple with one entry per axis for
+        cartesian sweeps and with a single entry for single and zip sweeps
+        '''
+        shape = [int(n) for n in shape]
+        if sweep_mode == 'single':
+            points = [(k,) for k in range(shape[0])]
+        elif sweep_mode == 'zip':
+            if len(set(shape)) > 1:
+                raise ValueError('all axes of a zipped sweep need the same number of points, got {:s}'.format(str(shape)))
+            points = [(k,) for k in range(shape[0])]
+        elif sweep_mode == 'cartesian':
+            points = []
+            for index in np.ndindex(*shape):
+                if snake:
+                    # the direction of an axis flips with every completed pass, i.e. with the flat index of the slower axes
+                    index = tuple(shape[k] - 1 - index[k] if k > 0 and np.ravel_multi_index(index[:k], shape[:k]) % 2 else index[k]
+                                  for k in range(len(shape)))
+                points.append(index)
+        else:
+            raise ValueError('unknown sweep mode ' + str(sweep_mode))
+
+        if randomize:
+            random.shuffle(points)
+        return points
+
+    def _store_in_result_cube(self, experiment_name, index, data):
+        '''
+        writes the data of a sweep point into the result cube of the subexperiment
+        Args:
+            experiment_name: name of the subexperiment
+            index: grid index of the point, one entry per axis of the cube
+            data: data of the point, as returned by release_data
+
+        Returns: data with the arrays replaced by views into the cube. For a nested sweep the cube is filled with the
+        result cube of the nested iterator, adding its axes, and data is returned unchanged
+        '''
+        cube = self.result_cubes[experiment_name]
+        experiment = self.experiments[experiment_name]
+        if isinstance(experiment, ExperimentIterator) and experiment.iterator_type == 'sweep':
+            if len(experiment.result_cubes) == 1:
+                inner_cube = list(experiment.result_cubes.values())[0]
+                cube.set(index, {key: inner_cube[key] for key in inner_cube.keys()},
+                         inner_dims={key: inner_cube.dims(key) for key in inner_cube.keys()})
+            return data
+        return cube.set(index, data)
+
+    def release_data(self):
+        '''
+        hands the data of all iterations over to the caller, the iterator starts the next run without data
+        '''
+        data = self.data
+        self.data = {}
+        return data
+
     def _estimate_progress(self):
         """
         estimates the current progress that is then used in _receive_signal
@@ -330,6 +529,8 @@ class ExperimentIterator(Experiment):
         # ==== get number of iterations and loop index ======================
         if self.iterator_type == 'loop':
             num_iterations = self.settings['num_loops']
+        elif self.iterator_type == 'sweep' and self.num_sweep_points is not None:
+            num_iterations = self.num_sweep_points
         elif self.iterator_type == 'sweep':
             sweep_range = self.settings['sweep_range']
             if self.settings['stepping_mode'] == 'value_step':
@@ -452,10 +653,18 @@ class ExperimentIterator(Experiment):
             # Return default value if calculation fails
             return 1
 
-    def save_data_to_matlab(self, filename=None):
+    def save_data_to_matlab(self, filename=None, data=None, settings=None, result_cubes=None):
+        if result_cubes is None and (data is None or data is self.data):
+            # cubes of a snapshot of the data are passed with it, see SaveJob in src/core/background_saver.py
+            result_cubes = self.result_cubes
+        if data is None:
+            data = self.data
+        if settings is None:
+            settings = self.settings
+
         if self.iterator_type == 'loop':
             #for loop the experiment data is averaged so its structure is similar to a single experiment; default to normal behavior
-            Experiment.save_data_to_matlab(self)
+            Experiment.save_data_to_matlab(self, filename, data=data, settings=settings)
 
         elif self.iterator_type == 'sweep': #for sweeps need more complex structure
             #does not include the settings of each iterator level as the important info is in the inherited scan info
@@ -489,7 +698,8 @@ class ExperimentIterator(Experiment):
 
                     elif current_level == target_level:
                         if isinstance(value, list) and len(value) == 3:
-
+                            if isinstance(current_level_settings, SettingsSnapshot):
+                                current_level_settings = current_level_settings.full()
                             result.append((next_dic_level, current_level_settings, updated_scan_info))
                         else:
                             raise ValueError(f"In matlab saving: Invalid leaf data at level {current_level}: {key} → {value}")
@@ -501,7 +711,7 @@ class ExperimentIterator(Experiment):
                 filename = self.filename('.mat')
             filename = self.check_filename(filename)
 
-            tag = self.settings['tag']
+            tag = settings['tag']
             if ' ' in tag or '.' in tag or '+' in tag or '-' in tag:
                 good_tag = tag.replace(' ', '_').replace('.', '_').replace('+', 'P').replace('-', 'M')
                 # matlab structs cant include spaces, dots, or plus/minus so replace with other characters
@@ -512,13 +722,22 @@ class ExperimentIterator(Experiment):
             good_tag = 'data_' + good_tag
 
             mat_saver = MatlabSaver(tag=good_tag)
-            data_tuples = extract_data(self.data, current_level=1, target_level=self.iterator_level)
+            data_tuples = extract_data(data, current_level=1, target_level=self.iterator_level)
             #print('data_tuples',data_tuples)
-            for data, settings, combined_scan_info in data_tuples:
-                mat_saver.add_experiment_data(data, settings, iterator_info_dic=combined_scan_info)
+            for point_data, point_settings, combined_scan_info in data_tuples:
+                mat_saver.add_experiment_data(point_data, point_settings, iterator_info_dic=combined_scan_info)
 
             structured_data = mat_saver.get_structured_data()
-            savemat(filename, structured_data)
+            if result_cubes:
+                # same data on the sweep grid, with the sweep axes as leading dimensions; object arrays can't be saved
+                cubes = {}
+                for experiment_name, cube in result_cubes.items():
+                    cube_dict = cube.to_dict()
+                    cube_dict['data'] = {key: value for key, value in cube_dict['data'].items() if value.dtype != object}
+                    cube_dict['dims'] = {key: value for key, value in cube_dict['dims'].items() if key in cube_dict['data']}
+                    cubes[experiment_name.replace(' ', '_').replace('.', '_')] = cube_dict
+                structured_data['result_cubes'] = cubes
+            sio.savemat(filename, structured_data)
 
         else:
             raise TypeError('wrong iterator type')
@@ -731,7 +950,10 @@ class ExperimentIterator(Experiment):
                 Parameter('experiment_order', experiment_order),
                 Parameter('experiment_execution_freq', experiment_execution_freq),
                 Parameter('num_loops', 0, int, 'times the subexperiments will be executed'),
-                Parameter('run_all_first', True, bool, 'Run all experiments with nonzero frequency in first pass')
+                Parameter('run_all_first', True, bool, 'Run all experiments with nonzero frequency in first pass'),
+                Parameter('background_save', False, bool, 'write the subexperiment data on a background thread while the next iteration runs'),
+                Parameter('save_queue_size', 4, int, 'number of runs that can wait to be saved before the iterator blocks'),
+                Parameter('trace', False, bool, 'record timing spans of every point, subexperiment and device call, see src/core/tracing.py')
             ]
 
         elif iterator_type == 'sweep':
@@ -748,7 +970,22 @@ class ExperimentIterator(Experiment):
                                                     'either number of steps or parameter value step, depending on mode'),
                                           Parameter('randomize', False, bool, 'randomize the sweep parameters')]),
                 Parameter('stepping_mode', 'N', ['N', 'value_step'], 'Switch between number of steps and step amount'),
-                Parameter('run_all_first', True, bool, 'Run all experiments with nonzero frequency in first pass')
+                Parameter('sweep_mode', 'single', ['single', 'cartesian', 'zip'],
+                          'single: sweep only sweep_param, cartesian: grid of sweep_param and the enabled extra sweeps, zip: step them together'),
+                Parameter('extra_sweeps', [
+                    Parameter('axis_{:d}'.format(k), [
+                        Parameter('enabled', False, bool, 'include this axis in cartesian and zip sweeps'),
+                        Parameter('sweep_param', sweep_params[0], sweep_params, 'variable over which to sweep'),
+                        Parameter('sweep_range', [Parameter('min_value', 0, float, 'min parameter value'),
+                                                  Parameter('max_value', 0, float, 'max parameter value'),
+                                                  Parameter('N/value_step', 0, float,
+                                                            'either number of steps or parameter value step, depending on mode')])])
+                    for k in range(1, ExperimentIterator.MAX_EXTRA_SWEEP_AXES + 1)]),
+                Parameter('snake', False, bool, 'cartesian sweeps reverse the faster axes on every other pass to avoid large moves'),
+                Parameter('run_all_first', True, bool, 'Run all experiments with nonzero frequency in first pass'),
+                Parameter('background_save', False, bool, 'write the subexperiment data on a background thread while the next point runs'),
+                Parameter('save_queue_size', 4, int, 'number of runs that can wait to be saved before the iterator blocks'),
+                Parameter('trace', False, bool, 'record timing spans of every point, subexperiment and device call, see src/core/tracing.py')
             ]
         else:
             print(('unknown iterator type ' + iterator_type))
@@ -21,8 +21,9 @@ from importlib import import_module
 import glob
 import pkgutil
 import numpy as np
-import h5py
-from pyparsing import empty
+from src.core.lazy_import import lazy_import
+
+h5py = lazy_import('h5py')  # only needed for hdf5 files, imported on first use
 
 
 def get_project_root() -> Path:
@@ -433,15 +434,60 @@ def explore_package(module_name):
     return packages
 
 
-#not using hdf5 but keeping function here if needed
-def structure_data_for_hdf5(filename,data,settings=None,tag=None):
+def _hdf5_value(value):
+    '''
+    Converts a python value to something h5py can store as a dataset.
+    Strings and lists of strings become fixed-length byte strings, None becomes an empty dataset and ragged
+    lists (that numpy can only store as objects) are stored as their string representation.
+    '''
+    if value is None:
+        return h5py.Empty('f8')
+    if isinstance(value, str):
+        return np.bytes_(value)
+    if isinstance(value, (bool, int, float, np.generic)):
+        return value
+    try:
+        array = np.asarray(value)
+    except ValueError:  # ragged nested lists
+        return np.bytes_(str(value))
+    if array.dtype.kind == 'U':
+        return array.astype('S')
+    if array.dtype.kind == 'O':
+        return np.bytes_(str(value))
+    return array
+
+
+def write_dict_to_hdf5(group, dic, compression=None):
+    '''
+    Recursively writes a (possibly nested) dictionary into an hdf5 group. Nested dictionaries, including Parameter
+    objects, become subgroups; everything else becomes a dataset.
+    Args:
+        group: h5py Group (or File) to write into
+        dic: dictionary to write
+        compression: optional h5py compression filter (e.g. 'gzip') used for array datasets with more than one element
+    '''
+    for key, value in dic.items():
+        key = str(key)
+        if isinstance(value, dict):
+            sub_group = group.create_group(key)
+            write_dict_to_hdf5(sub_group, value, compression=compression)
+        else:
+            value = _hdf5_value(value)
+            if compression is not None and isinstance(value, np.ndarray) and value.ndim > 0 and value.size > 1:
+                group.create_dataset(key, data=value, compression=compression)
+            else:
+                group.create_dataset(key, data=value)
+
+
+def structure_data_for_hdf5(filename, data, settings=None, tag=None, compression='gzip'):
     '''
     Takes a list of data dictionaries and saves it as a HDF5 file.
     Args:
         filename: file address of hdf5 file to save
         data: list of data dictionaries (can have 1 item or sublists)
-        settings: optional list of settings dictionaries that correspond to each data dictionary
+        settings: optional list of settings dictionaries that correspond to each data dictionary, nested the same way
         tag: name of tag to identify the experiment data; if None set to 'unamed_experiment'
+        compression: compression filter for array datasets; None to disable
 
     Returns:
         None
@@ -450,71 +496,262 @@ def structure_data_for_hdf5(filename,data,settings=None,tag=None):
         data_1_layer = [ex_data_1, ex_data_2]
         settings_1_layer = [ex_settings_1, ex_settings_2]
         structure_data_for_hdf5(filename=filename+'.hdf5',data=data_1_layer, settings=settings_1_layer)
+        -> groups tag_0, tag_1 each with the data and a 'settings' subgroup
 
-    #LAYERING NOT IMPLEMENTED YET
     2 layer example:
         data_2_layer = [[ex_data_1, ex_data_2],[ex_data_3, ex_data_4]]
         settings_2_layer = [[ex_settings_1, ex_settings_2],[ex_settings_3, ex_settings_4]]
         structure_data_for_hdf5(filename=filename+'.hdf5',data=data_2_layer, settings=settings_2_layer)
+        -> groups tag_0/tag_0_0, tag_0/tag_0_1, tag_1/tag_1_0, tag_1/tag_1_1
     '''
-    def guess_numpy_dtype(value):
-        '''
-        Gets type of inputed value; skips dictionaries as they are recursivly unpacked
-        '''
-        if isinstance(value, float) or isinstance(value, list):
-            return 'f8'
-        elif isinstance(value, bool):  # need to put bool before int as True/False are technically 1/0
-            return 'bool'
-        elif isinstance(value, int):
-            return 'i4'
-        elif isinstance(value, str):
-            return 'S{}'.format(len(value) + 1)  # +1 so empty string (S0) dont casue an error
-        elif isinstance(value, np.ndarray):
-            return value.dtype
-        else:
-            raise ValueError('hdf5 unsupported data type')
-
-    def get_shape(value):
-        if isinstance(value, np.ndarray):
-            return value.shape
-        elif isinstance(value, (list, tuple)):
-            try:
-                return np.array(value).shape
-            except:
-                return ()  # fallback if conversion fails
-        else:
-            return ()  # scalar or unknown type
-
-    def write_dict_to_hdf5(group,dic):
-        for key, value in dic.items():
-            if isinstance(value, dict):
-                sub_group = group.create_group(key)
-                write_dict_to_hdf5(sub_group, value)
+    def write_layer(group, data, settings, name):
+        for i, item in enumerate(data):
+            item_settings = settings[i] if settings is not None else None
+            sub_group = group.create_group(name + f'_{i}')
+            if isinstance(item, (list, tuple)):
+                # another layer, e.g. the subexperiments of an experiment iterator
+                if item_settings is not None and len(item_settings) != len(item):
+                    raise ValueError("settings and data must be nested lists of equal length")
+                write_layer(sub_group, item, item_settings, name + f'_{i}')
             else:
-                value_type = guess_numpy_dtype(value)
-                value_shape = get_shape(value)
-                dset = group.create_dataset(key, shape=value_shape, dtype=value_type, data=value)
+                write_dict_to_hdf5(sub_group, item, compression=compression)
+                if item_settings is not None:
+                    settings_group = sub_group.create_group('settings')
+                    write_dict_to_hdf5(settings_group, item_settings)
 
     #data and settings should be in lists
     if not isinstance(data, list):
         data = [data]
-    if settings:
-        if len(settings) != len(data): #should have a settings for each data dictionary
-            raise ValueError("settings and data must be lists of equal length")
+    if settings is not None:
         if not isinstance(settings, list):
             settings = [settings]
+        if len(settings) != len(data): #should have a settings for each data dictionary
+            raise ValueError("settings and data must be lists of equal length")
     if tag is None:
         tag = 'unnamed_experiment'
 
     with h5py.File(filename, 'w') as f:
-        for i, dic in enumerate(data):
-            group = f.create_group(tag+f'_{i}')
-            write_dict_to_hdf5(group, dic)
-
-            if settings is not None:
-                specific_settings = settings[i]
-                settings_group = group.create_group('settings')
-                write_dict_to_hdf5(settings_group, specific_settings)
+        write_layer(f, data, settings, tag)
+
+
+class HDF5StreamWriter:
+    '''
+    Streams data to resizable, chunked and compressed HDF5 datasets while an experiment is running, so that
+    long acquisitions do not have to be held in memory and survive a crash up to the last flushed frame.
+
+    Each key is a dataset whose first axis grows by one for every appended frame (a scalar, a line or an image).
+    Once the first frame has been appended the file is switched to single-writer/multiple-reader (SWMR) mode,
+    so the data can be opened with HDF5StreamWriter.open_reader (or h5py.File(..., swmr=True)) while the
+    acquisition is still going. HDF5 does not allow new datasets or attributes in SWMR mode, therefore all
+    streams have to be declared (add_stream) or written (write_settings, write_attrs) before the first append.
+
+    Usage:
+        with HDF5StreamWriter(filename, settings=self.settings) as stream:
+            stream.add_stream('count_rate', frame_shape=(Ny,))
+            for line in ...:
+                stream.append('count_rate', line)
+    '''
+
+    def __init__(self, filename, settings=None, compression='gzip', compression_opts=4, chunk_bytes=2**20,
+                 flush_every=1, swmr=True):
+        '''
+        Args:
+            filename: path of the .h5 file, parent folders are created if needed
+            settings: optional settings dictionary (e.g. experiment settings) stored in the 'settings' group
+            compression: h5py compression filter for the streamed datasets, None for no compression
+            compression_opts: compression level passed to h5py
+            chunk_bytes: target size of one chunk; sets how many frames are stored per chunk
+            flush_every: flush the file to disk after this many appends to a dataset
+            swmr: switch to SWMR mode on the first append so the file can be read during acquisition
+        '''
+        filename = Path(filename)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        self.filename = filename
+        self.compression = compression
+        self.compression_opts = compression_opts if compression == 'gzip' else None
+        self.chunk_bytes = chunk_bytes
+        self.flush_every = max(int(flush_every), 1)
+        self.swmr = swmr
+
+        self._file = h5py.File(filename, 'w', libver='latest')
+        self._datasets = {}
+        self._lengths = {}
+        self._pending = 0
+
+        if settings is not None:
+            self.write_settings(settings)
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    @property
+    def swmr_mode(self):
+        return self._file is not None and self._file.swmr_mode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _check_writable(self, action):
+        if self._file is None:
+            raise RuntimeError(f'cannot {action}: stream {self.filename} is closed')
+
+    def _check_not_swmr(self, action):
+        self._check_writable(action)
+        if self._file.swmr_mode:
+            raise RuntimeError(f'cannot {action} after streaming has started (file is in SWMR mode); '
+                               f'declare all streams before the first append')
+
+    def write_settings(self, settings, name='settings'):
+        '''
+        writes a (nested) settings dictionary into a group of the file. Must be called before the first append.
+        '''
+        self._check_not_swmr('write settings')
+        write_dict_to_hdf5(self._file.create_group(name), settings)
+
+    def write_attrs(self, **attrs):
+        '''
+        writes file level attributes, e.g. axes labels. Must be called before the first append.
+        '''
+        self._check_not_swmr('write attributes')
+        for key, value in attrs.items():
+            self._file.attrs[key] = value if isinstance(value, str) else _hdf5_value(value)
+
+    def add_stream(self, key, frame_shape=(), dtype='f8', fill_value=None):
+        '''
+        declares a growing dataset with frames of shape frame_shape
+        Args:
+            key: dataset name, '/' creates subgroups
+            frame_shape: shape of a single appended frame, () for scalars
+            dtype: numpy dtype of the dataset
+            fill_value: optional fill value of unwritten entries
+        '''
+        self._check_not_swmr('add stream ' + key)
+        if key in self._datasets:
+            raise KeyError(f'stream {key} already exists')
+        frame_shape = tuple(int(n) for n in frame_shape)
+        dtype = np.dtype(dtype)
+        frame_bytes = max(int(np.prod(frame_shape, dtype=np.int64)) * dtype.itemsize, 1)
+        frames_per_chunk = int(min(max(self.chunk_bytes // frame_bytes, 1), 2**16))
+        chunks = (frames_per_chunk,) + tuple(max(n, 1) for n in frame_shape)
+        self._datasets[key] = self._file.create_dataset(key, shape=(0,) + frame_shape, maxshape=(None,) + frame_shape,
+                                                        dtype=dtype, chunks=chunks, compression=self.compression,
+                                                        compression_opts=self.compression_opts,
+                                                        shuffle=self.compression is not None, fillvalue=fill_value)
+        self._lengths[key] = 0
+        return self._datasets[key]
+
+    def append(self, key, frame):
+        '''
+        appends a frame to the dataset key, creating the dataset from the frame shape if it was not declared
+        Args:
+            key: dataset name
+            frame: scalar or array of the declared frame shape
+
+        Returns: index of the frame in the dataset
+        '''
+        self._check_writable('append to ' + key)
+        frame = np.asarray(frame)
+        if key not in self._datasets:
+            dtype = frame.dtype if frame.dtype.kind in 'biuf' else 'f8'
+            self.add_stream(key, frame_shape=frame.shape, dtype=dtype)
+        dataset = self._datasets[key]
+        if frame.shape != dataset.shape[1:]:
+            raise ValueError(f'frame shape {frame.shape} does not match stream {key} of shape {dataset.shape[1:]}')
+        self._start_swmr()
+
+        index = self._lengths[key]
+        dataset.resize(index + 1, axis=0)
+        dataset[index] = frame
+        self._lengths[key] = index + 1
+
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+        return index
+
+    def extend(self, key, frames):
+        '''
+        appends several frames at once (a single resize and write), frames has shape (n,) + frame_shape
+        '''
+        self._check_writable('append to ' + key)
+        frames = np.asarray(frames)
+        if key not in self._datasets:
+            dtype = frames.dtype if frames.dtype.kind in 'biuf' else 'f8'
+            self.add_stream(key, frame_shape=frames.shape[1:], dtype=dtype)
+        dataset = self._datasets[key]
+        if frames.shape[1:] != dataset.shape[1:]:
+            raise ValueError(f'frame shape {frames.shape[1:]} does not match stream {key} of shape {dataset.shape[1:]}')
+        self._start_swmr()
+
+        start = self._lengths[key]
+        dataset.resize(start + len(frames), axis=0)
+        dataset[start:start + len(frames)] = frames
+        self._lengths[key] = start + len(frames)
+
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+        return start
+
+    def replace(self, key, index, frame):
+        '''
+        overwrites an appended frame, e.g. a line that is corrected once later lines are known. SWMR mode allows this,
+        it only forbids new datasets and attributes
+        Args:
+            key: dataset name
+            index: index of the frame, as returned by append
+            frame: scalar or array of the declared frame shape
+        '''
+        self._check_writable('replace in ' + key)
+        if not 0 <= index < self._lengths.get(key, 0):
+            raise IndexError(f'stream {key} has no frame {index}')
+        frame = np.asarray(frame)
+        dataset = self._datasets[key]
+        if frame.shape != dataset.shape[1:]:
+            raise ValueError(f'frame shape {frame.shape} does not match stream {key} of shape {dataset.shape[1:]}')
+        dataset[index] = frame
+
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def __len__(self):
+        return max(self._lengths.values()) if self._lengths else 0
+
+    def length(self, key):
+        return self._lengths[key]
+
+    def _start_swmr(self):
+        if self.swmr and not self._file.swmr_mode:
+            self._file.swmr_mode = True
+
+    def flush(self):
+        if self._file is None:
+            return
+        for dataset in self._datasets.values():
+            if self._file.swmr_mode:
+                dataset.flush()
+        self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    @staticmethod
+    def open_reader(filename):
+        '''
+        opens a file that is being streamed to for reading. Call dataset.refresh() to see newly appended frames.
+        '''
+        return h5py.File(filename, 'r', libver='latest', swmr=True)
+
 
 class MatlabSaver:
 
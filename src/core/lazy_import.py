@@ -0,0 +1,76 @@
+"""
+Lazy Imports
+
+Plotting (matplotlib, pyqtgraph), CSV export (pandas), .mat export (scipy.io) and HDF5 files (h5py) are only
+needed when data is actually plotted or saved, but importing them takes most of the time of `import src.core`.
+lazy_import returns a stand-in for a module that imports the real module on the first attribute access, so the
+core modules can keep using `pd.DataFrame`, `sio.savemat`, ... and the import cost is only paid on first use.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported on the first attribute access.
+
+    Usage:
+        pd = lazy_import('pandas')
+        df = pd.DataFrame(data)  # pandas is imported here
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with _lock:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        # only called for attributes that are not set on the stand-in itself
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return '<lazy module {!r} ({:s})>'.format(self.__name__, state)
+
+
+def lazy_import(name: str):
+    """
+    Args:
+        name: full name of the module, e.g. 'scipy.io'
+
+    Returns: the module itself if it has already been imported, otherwise a LazyModule that imports it on first use
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_loaded(module) -> bool:
+    """
+    Returns: True if module is a real module or a LazyModule whose module has been imported
+    """
+    if isinstance(module, LazyModule):
+        return module.__dict__['_lazy_module'] is not None
+    return True
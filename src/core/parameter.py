@@ -13,8 +13,6 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from src import ur
-
 
 class ValidationError(Exception):
     """Exception raised when parameter validation fails."""
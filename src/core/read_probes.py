@@ -16,8 +16,12 @@
 
 from PyQt5.QtCore import pyqtSignal, QThread
 from src.core import Device,Probe
+from src.core.device_stats import get_call_stats
 from src.Controller import ExampleDevice
 
+# entry of the probe tree with the call latencies of a device that is instrumented, see device_stats.py
+CALL_STATS_PROBE = 'call latency'
+
 
 class ReadProbes(QThread):
     # This is the signal that will be emitted during the processing.
@@ -61,6 +65,10 @@ class ReadProbes(QThread):
                     {probe_name: probe_instance.value for probe_name, probe_instance in probe.items()}
                 for device_name, probe in self.probes.items()
             }
+            for device_name, probe in self.probes.items():
+                stats = next((get_call_stats(p.device) for p in probe.values()), None)
+                if stats is not None:
+                    self.probes_values[device_name][CALL_STATS_PROBE] = stats.display_value()
 
             self.updateProgress.emit(1)
 
@@ -0,0 +1,218 @@
+"""
+Result Cube
+
+This module provides the preallocated result storage used by ExperimentIterator. A ResultCube holds one numpy
+array per data key of a subexperiment with shape (sweep axes..., data shape). The sweep grid is known before the
+first point runs, so the arrays are allocated once, when the first point delivers its data, and every point is
+written in place at its grid index. RunningStatistics keeps the in-place running mean and variance used to average
+the data of a loop.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import warnings
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _is_numeric(value) -> bool:
+    """True if value can be stored in a numeric numpy array"""
+    if value is None or isinstance(value, (str, bytes, dict)):
+        return False
+    try:
+        array = np.asarray(value)
+    except (ValueError, TypeError):
+        return False
+    return array.dtype.kind in 'biufc'
+
+
+class ResultCube:
+    """
+    Preallocated N-dimensional storage for the data of every point of a sweep.
+
+    Each data key gets an array of shape cube.shape + data shape. Keys whose values are not numeric or change shape
+    between points are kept in an object array of shape cube.shape instead. The axes are labeled by the swept
+    parameters, see dims() and coords.
+
+    Usage:
+        cube = ResultCube([('frequency', freqs), ('power', powers)])
+        stored = cube.set((i, j), experiment.data)
+        cube['counts'][:, 0]  # all frequencies at the first power
+    """
+
+    def __init__(self, axes: Sequence[Tuple[str, Sequence]], coords: Optional[Dict[str, Tuple[str, Sequence]]] = None):
+        """
+        Args:
+            axes: list of (name, values) of the sweep axes in order
+            coords: additional labels of an axis, name -> (axis name, values), e.g. the second parameter of a
+                    zipped sweep
+        """
+        self.axes = OrderedDict((name, np.asarray(values)) for name, values in axes)
+        self.coords = dict(coords or {})
+        for name, (axis, values) in self.coords.items():
+            if axis not in self.axes or len(values) != len(self.axes[axis]):
+                raise ValueError(f'coordinate {name} does not match axis {axis}')
+        self.shape = tuple(len(values) for values in self.axes.values())
+        self.filled = np.zeros(self.shape, dtype=bool)
+        self.arrays = OrderedDict()
+        self._inner_dims = {}  # key -> labels of the data dimensions
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def dims(self, key) -> Tuple[str, ...]:
+        """
+        Returns: the label of every dimension of the array of key, the sweep axes followed by the data dimensions
+        """
+        array = self.arrays[key]
+        inner = list(self._inner_dims.get(key, ()))
+        n_inner = array.ndim - len(self.shape)
+        inner += ['{:s}_dim_{:d}'.format(key, i) for i in range(len(inner), n_inner)]
+        return tuple(self.axes.keys()) + tuple(inner[:n_inner])
+
+    def _allocate(self, key, value):
+        array = np.asarray(value)
+        if array.dtype.kind in 'fc':
+            self.arrays[key] = np.full(self.shape + array.shape, np.nan, dtype=array.dtype)
+        else:
+            self.arrays[key] = np.zeros(self.shape + array.shape, dtype=array.dtype)
+
+    def _to_object(self, key):
+        """converts the array of key to an object array with one entry per point"""
+        old = self.arrays[key]
+        new = np.empty(self.shape, dtype=object)
+        for index in zip(*np.nonzero(self.filled)):
+            new[index] = old[index]
+        self.arrays[key] = new
+        self._inner_dims.pop(key, None)
+
+    def set(self, index, data: dict, inner_dims: Optional[Dict[str, Sequence[str]]] = None) -> dict:
+        """
+        writes the data of one point into the cube
+        Args:
+            index: grid index of the point, a tuple with one entry per axis
+            data: data dictionary of the experiment
+            inner_dims: optional labels of the data dimensions per key, e.g. the axes of a nested iterator
+
+        Returns: data where every array has been replaced by a view into the cube, so that the caller does not have
+        to keep a second copy
+        """
+        index = tuple(np.atleast_1d(index))
+        if len(index) != len(self.shape):
+            raise IndexError(f'index {index} does not match the {len(self.shape)} axes of the cube')
+
+        stored = {}
+        for key, value in data.items():
+            if key not in self.arrays:
+                if _is_numeric(value):
+                    self._allocate(key, value)
+                    if inner_dims is not None and key in inner_dims:
+                        self._inner_dims[key] = tuple(inner_dims[key])
+                else:
+                    self.arrays[key] = np.empty(self.shape, dtype=object)
+
+            array = self.arrays[key]
+            if array.dtype != object:
+                value_array = np.asarray(value) if _is_numeric(value) else None
+                if value_array is None or value_array.shape != array.shape[len(self.shape):]:
+                    warnings.warn(f'data {key} changed shape or type between sweep points, storing it as objects')
+                    self._to_object(key)
+                    array = self.arrays[key]
+                elif not np.can_cast(value_array.dtype, array.dtype, casting='same_kind'):
+                    self.arrays[key] = array = array.astype(np.result_type(array.dtype, value_array.dtype))
+
+            if array.dtype == object:
+                array[index] = value
+                stored[key] = value
+            else:
+                array[index] = value
+                stored[key] = array[index] if isinstance(value, np.ndarray) and value.ndim > 0 else value
+
+        self.filled[index] = True
+        return stored
+
+    def to_dict(self) -> dict:
+        """
+        Returns: the axes, coordinates and arrays as a nested dictionary, e.g. for savemat
+        """
+        axes = OrderedDict(self.axes)
+        for name, (_, values) in self.coords.items():
+            axes[name] = np.asarray(values)
+        return {'axes': axes, 'dims': {key: list(self.dims(key)) for key in self.arrays},
+                'data': OrderedDict(self.arrays), 'filled': self.filled}
+
+
+class RunningStatistics:
+    """
+    In-place running mean and variance (Welford's algorithm) of the data of repeated runs.
+
+    Numeric values, also inside nested dictionaries, are averaged; other values keep the value of the last run.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean = {}
+        self._state = {}  # same nesting as _mean, [number of runs, sum of squared deviations] per averaged value
+
+    def add(self, data: dict):
+        """adds the data of one run"""
+        self.count += 1
+        self._add(self._mean, self._state, data, prefix='')
+
+    def _add(self, mean, state, data, prefix):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                self._add(mean.setdefault(key, {}), state.setdefault(key, {}), value, prefix + str(key) + '.')
+            elif not _is_numeric(value) or (key in mean and key not in state):
+                # not numeric in this or an earlier run, keep the last value
+                mean[key] = value
+                state.pop(key, None)
+            elif key not in state:
+                mean[key] = np.array(value, dtype=np.result_type(np.asarray(value).dtype, float))
+                state[key] = [1, np.zeros_like(mean[key])]
+            else:
+                value = np.asarray(value)
+                if value.shape != mean[key].shape:
+                    warnings.warn(f'data {prefix}{key} has a different shape than in the previous runs, not averaged')
+                    continue
+                state[key][0] += 1
+                delta = value - mean[key]
+                mean[key] += delta / state[key][0]
+                state[key][1] += delta * (value - mean[key])
+
+    def mean(self) -> dict:
+        """
+        Returns: the running mean of every value; arrays are the arrays that are updated in place
+        """
+        def unwrap(mean):
+            return {key: unwrap(value) if isinstance(value, dict) else
+                    (value[()] if isinstance(value, np.ndarray) and value.ndim == 0 else value)
+                    for key, value in mean.items()}
+        return unwrap(self._mean)
+
+    def variance(self, ddof: int = 1) -> dict:
+        """
+        Returns: the variance of every averaged value, with the same nesting as mean
+        """
+        def var(state):
+            result = {}
+            for key, value in state.items():
+                if isinstance(value, dict):
+                    result[key] = var(value)
+                else:
+                    n, m2 = value
+                    result[key] = m2 / (n - ddof) if n > ddof else np.zeros_like(m2)
+                    if isinstance(result[key], np.ndarray) and result[key].ndim == 0:
+                        result[key] = result[key][()]
+            return result
+        return var(self._state)
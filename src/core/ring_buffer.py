@@ -0,0 +1,136 @@
+"""
+Ring Buffer
+
+This module provides the numpy ring buffer that device streams (ADwin FIFO, DAQ counters) publish into. One producer
+thread writes with _write; any number of RingConsumers read at their own pace, each with its own position in the
+stream. Values a consumer did not read before the ring wrapped around are skipped and counted in its overruns, so a
+slow consumer (e.g. a live plot) never blocks the acquisition.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-size numpy ring buffer with a running count of the values written. Subclasses write the values they acquire
+    with _write and override running while they may still produce values.
+    """
+
+    def __init__(self, capacity, dtype):
+        """
+        Args:
+            capacity: number of values the ring buffer holds
+            dtype: numpy type of the values
+        """
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        # number of values written to the ring buffer since the start
+        self.total = 0
+        # values up to this number may currently be written, consumers use it to detect values overwritten while read
+        self._reserved = 0
+        self._condition = threading.Condition()
+
+    @property
+    def running(self):
+        """True while values may still arrive, consumers only wait for new values while running"""
+        return False
+
+    def consumer(self, from_start=False):
+        """
+        Args:
+            from_start: read the values still in the ring buffer, otherwise only values that arrive from now on
+        Returns:
+            RingConsumer: reader with its own position in the stream
+        """
+        with self._condition:
+            position = max(0, self.total - self.capacity) if from_start else self.total
+        return RingConsumer(self, position)
+
+    def latest(self, n):
+        """
+        Returns:
+            np.ndarray: copy of the last n values (fewer if less arrived), e.g. for a live plot
+        """
+        consumer = RingConsumer(self, max(0, self.total - min(n, self.capacity)))
+        return consumer.read()
+
+    def _write(self, values):
+        """appends values, at most capacity of them, to the ring buffer and wakes up waiting consumers"""
+        n = len(values)
+        start = self.total % self.capacity
+        first = min(n, self.capacity - start)
+        self._reserved = self.total + n
+        self.buffer[start:start + first] = values[:first]
+        self.buffer[:n - first] = values[first:]
+        with self._condition:
+            self.total += n
+            self._condition.notify_all()
+
+    def _notify(self):
+        """wakes up waiting consumers, e.g. when the producer stops"""
+        with self._condition:
+            self._condition.notify_all()
+
+
+class RingConsumer:
+    """
+    Reader of a RingBuffer, created with RingBuffer.consumer(). Keeps its own position in the stream.
+    """
+
+    def __init__(self, stream, position):
+        self.stream = stream
+        self.position = position
+        # number of values skipped because they were overwritten before they were read
+        self.overruns = 0
+
+    @property
+    def available(self):
+        """number of values that arrived and were not read yet"""
+        return self.stream.total - self.position
+
+    def read(self, max_values=None, timeout=None, copy=True):
+        """
+        Returns the values that arrived since the last read.
+        Args:
+            max_values: read at most this many values
+            timeout: wait up to this many seconds for new values if there are none, None does not wait
+            copy: if False, returns a view of the ring buffer up to its end (the rest follows on the next read). The
+                view is only valid until the stream wraps around, i.e. capacity values later
+        Returns:
+            np.ndarray: the values, empty if none arrived
+        """
+        stream = self.stream
+        with stream._condition:
+            if timeout is not None and stream.total <= self.position and stream.running:
+                stream._condition.wait_for(lambda: stream.total > self.position or not stream.running, timeout)
+            total = stream.total
+        self._skip_lost(total)
+        n = total - self.position
+        if max_values is not None:
+            n = min(n, max_values)
+        start = self.position % stream.capacity
+        if not copy:
+            n = min(n, stream.capacity - start)
+            values = stream.buffer[start:start + n]
+        else:
+            first = min(n, stream.capacity - start)
+            values = np.concatenate((stream.buffer[start:start + first], stream.buffer[:n - first]))
+            # values the writer started to overwrite while they were copied are dropped
+            lost = stream._reserved - stream.capacity - self.position
+            if lost > 0:
+                values = values[lost:]
+                self.overruns += min(lost, n)
+        self.position += n
+        return values
+
+    def _skip_lost(self, total):
+        lost = total - self.stream.capacity - self.position
+        if lost > 0:
+            self.overruns += lost
+            self.position += lost
@@ -0,0 +1,141 @@
+"""
+Write-Through Settings Cache
+
+Keeps the settings last applied to a device and drops writes that would not change anything. Device.__init_subclass__
+wraps the update and read_probes methods of every device class:
+
+    - update(settings) only passes the keys (and, for nested settings, the sub keys) whose value differs from the last
+      applied one or from the current settings, and returns without calling the device at all if nothing changed.
+      Keys listed in _UNCACHED_SETTINGS of the device are actions (load a waveform, send a pulse, ...) and are always
+      passed. Nothing is recorded during Device.__init__, so the first update after it is sent in full.
+    - read_probes(key) for keys listed in _STATIC_PROBES of the device is served from the cache for probe_cache_ttl
+      seconds; every update clears the cached probe values.
+
+The cache is cleared when update raises and by Device.invalidate_settings_cache, which devices call when they
+reconnect or when the instrument changes state outside of update (e.g. a stage that is moved by a waveform).
+
+The cache is opt-in: a device class enables it with _CACHE_SETTINGS = True after listing its action keys in
+_UNCACHED_SETTINGS, a single instance is switched with device.enable_settings_cache(True/False).
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import functools
+import time
+from copy import deepcopy
+
+import numpy as np
+
+_MISSING = object()
+
+
+def same_value(a, b) -> bool:
+    """
+    Returns: True if a and b are equal, also for numpy arrays and values that cannot be compared
+    """
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b)
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+def changed_settings(settings, applied, current, uncached=()) -> dict:
+    """
+    Args:
+        settings: settings passed to update
+        applied: settings last applied to the device
+        current: current settings of the device
+        uncached: keys that are always passed
+
+    Returns: the part of settings that is not already applied, nested dicts are compared key by key
+    """
+    changed = {}
+    for key, value in settings.items():
+        last = applied.get(key, _MISSING)
+        now = current.get(key, _MISSING) if isinstance(current, dict) else _MISSING
+        if key in uncached:
+            changed[key] = value
+        elif isinstance(value, dict) and isinstance(last, dict):
+            sub_settings = changed_settings(value, last, now if isinstance(now, dict) else {}, uncached)
+            if sub_settings:
+                changed[key] = sub_settings
+        elif last is _MISSING or not same_value(last, value) or not same_value(now, value):
+            changed[key] = value
+    return changed
+
+
+def record_applied(applied, settings, uncached=()):
+    """
+    merges settings into applied, without the uncached keys
+    """
+    for key, value in settings.items():
+        if key in uncached:
+            continue
+        if isinstance(value, dict):
+            if not isinstance(applied.get(key), dict):
+                applied[key] = {}
+            record_applied(applied[key], value, uncached)
+        else:
+            applied[key] = deepcopy(value)
+
+
+def _cache_active(device) -> bool:
+    state = vars(device)
+    return (state.get('_settings_initialized', False) and state.get('_cache_settings', False)
+            and state.get('_settings_update_depth', 0) == 0)
+
+
+def cached_update(method):
+    """
+    wraps the update method of a device class so that it is only called with the settings that change, see the module
+    docstring
+    """
+    @functools.wraps(method)
+    def wrapper(self, settings, *args, **kwargs):
+        if not _cache_active(self) or not isinstance(settings, dict):
+            return method(self, settings, *args, **kwargs)
+        uncached = type(self)._UNCACHED_SETTINGS
+        settings = changed_settings(settings, self._applied_settings, self._settings, uncached)
+        if not settings:
+            return None
+        self._probe_cache.clear()
+        # recorded before the call so that update can invalidate keys it could not apply
+        record_applied(self._applied_settings, settings, uncached)
+        self._settings_update_depth = 1
+        try:
+            return method(self, settings, *args, **kwargs)
+        except BaseException:
+            self.invalidate_settings_cache()
+            raise
+        finally:
+            self._settings_update_depth = 0
+    wrapper._settings_cached = True
+    return wrapper
+
+
+def cached_read_probes(method):
+    """
+    wraps the read_probes method of a device class so that the keys in _STATIC_PROBES are read at most once per
+    probe_cache_ttl seconds, see the module docstring
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if (len(args) != 1 or kwargs or args[0] not in type(self)._STATIC_PROBES or not _cache_active(self)
+                or self.probe_cache_ttl <= 0):
+            return method(self, *args, **kwargs)
+        key = args[0]
+        cached = self._probe_cache.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < self.probe_cache_ttl:
+            return cached[0]
+        value = method(self, key)
+        self._probe_cache[key] = (value, now)
+        return value
+    wrapper._settings_cached = True
+    return wrapper
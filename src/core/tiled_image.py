@@ -0,0 +1,207 @@
+"""
+Tiled Image
+
+This module provides the out-of-core image store of mosaic scans. A TiledImage keeps a 2D image in a chunked HDF5
+file next to a pyramid of 2x downsampled levels for display. Tiles are written in place and only the region of every
+pyramid level they touch is recomputed, so the memory used does not grow with the number of tiles: the HDF5 chunk
+cache is bounded by cache_bytes and the work arrays by the tile size. overlap_offset estimates the shift between
+overlapping tiles for stitching.
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from src.core.lazy_import import lazy_import
+
+h5py = lazy_import('h5py')  # only needed for hdf5 files, imported on first use
+
+
+def _downsample(block):
+    """2x2 block means of block, ignoring NaN (not yet written) pixels; odd edges average the pixels they have"""
+    rows, cols = block.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=block.dtype)
+    padded[:rows, :cols] = block
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    written = np.isfinite(blocks)
+    count = written.sum(axis=(1, 3))
+    total = np.where(written, blocks, 0).sum(axis=(1, 3))
+    with np.errstate(invalid='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan).astype(block.dtype)
+
+
+def overlap_offset(reference, moving, max_shift=3, min_correlation=0.3):
+    """
+    Returns the integer shift (rows, cols) by which moving has to be moved to match reference, two images of the same
+    region, as the shift within max_shift pixels with the highest correlation coefficient of the overlapping pixels.
+    Args:
+        reference: image already in place, e.g. the overlap of a tile with the mosaic
+        moving: image of the same shape to be placed
+        max_shift: largest shift searched in each axis
+        min_correlation: correlation coefficient the best shift must reach
+    Returns:
+        (rows, cols) or None if the images have no common structure or contain unwritten (NaN) pixels
+    """
+    reference = np.asarray(reference, dtype=float)
+    moving = np.asarray(moving, dtype=float)
+    if reference.shape != moving.shape or not (np.all(np.isfinite(reference)) and np.all(np.isfinite(moving))):
+        return None
+    rows, cols = reference.shape
+    shifts = [(dr, dc) for dr in range(-max_shift, max_shift + 1) for dc in range(-max_shift, max_shift + 1)
+              if abs(dr) < rows - 1 and abs(dc) < cols - 1]
+    # images with structure along one axis only correlate equally well at every shift along the other, the smallest
+    # of equally good shifts is taken
+    shifts.sort(key=lambda shift: abs(shift[0]) + abs(shift[1]))
+    best, best_shift = min_correlation, None
+    for dr, dc in shifts:
+        a = reference[max(dr, 0):rows + min(dr, 0), max(dc, 0):cols + min(dc, 0)]
+        b = moving[max(-dr, 0):rows + min(-dr, 0), max(-dc, 0):cols + min(-dc, 0)]
+        a = a - a.mean()
+        b = b - b.mean()
+        norm = np.sqrt(np.sum(a ** 2) * np.sum(b ** 2))
+        if norm == 0:
+            continue
+        correlation = np.sum(a * b) / norm
+        if correlation > best + 1e-9:
+            best, best_shift = correlation, (dr, dc)
+    return best_shift
+
+
+class TiledImage:
+    """
+    2D image in a chunked HDF5 file with a display pyramid. Level 0 ('image') is the full image, level k
+    ('pyramid/k') is 2**k times smaller in each axis and holds block means. Pixels that were not written yet are NaN.
+
+    Usage:
+        with TiledImage(filename, (4000, 4000), chunk_shape=(400, 400)) as image:
+            image.write_tile((row, col), tile)
+            preview = image.level(image.preview_level(512))
+    """
+
+    def __init__(self, filename, shape, chunk_shape, levels=4, dtype='f4', cache_bytes=64 * 2**20,
+                 compression='gzip'):
+        """
+        Args:
+            filename: path of the .h5 file, parent folders are created if needed
+            shape: (rows, cols) of the full image
+            chunk_shape: chunk of the full image, e.g. the tile stride; the pyramid levels use chunks of the same
+                number of bytes
+            levels: number of downsampled levels
+            dtype: numpy float type of the pixels
+            cache_bytes: HDF5 chunk cache of the file, the RAM the image uses besides the tile being written
+            compression: h5py compression filter, None for no compression
+        """
+        filename = Path(filename)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        self.filename = filename
+        self.shape = tuple(int(n) for n in shape)
+        self.levels = int(levels)
+        self._file = h5py.File(filename, 'w', rdcc_nbytes=int(cache_bytes), rdcc_nslots=10007)
+        self._datasets = []
+        for k in range(self.levels + 1):
+            shape_k = tuple(max(-(-n // 2 ** k), 1) for n in self.shape)
+            chunks = tuple(max(min(int(c), n), 1) for c, n in zip(chunk_shape, shape_k))
+            name = 'image' if k == 0 else f'pyramid/{k}'
+            self._datasets.append(self._file.create_dataset(name, shape=shape_k, dtype=dtype, chunks=chunks,
+                                                            compression=compression, fillvalue=np.nan))
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _check_writable(self, action):
+        if self._file is None:
+            raise RuntimeError(f'cannot {action}: image {self.filename} is closed')
+
+    def write_attrs(self, **attrs):
+        """writes file level attributes, e.g. the pixel size"""
+        self._check_writable('write attributes')
+        for key, value in attrs.items():
+            self._file.attrs[key] = value
+
+    def write_dataset(self, key, values):
+        """writes (or replaces) a small dataset next to the image, e.g. the tile origins"""
+        self._check_writable('write ' + key)
+        if key in self._file:
+            del self._file[key]
+        self._file.create_dataset(key, data=np.asarray(values))
+
+    def write_tile(self, origin, tile):
+        """
+        Writes tile with its first pixel at origin (row, col) of the full image and updates the pyramid below it.
+        The parts of the tile outside the image are dropped, overlapping pixels are overwritten.
+        Returns:
+            (row, col, rows, cols) of the region written, None if the tile is outside the image
+        """
+        self._check_writable('write tile')
+        tile = np.asarray(tile)
+        r0, c0 = max(origin[0], 0), max(origin[1], 0)
+        r1 = min(origin[0] + tile.shape[0], self.shape[0])
+        c1 = min(origin[1] + tile.shape[1], self.shape[1])
+        if r1 <= r0 or c1 <= c0:
+            return None
+        self._datasets[0][r0:r1, c0:c1] = tile[r0 - origin[0]:r1 - origin[0], c0 - origin[1]:c1 - origin[1]]
+        region = (r0, c0, r1, c1)
+        for k in range(1, self.levels + 1):
+            region = self._update_level(k, *region)
+        return r0, c0, r1 - r0, c1 - c0
+
+    def _update_level(self, k, r0, c0, r1, c1):
+        """recomputes the pixels of level k below the region r0:r1, c0:c1 of level k - 1 and returns them"""
+        above = self._datasets[k - 1]
+        r0, c0, r1, c1 = r0 // 2, c0 // 2, -(-r1 // 2), -(-c1 // 2)
+        block = above[2 * r0:min(2 * r1, above.shape[0]), 2 * c0:min(2 * c1, above.shape[1])]
+        self._datasets[k][r0:r1, c0:c1] = _downsample(block)
+        return r0, c0, r1, c1
+
+    def read(self, region=None, level=0):
+        """
+        Args:
+            region: (row, col, rows, cols) of the level, None for all of it
+            level: 0 for the full image, k for the 2**k downsampled level
+        Returns:
+            np.ndarray: the pixels, NaN where nothing was written
+        """
+        self._check_writable('read')
+        dataset = self._datasets[level]
+        if region is None:
+            return dataset[...]
+        row, col, rows, cols = region
+        return dataset[max(row, 0):max(row + rows, 0), max(col, 0):max(col + cols, 0)]
+
+    def level(self, k):
+        """all pixels of level k"""
+        return self.read(level=k)
+
+    def preview_level(self, max_size):
+        """smallest level k (most detail) whose larger side is at most max_size pixels, the coarsest if none is"""
+        for k, dataset in enumerate(self._datasets):
+            if max(dataset.shape) <= max_size:
+                return k
+        return self.levels
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        self._file.close()
+        self._file = None
+
+    @staticmethod
+    def open_reader(filename):
+        """opens a mosaic file for reading, the full image is file['image'] and level k file['pyramid/k']"""
+        return h5py.File(filename, 'r')
@@ -0,0 +1,245 @@
+"""
+Timing Spans
+
+Low-overhead span instrumentation to see where the wall-clock time of a run goes: device setup, _function, sleeps,
+device I/O, plotting and the save steps. Spans are recorded by a process wide Tracer that is off by default; while
+it is off a span is a shared no-op object, so the instrumentation can stay in place.
+
+Tracing is switched on by
+    - the environment variable AQUISS_TRACE=1 (for the whole process),
+    - a 'trace' setting of an experiment or iterator (for that run), or
+    - get_tracer().enable() from code.
+
+Experiment.run writes the spans of a run to <filename>-trace.json, which can be opened in chrome://tracing or
+https://ui.perfetto.dev, and appends a summary table to the -info.txt log.
+
+Usage:
+    from src.core import tracing
+
+    with tracing.span('line', category='scan', index=i):
+        ...
+    tracing.sleep(0.1)  # like time.sleep, but shows up as a 'sleep' span
+
+Author: Gurudev Dutt <gdutt@pitt.edu>
+Created: 2025
+License: GPL v2
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+TRACE_ENV_VAR = 'AQUISS_TRACE'
+
+
+class _NullSpan:
+    """span that records nothing, returned while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        return False
+
+    def end(self):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    A running span; it is recorded when the with block is left or end() is called.
+    """
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.end()
+        return False
+
+    def end(self):
+        if self.start is not None:
+            self.tracer.record(self.name, self.category, self.start, time.perf_counter() - self.start, self.args)
+            self.start = None
+
+
+class Tracer:
+    """
+    Collects spans (name, category, start, duration, thread, args) of all threads of the process.
+    """
+
+    def __init__(self, enabled: bool = False, max_events: int = 1000000):
+        """
+        Args:
+            enabled: record spans from the start
+            max_events: spans beyond this number are counted in dropped but not stored
+        """
+        self.enabled = enabled
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+            self.dropped = 0
+
+    def mark(self) -> int:
+        """
+        Returns: position in the event list, pass it to events_since to get the spans recorded after this call
+        """
+        return len(self.events)
+
+    def events_since(self, mark: int) -> List[tuple]:
+        return self.events[mark:]
+
+    def span(self, name: str, category: str = 'experiment', **args):
+        """
+        Returns: a context manager that records the time spent in the with block, a no-op if tracing is off
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, category, args)
+
+    def record(self, name, category, start, duration, args=None):
+        """
+        adds a finished span, start and duration in seconds from time.perf_counter
+        """
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append((name, category, start, duration, thread, args or {}))
+
+    def chrome_trace(self, events: Optional[List[tuple]] = None) -> Dict:
+        """
+        Returns: the spans in the Chrome trace event format (complete events, timestamps in us)
+        """
+        if events is None:
+            events = self.events
+        pid = os.getpid()
+        trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+                        for thread, name in self.thread_names.items()]
+        for name, category, start, duration, thread, args in events:
+            trace_events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+                                 'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6, 'args': args})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, filename, events: Optional[List[tuple]] = None):
+        """
+        writes the spans to filename as a Chrome/Perfetto trace json
+        """
+        with open(filename, 'w') as outfile:
+            json.dump(self.chrome_trace(events), outfile, default=str)
+
+    @staticmethod
+    def summary(events: List[tuple]) -> 'OrderedDict':
+        """
+        Returns: {(category, name): {'count', 'total', 'mean', 'max'}} in seconds, largest total first.
+        The times are inclusive, i.e. the time of a span contains the time of the spans nested in it.
+        """
+        totals = {}
+        for name, category, _, duration, _, _ in events:
+            entry = totals.setdefault((category, name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+        rows = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        return OrderedDict((key, {'count': count, 'total': total, 'mean': total / count, 'max': maximum})
+                           for key, (count, total, maximum) in rows)
+
+    def format_summary(self, events: List[tuple], max_rows: int = 40) -> List[str]:
+        """
+        Returns: the summary as lines of a text table
+        """
+        lines = ['{:<12s} {:<40s} {:>8s} {:>11s} {:>11s} {:>11s}'.format(
+            'category', 'span', 'count', 'total [s]', 'mean [ms]', 'max [ms]')]
+        summary = self.summary(events)
+        for (category, name), row in list(summary.items())[:max_rows]:
+            lines.append('{:<12s} {:<40s} {:>8d} {:>11.4f} {:>11.3f} {:>11.3f}'.format(
+                category[:12], name[:40], row['count'], row['total'], row['mean'] * 1e3, row['max'] * 1e3))
+        if len(summary) > max_rows:
+            lines.append('... {:d} more spans'.format(len(summary) - max_rows))
+        if self.dropped:
+            lines.append('{:d} spans were dropped, the trace buffer is full'.format(self.dropped))
+        return lines
+
+
+_tracer = Tracer(enabled=os.environ.get(TRACE_ENV_VAR, '').lower() in ('1', 'true', 'yes', 'on'))
+
+
+def get_tracer() -> Tracer:
+    """
+    Returns: the tracer shared by the whole process
+    """
+    return _tracer
+
+
+def span(name: str, category: str = 'experiment', **args):
+    """
+    span of the process wide tracer, see Tracer.span
+    """
+    if not _tracer.enabled:
+        return _NULL_SPAN
+    return Span(_tracer, name, category, args)
+
+
+def sleep(seconds: float, name: str = 'sleep', category: str = 'sleep'):
+    """
+    time.sleep that is recorded as a span, so that fixed waits can be told apart from acquisition time
+    Args:
+        seconds: time to sleep
+        name, category: of the span, e.g. to mark a wait for an acquisition instead of a settling delay
+    """
+    if not _tracer.enabled:
+        time.sleep(seconds)
+        return
+    with Span(_tracer, name, category, {'seconds': seconds}):
+        time.sleep(seconds)
+
+
+def traced_method(method, category: str = 'device'):
+    """
+    wraps a method so that its calls are recorded as spans named Class.method while tracing is on
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _tracer.enabled:
+            return method(self, *args, **kwargs)
+        # the name of a Device is stored in _name, vars() keeps Device.__getattr__ out of the way before it is set
+        span_args = {'device': vars(self).get('_name')}
+        if method.__name__ == 'read_probes' and args:
+            span_args['key'] = args[0]
+        with Span(_tracer, '{:s}.{:s}'.format(type(self).__name__, method.__name__), category, span_args):
+            return method(self, *args, **kwargs)
+    wrapper._traced = True
+    return wrapper
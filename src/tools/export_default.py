@@ -27,19 +27,22 @@ import inspect
 from src.core import Device,Experiment,ExperimentIterator
 from importlib import import_module
 from src.core.helper_functions import module_name_from_path
+from src.core.discovery_cache import get_discovery_cache
 import glob
 import json
 import numpy as np
 
 
 
-def find_exportable_in_python_files(folder_name, class_type, verbose = True):
+def find_exportable_in_python_files(folder_name, class_type, verbose = True, cache = None):
     """
     load all the devices or experiment objects that are located in folder_name and
     return a dictionary with the experiment class name and path_to_python_file
     Args:
         folder_name (string): folder in which to search for class objects / or name of module
         class_type (string or class): class type for which to look for
+        cache: DiscoveryCache used to skip importing unchanged files, defaults to the shared cache; False imports
+               every file
 
     Returns:
         a dictionary with the class name and path_to_python_file:
@@ -59,10 +62,13 @@ def find_exportable_in_python_files(folder_name, class_type, verbose = True):
     subdirs = [_os_module.path.join(folder_name, x) for x in _os_module.listdir(folder_name) if
                _os_module.path.isdir(_os_module.path.join(folder_name, x)) and not x.startswith('.')]
 
+    if cache is None:
+        cache = get_discovery_cache()
+
     classes_dict = {}
     # if there are subdirs in the folder recursively check all the subfolders for experiments
     for subdir in subdirs:
-        classes_dict.update(find_exportable_in_python_files(subdir, class_type))
+        classes_dict.update(find_exportable_in_python_files(subdir, class_type, cache=cache))
 
     if class_type.lower() == 'device':
         class_type = Device
@@ -70,6 +76,13 @@ def find_exportable_in_python_files(folder_name, class_type, verbose = True):
         class_type = Experiment
 
     for python_file in [file_path for file_path in glob.glob(_os_module.path.join(folder_name, "*.py"))if '__init__' not in file_path and 'setup' not in file_path]:
+        if cache:
+            # only imports the module if the file or one of its base classes changed since it was last discovered
+            found = cache.discover(python_file, class_type, exclude=(Device, Experiment, ExperimentIterator), verbose=verbose)
+            classes_dict.update({name: {'class': name, 'filepath': info['filepath'], 'info': info['info'],
+                                        'devices': {}, 'experiments': {}} for name, info in found.items()})
+            continue
+
         module, path = module_name_from_path(python_file)
 
         #appends path to this module to the python path if it is not present so it can be used
@@ -88,6 +101,12 @@ def find_exportable_in_python_files(folder_name, class_type, verbose = True):
             if verbose:
                 print('Could not import module', module)
 
+    if cache:
+        try:
+            cache.save()
+        except OSError as e:
+            print('Could not save the discovery cache:', e)
+
     return classes_dict
 
 def find_experiments_in_python_files(folder_name, verbose = False):
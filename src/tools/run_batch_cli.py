@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Command Line Batch Runner
+
+Runs a queue of experiments from .aqs files without the GUI, with the devices from the lab config created once and
+kept connected for the whole queue. Progress is written as JSON lines (see src/core/batch_runner.py); when it goes
+to stdout, everything else the experiments and devices print is sent to stderr.
+
+Usage:
+    # Run the experiments of two .aqs files one after the other
+    python src/tools/run_batch_cli.py confocal.aqs odmr.aqs
+
+    # Run a queue file, writing the progress to a file
+    python src/tools/run_batch_cli.py --queue overnight_queue.json --progress overnight.jsonl
+
+    # Use a specific lab config and data folder
+    python src/tools/run_batch_cli.py --config src/config.json --data-path D:/data --queue overnight_queue.json
+
+Press Ctrl+C once to stop the running experiment and skip the rest of the queue.
+"""
+
+import os
+import signal
+import sys
+import argparse
+from pathlib import Path
+
+# Add project root to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+# experiments create their plot images with pyqtgraph, which needs a Qt platform but no screen
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from src.core.batch_runner import BatchJob, BatchRunner, ProgressReporter, load_queue
+from src.core.tracing import get_tracer
+
+
+def main(argv=None):
+    """Main function for the command-line batch runner."""
+    parser = argparse.ArgumentParser(
+        description="Run a queue of experiments without the GUI",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument("files", nargs="*", help=".aqs files to run, in order")
+    parser.add_argument("--queue", "-q", help="JSON queue file, run after the files given as arguments")
+    parser.add_argument("--config", "-c", help="config.json with the devices (default: src/config.json)")
+    parser.add_argument("--progress", "-p", help="JSON lines file for the progress (default: stdout)")
+    parser.add_argument("--data-path", help="folder for experiments with a relative data path")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times each file is run (default: 1)")
+    parser.add_argument("--stop-on-error", action="store_true", help="stop the queue at the first failed job")
+    parser.add_argument("--trace", action="store_true",
+                        help="record timing spans, every saved run gets a -trace.json and a timing summary in its log")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        get_tracer().enable()
+
+    jobs = [BatchJob(file, repeat=args.repeat) for file in args.files]
+    if args.queue:
+        jobs += load_queue(args.queue)
+    if not jobs:
+        print("❌ Error: You must specify .aqs files or a queue file", file=sys.stderr)
+        return 1
+
+    stdout = sys.stdout
+    if args.progress:
+        reporter = ProgressReporter(args.progress)
+    else:
+        # keep stdout for the progress, the prints of devices and experiments go to stderr
+        reporter = ProgressReporter(stdout)
+        sys.stdout = sys.stderr
+
+    runner = BatchRunner(config_path=args.config, progress=reporter, data_path=args.data_path,
+                         stop_on_error=args.stop_on_error)
+
+    def interrupt(signum, frame):
+        print("⚠️  Stopping after the running experiment", file=sys.stderr)
+        runner.stop()
+        signal.signal(signal.SIGINT, signal.default_int_handler)  # a second Ctrl+C ends the process
+
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    try:
+        results = runner.run(jobs)
+    finally:
+        runner.close()
+        signal.signal(signal.SIGINT, previous_handler)
+        sys.stdout = stdout
+    return 0 if results and all(result['success'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,6 +22,9 @@ import signal
 from functools import wraps
 import time
 import threading
+import math
+
+import numpy as np
 
 # Pytest configuration for hardware tests
 def pytest_configure(config):
@@ -134,6 +137,12 @@ def pytest_collection_modifyitems(config, items):
         for item in items:
             if "hardware" in item.keywords:
                 item.add_marker(skip_hardware)
+    # benchmarks and wall clock comparisons depend on the load of the machine, they run on request
+    if not os.getenv('RUN_SLOW_TESTS') and 'slow' not in (config.getoption('markexpr') or ''):
+        skip_slow = pytest.mark.skip(reason="Slow tests disabled by default. Set RUN_SLOW_TESTS=1 or select -m slow.")
+        for item in items:
+            if "slow" in item.keywords:
+                item.add_marker(skip_slow)
 
 # ============================================================================
 # Mock Device Fixtures
@@ -233,4 +242,207 @@ def mock_sg384_device():
     mock_device.set_modulation_function.return_value = None
     mock_device.update.return_value = None
     
-    return mock_device
\ No newline at end of file
+    return mock_device
+
+# ============================================================================
+# Timing-Faithful Confocal Hardware
+# ============================================================================
+
+class VirtualClock:
+    """
+    stand-in for the time module in which time only passes in sleep, so that a scan against the fakes below takes the
+    same (simulated) time on every run, however loaded the machine is. Other attributes are those of the time module.
+    """
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds, name=None, category=None):
+        # name and category of src.core.tracing.sleep are accepted and ignored
+        self.now += max(seconds, 0.0)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class _DriverFunction:
+    """callable with a settable restype, like a function of a ctypes library"""
+
+    def __init__(self, function):
+        self.function = function
+        self.restype = None
+
+    def __call__(self, *args):
+        return self.function(*args)
+
+
+class FakeMadlib:
+    """
+    madlib.dll stand-in with the timing of a NanoDrive. Every call takes call_latency, a move settles exponentially with
+    time constant settle_tau and a waveform acquisition blocks until both waveforms are done. The load waveform starts
+    start_delay after the trigger, like the warm up of the real stage. Moves and waveform setups are logged in events.
+    Time is that of clock, the time module or a VirtualClock.
+    """
+    READ_PERIODS = {3: 0.267e-3, 4: 0.5e-3, 5: 1e-3, 6: 2e-3, 7: 10e-3, 8: 17e-3, 9: 20e-3}
+
+    def __init__(self, call_latency=2e-4, settle_tau=4e-3, start_delay=0.02, clock=time):
+        self.clock = clock
+        self.call_latency = call_latency
+        self.settle_tau = settle_tau
+        self.start_delay = start_delay
+        # axis: (position at t0, target, t0) of the last move
+        self.axes = {axis: (0.0, 0.0, 0.0) for axis in (1, 2, 3, 4)}
+        # axis: (position before, start time, time per point, values) of the last load waveform
+        self.waveforms = {}
+        self.load = None
+        self.read = None
+        self.events = []
+        functions = {
+            'MCL_GrabAllHandles': lambda: 1,
+            'MCL_GetHandleBySerial': lambda serial: 1,
+            'MCL_ReleaseHandle': lambda handle: None,
+            'MCL_GetCalibration': lambda axis, handle: 100.0,
+            'MCL_SingleReadN': self._single_read,
+            'MCL_SingleWriteN': self._single_write,
+            'MCL_Setup_LoadWaveFormN': self._setup_load,
+            'MCL_Setup_ReadWaveFormN': self._setup_read,
+            'MCL_TriggerWaveformAcquisition': self._trigger_acquisition,
+        }
+        for name, function in functions.items():
+            setattr(self, name, _DriverFunction(function))
+
+    def __getattr__(self, name):
+        # clock functions and other calls that only return success
+        if name.startswith('MCL_'):
+            return _DriverFunction(lambda *args: 0)
+        raise AttributeError(name)
+
+    def position(self, axis, t):
+        start, target, t0 = self.axes[axis]
+        if t >= t0 or axis not in self.waveforms:
+            return target + (start - target) * math.exp(-(t - t0) / self.settle_tau)
+        before, t_start, period, values = self.waveforms[axis]
+        if t < t_start:
+            return before
+        # the stage moves steadily from point to point of the waveform
+        index = (t - t_start) / period
+        if index >= len(values) - 1:
+            return values[-1]
+        fraction = index - int(index)
+        return values[int(index)] * (1 - fraction) + values[int(index) + 1] * fraction
+
+    def _call(self):
+        self.clock.sleep(self.call_latency)
+        return self.clock.perf_counter()
+
+    def _single_read(self, axis, handle):
+        return self.position(axis.value, self._call())
+
+    def _single_write(self, value, axis, handle):
+        now = self._call()
+        self.axes[axis.value] = (self.position(axis.value, now), value.value, now)
+        self.events.append(('move', axis.value, value.value, now))
+        return 0
+
+    def _setup_load(self, axis, num_points, load_rate, waveform, handle):
+        self.clock.sleep(1e-6 * num_points.value)  # USB transfer of the waveform
+        self.load = (axis.value, load_rate.value * 1e-3, list(waveform._obj))
+        self.events.append(('setup_load', id(waveform._obj), self._call()))
+        return 0
+
+    def _setup_read(self, axis, num_points, read_rate, handle):
+        self.read = (axis.value, num_points.value, self.READ_PERIODS[int(read_rate.value)])
+        return 0
+
+    def _trigger_acquisition(self, axis, num_points, read_waveform, handle):
+        axis = axis.value
+        trigger = self._call()
+        _, period, values = self.load
+        t_start = trigger + self.start_delay
+        t_end = t_start + period * len(values)
+        self.waveforms[axis] = (self.position(axis, trigger), t_start, period, values)
+        self.axes[axis] = (values[-1], values[-1], t_end)
+        read_period = self.read[2]
+        for k in range(num_points.value):
+            read_waveform._obj[k] = self.position(axis, trigger + k * read_period)
+        end = max(t_end, trigger + read_period * num_points.value)
+        self.clock.sleep(max(0.0, end - self.clock.perf_counter()))
+        return 0
+
+
+class FakeCounterAdwin:
+    """
+    ADwin driver stand-in running One_D_Scan as process 2: while it runs, Data_1[k] holds the counts of the k-th process
+    delay, given by counts(x, y) at the stage position in the middle of that interval. Reads are logged in events. Time
+    is that of the clock of stage.
+    """
+
+    def __init__(self, stage, counts=None):
+        self.stage = stage
+        self.clock = stage.clock
+        self.counts = counts if counts is not None else (lambda x, y: int(1000 + 10 * y))
+        self.delay = 3000 * 3.3e-9
+        self.data = np.zeros(1000, dtype=np.int64)
+        self.started = None
+        self.stopped = None
+        self.events = []
+
+    def Load_Process(self, filepath):
+        pass
+
+    def Clear_Process(self, number):
+        pass
+
+    def Set_Processdelay(self, number, delay):
+        self.delay = delay * 3.3e-9
+
+    def Start_Process(self, number):
+        self.started = self.clock.perf_counter()
+        self.stopped = None
+
+    def Stop_Process(self, number):
+        if self.started is not None and self.stopped is None:
+            self.stopped = self.clock.perf_counter()
+            self._fill(self.stopped)
+
+    def Process_Status(self, number):
+        return int(self.started is not None and self.stopped is None)
+
+    def GetData_Long(self, data_id, start, count):
+        if self.Process_Status(2):
+            self._fill(self.clock.perf_counter())
+        self.events.append(('read', self.clock.perf_counter()))
+        return list(self.data[start - 1:start - 1 + count])
+
+    def _fill(self, now):
+        events = min(int((now - self.started) / self.delay), len(self.data))
+        for k in range(1, events):
+            t = self.started + (k - 0.5) * self.delay
+            self.data[k - 1] = self.counts(self.stage.position(1, t), self.stage.position(2, t))
+
+
+@pytest.fixture
+def timed_confocal_devices():
+    """
+    MCLNanoDrive and AdwinGoldDevice on a FakeMadlib and a FakeCounterAdwin, as devices dict of an experiment. The fakes,
+    the waits of the NanoDrive and of NanodriveAdwinConfocalScanFast run on one VirtualClock, DLL.clock of the NanoDrive.
+    """
+    from unittest.mock import patch
+    from src.Controller.adwin_gold import AdwinGoldDevice
+    from src.Controller.nanodrive import MCLNanoDrive
+
+    clock = VirtualClock()
+    madlib = FakeMadlib(clock=clock)
+    with patch('src.Controller.nanodrive.windll') as windll:
+        windll.LoadLibrary.return_value = madlib
+        nanodrive = MCLNanoDrive()
+    with patch('src.Controller.adwin_gold.ADwin'):
+        adwin = AdwinGoldDevice(boot=False)
+    adwin.adw = FakeCounterAdwin(madlib)
+    scan_module = 'src.Model.experiments.nanodrive_adwin_confocal_scan_fast'
+    with patch(f'{scan_module}.time', clock), patch(f'{scan_module}.sleep', clock.sleep), \
+            patch('src.Controller.nanodrive.time', clock):
+        yield {'nanodrive': {'instance': nanodrive}, 'adwin': {'instance': adwin}}
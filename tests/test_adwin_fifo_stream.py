@@ -0,0 +1,195 @@
+"""
+Tests for FifoStream, the background reader of ADwin FIFO arrays, against a simulated ADwin FIFO.
+"""
+
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.Controller.adwin_gold import AdwinGoldDevice, FifoStream
+
+
+class FakeFifoAdwin:
+    """ADwin driver stand-in whose FIFO Data_1 is filled by a producer thread with 0, 1, 2, ..."""
+
+    def __init__(self, size=10000, rate=200000.0):
+        self.size = size
+        self.rate = rate
+        self.fifo = deque()
+        self.produced = 0
+        self.lost = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, count=None):
+        def produce():
+            t0 = time.perf_counter()
+            while not self._stop.is_set() and (count is None or self.produced < count):
+                due = int((time.perf_counter() - t0) * self.rate) - self.produced
+                if count is not None:
+                    due = min(due, count - self.produced)
+                with self.lock:
+                    for _ in range(max(due, 0)):
+                        if len(self.fifo) < self.size:
+                            self.fifo.append(self.produced)
+                        else:
+                            self.lost += 1
+                        self.produced += 1
+                time.sleep(1e-4)
+        self._thread = threading.Thread(target=produce, daemon=True)
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def Fifo_Full(self, fifo_id):
+        return len(self.fifo)
+
+    def Fifo_Empty(self, fifo_id):
+        return self.size - len(self.fifo)
+
+    def GetFifo_Long(self, fifo_id, count):
+        with self.lock:
+            return [self.fifo.popleft() for _ in range(min(count, len(self.fifo)))]
+
+
+def test_stream_delivers_all_values_in_order():
+    adw = FakeFifoAdwin()
+    stream = FifoStream(SimpleNamespace(adw=adw), 1, capacity=50000, target_chunk=500)
+    received = []
+    with stream:
+        consumer = stream.consumer()
+        adw.start(count=20000)
+        while sum(len(chunk) for chunk in received) < 20000:
+            chunk = consumer.read(timeout=1.0)
+            assert len(chunk) or stream.running
+            received.append(chunk)
+    adw.stop()
+    values = np.concatenate(received)
+    assert values.dtype == np.int32
+    assert np.array_equal(values, np.arange(20000))
+    assert consumer.overruns == 0 and stream.adwin_overruns == 0 and stream.error is None
+    assert np.array_equal(stream.latest(10), np.arange(19990, 20000))
+
+
+def test_consumer_overrun_and_views():
+    adw = FakeFifoAdwin()
+    stream = FifoStream(SimpleNamespace(adw=adw), 1, capacity=1000)
+    adw.fifo.extend(range(2500))
+    adw.produced = 2500
+    for _ in range(3):
+        stream._drain()
+    assert stream.total == 2500
+
+    consumer = stream.consumer(from_start=True)
+    assert consumer.available == 1000
+    view = consumer.read(copy=False)
+    # the ring buffer wraps at 1000 values, a view ends there and the rest follows on the next read
+    assert np.shares_memory(view, stream.buffer)
+    assert np.array_equal(view, np.arange(1500, 2000))
+    assert np.array_equal(consumer.read(copy=False), np.arange(2000, 2500))
+
+    lagging = stream.consumer()
+    adw.fifo.extend(range(2500, 4000))
+    stream._drain()
+    stream._drain()
+    values = lagging.read()
+    assert lagging.overruns == 500
+    assert np.array_equal(values, np.arange(3000, 4000))
+
+
+def test_adwin_fifo_full_is_reported():
+    adw = FakeFifoAdwin(size=100)
+    adw.fifo.extend(range(100))
+    stream = FifoStream(SimpleNamespace(adw=adw), 1, capacity=1000)
+    assert stream._drain() == 100
+    assert stream.adwin_overruns == 1
+
+
+def test_poll_interval_adapts_to_rate():
+    adw = FakeFifoAdwin(size=1_000_000, rate=200_000.0)
+    stream = FifoStream(SimpleNamespace(adw=adw), 1, capacity=1_000_000, target_chunk=10, min_interval=1e-4)
+    with stream:
+        adw.start()
+        time.sleep(0.3)
+    adw.stop()
+    assert stream.interval < 1e-3
+
+    idle = FifoStream(SimpleNamespace(adw=FakeFifoAdwin()), 1, max_interval=0.02)
+    with idle:
+        time.sleep(0.2)
+    assert idle.interval == pytest.approx(0.02)
+
+
+def test_device_creates_stream():
+    with patch('src.Controller.adwin_gold.ADwin'):
+        adwin = AdwinGoldDevice(boot=False)
+    stream = adwin.fifo_stream(3, kind='float', capacity=10)
+    assert stream.device is adwin and stream.fifo_id == 3
+    assert stream.buffer.dtype == np.float32 and len(stream.buffer) == 10
+
+
+class OverlapCheckingAdwin(FakeFifoAdwin):
+    """FakeFifoAdwin that counts the calls made while another call of the driver is still running"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.overlaps = 0
+        self.pars = np.zeros(80, dtype=np.int32)
+
+    def _call(self, method, *args):
+        self.active += 1
+        if self.active > 1:
+            self.overlaps += 1
+        time.sleep(1e-4)
+        try:
+            return method(*args)
+        finally:
+            self.active -= 1
+
+    def Fifo_Full(self, fifo_id):
+        return self._call(super().Fifo_Full, fifo_id)
+
+    def Fifo_Empty(self, fifo_id):
+        return self._call(super().Fifo_Empty, fifo_id)
+
+    def GetFifo_Long(self, fifo_id, count):
+        return self._call(super().GetFifo_Long, fifo_id, count)
+
+    def Set_Par(self, Par_id, value):
+        self._call(self.pars.__setitem__, Par_id - 1, value)
+
+    def Get_Par(self, Par_id):
+        return self._call(self.pars.__getitem__, Par_id - 1)
+
+    def Get_Par_All(self):
+        return self._call(self.pars.copy)
+
+
+def test_stream_and_experiment_thread_do_not_interleave_driver_calls():
+    with patch('src.Controller.adwin_gold.ADwin'):
+        adwin = AdwinGoldDevice(boot=False)
+    adwin.adw = OverlapCheckingAdwin(rate=50000.0)
+    adwin.adw.start()
+    with adwin.fifo_stream(1, capacity=100000, target_chunk=50) as stream:
+        consumer = stream.consumer()
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < 0.3:
+            adwin.set_int_var(5, 7)
+            assert adwin.get_int_var(5) == 7
+            assert adwin.read_many(pars=[5])['pars'] == {5: 7}
+    adwin.adw.stop()
+    assert len(consumer.read()) > 0 and stream.error is None
+    assert adwin.adw.overlaps == 0
@@ -260,6 +260,138 @@ def test_mock_cleanup():
         del adwin  # This should trigger __del__ without warnings
 
 
+def test_numpy_data_reads(get_adwin):
+    '''
+    Typed numpy reads wrap ctypes arrays without copying and fill preallocated buffers.
+    '''
+    import ctypes
+    adw = get_adwin
+    adw.adw.GetData_Long.return_value = [1, 2, 3, 4, 5]
+    adw.adw.GetData_Float.return_value = [1.0, 2.0, 3.0, 4.0, 5.0]
+    adw.adw.GetData_Double.return_value = [1.0, 2.0, 3.0, 4.0, 5.0]
+    counts = adw.get_int_data_np(1, 5)
+    assert counts.dtype == np.int32 and list(counts) == [1, 2, 3, 4, 5]
+    adw.adw.GetData_Long.assert_called_with(1, 1, 5)
+    assert adw.get_float_data_np(2, 5).dtype == np.float32
+    assert adw.get_float64_data_np(3, 5).dtype == np.float64
+
+    raw = (ctypes.c_int32 * 4)(7, 8, 9, 10)
+    adw.adw.GetData_Long.return_value = raw
+    view = adw.get_int_data_np(1, 4)
+    assert view.ctypes.data == ctypes.addressof(raw)
+
+    buffer = np.zeros(10, dtype=np.int32)
+    filled = adw.get_int_data_np(1, 4, out=buffer)
+    assert np.shares_memory(filled, buffer)
+    assert list(buffer[:5]) == [7, 8, 9, 10, 0]
+
+    with pytest.raises(KeyError):
+        adw.get_int_data_np(11)
+
+
+def test_read_many(get_adwin):
+    '''
+    read_many reads the requested Pars with one Get_Par_All and returns the arrays as numpy arrays.
+    '''
+    adw = get_adwin
+    adw.adw.Get_Par_All.return_value = list(range(1, 81))
+    adw.adw.Get_FPar_All.return_value = [0.0] * 80
+    adw.adw.GetData_Long.return_value = [1, 2, 3, 4, 5]
+    adw.adw.GetData_Float.return_value = [1.0, 2.0, 3.0, 4.0, 5.0]
+    adw.adw.Get_Par.reset_mock()
+    result = adw.read_many({1: 5, 2: (5, 'float')}, pars=[20, 21, 25], fpars=[1])
+    assert result['pars'] == {20: 20, 21: 21, 25: 25}
+    assert result['fpars'] == {1: 0.0}
+    assert adw.adw.Get_Par_All.call_count == 1
+    adw.adw.Get_Par.assert_not_called()
+    assert result['data'][1].dtype == np.int32
+    assert result['data'][2].dtype == np.float32
+    with pytest.raises(KeyError):
+        adw.read_many(pars=[81])
+
+
+def test_wait_for(get_adwin):
+    '''
+    wait_for reads the watched Pars with one Get_Par_All per poll and stops on the condition, a timeout or a stalled
+    heartbeat. Failed reads are tolerated.
+    '''
+    from ADwin import ADwinError
+    adw = get_adwin
+
+    polls = []
+
+    def get_par_all():
+        # Par_20 = ready flag set from the 5th poll on, Par_25 = heartbeat advancing every poll
+        polls.append(len(polls))
+        if len(polls) == 2:
+            raise ADwinError('Get_Par_All', 'transient error', 0)
+        values = [0] * 80
+        values[19] = int(len(polls) > 5)
+        values[24] = len(polls)
+        return values
+
+    adw.adw.Get_Par_All.side_effect = get_par_all
+    adw.adw.Get_Par.reset_mock()
+    result = adw.wait_for(lambda pars: pars[20] == 1, pars=[20], timeout=1.0, heartbeat_par=25)
+    assert result['status'] == 'done'
+    assert result['pars'] == {20: 1, 25: 6}
+    assert result['polls'] == 6 and result['errors'] == 1
+    adw.adw.Get_Par.assert_not_called()
+
+    adw.adw.Get_Par_All.side_effect = None
+    adw.adw.Get_Par_All.return_value = [0] * 80
+    result = adw.wait_for(lambda pars: pars[20] == 1, pars=[20], timeout=0.05)
+    assert result['status'] == 'timeout'
+    assert 0.05 <= result['elapsed'] < 0.5
+
+    result = adw.wait_for(lambda pars: pars[20] == 1, pars=[20], timeout=1.0, heartbeat_par=25, stall_timeout=0.05)
+    assert result['status'] == 'stalled'
+    assert result['elapsed'] < 0.5
+
+    # before the expected completion time the polls are sparse
+    adw.adw.Get_Par_All.reset_mock()
+    result = adw.wait_for(lambda pars: False, pars=[20], timeout=0.2, expected=0.2, max_interval=0.05)
+    assert result['status'] == 'timeout'
+    assert adw.adw.Get_Par_All.call_count < 20
+
+    with pytest.raises(KeyError):
+        adw.wait_for(lambda pars: True, pars=[0])
+
+
+def test_digit_volt_conversion():
+    from src.Controller.adwin_gold import digits_to_volts, volts_to_digits
+    volts = digits_to_volts([0, 32768, 65535, 70000], invalid=0.0)
+    assert volts[0] == -10.0 and volts[2] == 10.0 and volts[3] == 0.0
+    assert abs(volts[1]) < 1e-3
+    assert np.isnan(digits_to_volts([-1])[0])
+    digits = volts_to_digits([-12.0, -10.0, 0.0, 1.0, 10.0])
+    assert digits.dtype == np.int32
+    assert list(digits) == [0, 0, int(10.0 * 65535.0 / 20.0), int(11.0 * 65535.0 / 20.0), 65535]
+    assert np.allclose(digits_to_volts(volts_to_digits(np.linspace(-10, 10, 101))), np.linspace(-10, 10, 101),
+                       atol=20.0 / 65535)
+
+
+def test_delay_is_set_again_after_reload(get_adwin):
+    """loading a process resets its delay to the one of the binary, the settings cache must not drop the same delay"""
+    adw = get_adwin
+    binary = str(get_adwin_binary_path('One_D_Scan.TB2'))
+    adw.adw.Set_Processdelay.reset_mock()
+    adw.update({'process_2': {'load': binary}})
+    adw.update({'process_2': {'delay': 4000}})
+    adw.clear_process(2)
+    adw.update({'process_2': {'load': binary}})
+    adw.update({'process_2': {'delay': 4000}})
+    assert adw.adw.Set_Processdelay.call_count == 2
+    # the delay given together with the load is set after it
+    adw.adw.Set_Processdelay.reset_mock()
+    adw.adw.Load_Process.reset_mock()
+    calls = Mock()
+    calls.attach_mock(adw.adw.Load_Process, 'load')
+    calls.attach_mock(adw.adw.Set_Processdelay, 'delay')
+    adw.update({'process_2': {'delay': 4000, 'load': binary}})
+    assert [call[0] for call in calls.mock_calls] == ['load', 'delay']
+
+
 @pytest.mark.hardware
 def test_adwin_hardware_connection():
     '''
@@ -462,6 +462,7 @@ class TestAWG520Device:
             
             # Mock the send_command method for connection testing
             mock_driver.send_command.return_value = "SONY/TEK,AWG520,0,SCPI:95.0 OS:3.0"
+            mock_driver.upload_files.return_value = {'uploaded': ['test.seq'], 'skipped': [], 'failed': []}
             
             # Create device first
             device = AWG520Device(settings={
@@ -572,15 +573,16 @@ class TestAWG520Device:
         
         # Mock successful connection
         mock_driver.send_command.return_value = "SONY/TEK,AWG520,0,SCPI:95.0 OS:3.0"
+        mock_driver.batch.return_value = MagicMock()
         
         # Setup should succeed when connected
         result = device.setup()
         assert result is True
         
-        # Verify setup commands were called
-        mock_driver.set_ref_clock.assert_any_call(1, 'EXT')
-        mock_driver.set_ref_clock.assert_any_call(2, 'EXT')
-        mock_driver.send_command.assert_any_call('AWGC:RMOD ENH')
+        # Verify setup commands were sent in one batch that waits for completion
+        mock_driver.batch.assert_called_with(wait=True)
+        mock_driver.set_ref_clock_external.assert_called_once()
+        mock_driver.set_enhanced_run_mode.assert_called_once()
 
     def test_device_setup_without_connection(self, mock_awg_device):
         """Test AWG520Device setup when not connected."""
@@ -605,7 +607,7 @@ class TestAWG520Device:
         assert result is False
         
         # No setup commands should be called
-        mock_driver.set_ref_clock.assert_not_called()
+        mock_driver.set_ref_clock_external.assert_not_called()
         mock_driver.send_command.assert_not_called()
 
     def test_device_reconnect(self, mock_awg_device):
@@ -756,14 +758,14 @@ class TestFileTransferWorker:
     def test_file_transfer_worker(self):
         """Test FileTransferWorker functionality."""
         mock_driver = Mock()
-        mock_driver.upload_file.return_value = True
+        mock_driver.upload_files.return_value = {'uploaded': ['remote.txt'], 'skipped': [], 'failed': []}
         
         worker = FileTransferWorker(mock_driver, 'local.txt', 'remote.txt')
         
         # Test run method
         worker.run()
         
-        mock_driver.upload_file.assert_called_with('local.txt', 'remote.txt')
+        mock_driver.upload_files.assert_called_with([('local.txt', 'remote.txt')], workers=1)
         # Note: Signal emission testing would require QApplication context
 
 
@@ -0,0 +1,171 @@
+"""
+Tests for the persistent SCPI session of AWG520Driver against a local fake SCPI server.
+"""
+
+import socket
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from src.Controller.awg520 import AWG520Driver
+
+
+class FakeScpiServer:
+    """TCP server that records every line and answers all queries of a line with one line, joined by ';'"""
+    responses = {'*IDN?': 'SONY/TEK,AWG520,0,SCPI:95.0 OS:2.0 USR:4.0', '*OPC?': '1',
+                 'SOUR1:MARK2:VOLT:LOW?': '2.0', 'SOUR1:MARK2:VOLT:HIGH?': '2.0',
+                 'AWGC:FG1:FUNC?': 'SIN', 'AWGC:FG1:FREQ?': '10000000', 'AWGC:FG1:VOLT?': '2.0',
+                 'AWGC:FG1:PHAS?': '0.0'}
+
+    def __init__(self):
+        self.lines = []
+        self.connections = 0
+        self.round_trips = 0
+        self._clients = []
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(5)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self._clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        buffer = b''
+        while True:
+            try:
+                data = client.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                line = line.decode()
+                self.lines.append(line)
+                queries = [cmd.lstrip(':') for cmd in line.split(';') if cmd.endswith('?')]
+                if queries:
+                    self.round_trips += 1
+                    client.sendall((';'.join(self.responses.get(q, '0') for q in queries) + '\n').encode())
+
+    def drop_clients(self):
+        for client in self._clients:
+            client.shutdown(socket.SHUT_RDWR)
+            client.close()
+        self._clients.clear()
+
+    def close(self):
+        self.drop_clients()
+        self._server.close()
+
+
+@pytest.fixture
+def server():
+    server = FakeScpiServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def driver(server):
+    with patch('src.Controller.awg520.FTP'):
+        driver = AWG520Driver('127.0.0.1', scpi_port=server.port)
+    yield driver
+    driver.close()
+
+
+def test_connection_is_kept_open(driver, server):
+    assert 'AWG520' in driver.send_command('*IDN?', query=True)
+    driver.run()
+    driver.stop()
+    assert driver.send_command('*OPC?', query=True) == '1'
+    assert server.connections == 1
+    assert server.lines == ['*IDN?', 'AWGC:RUN', 'AWGC:STOP', '*OPC?']
+
+
+def test_configure_is_one_round_trip(driver, server):
+    assert driver.configure('test.seq', enable_iq=True) is True
+    assert server.round_trips == 1
+    assert len(server.lines) == 1
+    commands = server.lines[0].split(';')
+    assert commands[:3] == ['SOUR1:ROSC:SOUR EXT', ':SOUR2:ROSC:SOUR EXT', ':AWGC:RMOD ENH']
+    assert ':SOUR2:FUNC:USER "test.seq","MAIN"' in commands
+    assert ':SOUR2:MARK2:VOLT:HIGH 2.0' in commands
+    assert commands[-3:] == [':OUTP1:STAT ON', ':OUTP2:STAT ON', '*OPC?']
+    # every header after the first starts from the root, not from the node of the header before it
+    assert all(cmd.startswith((':', '*')) for cmd in commands[1:])
+
+
+def test_batch_and_query_pipelining(driver, server):
+    assert driver.mw_on_sb10MHz(enable_iq=True) is True
+    assert server.round_trips == 1
+    assert server.lines[0].endswith(';:AWGC:FG2:VOLT 2.0;*OPC?')
+
+    with driver.batch():
+        driver.set_ch1_marker2_laser_on()
+        assert driver.get_ch1_marker2_voltage() == (2.0, 2.0)
+        driver.trigger()
+    assert server.lines[1:] == ['SOUR1:MARK2:VOLT:LOW 2.0;:SOUR1:MARK2:VOLT:HIGH 2.0;:SOUR1:MARK2:VOLT:LOW?',
+                                'SOUR1:MARK2:VOLT:HIGH?', '*TRG']
+
+    status = driver.get_function_generator_status(1)
+    assert status == {'function': 'SIN', 'frequency': '10000000', 'voltage': 2.0, 'phase': 0.0}
+    assert server.lines[-1] == 'AWGC:FG1:FUNC?;:AWGC:FG1:FREQ?;:AWGC:FG1:VOLT?;:AWGC:FG1:PHAS?'
+    assert server.connections == 1
+
+
+def test_failed_batch_sends_nothing(driver, server):
+    with pytest.raises(RuntimeError):
+        with driver.batch(wait=True):
+            driver.run()
+            raise RuntimeError('sequence not ready')
+    driver.stop()
+    assert driver.wait_for_completion()
+    assert server.lines == ['AWGC:STOP', '*OPC?']
+
+
+def test_setters_report_the_result_of_their_batch(driver, server):
+    assert driver.set_ch1_marker2_laser_on() is True
+    assert driver.set_function_generator(1, phase=90.0) is True
+    # nested setters go out with the outer batch, which has the result
+    with driver.batch() as batch:
+        assert driver.set_ch1_marker1_voltage(1.0) is None
+    assert batch.sent is True
+    assert driver.wait_for_completion()
+    assert server.lines[-2:] == ['SOUR1:MARK1:VOLT:LOW 1.0;:SOUR1:MARK1:VOLT:HIGH 1.0', '*OPC?']
+
+
+def test_setters_fail_without_awg():
+    # a port nobody listens on
+    with socket.socket() as unused:
+        unused.bind(('127.0.0.1', 0))
+        port = unused.getsockname()[1]
+    with patch('src.Controller.awg520.FTP'):
+        driver = AWG520Driver('127.0.0.1', scpi_port=port)
+    assert driver.set_ch1_marker2_laser_off() is False
+    assert driver.set_ch2_marker2_voltage(0.0) is False
+    assert driver.set_function_generator(2) is False
+    with driver.batch() as batch:
+        driver.run()
+        # a failed query inside the batch takes the commands before it along
+        assert driver.send_command('*IDN?', query=True) is None
+        driver.stop()
+    assert not batch
+    driver.close()
+
+
+def test_reconnects_after_connection_loss(driver, server):
+    assert driver.wait_for_completion()
+    server.drop_clients()
+    assert driver.send_command('*IDN?', query=True).startswith('SONY/TEK')
+    assert server.connections == 2
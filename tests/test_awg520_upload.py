@@ -0,0 +1,165 @@
+"""
+Tests for the manifest-based, parallel waveform upload of AWG520Driver against an in-memory FTP stand-in.
+"""
+
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from PyQt5 import QtWidgets
+
+from src.Controller.awg520 import AWG520Device, AWG520Driver, WaveformManifest
+
+
+class FakeFTPServer:
+    """files and session statistics shared by all FakeFTP sessions"""
+
+    def __init__(self):
+        self.files = {}
+        self.stored = []
+        self.sessions = 0
+        self.active_uploads = 0
+        self.max_active_uploads = 0
+        self.lock = threading.Lock()
+
+
+class FakeFTP:
+    """stand-in for ftplib.FTP that keeps the files of all sessions in one FakeFTPServer"""
+    server = None
+
+    def connect(self, host, port):
+        with self.server.lock:
+            self.server.sessions += 1
+
+    def login(self, user, password):
+        pass
+
+    def nlst(self):
+        return list(self.server.files)
+
+    def storbinary(self, cmd, fp):
+        name = cmd.split(' ', 1)[1]
+        with self.server.lock:
+            self.server.active_uploads += 1
+            self.server.max_active_uploads = max(self.server.max_active_uploads, self.server.active_uploads)
+        time.sleep(0.05)
+        data = fp.read()
+        with self.server.lock:
+            self.server.active_uploads -= 1
+            self.server.files[name] = data
+            self.server.stored.append(name)
+
+    def delete(self, name):
+        del self.server.files[name]
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server():
+    FakeFTP.server = FakeFTPServer()
+    yield FakeFTP.server
+    FakeFTP.server = None
+
+
+@pytest.fixture
+def driver(server, tmp_path):
+    with patch('src.Controller.awg520.FTP', FakeFTP):
+        driver = AWG520Driver('127.0.0.1', manifest_file=tmp_path / 'manifest.json')
+        yield driver
+
+
+@pytest.fixture
+def waveforms(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f'scan_point_{i:03d}_1.wfm'
+        path.write_bytes(bytes([i]) * 1000)
+        paths.append(path)
+    return paths
+
+
+def test_parallel_upload_with_progress(driver, server, waveforms):
+    progress = []
+    result = driver.upload_files(waveforms, workers=3, progress=lambda *args: progress.append(args))
+    assert sorted(result['uploaded']) == sorted(path.name for path in waveforms)
+    assert result['skipped'] == [] and result['failed'] == []
+    assert server.files['scan_point_002_1.wfm'] == bytes([2]) * 1000
+    assert server.max_active_uploads > 1
+    assert [(done, total) for done, total, _ in progress] == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_unchanged_files_are_skipped(driver, server, waveforms, tmp_path):
+    driver.upload_files(waveforms)
+    waveforms[1].write_bytes(b'changed')
+    server.stored.clear()
+
+    # a new driver reads the manifest from disk
+    with patch('src.Controller.awg520.FTP', FakeFTP):
+        other = AWG520Driver('127.0.0.1', manifest_file=tmp_path / 'manifest.json')
+    result = other.upload_files(waveforms)
+    assert result['uploaded'] == ['scan_point_001_1.wfm']
+    assert len(result['skipped']) == 3
+    assert server.stored == ['scan_point_001_1.wfm']
+    assert server.files['scan_point_001_1.wfm'] == b'changed'
+
+
+def test_files_gone_from_awg_or_overwritten_are_uploaded_again(driver, server, waveforms):
+    driver.upload_files(waveforms)
+    del server.files['scan_point_000_1.wfm']
+    driver.upload_file(str(waveforms[3]), 'scan_point_001_1.wfm')
+    assert driver.delete_file('scan_point_002_1.wfm')
+    server.stored.clear()
+
+    result = driver.upload_files([(str(path), path.name) for path in waveforms])
+    assert sorted(result['uploaded']) == ['scan_point_000_1.wfm', 'scan_point_001_1.wfm', 'scan_point_002_1.wfm']
+    assert result['skipped'] == ['scan_point_003_1.wfm']
+    assert server.files['scan_point_001_1.wfm'] == bytes([1]) * 1000
+
+    assert driver.upload_files(waveforms, force=True)['uploaded'] != []
+
+
+def test_manifest_ignores_unreadable_file(tmp_path):
+    manifest_file = tmp_path / 'manifest.json'
+    manifest_file.write_text('not json')
+    manifest = WaveformManifest(manifest_file)
+    assert manifest.files == {}
+    path = tmp_path / 'a.wfm'
+    path.write_bytes(b'abc')
+    manifest.record('a.wfm', WaveformManifest.file_digest(path))
+    manifest.save()
+    assert WaveformManifest(manifest_file).matches('a.wfm', {
+        'sha256': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad', 'size': 3})
+
+
+def test_setup_skips_unchanged_sequence_file(server, tmp_path):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    seq_file = tmp_path / 'scan.seq'
+    seq_file.write_text('MAGIC 3002\n')
+    with patch('src.Controller.awg520.FTP', FakeFTP):
+        device = AWG520Device(settings={'ip_address': '127.0.0.1', 'seq_file': str(seq_file)})
+    device.driver.manifest_file = tmp_path / 'manifest.json'
+    device.driver.send_command = Mock(return_value='SONY/TEK,AWG520,0,SCPI:95.0 OS:3.0')
+    device.driver.configure = Mock()
+    device._is_connected = True
+
+    completed = []
+    device.file_transfer_completed.connect(lambda success, name: completed.append((success, name)))
+    with patch('src.Controller.awg520.FTP', FakeFTP):
+        for runs in (1, 2):
+            assert device.setup()
+            deadline = time.monotonic() + 5.0
+            while len(completed) < runs and time.monotonic() < deadline:
+                app.processEvents()
+                time.sleep(0.01)
+            device._ftp_thread.wait()
+
+    # the AWG loads the file by the name it was stored under, the unchanged file is not sent again
+    assert completed == [(True, 'scan.seq'), (True, 'scan.seq')]
+    assert server.stored == ['scan.seq']
+    device.driver.configure.assert_called_with('scan.seq', enable_iq=False)
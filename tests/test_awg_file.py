@@ -119,3 +119,76 @@ def test_write_sequence(tmp_awg, tmp_path):
     # so adjust index if needed
     # Alternatively, look anywhere for STROBE
     assert any(line.startswith("STROBE ") for line in text)
+
+
+def _legacy_record(iq, marker):
+    """per-sample struct packing, as AWGFile did before the records were built with numpy"""
+    n = len(iq)
+    if n % 4:
+        pad = 4 - (n % 4)
+        iq = np.concatenate([iq, np.zeros(pad, dtype=iq.dtype)])
+        marker = np.concatenate([marker, np.zeros(pad, dtype=marker.dtype)])
+        n += pad
+    rec_size = struct.calcsize("<fb")
+    buf = bytearray(n * rec_size)
+    for i in range(n):
+        struct.pack_into('<fb', buf, i * rec_size, float(iq[i]), int(marker[i]))
+    return bytes(buf)
+
+
+def _random_waveform(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-1, 1, n), rng.integers(0, 4, n)
+
+
+def test_binary_record_matches_struct_packing(tmp_awg):
+    iq, marker = _random_waveform(1001)
+    nbytes, rec_size, payload = tmp_awg._make_binary_record(iq, marker)
+    assert rec_size == struct.calcsize("<fb")
+    assert nbytes == 1004 * rec_size
+    assert payload == _legacy_record(iq, marker)
+
+
+def test_write_waveform_stream(tmp_awg, tmp_path):
+    iq, marker = _random_waveform(10_003)
+    whole = tmp_awg.write_waveform(iq, marker, name="whole").read_bytes()
+    chunks = ((iq[i:i + 1000], marker[i:i + 1000]) for i in range(0, len(iq), 1000))
+    streamed = tmp_awg.write_waveform_stream(chunks, len(iq), name="streamed").read_bytes()
+    assert streamed == whole
+    assert _legacy_record(iq, marker) in whole
+
+    # a memmap is written without being loaded as a whole
+    iq_map = np.memmap(tmp_path / "iq.dat", dtype="<f8", mode="w+", shape=len(iq))
+    iq_map[:] = iq
+    assert tmp_awg.write_waveform(iq_map, marker, name="mapped").read_bytes() == whole
+
+
+def test_write_waveform_stream_length_mismatch(tmp_awg, tmp_path):
+    iq, marker = _random_waveform(100)
+    with pytest.raises(ValueError):
+        tmp_awg.write_waveform_stream([(iq, marker)], 200, name="short")
+    with pytest.raises(ValueError):
+        tmp_awg.write_waveform_stream([(iq, marker), (iq, marker)], 150, name="long")
+    assert not list(tmp_path.glob("*.wfm"))
+    with pytest.raises(ValueError):
+        tmp_awg.write_waveform_stream([], _WFM_MEMORY_LIMIT, name="huge")
+
+
+@pytest.mark.slow
+def test_record_packing_throughput(tmp_awg):
+    """numpy record packing against the per-sample struct loop, prints samples per second"""
+    import time
+    iq, marker = _random_waveform(1_000_000)
+
+    start = time.perf_counter()
+    legacy = _legacy_record(iq, marker)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, _, payload = tmp_awg._make_binary_record(iq, marker)
+    numpy_time = time.perf_counter() - start
+
+    assert payload == legacy
+    print(f"\nstruct loop: {len(iq) / legacy_time / 1e6:.2f} MSa/s, "
+          f"numpy records: {len(iq) / numpy_time / 1e6:.2f} MSa/s")
+    assert numpy_time * 10 < legacy_time
@@ -0,0 +1,140 @@
+"""
+Tests for the background save pipeline in src/core/background_saver.py.
+
+Covers writing the data files on the worker thread, backpressure of the bounded queue, error reporting and the
+background_save setting of ExperimentIterator.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.core.background_saver import BackgroundSaver
+from src.core.experiment import Experiment
+from src.core.experiment_iterator import ExperimentIterator
+from src.core.parameter import Parameter
+
+
+class CountingExperiment(Experiment):
+    """Experiment that produces a small data set that depends on the run index."""
+    _DEFAULT_SETTINGS = [
+        Parameter('points', 5, int, 'number of data points'),
+        Parameter('offset', 0.0, float, 'added to the counts')
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def _function(self):
+        self.data = {'counts': np.arange(self.settings['points']) + self.settings['offset']}
+
+
+class SlowSaveExperiment(CountingExperiment):
+    """Experiment whose csv export blocks until released by the test."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def save_data(self, filename=None, data_tag=None, verbose=False, data=None):
+        self.release.wait(5)
+        super().save_data(filename, data_tag, verbose, data=data)
+
+
+class SaverLoop(ExperimentIterator):
+    _EXPERIMENTS = {'counting': CountingExperiment}
+    _DEFAULT_SETTINGS = [
+        Parameter('experiment_order', {'counting': 1}),
+        Parameter('experiment_execution_freq', {'counting': 1}),
+        Parameter('num_loops', 3, int, 'Number of loops'),
+        Parameter('run_all_first', True, bool, 'Run all first'),
+        Parameter('background_save', True, bool, 'save on a background thread'),
+        Parameter('save_queue_size', 2, int, 'queued runs')
+    ]
+    _DEVICES = {}
+
+
+def make_experiment(tmp_path, cls=CountingExperiment, name='counting', **settings):
+    settings.update({'path': str(tmp_path), 'save': True})
+    experiment = cls(name=name, settings=settings)
+    experiment.run()
+    return experiment
+
+
+class TestBackgroundSaver:
+
+    def test_submit_writes_all_formats(self, tmp_path):
+        experiment = make_experiment(tmp_path)
+        saver = BackgroundSaver(log_function=lambda s: None)
+        job = saver.submit(experiment)
+        assert saver.wait(5)
+        saver.close()
+
+        assert saver.errors == []
+        assert set(saver.completed[0][1]) == {'data', 'matlab', 'log'}
+        with open(job.filenames['log']) as infile:
+            assert 'background save timings' in infile.read()
+        assert list(tmp_path.rglob('*.mat'))
+        assert list(tmp_path.rglob('*.csv'))
+
+    def test_snapshot_is_independent_of_later_runs(self, tmp_path):
+        experiment = make_experiment(tmp_path)
+        saver = BackgroundSaver(formats=['data'], log_function=lambda s: None)
+        saver.submit(experiment)
+        experiment.data['counts'][:] = -1
+        saver.close()
+        for filename in tmp_path.rglob('*counts.csv'):
+            assert '-1' not in filename.read_text()
+
+    def test_backpressure(self, tmp_path):
+        experiment = SlowSaveExperiment(name='slow', settings={'path': str(tmp_path)})
+        experiment.run()
+        saver = BackgroundSaver(max_queue=1, formats=['data'], log_function=lambda s: None)
+        saver.submit(experiment)  # taken by the worker, blocks in save_data
+        time.sleep(0.05)
+        saver.submit(experiment)  # fills the queue
+        with pytest.raises(TimeoutError):
+            saver.submit(experiment, timeout=0.05)
+        assert not saver.wait(0.05)
+
+        experiment.release.set()
+        assert saver.wait(5)
+        saver.close()
+        assert len(saver.completed) == 2
+        assert saver.blocked_time >= 0.05
+
+    def test_errors_are_recorded(self, tmp_path):
+        experiment = make_experiment(tmp_path)
+        saver = BackgroundSaver(formats=['data'], log_function=lambda s: None)
+        experiment.save_data = lambda *args, **kwargs: 1 / 0
+        saver.submit(experiment)
+        saver.close()
+        assert saver.completed == []
+        assert isinstance(saver.errors[0][1], ZeroDivisionError)
+
+    def test_submit_after_close(self):
+        saver = BackgroundSaver(log_function=lambda s: None)
+        saver.close()
+        with pytest.raises(RuntimeError):
+            saver.submit(CountingExperiment(name='late'))
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            BackgroundSaver(formats=['png'])
+
+
+class TestIteratorBackgroundSave:
+
+    def test_loop_saves_in_background(self, tmp_path):
+        log = []
+        experiment = CountingExperiment(name='counting', settings={'path': str(tmp_path), 'save': True})
+        iterator = SaverLoop(experiments={'counting': experiment}, name='loop',
+                             settings={'path': str(tmp_path)}, log_function=log.append)
+        iterator._abort = False
+        iterator._function()
+
+        assert experiment.background_saver is None
+        assert len(list(tmp_path.rglob('*counting*.csv'))) == 3
+        assert len(list(tmp_path.rglob('*counting*-info.txt'))) == 3
+        assert any('3 runs written' in line for line in log)
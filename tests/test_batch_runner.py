@@ -0,0 +1,173 @@
+"""
+Tests for the headless batch runner in src/core/batch_runner.py and its command line tool.
+"""
+
+import io
+import json
+import sys
+import uuid
+
+import pytest
+
+from src.core.batch_runner import BatchJob, BatchRunner, load_queue
+from src.core.read_write_functions import save_aqs_file
+
+EXPERIMENT_SOURCE = '''
+from src.core import Device, Experiment, Parameter
+
+
+class BatchDevice(Device):
+    """Device that counts how often it is connected."""
+    _DEFAULT_SETTINGS = Parameter([Parameter('offset', 0, int, 'added to the counts')])
+    _PROBES = {}
+    connections = 0
+
+    def __init__(self, name=None, settings=None):
+        super().__init__(name, settings)
+        BatchDevice.connections += 1
+
+    def update(self, settings):
+        super().update(settings)
+
+    def read_probes(self, key):
+        pass
+
+
+class BatchExperiment(Experiment):
+    """Experiment that reads the device and reports progress."""
+    _DEFAULT_SETTINGS = [Parameter('points', 3, int, 'number of points'),
+                         Parameter('fail', False, bool, 'raise in _function')]
+    _DEVICES = {'counter': 'counter'}
+    _EXPERIMENTS = {}
+
+    def _function(self):
+        if self.settings['fail']:
+            raise RuntimeError('lost the counter')
+        device = self.devices['counter']['instance']
+        self.data = {'counts': [device.settings['offset'] + i for i in range(self.settings['points'])]}
+        for i in range(self.settings['points']):
+            self.updateProgress.emit(int(100 * (i + 1) / self.settings['points']))
+'''
+
+
+@pytest.fixture
+def batch_package(tmp_path):
+    """a package with the device and experiment of the tests, with a unique name so that it is imported fresh"""
+    name = 'batch_pkg_' + uuid.uuid4().hex[:8]
+    package = tmp_path / name
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    module_file = package / 'batch_experiment.py'
+    module_file.write_text(EXPERIMENT_SOURCE)
+    sys.path.insert(0, str(tmp_path))
+    module = __import__(name + '.batch_experiment', fromlist=['BatchDevice'])
+    yield module, module_file
+    sys.path.remove(str(tmp_path))
+    for loaded in [m for m in sys.modules if m.startswith(name)]:
+        del sys.modules[loaded]
+
+
+def write_aqs(path, module_file, **settings):
+    experiment_settings = {'path': str(path.parent / 'data'), 'save': False, 'points': 3, 'fail': False}
+    experiment_settings.update(settings)
+    experiments = {'counting': {'class': 'BatchExperiment', 'filepath': str(module_file),
+                                'settings': experiment_settings}}
+    save_aqs_file(str(path), experiments=experiments, overwrite=True)
+    return path
+
+
+def read_events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestBatchRunner:
+
+    def test_queue_reuses_devices(self, tmp_path, batch_package):
+        module, module_file = batch_package
+        device = module.BatchDevice('counter')
+        aqs = write_aqs(tmp_path / 'counting.aqs', module_file)
+        progress = io.StringIO()
+
+        runner = BatchRunner(devices={'counter': device}, progress=progress)
+        results = runner.run([BatchJob(aqs, repeat=3)])
+
+        assert [result['success'] for result in results] == [True] * 3
+        assert module.BatchDevice.connections == 1
+        events = read_events(progress)
+        assert [event['event'] for event in events].count('job_finished') == 3
+        assert [event['percent'] for event in events if event['event'] == 'progress'][:3] == [33, 66, 100]
+        assert events[-1]['event'] == 'batch_finished' and events[-1]['succeeded'] == 3
+
+    def test_failed_job_does_not_stop_queue(self, tmp_path, batch_package):
+        module, module_file = batch_package
+        failing = write_aqs(tmp_path / 'failing.aqs', module_file, fail=True)
+        working = write_aqs(tmp_path / 'working.aqs', module_file)
+        progress = io.StringIO()
+
+        runner = BatchRunner(devices={'counter': module.BatchDevice('counter')}, progress=progress)
+        results = runner.run([failing, str(tmp_path / 'missing.aqs'), working])
+
+        assert [result['success'] for result in results] == [False, False, True]
+        failed = [event for event in read_events(progress) if event['event'] == 'job_failed']
+        assert 'lost the counter' in failed[0]['error']
+
+        progress = io.StringIO()
+        runner = BatchRunner(devices={'counter': module.BatchDevice('counter')}, progress=progress,
+                             stop_on_error=True)
+        assert len(runner.run([failing, working])) == 1
+
+    def test_stop_on_error_after_job_without_experiments(self, tmp_path, batch_package):
+        module, module_file = batch_package
+        aqs = write_aqs(tmp_path / 'counting.aqs', module_file)
+
+        runner = BatchRunner(devices={'counter': module.BatchDevice('counter')}, progress=io.StringIO(),
+                             stop_on_error=True)
+        results = runner.run([BatchJob(aqs, experiments=[]), BatchJob(aqs)])
+
+        assert [result['success'] for result in results] == [True]
+
+    def test_settings_override_and_queue_file(self, tmp_path, batch_package):
+        module, module_file = batch_package
+        write_aqs(tmp_path / 'counting.aqs', module_file)
+        queue_file = tmp_path / 'queue.json'
+        queue_file.write_text(json.dumps({'jobs': [
+            'counting.aqs',
+            {'file': 'counting.aqs', 'name': 'long', 'settings': {'points': 5}, 'repeat': 2}]}))
+
+        jobs = load_queue(queue_file)
+        assert [job.name for job in jobs] == ['counting', 'long']
+        assert jobs[0].file == tmp_path / 'counting.aqs'
+
+        runner = BatchRunner(devices={'counter': module.BatchDevice('counter')}, progress=io.StringIO())
+        experiments = runner.load_experiments(jobs[1])
+        assert experiments['counting'].settings['points'] == 5
+        assert experiments['counting'].devices['counter']['instance'] is runner.devices['counter']
+
+    def test_saves_data(self, tmp_path, batch_package):
+        module, module_file = batch_package
+        aqs = write_aqs(tmp_path / 'counting.aqs', module_file, save=True)
+        progress = io.StringIO()
+        BatchRunner(devices={'counter': module.BatchDevice('counter')}, progress=progress).run([aqs])
+
+        finished = [event for event in read_events(progress) if event['event'] == 'job_finished'][0]
+        assert finished['success']
+        assert list((tmp_path / 'data').rglob('*-info.txt'))
+
+
+class TestBatchCli:
+
+    def test_main_loads_config_once(self, tmp_path, batch_package):
+        from src.tools import run_batch_cli
+        module, module_file = batch_package
+        aqs = write_aqs(tmp_path / 'counting.aqs', module_file)
+        config = tmp_path / 'config.json'
+        config.write_text(json.dumps({'devices': {'counter': {'class': 'BatchDevice', 'filepath': str(module_file),
+                                                              'settings': {'offset': 10}}}}))
+
+        progress_file = tmp_path / 'progress.jsonl'
+        assert run_batch_cli.main([str(aqs), '--repeat', '2', '--config', str(config),
+                                   '--progress', str(progress_file)]) == 0
+        events = [json.loads(line) for line in progress_file.read_text().splitlines()]
+        assert [event['devices'] for event in events if event['event'] == 'devices_loaded'] == [['counter']]
+        assert sum(event['event'] == 'job_finished' for event in events) == 2
+        assert module.BatchDevice.connections == 1
@@ -0,0 +1,140 @@
+"""
+Tests for NanodriveAdwinConfocalMosaicFast, the tiled mosaic of confocal scans, with a stand-in tile scan that cuts its
+tiles out of a synthetic sample and with NanodriveAdwinConfocalScanFast on the timing-faithful fakes of conftest.py.
+"""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from src.core import Experiment, Parameter
+from src.core.tiled_image import TiledImage
+from src.Model.experiments.nanodrive_adwin_confocal_mosaic import NanodriveAdwinConfocalMosaicFast
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+
+
+def make_sample(resolution, seed=0):
+    # NVs as gaussian spots of 1 um on a 0 - 100 um grid
+    rng = np.random.default_rng(seed)
+    axis = np.arange(0.0, 100.0 + resolution, resolution)
+    sample = np.full((len(axis), len(axis)), 1000.0)
+    for x, y in rng.uniform(0.0, 100.0, (400, 2)):
+        sample += 20000 * np.outer(np.exp(-(axis - x) ** 2 / 2.0), np.exp(-(axis - y) ** 2 / 2.0))
+    return sample
+
+
+class SampleScan(Experiment):
+    """tile scan stand-in returning the tile of sample from point_a to point_b, shifted by drift(tile) pixels"""
+
+    _DEFAULT_SETTINGS = [
+        Parameter('point_a', [Parameter('x', 0.0, float, ''), Parameter('y', 0.0, float, '')]),
+        Parameter('point_b', [Parameter('x', 10.0, float, ''), Parameter('y', 10.0, float, '')]),
+        Parameter('resolution', 1.0, float, ''),
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def __init__(self, sample, drift=None):
+        super().__init__()
+        self.sample = sample
+        self.drift = drift
+        self.tiles = 0
+
+    def _function(self):
+        step = self.settings['resolution']
+        row, col = (int(round(self.settings['point_a'][axis] / step)) for axis in ('x', 'y'))
+        rows, cols = (int(round((self.settings['point_b'][axis] - self.settings['point_a'][axis]) / step)) + 1
+                      for axis in ('x', 'y'))
+        if self.drift is not None:
+            drift = self.drift(self.tiles)
+            row, col = row + drift[0], col + drift[1]
+        self.tiles += 1
+        self.data['count_img'] = self.sample[row:row + rows, col:col + cols].copy()
+
+
+def make_mosaic(scan, tmp_path, **settings):
+    return NanodriveAdwinConfocalMosaicFast(experiments={'scan': scan}, settings=settings, data_path=str(tmp_path))
+
+
+def test_mosaic_reassembles_sample(tmp_path):
+    sample = make_sample(0.5)
+    mosaic = make_mosaic(SampleScan(sample), tmp_path, resolution=0.5, tile_size=12.0, overlap=4.0,
+                         point_a={'x': 10.0, 'y': 20.0}, point_b={'x': 60.0, 'y': 50.0}, preview_size=32)
+    mosaic.run()
+    # 101 x 61 pixels in tiles of 25 with a stride of 17
+    assert len(mosaic.data['tile_origins']) == 6 * 4
+    assert np.all(mosaic.data['tile_offsets'] == 0)
+    assert np.array_equal(mosaic.data['tile_origins'][-1], [76, 36])
+    with TiledImage.open_reader(mosaic.data['mosaic_file']) as f:
+        assert np.allclose(f['image'][...], sample[20:121, 40:101])
+        assert f.attrs['x_min'] == 10.0 and f.attrs['resolution'] == 0.5
+        assert np.array_equal(f['tile_origins'][...], mosaic.data['tile_origins'])
+    # the displayed level fits preview_size
+    assert mosaic.data['count_img'].shape == (26, 16) and mosaic.data['preview_level'] == 2
+
+
+def test_mosaic_stitches_drifting_tiles(tmp_path):
+    sample = make_sample(1.0)
+    # the stage drifts by a pixel in x every second tile and a pixel in y every third
+    drift = lambda tile: (tile // 2, -(tile // 3))
+    mosaic = make_mosaic(SampleScan(sample, drift), tmp_path, tile_size=20.0, overlap=8.0, max_shift=3,
+                         point_a={'x': 20.0, 'y': 20.0}, point_b={'x': 60.0, 'y': 60.0})
+    mosaic.run()
+    expected = np.array([drift(tile) for tile in range(len(mosaic.data['tile_offsets']))])
+    # the drift adds up to more than max_shift, each tile is searched around the offsets of its neighbours
+    assert np.array_equal(mosaic.data['tile_offsets'], expected)
+    with TiledImage.open_reader(mosaic.data['mosaic_file']) as f:
+        image = f['image'][...]
+    # away from the edges, where the drift leaves pixels unwritten, the mosaic is the sample
+    assert np.allclose(image[5:-5, 5:-5], sample[25:56, 25:56])
+
+
+@pytest.mark.slow
+def test_mosaic_memory_stays_bounded(tmp_path):
+    sample = make_sample(0.1)
+    mosaic = make_mosaic(SampleScan(sample), tmp_path, resolution=0.1, tile_size=5.0, overlap=0.5, max_shift=2,
+                         point_a={'x': 0.0, 'y': 0.0}, point_b={'x': 100.0, 'y': 100.0}, memory_budget=16.0,
+                         preview_size=256)
+    tracemalloc.start()
+    mosaic.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(mosaic.data['tile_origins']) == 22 * 22 and np.all(mosaic.data['tile_offsets'] == 0)
+    # a dense float64 image of the mosaic would be 8 MB
+    assert peak < 4 * 2**20
+    with TiledImage.open_reader(mosaic.data['mosaic_file']) as f:
+        assert f['image'].shape == (1001, 1001) and not np.any(np.isnan(f['pyramid/4'][...]))
+
+
+def test_tiles_larger_than_memory_budget(tmp_path):
+    mosaic = make_mosaic(SampleScan(make_sample(0.1)), tmp_path, resolution=0.1, tile_size=90.0, memory_budget=64.0)
+    with pytest.raises(ValueError):
+        mosaic._function()
+
+
+def test_mosaic_of_fast_scans(timed_confocal_devices, tmp_path):
+    sample = make_sample(1.0)
+    timed_confocal_devices['adwin']['instance'].adw.counts = lambda x, y: int(sample[int(round(x)), int(round(y))] * 2e-3)
+    scan = NanodriveAdwinConfocalScanFast(timed_confocal_devices, settings={
+        'binning': 'position', 'read_delay': 0.2, 'ending_behavior': 'leave_at_corner'}, data_path=str(tmp_path))
+    mosaic = make_mosaic(scan, tmp_path, tile_size=15.0, overlap=7.0, max_shift=2,
+                         point_a={'x': 2.0, 'y': 2.0}, point_b={'x': 26.0, 'y': 26.0})
+    mosaic.run()
+    # the fast scan keeps its 5 um y overscan inside the Nanodrive range
+    with TiledImage.open_reader(mosaic.data['mosaic_file']) as f:
+        assert f.attrs['y_min'] == 5.0
+        image = f['image'][...]
+    assert image.shape == (25, 22) and len(mosaic.data['tile_origins']) == 4
+    assert np.all(np.abs(mosaic.data['tile_offsets']) <= 1)
+    assert np.corrcoef(image.ravel(), sample[2:27, 5:27].ravel())[0, 1] > 0.9
+
+
+def test_resolution_limited_to_the_tile_scan_values(tmp_path):
+    # rejected by the settings before _function creates the -mosaic.h5 file
+    with pytest.raises(AssertionError):
+        make_mosaic(SampleScan(make_sample(1.0)), tmp_path, resolution=0.3)
+    mosaic = make_mosaic(SampleScan(make_sample(1.0)), tmp_path)
+    with pytest.raises(AssertionError):
+        mosaic.settings.update({'resolution': 0.3})
+    assert not list(tmp_path.rglob('*.h5'))
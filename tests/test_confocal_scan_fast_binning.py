@@ -0,0 +1,87 @@
+"""
+Tests for the position-aware binning of NanodriveAdwinConfocalScanFast, which places the counts of a line on the pixels
+with the stage positions of the read waveform, against the timing-faithful FakeMadlib and FakeCounterAdwin of conftest.py.
+"""
+
+import numpy as np
+import pytest
+
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+
+
+def spots(x, y):
+    # a line of NVs along x at y = 30
+    return int(1000 + 20000 * np.exp(-(y - 30.0) ** 2 / 8.0))
+
+
+def make_experiment(devices, tmp_path, **settings):
+    # read_delay calibrates the 0.2 ms call latency of FakeMadlib, like it would the trigger delay of a real Nanodrive
+    defaults = {'point_a': {'x': 5.0, 'y': 5.0}, 'point_b': {'x': 6.0, 'y': 95.0}, 'resolution': 1.0,
+                'binning': 'position', 'read_delay': 0.2, 'ending_behavior': 'leave_at_corner',
+                '3D_scan': {'enable': False, 'folderpath': str(tmp_path)}}
+    defaults.update(settings)
+    return NanodriveAdwinConfocalScanFast(devices, settings=defaults, data_path=str(tmp_path))
+
+
+@pytest.mark.parametrize('count_period', [0.5e-3, 2e-3, 6e-3])
+@pytest.mark.parametrize('backward', [False, True])
+def test_bin_line_recovers_rates(count_period, backward):
+    # the stage moves from -3 to 13 um at 1 um per 2 ms and starts 10 ms after the counter, the rate is 1e6 + 1e5 y
+    y_array = np.arange(0.0, 11.0)
+    speed = 0.5e3
+    start, end = (13.0, -3.0) if backward else (-3.0, 13.0)
+    direction = np.sign(end - start)
+    read_times = 0.01 + np.arange(30) * 2e-3
+    y_pos = np.clip(start + direction * speed * (read_times - 0.01), min(start, end), max(start, end))
+    mid_times = (np.arange(int(0.08 / count_period)) + 0.5) * count_period
+    y_mid = np.interp(mid_times, read_times, y_pos, left=start, right=end)
+    raw_counts = np.rint((1e6 + 1e5 * y_mid) * count_period).astype(np.int32)
+    counts, rates = NanodriveAdwinConfocalScanFast._bin_line(raw_counts, y_pos, y_array, 1.0, count_period, 2e-3, 0.01)
+    assert np.allclose(rates, 1e6 + 1e5 * y_array, rtol=0.01)
+    if count_period < 2e-3:
+        # several points per pixel, their counts are summed
+        assert np.all(counts == np.rint(counts))
+        assert np.allclose(counts, (1e6 + 1e5 * y_array) * 2e-3, rtol=0.01)
+    else:
+        assert np.allclose(counts, rates * count_period)
+
+
+@pytest.mark.parametrize('time_per_pt', [0.5, 3.0, 8.0])
+def test_any_dwell_time(timed_confocal_devices, tmp_path, time_per_pt):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, time_per_pt=time_per_pt)
+    experiment._function()
+    count_img = experiment.data['count_img']
+    assert count_img.shape == (2, 91)
+    # FakeCounterAdwin counts 1000 + 10 y per point, within a pixel of the true position
+    expected = (1000 + 10 * np.arange(5.0, 96.0)) * 1e3 / time_per_pt
+    assert np.all(np.abs(count_img - expected) <= 10 * 1e3 / time_per_pt)
+    madlib = timed_confocal_devices['nanodrive']['instance'].DLL
+    # above 5 ms a pixel is split into several waveform points
+    assert madlib.load[1] == pytest.approx(time_per_pt / np.ceil(time_per_pt / 5.0) * 1e-3)
+
+
+def test_small_overscan(timed_confocal_devices, tmp_path):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, overscan=1.0,
+                                 point_a={'x': 5.0, 'y': 0.0}, point_b={'x': 6.0, 'y': 100.0})
+    experiment._function()
+    count_img = experiment.data['count_img']
+    assert count_img.shape == (2, 99)
+    expected = (1000 + 10 * np.arange(1.0, 100.0)) * 1e3 / 2.0
+    assert np.all(np.abs(count_img - expected) <= 10 * 1e3 / 2.0)
+    y_pos = experiment.data['y_pos'][0]
+    assert min(y_pos) > -0.01 and max(y_pos) < 100.01
+
+
+def test_serpentine_lines_agree(timed_confocal_devices, tmp_path):
+    timed_confocal_devices['adwin']['instance'].adw.counts = spots
+    experiment = make_experiment(timed_confocal_devices, tmp_path, serpentine=True, point_b={'x': 10.0, 'y': 95.0})
+    experiment._function()
+    # both directions are binned by position, backward lines need (almost) no registration
+    assert abs(experiment.data['line_shift']) < 0.5
+    assert np.all(np.argmax(experiment.data['count_img'], axis=1) == 25)
+
+
+def test_crop_binning_needs_calibrated_dwell_time(timed_confocal_devices, tmp_path):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, binning='crop', time_per_pt=3.0)
+    with pytest.raises(ValueError):
+        experiment._function()
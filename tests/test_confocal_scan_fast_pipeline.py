@@ -0,0 +1,78 @@
+"""
+Tests for the pipelined line acquisition of NanodriveAdwinConfocalScanFast against the timing-faithful FakeMadlib and
+FakeCounterAdwin of conftest.py.
+"""
+
+import numpy as np
+import pytest
+
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+
+
+def make_experiment(devices, tmp_path, pipelined=True, x_max=7.0, time_per_pt=2.0):
+    return NanodriveAdwinConfocalScanFast(devices, settings={
+        'point_a': {'x': 5.0, 'y': 5.0}, 'point_b': {'x': x_max, 'y': 95.0}, 'resolution': 1.0,
+        'time_per_pt': time_per_pt, 'pipelined': pipelined, 'ending_behavior': 'leave_at_corner',
+        '3D_scan': {'enable': False, 'folderpath': str(tmp_path)}}, data_path=str(tmp_path))
+
+
+def line_rows_look_right(count_img, time_per_pt=2.0):
+    # FakeCounterAdwin counts 1000 + 10 y per process delay; with its 20 ms warm up the crop of 2 ms points lands on y = 5 ... 95
+    expected = (1000 + 10 * np.arange(5.0, 96.0)) * 1e3 / time_per_pt
+    return np.all(np.abs(count_img - expected) <= 10 * 1e3 / time_per_pt)
+
+
+@pytest.mark.parametrize('time_per_pt', [2.0, 5.0])
+def test_pipelined_scan(timed_confocal_devices, tmp_path, time_per_pt):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, time_per_pt=time_per_pt)
+    experiment._function()
+    count_img = experiment.data['count_img']
+    assert count_img.shape == (3, 91)
+    if time_per_pt == 2.0:
+        assert line_rows_look_right(count_img)
+    else:
+        # the crop offsets of 5 ms points are tuned to the real stage, the lines only have to agree with each other
+        assert np.all(np.abs(count_img - count_img[0]) <= 10 * 1e3 / time_per_pt)
+    assert np.allclose(experiment.data['x_pos'], [5.0, 6.0, 7.0], atol=0.05)
+
+    madlib = timed_confocal_devices['nanodrive']['instance'].DLL
+    adwin = timed_confocal_devices['adwin']['instance'].adw
+    # the move to the next line is issued before the counts of a line are read
+    x_moves = [t for event, axis, value, t in
+               (e for e in madlib.events if e[0] == 'move') if axis == 1 and value in (6.0, 7.0)]
+    reads = [t for _, t in adwin.events]
+    assert x_moves[0] < reads[0] and x_moves[1] < reads[1]
+    # the load waveform is built once and reused for every line
+    assert len({obj for event, obj, _ in (e for e in madlib.events if e[0] == 'setup_load')}) == 1
+
+
+def test_serial_scan(timed_confocal_devices, tmp_path):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, pipelined=False)
+    experiment._function()
+    assert line_rows_look_right(experiment.data['count_img'])
+    madlib = timed_confocal_devices['nanodrive']['instance'].DLL
+    adwin = timed_confocal_devices['adwin']['instance'].adw
+    x_moves = [e[3] for e in madlib.events if e[0] == 'move' and e[1] == 1 and e[2] == 6.0]
+    assert adwin.events[0][1] < x_moves[0]
+
+
+@pytest.mark.slow
+def test_line_throughput(timed_confocal_devices, tmp_path):
+    """
+    pipelined and serial line times against the fixed waits of the previous scan loop, prints seconds per line. The
+    times are those of the VirtualClock, i.e. the waits for the stage and the counter without the Python overhead.
+    """
+    clock = timed_confocal_devices['nanodrive']['instance'].DLL.clock
+    times = {}
+    for pipelined in (True, False):
+        experiment = make_experiment(timed_confocal_devices, tmp_path, pipelined=pipelined, x_max=14.0)
+        start = clock.perf_counter()
+        experiment._function()
+        times[pipelined] = (clock.perf_counter() - start) / 10
+    # the previous loop waited 0.1 s for the stage and time_per_pt * len(waveform) after the waveform acquisition
+    waveform_time = 2e-3 * (101 + 20)
+    legacy = 0.1 + waveform_time + 2e-3 * 101
+    print(f"\npipelined: {times[True] * 1e3:.0f} ms/line, serial: {times[False] * 1e3:.0f} ms/line, "
+          f"fixed waits: >= {legacy * 1e3:.0f} ms/line, waveform: {waveform_time * 1e3:.0f} ms")
+    assert times[True] < legacy * 0.75
+    assert times[True] <= times[False] * 1.05
@@ -0,0 +1,74 @@
+"""
+Tests for the serpentine raster of NanodriveAdwinConfocalScanFast against the timing-faithful FakeMadlib and
+FakeCounterAdwin of conftest.py.
+"""
+
+import numpy as np
+import pytest
+
+from src.core.helper_functions import HDF5StreamWriter
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+
+
+def spots(x, y):
+    # lines of NVs along x, so every scan line sees the same profile
+    return int(1000 + sum(height * np.exp(-(y - center) ** 2 / 8.0)
+                          for center, height in ((30.0, 20000), (50.5, 12000), (71.0, 8000))))
+
+
+def run_scan(devices, tmp_path, serpentine, binning='position', **settings):
+    devices['adwin']['instance'].adw.counts = spots
+    settings.update({
+        'point_a': {'x': 5.0, 'y': 5.0}, 'point_b': {'x': 10.0, 'y': 95.0}, 'resolution': 1.0,
+        'time_per_pt': 2.0, 'serpentine': serpentine, 'binning': binning, 'ending_behavior': 'leave_at_corner',
+        '3D_scan': {'enable': False, 'folderpath': str(tmp_path)}})
+    experiment = NanodriveAdwinConfocalScanFast(devices, settings=settings, data_path=str(tmp_path))
+    # the scan time of the VirtualClock of the fakes
+    clock = devices['nanodrive']['instance'].DLL.clock
+    start = clock.perf_counter()
+    experiment._function()
+    return experiment, clock.perf_counter() - start
+
+
+def test_serpentine_lines_are_registered(timed_confocal_devices, tmp_path):
+    experiment, _ = run_scan(timed_confocal_devices, tmp_path, serpentine=True, binning='crop')
+    count_img = experiment.data['count_img']
+    forward, backward = count_img[0::2], count_img[1::2]
+    # the stage only moves in x between lines, backward lines start where forward lines end
+    y_pos = experiment.data['y_pos']
+    assert y_pos[1][0] > 99.0 and y_pos[2][0] < 1.0
+    # a cropped backward bin integrates the other half pixel, about one pixel of offset is registered away
+    assert 0.5 < abs(experiment.data['line_shift']) < 1.5
+    peak = np.argmax(forward[0])
+    assert abs(peak - 25) <= 1 and np.all(np.argmax(backward, axis=1) == peak)
+    assert np.max(np.abs(backward - forward[0])) < 0.2 * np.max(forward[0])
+    madlib = timed_confocal_devices['nanodrive']['instance'].DLL
+    assert len({e[1] for e in madlib.events if e[0] == 'setup_load'}) == 2
+
+
+def test_registered_lines_are_streamed_and_kept_as_raw_counts(timed_confocal_devices, tmp_path):
+    experiment, _ = run_scan(timed_confocal_devices, tmp_path, serpentine=True, binning='crop', stream_data=True)
+    count_img = experiment.data['count_img']
+    # the raw counts of backward lines are shifted like their count rate
+    assert np.allclose(experiment.data['raw_counts'] * 1e3 / 2.0, count_img)
+    stream_file, = tmp_path.rglob('*.h5')
+    with HDF5StreamWriter.open_reader(stream_file) as f:
+        assert np.allclose(f['count_rate'][...], count_img)
+        assert np.allclose(f['raw_counts'][...], experiment.data['raw_counts'])
+
+
+def test_line_shift_is_subpixel():
+    pixels = np.arange(91.0)
+    forward = np.exp(-(pixels - 40.0) ** 2 / 8.0)
+    backward = np.exp(-(pixels - 40.6) ** 2 / 8.0)
+    shift = NanodriveAdwinConfocalScanFast._line_shift(forward, backward)
+    assert abs(shift - 0.6) < 0.1
+    assert NanodriveAdwinConfocalScanFast._line_shift(np.ones(91), np.ones(91)) is None
+
+
+@pytest.mark.slow
+def test_serpentine_frame_is_faster(timed_confocal_devices, tmp_path):
+    _, unidirectional = run_scan(timed_confocal_devices, tmp_path, serpentine=False)
+    _, serpentine = run_scan(timed_confocal_devices, tmp_path, serpentine=True)
+    print(f"\nunidirectional: {unidirectional:.2f} s, serpentine: {serpentine:.2f} s")
+    assert serpentine < unidirectional
@@ -0,0 +1,76 @@
+"""
+Tests for the z stack of NanodriveAdwinConfocalScanFast, which scans the planes of a volume in one run and streams them
+to a (z, x, y) dataset, against the timing-faithful FakeMadlib and FakeCounterAdwin of conftest.py.
+"""
+
+import numpy as np
+import pytest
+
+from src.core.helper_functions import HDF5StreamWriter
+from src.Model.experiments.nanodrive_adwin_confocal_scan_fast import NanodriveAdwinConfocalScanFast
+
+
+def make_experiment(devices, tmp_path, **settings):
+    defaults = {'point_a': {'x': 5.0, 'y': 5.0}, 'point_b': {'x': 7.0, 'y': 95.0}, 'resolution': 1.0,
+                'binning': 'position', 'read_delay': 0.2, 'ending_behavior': 'leave_at_corner',
+                'z_stack': {'enable': True, 'z_min': 48.0, 'z_max': 52.0, 'z_step': 2.0}}
+    defaults.update(settings)
+    return NanodriveAdwinConfocalScanFast(devices, settings=defaults, data_path=str(tmp_path))
+
+
+def focus_counts(madlib):
+    # the counts of an NV at y = 30 are largest in the focal plane z = 50
+    def counts(x, y):
+        z = madlib.axes[3][1]
+        return int(1000 + 20000 * np.exp(-(y - 30.0) ** 2 / 8.0 - (z - 50.0) ** 2 / 4.0))
+    return counts
+
+
+@pytest.mark.parametrize('serpentine', [False, True])
+def test_z_stack(timed_confocal_devices, tmp_path, serpentine):
+    madlib = timed_confocal_devices['nanodrive']['instance'].DLL
+    timed_confocal_devices['adwin']['instance'].adw.counts = focus_counts(madlib)
+    experiment = make_experiment(timed_confocal_devices, tmp_path, serpentine=serpentine)
+    experiment.run()
+
+    assert experiment.data['z_values'] == [48.0, 50.0, 52.0]
+    assert [event[2] for event in madlib.events if event[0] == 'move' and event[1] == 3][-3:] == [48.0, 50.0, 52.0]
+    # the waveforms of the first plane are loaded again for the others
+    loads = {event[1] for event in madlib.events if event[0] == 'setup_load'}
+    assert len(loads) == (2 if serpentine else 1)
+
+    with HDF5StreamWriter.open_reader(experiment.data['stack_file']) as f:
+        stack = f['count_stack'][...]
+        assert f['count_stack'].chunks[1:] == (3, 91)
+        assert np.array_equal(f['z_pos'][...], [48.0, 50.0, 52.0])
+        assert np.array_equal(f.attrs['z_values'], [48.0, 50.0, 52.0])
+    assert stack.shape == (3, 3, 91)
+    # the NV is brightest at y = 30 in the focal plane
+    peaks = stack.max(axis=(1, 2))
+    assert np.argmax(peaks) == 1 and peaks[0] < 0.6 * peaks[1] and peaks[2] < 0.6 * peaks[1]
+    assert np.argmax(stack[1].mean(axis=0)) == 25
+    # the projection is the maximum of the planes, the last plane is still count_img
+    assert np.array_equal(experiment.data['mip'], stack.max(axis=0))
+    assert np.array_equal(experiment.data['count_img'], stack[2])
+    assert len(experiment.data['count_rate']) == 3
+
+
+def test_z_stack_with_line_streams(timed_confocal_devices, tmp_path):
+    experiment = make_experiment(timed_confocal_devices, tmp_path, stream_data=True, pipelined=False)
+    experiment.run()
+    with HDF5StreamWriter.open_reader(experiment.data['stack_file']) as f:
+        # the lines of all planes are streamed, the planes are the lines of each plane
+        assert f['count_rate'].shape == (9, 91) and f['count_stack'].shape == (3, 3, 91)
+        assert np.array_equal(f['count_rate'][6:], f['count_stack'][2])
+
+
+def test_z_values(timed_confocal_devices, tmp_path):
+    experiment = make_experiment(timed_confocal_devices, tmp_path)
+    experiment.settings['z_stack'].update({'z_min': 10.0, 'z_max': 8.5, 'z_step': 0.5})
+    assert experiment._z_values() == [10.0, 9.5, 9.0, 8.5]
+    experiment.settings['z_stack'].update({'z_min': 99.0, 'z_max': 110.0, 'z_step': 4.0})
+    assert experiment._z_values() == [99.0]
+    for z_stack in ({'z_step': 0.0}, {'z_min': 101.0, 'z_step': 1.0}):
+        experiment.settings['z_stack'].update(z_stack)
+        with pytest.raises(ValueError):
+            experiment._z_values()
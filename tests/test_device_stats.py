@@ -0,0 +1,149 @@
+"""
+Tests for the device call statistics in src/core/device_stats.py and their opt-in in DeviceConfigManager.
+"""
+
+import json
+import math
+
+import pytest
+
+from src.core import Device, Parameter
+from src.core.device_config import DeviceConfigManager
+from src.core.device_stats import (DeviceCallStats, LatencyHistogram, call_stats_summary, get_call_stats,
+                                   instrument_device)
+
+
+class FakeDriver:
+    """stands in for a vendor driver such as ADwin.ADwin"""
+
+    def __init__(self):
+        self.boot_count = 0
+        self.pars = {1: 10}
+
+    def Get_Par(self, index):
+        return self.pars[index]
+
+
+class TimedDevice(Device):
+    _DEFAULT_SETTINGS = Parameter([Parameter('level', 0.0, float, 'output level')])
+    _PROBES = {'level': 'output level', 'par_1': 'parameter 1 of the driver'}
+    _DRIVER_ATTRIBUTES = ('adw',)
+
+    def __init__(self, name=None, settings=None):
+        self.adw = FakeDriver()
+        self.sent = []
+        super().__init__(name, settings)
+
+    def update(self, settings):
+        super().update(settings)
+        if 'level' in settings:
+            self._send('LEVEL {}'.format(settings['level']))
+
+    def _send(self, command):
+        self.sent.append(command)
+
+    def read_probes(self, key):
+        if key == 'par_1':
+            return self.adw.Get_Par(1)
+        return self.settings['level']
+
+
+class TestLatencyHistogram:
+
+    def test_percentiles_within_bin_resolution(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.add(i * 1e-5)  # uniform between 10 us and 10 ms
+        summary = histogram.summary()
+        assert summary['count'] == 1000
+        assert summary['total'] == pytest.approx(sum(i * 1e-5 for i in range(1, 1001)))
+        resolution = 10 ** (1 / LatencyHistogram.BINS_PER_DECADE)
+        for p in (50, 90, 99):
+            assert p * 1e-4 / resolution <= summary['p{}'.format(p)] <= p * 1e-4 * resolution
+        assert summary['max'] == pytest.approx(1e-2)
+
+    def test_empty_and_out_of_range(self):
+        assert math.isnan(LatencyHistogram().percentile(50))
+        histogram = LatencyHistogram()
+        histogram.add(0.0)
+        histogram.add(5e3)
+        assert histogram.percentile(0) == 0.0
+        assert histogram.percentile(100) == 5e3
+
+
+class TestInstrumentDevice:
+
+    def test_counts_methods_probes_and_driver_calls(self):
+        device = TimedDevice('timed')
+        stats = instrument_device(device)
+
+        device.update({'level': 1.5})
+        device.update({'level': 2.5})
+        assert device.read_probes('level') == 2.5
+        assert device.read_probes('par_1') == 10
+
+        summary = stats.summary()
+        assert summary['update']['count'] == 2
+        assert summary['_send']['count'] == 2
+        assert summary['read_probes[level]']['count'] == 1
+        assert summary['read_probes[par_1]']['count'] == 1
+        assert summary['Get_Par']['count'] == 1
+        assert summary['update']['total'] >= summary['_send']['total']
+        assert device.sent == ['LEVEL 1.5', 'LEVEL 2.5']
+
+    def test_instance_is_unchanged_otherwise(self):
+        device = TimedDevice('timed')
+        stats = instrument_device(device)
+        other = TimedDevice('other')
+
+        assert isinstance(device, TimedDevice)
+        assert instrument_device(device) is stats
+        assert get_call_stats(device) is stats and stats.device_name == 'timed'
+        assert get_call_stats(other) is None
+        device.adw.boot_count = 3
+        assert device.adw._driver.boot_count == 3
+        other.update({'level': 1.0})
+        assert call_stats_summary({'timed': device, 'other': other}) == {'timed': stats.summary()}
+
+    def test_display_value_and_reset(self):
+        stats = DeviceCallStats('timed')
+        for i in range(6):
+            stats.record('call_{}'.format(i), 1e-3 * (i + 1))
+        text = stats.display_value(max_calls=2)
+        assert text.startswith('call_5 6.00/6.00 ms (1), call_4')
+        assert text.endswith('4 more')
+        assert len(stats.format_table()) == 7
+        stats.reset()
+        assert stats.summary() == {}
+
+
+class TestDeviceConfigManager:
+
+    def write_config(self, tmp_path, **extra):
+        devices = {'timed': {'class': 'TimedDevice', 'filepath': __file__, 'settings': {'level': 1.0}}}
+        devices['timed'].update(extra.pop('device', {}))
+        config = dict(devices=devices, **extra)
+        config_path = tmp_path / 'config.json'
+        config_path.write_text(json.dumps(config))
+        return config_path
+
+    def test_not_instrumented_by_default(self, tmp_path, monkeypatch):
+        monkeypatch.delenv('AQUISS_DEVICE_STATS', raising=False)
+        devices, failed = DeviceConfigManager(self.write_config(tmp_path)).load_devices_from_config()
+        assert not failed
+        assert get_call_stats(devices['timed']) is None
+
+    @pytest.mark.parametrize('extra', [{'device': {'instrument': True}}, {'instrument_devices': True}])
+    def test_opt_in_from_config(self, tmp_path, monkeypatch, extra):
+        monkeypatch.delenv('AQUISS_DEVICE_STATS', raising=False)
+        devices, _ = DeviceConfigManager(self.write_config(tmp_path, **extra)).load_devices_from_config()
+        devices['timed'].update({'level': 2.0})
+        assert get_call_stats(devices['timed']).summary()['_send']['count'] == 1
+
+    def test_opt_in_from_environment_and_argument(self, tmp_path, monkeypatch):
+        config_path = self.write_config(tmp_path)
+        monkeypatch.setenv('AQUISS_DEVICE_STATS', '1')
+        devices, _ = DeviceConfigManager(config_path).load_devices_from_config()
+        assert get_call_stats(devices['timed']) is not None
+        devices, _ = DeviceConfigManager(config_path, instrument=False).load_devices_from_config()
+        assert get_call_stats(devices['timed']) is None
@@ -0,0 +1,109 @@
+"""
+Tests for the persistent experiment/device discovery cache in src/core/discovery_cache.py.
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+from src.core import Experiment
+from src.core.discovery_cache import DiscoveryCache
+from src.tools.export_default import find_exportable_in_python_files
+
+EXPERIMENT_SOURCE = '''
+from src.core import Experiment, Parameter
+
+
+class CachedExperiment(Experiment):
+    """Experiment found through the discovery cache."""
+    _DEFAULT_SETTINGS = [Parameter('points', {points}, int, 'number of points')]
+    _DEVICES = {{}}
+    _EXPERIMENTS = {{}}
+
+    def _function(self):
+        pass
+'''
+
+
+@pytest.fixture
+def experiment_package(tmp_path):
+    """a package with one experiment module, with a unique name so that every test imports it fresh"""
+    name = 'discovery_pkg_' + uuid.uuid4().hex[:8]
+    package = tmp_path / name
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    module_file = package / 'cached_experiment.py'
+    module_file.write_text(EXPERIMENT_SOURCE.format(points=10))
+    yield name, module_file
+    for module in [m for m in sys.modules if m.startswith(name)]:
+        del sys.modules[module]
+
+
+def forget_module(name):
+    for module in [m for m in sys.modules if m.startswith(name)]:
+        del sys.modules[module]
+
+
+class TestDiscoveryCache:
+
+    def test_second_lookup_does_not_import(self, tmp_path, experiment_package):
+        name, module_file = experiment_package
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        found = cache.discover(module_file, Experiment, exclude=(Experiment,))
+        assert cache.misses == 1
+        assert found['CachedExperiment']['default_settings'] == {'points': 10}
+        assert found['CachedExperiment']['info'] == 'Experiment found through the discovery cache.'
+        cache.save()
+
+        forget_module(name)
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        found = cache.discover(module_file, Experiment, exclude=(Experiment,))
+        assert cache.hits == 1 and cache.misses == 0
+        assert 'CachedExperiment' in found
+        assert name + '.cached_experiment' not in sys.modules
+
+    def test_touch_keeps_entry(self, tmp_path, experiment_package):
+        _, module_file = experiment_package
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        cache.discover(module_file, Experiment, exclude=(Experiment,))
+        stat = os.stat(module_file)
+        os.utime(module_file, (stat.st_atime, stat.st_mtime + 10))
+        assert cache.lookup(module_file, 'Experiment') is not None
+
+    def test_changed_file_is_rediscovered(self, tmp_path, experiment_package):
+        name, module_file = experiment_package
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        cache.discover(module_file, Experiment, exclude=(Experiment,))
+
+        module_file.write_text(EXPERIMENT_SOURCE.format(points=200))
+        assert cache.lookup(module_file, 'Experiment') is None
+        forget_module(name)
+        found = cache.discover(module_file, Experiment, exclude=(Experiment,))
+        assert found['CachedExperiment']['default_settings'] == {'points': 200}
+        assert cache.misses == 2
+
+    def test_base_class_files_are_tracked(self, tmp_path, experiment_package):
+        _, module_file = experiment_package
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        cache.discover(module_file, Experiment, exclude=(Experiment,))
+        entry = cache.entries[cache._key(module_file)]
+        assert cache._key(sys.modules['src.core.experiment'].__file__) in entry['files']
+
+    def test_corrupt_cache_file(self, tmp_path):
+        cache_file = tmp_path / 'cache.json'
+        cache_file.write_text('{not json')
+        assert DiscoveryCache(cache_file).entries == {}
+
+    def test_find_exportable_uses_cache(self, tmp_path, experiment_package):
+        name, module_file = experiment_package
+        cache = DiscoveryCache(tmp_path / 'cache.json')
+        first = find_exportable_in_python_files(str(module_file.parent), 'Experiment', verbose=False, cache=cache)
+        forget_module(name)
+        second = find_exportable_in_python_files(str(module_file.parent), 'Experiment', verbose=False, cache=cache)
+
+        assert first == second
+        assert set(first['CachedExperiment']) == {'class', 'filepath', 'info', 'devices', 'experiments'}
+        assert cache.hits == 1
+        assert (tmp_path / 'cache.json').exists()
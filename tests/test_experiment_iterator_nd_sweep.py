@@ -0,0 +1,121 @@
+"""
+Tests for multi-parameter sweeps (sweep_mode cartesian and zip) of a single ExperimentIterator.
+"""
+
+import numpy as np
+import pytest
+
+from src.core.experiment import Experiment
+from src.core.experiment_iterator import ExperimentIterator
+from src.core.parameter import Parameter
+
+
+class PlaneExperiment(Experiment):
+    """Experiment whose result depends on two settings, like a confocal frame at a z position."""
+    _DEFAULT_SETTINGS = [
+        Parameter('x', 0.0, float, 'first parameter'),
+        Parameter('z', 0.0, float, 'second parameter'),
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.visited = []
+
+    def _function(self):
+        self.visited.append((self.settings['x'], self.settings['z']))
+        self.data = {'value': np.full(2, 10 * self.settings['x'] + self.settings['z'])}
+
+
+def make_sweep_class(sweep_mode, snake=False, z_points=3):
+    default_settings = ExperimentIterator.get_default_settings({'plane': PlaneExperiment}, {'plane': 1}, {'plane': 1},
+                                                               'sweep')
+
+    class PlaneSweep(ExperimentIterator):
+        _EXPERIMENTS = {'plane': PlaneExperiment}
+        _DEFAULT_SETTINGS = default_settings + [
+            Parameter('iterator_type', 'Parameter Sweep', ['Loop', 'Parameter Sweep'], '')]
+        _DEVICES = {}
+
+    iterator = PlaneSweep(experiments={'plane': PlaneExperiment(name='plane')}, name='nd_sweep')
+    iterator.settings.update({
+        'sweep_param': 'plane.z',
+        'sweep_range': {'min_value': 0, 'max_value': 2, 'N/value_step': 3},
+        'sweep_mode': sweep_mode,
+        'snake': snake,
+        'extra_sweeps': {'axis_1': {'enabled': True, 'sweep_param': 'plane.x',
+                                    'sweep_range': {'min_value': 0, 'max_value': 3, 'N/value_step': z_points}}}
+    })
+    iterator._abort = False
+    return iterator
+
+
+class TestSweepPoints:
+
+    def test_single_and_zip(self):
+        assert ExperimentIterator.get_sweep_points([3]) == [(0,), (1,), (2,)]
+        assert ExperimentIterator.get_sweep_points([2, 2], 'zip') == [(0,), (1,)]
+        with pytest.raises(ValueError):
+            ExperimentIterator.get_sweep_points([2, 3], 'zip')
+        with pytest.raises(ValueError):
+            ExperimentIterator.get_sweep_points([2], 'spiral')
+
+    def test_cartesian_order(self):
+        points = ExperimentIterator.get_sweep_points([2, 3], 'cartesian')
+        assert points == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+
+    @pytest.mark.parametrize('shape', [[2, 3], [3, 2, 4], [2, 3, 3]])
+    def test_snake_only_takes_single_steps(self, shape):
+        points = ExperimentIterator.get_sweep_points(shape, 'cartesian', snake=True)
+        assert sorted(points) == list(np.ndindex(*shape))
+        steps = np.abs(np.diff(np.array(points), axis=0)).sum(axis=1)
+        assert np.all(steps == 1)
+
+    def test_randomize_keeps_all_points(self):
+        points = ExperimentIterator.get_sweep_points([3, 3], 'cartesian', randomize=True)
+        assert sorted(points) == list(np.ndindex(3, 3))
+
+
+class TestMultiParameterSweep:
+
+    def test_default_settings(self):
+        settings = ExperimentIterator.get_default_settings({'plane': PlaneExperiment}, {'plane': 1}, {'plane': 1}, 'sweep')
+        names = [list(parameter.keys())[0] for parameter in settings]
+        assert 'sweep_mode' in names and 'extra_sweeps' in names and 'snake' in names
+
+    def test_cartesian_fills_grid(self):
+        iterator = make_sweep_class('cartesian', z_points=4)
+        iterator._function()
+
+        cube = iterator.result_cubes['plane']
+        assert list(cube.axes) == ['z', 'x']
+        assert cube['value'].shape == (3, 4, 2)
+        expected = 10 * np.linspace(0, 3, 4)[None, :] + np.linspace(0, 2, 3)[:, None]
+        np.testing.assert_allclose(cube['value'][..., 0], expected)
+        assert iterator.num_sweep_points == 12
+        assert len(iterator.data) == 12
+
+        tag, (data, settings, scan_info) = next(iter(iterator.data.items()))
+        assert tag == 'plane_z_0.000e+00_x_0.000e+00'
+        assert scan_info['scan_parameter_iterator_1'] == 'z, x'
+
+    def test_snake_visits_neighbours(self):
+        iterator = make_sweep_class('cartesian', snake=True)
+        iterator._function()
+        visited = iterator.experiments['plane'].visited
+        assert visited[:6] == [(0.0, 0.0), (1.5, 0.0), (3.0, 0.0), (3.0, 1.0), (1.5, 1.0), (0.0, 1.0)]
+
+    def test_zip(self):
+        iterator = make_sweep_class('zip')
+        iterator._function()
+
+        cube = iterator.result_cubes['plane']
+        assert cube['value'].shape == (3, 2)
+        np.testing.assert_array_equal(cube.coords['x'][1], [0.0, 1.5, 3.0])
+        assert iterator.experiments['plane'].visited == [(0.0, 0.0), (1.5, 1.0), (3.0, 2.0)]
+
+    def test_zip_length_mismatch(self):
+        iterator = make_sweep_class('zip', z_points=4)
+        with pytest.raises(ValueError):
+            iterator._function()
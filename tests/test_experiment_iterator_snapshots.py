@@ -0,0 +1,122 @@
+"""
+Tests for the copy-free data snapshots of ExperimentIterator sweeps.
+
+The iterator takes ownership of the data of every sweep point through Experiment.release_data and stores the
+settings of each point as a SettingsSnapshot, i.e. as the difference to the settings at the start of the sweep.
+"""
+
+import numpy as np
+import pytest
+from scipy.io import loadmat
+
+from src.core.experiment import Experiment
+from src.core.experiment_iterator import ExperimentIterator, SettingsSnapshot
+from src.core.parameter import Parameter
+
+
+class ImageExperiment(Experiment):
+    """Experiment that fills a preallocated image in place, like the confocal scans."""
+    _DEFAULT_SETTINGS = [
+        Parameter('offset', 0.0, float, 'added to the image'),
+        Parameter('size', 4, int, 'image size')
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.data = {'image': np.zeros((4, 4)), 'label': 'image'}
+
+    def _function(self):
+        self.data['image'][:] = self.settings['offset']
+
+
+class ImageSweep(ExperimentIterator):
+    _EXPERIMENTS = {'image': ImageExperiment}
+    _DEFAULT_SETTINGS = [
+        Parameter('iterator_type', 'Parameter Sweep', ['Loop', 'Parameter Sweep'], ''),
+        Parameter('experiment_order', {'image': 1}),
+        Parameter('experiment_execution_freq', {'image': 1}),
+        Parameter('sweep_param', 'image.offset', ['image.offset'], 'variable over which to sweep'),
+        Parameter('sweep_range', [Parameter('min_value', 1, float, 'min parameter value'),
+                                  Parameter('max_value', 3, float, 'max parameter value'),
+                                  Parameter('N/value_step', 3, float, 'number of steps'),
+                                  Parameter('randomize', False, bool, 'randomize the sweep parameters')]),
+        Parameter('stepping_mode', 'N', ['N', 'value_step'], ''),
+        Parameter('run_all_first', True, bool, '')
+    ]
+    _DEVICES = {}
+
+
+class TestReleaseData:
+
+    def test_fresh_buffers(self):
+        experiment = ImageExperiment(name='image')
+        experiment.data['nested'] = {'trace': np.ones(3, dtype='i4'), 'fits': [np.ones(2), 1.5]}
+        image = experiment.data['image']
+        data = experiment.release_data()
+
+        assert data['image'] is image
+        assert experiment.data['image'] is not image
+        assert experiment.data['image'].shape == (4, 4)
+        assert experiment.data['nested']['trace'].dtype == np.dtype('i4')
+        assert experiment.data['nested']['fits'][1] == 1.5
+        assert experiment.data['label'] == 'image'
+
+    def test_iterator_release(self):
+        iterator = ImageSweep(experiments={'image': ImageExperiment(name='image')}, name='sweep')
+        iterator.data = {'a': [1]}
+        assert iterator.release_data() == {'a': [1]}
+        assert iterator.data == {}
+
+
+class TestSettingsSnapshot:
+
+    def test_difference_and_full(self):
+        base = {'tag': 'odmr', 'power': -10.0, 'sweep': {'start': 1.0, 'stop': 2.0}, 'points': [1, 2]}
+        snapshot = SettingsSnapshot(base, {'tag': 'odmr_power_-5', 'power': -10.0,
+                                           'sweep': {'start': 1.0, 'stop': 3.0}, 'points': [1, 2]})
+        assert dict(snapshot) == {'tag': 'odmr_power_-5', 'sweep': {'stop': 3.0}}
+        assert snapshot.full() == {'tag': 'odmr_power_-5', 'power': -10.0,
+                                   'sweep': {'start': 1.0, 'stop': 3.0}, 'points': [1, 2]}
+        assert base['sweep']['stop'] == 2.0
+
+    def test_values_are_copied(self):
+        settings = {'list': [1, 2]}
+        snapshot = SettingsSnapshot({}, settings)
+        settings['list'].append(3)
+        assert snapshot['list'] == [1, 2]
+
+
+class TestSweepSnapshots:
+
+    def test_points_keep_their_data(self, tmp_path):
+        experiment = ImageExperiment(name='image', settings={'path': str(tmp_path)})
+        iterator = ImageSweep(experiments={'image': experiment}, name='sweep', settings={'path': str(tmp_path)})
+        iterator._abort = False
+        iterator._function()
+
+        assert len(iterator.data) == 3
+        offsets = []
+        for data, settings, scan_info in iterator.data.values():
+            assert isinstance(settings, SettingsSnapshot)
+            assert set(settings) == {'offset', 'tag'}
+            np.testing.assert_array_equal(data['image'], settings['offset'])
+            offsets.append(settings['offset'])
+        assert offsets == [1.0, 2.0, 3.0]
+
+        # after the sweep the experiment holds the data of the last point for plotting
+        assert np.all(experiment.data['image'] == 3.0)
+
+    def test_matlab_gets_full_settings(self, tmp_path):
+        experiment = ImageExperiment(name='image', settings={'path': str(tmp_path)})
+        iterator = ImageSweep(experiments={'image': experiment}, name='sweep', settings={'path': str(tmp_path)})
+        iterator._abort = False
+        iterator._function()
+
+        filename = str(tmp_path / 'sweep.mat')
+        iterator.save_data_to_matlab(filename)
+        points = loadmat(filename)['data_sweep']
+        assert points.size == 3
+        # settings that did not change during the sweep come from the base settings
+        assert set(points['settings'][0, 0].dtype.names) == {'offset', 'size', 'path', 'tag', 'save'}
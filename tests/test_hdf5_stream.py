@@ -0,0 +1,178 @@
+"""
+Tests for the HDF5 streaming writer and structure_data_for_hdf5 in helper_functions.
+
+Covers appending frames while a file is being read in SWMR mode, the nested layout written by
+structure_data_for_hdf5 and the Experiment.open_data_stream hook used by experiments.
+"""
+
+import pytest
+import h5py
+import numpy as np
+
+from src.core.helper_functions import HDF5StreamWriter, structure_data_for_hdf5
+from src.core.experiment import Experiment
+from src.core.parameter import Parameter
+
+
+class StreamingExperiment(Experiment):
+    """Experiment that streams one line per iteration."""
+    _DEFAULT_SETTINGS = [
+        Parameter('lines', 4, int, 'number of lines'),
+        Parameter('points', 8, int, 'points per line'),
+        Parameter('fail_after', -1, int, 'raise after this many lines, -1 to never fail')
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def _function(self):
+        stream = self.open_data_stream()
+        stream.add_stream('line', frame_shape=(self.settings['points'],))
+        for i in range(self.settings['lines']):
+            if i == self.settings['fail_after']:
+                raise RuntimeError('hardware went away')
+            stream.append('line', np.full(self.settings['points'], i, dtype=float))
+
+
+class TestHDF5StreamWriter:
+
+    def test_append_grows_dataset(self, tmp_path):
+        filename = tmp_path / 'stream.h5'
+        with HDF5StreamWriter(filename) as stream:
+            stream.add_stream('counts', frame_shape=(5,))
+            for i in range(3):
+                assert stream.append('counts', np.arange(5) + i) == i
+            assert len(stream) == 3
+
+        with h5py.File(filename, 'r') as f:
+            assert f['counts'].shape == (3, 5)
+            assert f['counts'].maxshape == (None, 5)
+            assert f['counts'].compression == 'gzip'
+            np.testing.assert_array_equal(f['counts'][2], np.arange(5) + 2)
+
+    def test_extend_and_scalars(self, tmp_path):
+        filename = tmp_path / 'stream.h5'
+        with HDF5StreamWriter(filename, compression=None) as stream:
+            stream.add_stream('x_pos')
+            stream.add_stream('img', frame_shape=(2, 3), dtype='i4')
+            stream.append('x_pos', 1.5)
+            stream.extend('img', np.ones((4, 2, 3), dtype='i4'))
+
+        with h5py.File(filename, 'r') as f:
+            assert f['x_pos'][:].tolist() == [1.5]
+            assert f['img'].shape == (4, 2, 3)
+            assert f['img'].dtype == np.dtype('i4')
+
+    def test_replace_frame_while_streaming(self, tmp_path):
+        filename = tmp_path / 'stream.h5'
+        with HDF5StreamWriter(filename) as stream:
+            stream.add_stream('line', frame_shape=(4,))
+            index = stream.append('line', np.zeros(4))
+            stream.append('line', np.ones(4))
+            assert stream.swmr_mode
+            stream.replace('line', index, np.full(4, 2.0))
+            with pytest.raises(IndexError):
+                stream.replace('line', 2, np.zeros(4))
+            with pytest.raises(ValueError):
+                stream.replace('line', 0, np.zeros(3))
+
+        with h5py.File(filename, 'r') as f:
+            assert f['line'][:, 0].tolist() == [2.0, 1.0]
+
+    def test_readable_while_streaming(self, tmp_path):
+        filename = tmp_path / 'stream.h5'
+        stream = HDF5StreamWriter(filename, settings={'tag': 'scan', 'nested': {'a': 1}})
+        stream.add_stream('line', frame_shape=(10,))
+        stream.append('line', np.zeros(10))
+        assert stream.swmr_mode
+
+        reader = HDF5StreamWriter.open_reader(filename)
+        dataset = reader['line']
+        assert dataset.shape == (1, 10)
+        assert reader['settings/nested/a'][()] == 1
+
+        stream.append('line', np.ones(10))
+        dataset.refresh()
+        assert dataset.shape == (2, 10)
+        np.testing.assert_array_equal(dataset[1], np.ones(10))
+
+        reader.close()
+        stream.close()
+        assert not stream.is_open
+
+    def test_no_new_streams_after_first_append(self, tmp_path):
+        with HDF5StreamWriter(tmp_path / 'stream.h5') as stream:
+            stream.append('a', np.zeros(3))
+            with pytest.raises(RuntimeError):
+                stream.add_stream('b')
+            with pytest.raises(RuntimeError):
+                stream.write_attrs(late=True)
+
+    def test_frame_shape_mismatch(self, tmp_path):
+        with HDF5StreamWriter(tmp_path / 'stream.h5') as stream:
+            stream.add_stream('a', frame_shape=(3,))
+            with pytest.raises(ValueError):
+                stream.append('a', np.zeros(4))
+
+    def test_append_after_close(self, tmp_path):
+        stream = HDF5StreamWriter(tmp_path / 'stream.h5')
+        stream.close()
+        with pytest.raises(RuntimeError):
+            stream.append('a', 1.0)
+
+
+class TestStructureDataForHDF5:
+
+    def test_one_layer_with_settings(self, tmp_path):
+        filename = tmp_path / 'data.hdf5'
+        data = [{'counts': np.arange(4), 'name': 'nv1', 'fit': None},
+                {'counts': np.arange(4) * 2, 'name': 'nv2', 'fit': [1.0, 2.0]}]
+        settings = [Parameter([Parameter('power', -10.0, float, ''), Parameter('label', 'a', str, '')]),
+                    {'power': -5.0, 'label': 'b'}]
+        structure_data_for_hdf5(filename, data, settings=settings, tag='odmr')
+
+        with h5py.File(filename, 'r') as f:
+            assert set(f.keys()) == {'odmr_0', 'odmr_1'}
+            np.testing.assert_array_equal(f['odmr_1/counts'][:], np.arange(4) * 2)
+            assert f['odmr_0/name'][()] == b'nv1'
+            assert f['odmr_0/fit'].shape is None
+            assert f['odmr_0/settings/power'][()] == -10.0
+            assert f['odmr_1/settings/label'][()] == b'b'
+
+    def test_two_layers(self, tmp_path):
+        filename = tmp_path / 'data.hdf5'
+        data = [[{'a': 1}, {'a': 2}], [{'a': 3}, {'a': 4}]]
+        settings = [[{'s': 1}, {'s': 2}], [{'s': 3}, {'s': 4}]]
+        structure_data_for_hdf5(filename, data, settings=settings)
+
+        with h5py.File(filename, 'r') as f:
+            assert f['unnamed_experiment_1/unnamed_experiment_1_0/a'][()] == 3
+            assert f['unnamed_experiment_0/unnamed_experiment_0_1/settings/s'][()] == 2
+
+    def test_settings_length_mismatch(self, tmp_path):
+        with pytest.raises(ValueError):
+            structure_data_for_hdf5(tmp_path / 'data.hdf5', [{'a': 1}, {'a': 2}], settings=[{'s': 1}])
+
+
+class TestExperimentDataStream:
+
+    def test_stream_closed_after_run(self, tmp_path):
+        experiment = StreamingExperiment(name='stream_test', settings={'path': str(tmp_path)})
+        experiment.run()
+        assert experiment.data_stream is None
+
+        files = list(tmp_path.rglob('*.h5'))
+        assert len(files) == 1
+        with h5py.File(files[0], 'r') as f:
+            assert f['line'].shape == (4, 8)
+            assert f.attrs['experiment_class'] == 'StreamingExperiment'
+            assert f['settings/points'][()] == 8
+
+    def test_stream_survives_exception(self, tmp_path):
+        experiment = StreamingExperiment(name='stream_fail', settings={'path': str(tmp_path), 'fail_after': 2})
+        with pytest.raises(RuntimeError):
+            experiment.run()
+        assert experiment.data_stream is None
+
+        files = list(tmp_path.rglob('*.h5'))
+        with h5py.File(files[0], 'r') as f:
+            assert f['line'].shape == (2, 8)
@@ -0,0 +1,75 @@
+"""
+Import-time budget of the core package and tests for the lazy imports in src/core/lazy_import.py.
+
+The budget is checked by running `python -X importtime -c "import src.core"` in a fresh interpreter and reading the
+cumulative time of src.core, which includes everything it imports. Set IMPORT_TIME_BUDGET_MS to change the budget,
+e.g. on a slow machine.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.core.lazy_import import LazyModule, is_loaded, lazy_import
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', 1000))
+HEAVY_MODULES = ['pandas', 'matplotlib', 'pyqtgraph', 'scipy.io', 'h5py', 'pint']
+
+
+def run_python(*args):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    return subprocess.run([sys.executable, *args], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+                          timeout=120)
+
+
+def import_time_ms(module='src.core') -> float:
+    """
+    Returns: the cumulative import time of module in ms, as reported by python -X importtime in a fresh interpreter
+    """
+    result = run_python('-X', 'importtime', '-c', 'import ' + module)
+    assert result.returncode == 0, result.stderr
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and line.split('|')[-1].strip() == module:
+            return int(line.split('|')[1]) / 1000
+    raise AssertionError('no import time reported for ' + module)
+
+
+class TestLazyImport:
+
+    def test_imported_on_first_attribute(self):
+        module = lazy_import('src.core.lazy_import_test_module')
+        assert isinstance(module, LazyModule) and not is_loaded(module)
+        with pytest.raises(ModuleNotFoundError):
+            module.anything
+
+    def test_loaded_module_is_returned(self):
+        assert lazy_import('os') is os
+        json = LazyModule('json')
+        assert json.dumps([1]) == '[1]'
+        assert is_loaded(json)
+
+
+class TestImportTime:
+
+    def test_heavy_modules_not_imported(self):
+        statement = 'import sys, src.core; print(",".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES)
+        result = run_python('-c', statement)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == ''
+
+    def test_heavy_modules_loaded_on_first_use(self, tmp_path):
+        statement = ('import sys, src.core; from src.core import experiment; '
+                     'experiment.sio.savemat({!r}, {{"a": 1}}); '
+                     'print("scipy.io" in sys.modules)').format(str(tmp_path / 'lazy.mat'))
+        result = run_python('-c', statement)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == 'True'
+
+    def test_import_budget(self):
+        elapsed = min(import_time_ms() for _ in range(3))
+        assert elapsed < IMPORT_TIME_BUDGET_MS, \
+            'import src.core took {:.0f} ms, budget {:.0f} ms'.format(elapsed, IMPORT_TIME_BUDGET_MS)
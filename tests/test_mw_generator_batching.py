@@ -0,0 +1,135 @@
+"""
+Tests for the SCPI command batching of MicrowaveGeneratorBase and its use in SG384Generator.
+"""
+
+import pytest
+
+from src.Controller import mw_generator_base
+from src.Controller.mw_generator_base import MicrowaveGeneratorBase
+from src.Controller.sg384 import SG384Generator
+
+
+class FakeScpiSocket:
+    """socket of an instrument that answers every query of a line, the answers joined by ';'"""
+    responses = {'*IDN?': 'Stanford Research Systems,SG384,s/n000000,ver1.0', '*OPC?': '1',
+                 'FREQ?': '2870000000.0', 'AMPR?': '-10.00', 'PHAS?': '0.0', 'ENBR?': '1', 'MODL?': '0',
+                 'ERR?': '0'}
+
+    def __init__(self, *args, **kwargs):
+        self.lines = []
+        self.round_trips = 0
+        self._reply = b''
+
+    def settimeout(self, timeout):
+        pass
+
+    def connect(self, address):
+        pass
+
+    def sendall(self, data):
+        line = data.decode().rstrip('\n')
+        self.lines.append(line)
+        queries = [cmd for cmd in line.split(';') if cmd.endswith('?')]
+        if queries:
+            self.round_trips += 1
+            self._reply = (';'.join(self.responses.get(query, '0') for query in queries) + '\n').encode()
+
+    def recv(self, size):
+        reply, self._reply = self._reply[:size], self._reply[size:]
+        return reply
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_socket(monkeypatch):
+    sockets = []
+
+    def create(*args, **kwargs):
+        sockets.append(FakeScpiSocket())
+        return sockets[-1]
+    monkeypatch.setattr(mw_generator_base.socket, 'socket', create)
+    return sockets
+
+
+@pytest.fixture
+def sg384(fake_socket):
+    generator = SG384Generator(name='sg384', settings={'connection_type': 'LAN', 'ip_address': '127.0.0.1'})
+    sock = fake_socket[-1]
+    sock.lines.clear()
+    sock.round_trips = 0
+    return generator, sock
+
+
+class TestBatching:
+
+    def test_frequency_step_is_one_round_trip(self, sg384, fake_socket):
+        generator, sock = sg384
+        sockets = len(fake_socket)
+        generator.update({'frequency': 2.88e9})
+        assert len(fake_socket) == sockets, 'the connection should be kept open'
+        assert sock.lines == ['FREQ 2880000000.0HZ;*OPC?']
+        assert sock.round_trips == 1
+        assert generator.settings['frequency'] == 2.88e9
+
+    def test_commands_are_joined(self, sg384):
+        generator, sock = sg384
+        with generator.batch():
+            generator.set_power_rf(-5.0)
+            generator.enable_output()
+            assert sock.lines == []
+        assert sock.lines == ['AMPR -5.0;ENBR 1']
+        assert sock.round_trips == 0
+
+    def test_nested_batch_and_query_inside_batch(self, sg384):
+        generator, sock = sg384
+        with generator.batch():
+            generator.set_frequency(2.87e9)
+            with generator.batch(wait=True):
+                generator.enable_output()
+            assert generator.read_probes('frequency') == 2.87e9
+            generator.disable_output()
+        assert sock.lines == ['FREQ 2870000000.0HZ;ENBR 1;FREQ?', 'ENBR 0;*OPC?']
+
+    def test_failed_batch_sends_nothing(self, sg384):
+        generator, sock = sg384
+        with pytest.raises(ValueError):
+            with generator.batch():
+                generator.enable_output()
+                generator.set_sweep_rate(500.0)
+        assert sock.lines == []
+        generator.disable_output()
+        assert sock.lines == ['ENBR 0']
+
+    def test_query_many_and_device_state(self, sg384):
+        generator, sock = sg384
+        assert generator._query_many(['FREQ?', 'AMPR?', 'PHAS?']) == ['2870000000.0', '-10.00', '0.0']
+        generator._check_device_state()
+        assert sock.round_trips == 2
+        assert sock.lines[-1] == 'ERR?;ENBR?;MODL?;FREQ?;AMPR?;PHAS?'
+
+
+class OneCommandPerLine(MicrowaveGeneratorBase):
+    COMMAND_SEPARATOR = None
+    OPC_QUERY = None
+
+    def set_frequency(self, freq_hz):
+        self._send(f'f{freq_hz / 1e6}')
+
+    def set_power(self, power_dbm):
+        self._send(f'a{power_dbm}')
+
+    def set_phase(self, phase_deg):
+        pass
+
+
+def test_batch_without_separator_sends_lines(fake_socket):
+    generator = OneCommandPerLine(name='usb', settings={'connection_type': 'LAN', 'ip_address': '127.0.0.1'})
+    with generator.batch(wait=True):
+        generator.set_frequency(1.5e9)
+        generator.set_power(-4)
+    sock = fake_socket[-1]
+    assert sock.lines == ['f1500.0', 'a-4']
+    assert generator._query_many(['f?', 'a?']) == ['0', '0']
+    assert sock.lines[2:] == ['f?', 'a?']
@@ -84,11 +84,13 @@ class TestNanodriveAdwinConfocalScanFast:
         assert resolution_param._valid_values[resolution_param.name] == expected_resolutions
     
     def test_time_per_pt_options(self, experiment):
-        """Test that time_per_pt has the expected options and default value."""
+        """Test that time_per_pt takes any dwell time and its default value."""
         time_param = next(p for p in experiment._DEFAULT_SETTINGS if p.name == 'time_per_pt')
-        expected_times = [2.0, 5.0]
         assert time_param['time_per_pt'] == 2.0
-        assert time_param._valid_values[time_param.name] == expected_times
+        assert time_param._valid_values[time_param.name] == float
+        binning_param = next(p for p in experiment._DEFAULT_SETTINGS if p.name == 'binning')
+        assert binning_param['binning'] == 'crop'
+        assert binning_param._valid_values[binning_param.name] == ['position', 'crop']
     
     def test_ending_behavior_options(self, experiment):
         """Test that ending_behavior has the expected options and default value."""
@@ -0,0 +1,188 @@
+"""
+Tests for CounterStream, the streaming counter reads of NIDAQ, against a simulated continuous edge counting task.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import nidaqmx
+import numpy as np
+import pytest
+
+from src.Controller.ni_daq import CounterStream, NIDAQ
+
+
+class MockInStream:
+    """stand-in for the in_stream of a task"""
+
+    def __init__(self, task):
+        self.task = task
+
+    @property
+    def avail_samp_per_chan(self):
+        return len(self.task.totals) - self.task.read_position
+
+
+class MockCounterTask:
+    """
+    Stand-in for a continuous nidaqmx counter input task. A thread acquires samples at rate; sample k counts k % 7
+    edges and the running total starts just below 2**32, so it rolls over during a test.
+    """
+
+    def __init__(self, rate=20000.0, callbacks=True, start_total=2 ** 32 - 5000):
+        self.rate = rate
+        self.supports_callbacks = callbacks
+        self.totals = []
+        self.read_position = 0
+        self.total = start_total
+        self.callback = None
+        self.interval = None
+        self.reads = 0
+        self.lock = threading.Lock()
+        self.in_stream = MockInStream(self)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register_every_n_samples_acquired_into_buffer_event(self, sample_interval, callback_method):
+        if not self.supports_callbacks:
+            raise NotImplementedError
+        self.interval = sample_interval
+        self.callback = callback_method
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def acquire(self, count):
+        """acquires count samples in a thread, calling the registered callback every interval samples"""
+        def produce():
+            t0 = time.perf_counter()
+            k = 0
+            while k < count and not self._stop.is_set():
+                due = min(int((time.perf_counter() - t0) * self.rate), count)
+                while k < due:
+                    with self.lock:
+                        self.total = (self.total + k % 7) % 2 ** 32
+                        self.totals.append(self.total)
+                    k += 1
+                    if self.callback is not None and k % self.interval == 0:
+                        self.callback(0, 0, self.interval, None)
+                time.sleep(1e-4)
+        self._thread = threading.Thread(target=produce, daemon=True)
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def read_uint32(self, data, count):
+        with self.lock:
+            count = min(count, len(self.totals) - self.read_position)
+            data[:count] = self.totals[self.read_position:self.read_position + count]
+            self.read_position += count
+        self.reads += 1
+        return count
+
+
+class MockCounterReader:
+    """stand-in for nidaqmx CounterReader, reading the totals of the MockCounterTask"""
+    created = 0
+
+    def __init__(self, in_stream):
+        MockCounterReader.created += 1
+        self.task = in_stream.task
+
+    def read_many_sample_uint32(self, data, number_of_samples_per_channel=-1, timeout=10.0):
+        return self.task.read_uint32(data, number_of_samples_per_channel)
+
+
+@pytest.fixture
+def make_task():
+    tasks = []
+
+    def make(**kwargs):
+        task = MockCounterTask(**kwargs)
+        tasks.append(task)
+        return task
+
+    with patch('src.Controller.ni_daq.CounterReader', MockCounterReader):
+        yield make
+    for task in tasks:
+        task.close()
+
+
+def expected_counts(count):
+    # the first sample only sets the baseline
+    return np.arange(1, count) % 7
+
+
+def collect(stream, consumer, count):
+    received = []
+    deadline = time.perf_counter() + 5.0
+    while sum(len(chunk) for chunk in received) < count - 1 and time.perf_counter() < deadline:
+        if not stream.callbacks:
+            stream.poll()
+        received.append(consumer.read(timeout=0.05))
+    return np.concatenate(received)
+
+
+def test_callback_stream_differences_across_chunks_and_rollover(make_task):
+    task = make_task()
+    stream = CounterStream(task, 100, capacity=10000)
+    assert stream.callbacks and task.interval == 100
+    consumer = stream.consumer()
+    task.acquire(3000)
+    counts = collect(stream, consumer, 3000)
+    task.join()
+    stream.close()
+    assert counts.dtype == np.uint32
+    assert np.array_equal(counts, expected_counts(3000))
+    assert task.total < 5000  # the 32 bit counter rolled over
+    assert stream.error is None and not stream.running
+    # one read per chunk into the preallocated buffer
+    assert task.reads == 30
+
+
+def test_poll_stream_without_driver_callbacks(make_task):
+    task = make_task(callbacks=False)
+    created = MockCounterReader.created
+    stream = CounterStream(task, 64, capacity=10000)
+    assert not stream.callbacks
+    consumer = stream.consumer()
+    task.acquire(2000)
+    counts = collect(stream, consumer, 2000)
+    task.join()
+    stream.close()
+    assert np.array_equal(counts, expected_counts(2000))
+    assert MockCounterReader.created == created + 1
+    assert np.array_equal(stream.latest(5), expected_counts(2000)[-5:])
+
+
+def test_callback_errors_are_kept(make_task):
+    task = make_task()
+    stream = CounterStream(task, 10)
+    stream._reader = MagicMock()
+    stream._reader.read_many_sample_uint32.side_effect = nidaqmx.errors.DaqError('buffer overflow', -200279)
+    assert task.callback(0, 0, 10, None) == 0
+    assert isinstance(stream.error, nidaqmx.errors.DaqError)
+
+
+def test_daq_stream_counter_and_stop(make_task):
+    task = make_task(callbacks=False)
+    clock = MagicMock()
+    daq = SimpleNamespace(tasklist={'ctr000': {'task_handle': clock, 'task_handle_ctr': task, 'sample_rate': 1000.0}})
+    stream = NIDAQ.stream_counter(daq, 'ctr000')
+    assert stream.chunk == 50 and daq.tasklist['ctr000']['stream'] is stream
+    task.acquire(30)
+    task.join()
+    NIDAQ.stop(daq, 'ctr000')
+    assert not stream.running and stream.total == 29
+    clock.close.assert_called_once()
@@ -0,0 +1,148 @@
+"""
+Tests for the double-buffered (ping-pong) sweep averages of ODMRSweepContinuousExperiment against a simulated
+ODMR_Sweep_Counter_PingPong process.
+"""
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+from src.Controller.adwin_gold import AdwinGoldDevice
+from src.Model.experiments.odmr_sweep_continuous import ODMRSweepContinuousExperiment
+
+
+class FakePingPongAdwin:
+    """
+    ADwin driver stand-in running the ping-pong sweep protocol in a thread: sweep s writes counts 1000 * s + k to
+    Data_1 (odd s) or Data_3 (even s), Par_23 counts finished sweeps and a sweep waits while Par_24 lags by two. The
+    values written to Par_24 (the sweeps read by Python) are logged in acks.
+    """
+
+    def __init__(self, n_points, sweep_time=0.01, read_delay=0.0):
+        self.n_points = n_points
+        self.sweep_time = sweep_time
+        self.read_delay = read_delay
+        self.pars = [0] * 80
+        self.data = {i: [0] * n_points for i in range(1, 5)}
+        self.acks = []
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._process, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _process(self):
+        digits = np.linspace(29491, 36044, self.n_points).astype(int).tolist()
+        while not self._stop.is_set():
+            self.pars[24] += 1  # heartbeat
+            if self.pars[9] != 1:
+                time.sleep(1e-4)
+                continue
+            with self.lock:
+                self.pars[22] = self.pars[26] = 0
+            sweeps_done = 0
+            while self.pars[9] == 1 and not self._stop.is_set():
+                if sweeps_done - self.pars[23] >= 2:
+                    # wait for the PC to read the buffer of this sweep
+                    time.sleep(1e-4)
+                    self.pars[24] += 1
+                    with self.lock:
+                        self.pars[26] += 100
+                    continue
+                count_id, digit_id = (1, 2) if sweeps_done % 2 == 0 else (3, 4)
+                for k in range(self.n_points):
+                    self.data[count_id][k] = 1000 * (sweeps_done + 1) + k
+                    self.data[digit_id][k] = digits[k]
+                time.sleep(self.sweep_time)
+                self.pars[24] += 1
+                sweeps_done += 1
+                with self.lock:
+                    self.pars[22] = sweeps_done
+                    self.pars[19] = 1
+                    if sweeps_done >= self.pars[6] > 0:
+                        self.pars[9] = 0
+
+    def Set_Par(self, index, value):
+        with self.lock:
+            self.pars[index - 1] = value
+            if index == 24 and value > 0:
+                self.acks.append(value)
+
+    def Get_Par(self, index):
+        return self.pars[index - 1]
+
+    def Get_Par_All(self):
+        with self.lock:
+            return list(self.pars)
+
+    def GetData_Long(self, data_id, start, count):
+        time.sleep(self.read_delay)
+        return list(self.data[data_id][start - 1:start - 1 + count])
+
+
+@pytest.fixture
+def make_experiment():
+    fakes = []
+
+    def make(num_steps=51, averages=8, **kwargs):
+        with patch('src.Controller.adwin_gold.ADwin'):
+            adwin = AdwinGoldDevice(boot=False)
+        adwin.adw = FakePingPongAdwin(2 * num_steps - 2, **kwargs)
+        fakes.append(adwin.adw)
+        devices = {'microwave': {'instance': MagicMock()}, 'adwin': {'instance': adwin}}
+        experiment = ODMRSweepContinuousExperiment(devices, settings={
+            'acquisition': {'averages': averages, 'integration_time': 1e-4, 'settle_time': 1e-5,
+                            'double_buffered': True}})
+        experiment.num_steps = num_steps
+        adwin.set_int_var(7, averages)  # N_SWEEPS, set by _setup_adwin_sweep
+        return experiment
+
+    yield make
+    for fake in fakes:
+        fake.close()
+
+
+def expected_counts(num_steps, averages):
+    n_points = 2 * num_steps - 2
+    return 1000 * (averages + 1) / 2 + np.arange(n_points)
+
+
+def test_double_buffered_averages(make_experiment):
+    experiment = make_experiment(num_steps=51, averages=8, sweep_time=0.05)
+    experiment._run_sweep_averages()
+    mean = expected_counts(51, 8)
+    assert np.allclose(experiment.counts_forward, mean[:50])
+    assert np.allclose(experiment.counts_reverse, mean[50:])
+    assert np.allclose(experiment.counts_averaged, (mean[:50] + mean[50:]) / 2)
+    assert len(experiment.voltages) == 50 and -1.01 < experiment.voltages[0] < experiment.voltages[-1] < 1.01
+    # reading overlaps the next sweep, the simulated ADwin never waits for Python, which acknowledges every sweep once
+    assert experiment.adwin.adw.pars[26] == 0
+    assert experiment.adwin.adw.acks == list(range(1, 9))
+    assert experiment.adwin.adw.pars[9] == 0
+
+
+def test_slow_reads_make_adwin_wait_without_overwriting(make_experiment):
+    experiment = make_experiment(num_steps=11, averages=6, sweep_time=0.002, read_delay=0.02)
+    experiment._run_sweep_averages()
+    mean = expected_counts(11, 6)
+    assert np.allclose(experiment.counts_forward, mean[:10])
+    assert np.allclose(experiment.counts_reverse, mean[10:])
+    assert experiment.adwin.adw.pars[26] > 0
+    assert experiment.adwin.adw.acks == list(range(1, 7))
+
+
+@pytest.mark.slow
+def test_duty_cycle(make_experiment):
+    """the duty cycle relates the waits of the simulated ADwin to the wall clock, so it needs an idle machine"""
+    fast = make_experiment(num_steps=51, averages=8, sweep_time=0.02)
+    fast._run_sweep_averages()
+    assert fast.duty_cycle > 0.9
+    slow = make_experiment(num_steps=11, averages=6, sweep_time=0.002, read_delay=0.02)
+    slow._run_sweep_averages()
+    assert slow.duty_cycle < 0.9
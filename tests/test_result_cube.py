@@ -0,0 +1,177 @@
+"""
+Tests for ResultCube and RunningStatistics in src/core/result_cube.py and their use by ExperimentIterator.
+"""
+
+import numpy as np
+import pytest
+from scipy.io import loadmat
+
+from src.core.background_saver import BackgroundSaver
+from src.core.experiment import Experiment
+from src.core.experiment_iterator import ExperimentIterator
+from src.core.parameter import Parameter
+from src.core.result_cube import ResultCube, RunningStatistics
+
+
+class TraceExperiment(Experiment):
+    """Experiment with a trace that depends on the offset and a counter of the runs."""
+    _DEFAULT_SETTINGS = [
+        Parameter('offset', 0.0, float, 'added to the trace'),
+    ]
+    _DEVICES = {}
+    _EXPERIMENTS = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = 0
+
+    def _function(self):
+        self.runs += 1
+        self.data = {'trace': np.arange(3) + self.settings['offset'], 'runs': self.runs, 'label': 'trace'}
+
+
+class TraceSweep(ExperimentIterator):
+    _EXPERIMENTS = {'trace': TraceExperiment}
+    _DEFAULT_SETTINGS = [
+        Parameter('iterator_type', 'Parameter Sweep', ['Loop', 'Parameter Sweep'], ''),
+        Parameter('experiment_order', {'trace': 1}),
+        Parameter('experiment_execution_freq', {'trace': 1}),
+        Parameter('sweep_param', 'trace.offset', ['trace.offset'], 'variable over which to sweep'),
+        Parameter('sweep_range', [Parameter('min_value', 0, float, 'min parameter value'),
+                                  Parameter('max_value', 30, float, 'max parameter value'),
+                                  Parameter('N/value_step', 4, float, 'number of steps'),
+                                  Parameter('randomize', True, bool, 'randomize the sweep parameters')]),
+        Parameter('stepping_mode', 'N', ['N', 'value_step'], ''),
+        Parameter('run_all_first', True, bool, '')
+    ]
+    _DEVICES = {}
+
+
+class TraceLoop(ExperimentIterator):
+    _EXPERIMENTS = {'trace': TraceExperiment}
+    _DEFAULT_SETTINGS = [
+        Parameter('iterator_type', 'Loop', ['Loop', 'Parameter Sweep'], ''),
+        Parameter('experiment_order', {'trace': 1}),
+        Parameter('experiment_execution_freq', {'trace': 1}),
+        Parameter('num_loops', 4, int, 'Number of loops'),
+        Parameter('run_all_first', True, bool, '')
+    ]
+    _DEVICES = {}
+
+
+class TestResultCube:
+
+    def test_set_fills_in_place(self):
+        cube = ResultCube([('x', [0, 1, 2]), ('y', [10, 20])])
+        trace = np.ones(4)
+        stored = cube.set((2, 1), {'trace': trace, 'count': 5, 'name': 'a'})
+
+        assert cube['trace'].shape == (3, 2, 4)
+        assert np.isnan(cube['trace'][0, 0]).all()
+        np.testing.assert_array_equal(cube['trace'][2, 1], trace)
+        assert np.shares_memory(stored['trace'], cube['trace'])
+        assert cube['count'][2, 1] == 5
+        assert cube['name'].dtype == object and cube['name'][2, 1] == 'a'
+        assert cube.filled.sum() == 1
+        assert cube.dims('trace') == ('x', 'y', 'trace_dim_0')
+
+    def test_shape_change_falls_back_to_objects(self):
+        cube = ResultCube([('x', [0, 1])])
+        cube.set(0, {'fit': np.ones(2)})
+        with pytest.warns(UserWarning):
+            cube.set(1, {'fit': np.ones(3)})
+        assert cube['fit'].dtype == object
+        assert len(cube['fit'][0]) == 2 and len(cube['fit'][1]) == 3
+
+    def test_upcast(self):
+        cube = ResultCube([('x', [0, 1])])
+        cube.set(0, {'value': 1})
+        cube.set(1, {'value': 1.5})
+        assert cube['value'][1] == 1.5
+
+    def test_wrong_index(self):
+        cube = ResultCube([('x', [0, 1]), ('y', [0, 1])])
+        with pytest.raises(IndexError):
+            cube.set(0, {'a': 1})
+
+    def test_coords_must_match_axis(self):
+        with pytest.raises(ValueError):
+            ResultCube([('x', [0, 1])], coords={'z': ('x', [1, 2, 3])})
+
+
+class TestRunningStatistics:
+
+    def test_mean_and_variance(self):
+        runs = [np.random.random(5) for _ in range(6)]
+        statistics = RunningStatistics()
+        for run in runs:
+            statistics.add({'trace': run, 'nested': {'value': run[0]}, 'name': 'x', 'fit': None})
+
+        mean = statistics.mean()
+        np.testing.assert_allclose(mean['trace'], np.mean(runs, axis=0))
+        np.testing.assert_allclose(mean['nested']['value'], np.mean([run[0] for run in runs]))
+        np.testing.assert_allclose(statistics.variance()['trace'], np.var(runs, axis=0, ddof=1))
+        assert mean['name'] == 'x' and mean['fit'] is None
+
+    def test_integers_are_averaged_as_floats(self):
+        statistics = RunningStatistics()
+        statistics.add({'counts': [1, 2]})
+        statistics.add({'counts': [2, 2]})
+        np.testing.assert_array_equal(statistics.mean()['counts'], [1.5, 2.0])
+
+    def test_shape_mismatch_is_skipped(self):
+        statistics = RunningStatistics()
+        statistics.add({'fit': [1.0, 2.0]})
+        with pytest.warns(UserWarning):
+            statistics.add({'fit': [1.0]})
+        np.testing.assert_array_equal(statistics.mean()['fit'], [1.0, 2.0])
+
+
+class TestIteratorResultCubes:
+
+    def test_sweep_fills_grid_in_order(self, tmp_path):
+        experiment = TraceExperiment(name='trace', settings={'path': str(tmp_path)})
+        iterator = TraceSweep(experiments={'trace': experiment}, name='sweep', settings={'path': str(tmp_path)})
+        iterator._abort = False
+        iterator._function()
+
+        cube = iterator.result_cubes['trace']
+        np.testing.assert_array_equal(cube.axes['offset'], [0, 10, 20, 30])
+        assert cube.dims('trace') == ('offset', 'trace_dim_0')
+        # randomized execution order, but every point lands on its grid position
+        np.testing.assert_array_equal(cube['trace'][:, 0], [0, 10, 20, 30])
+        assert sorted(cube['runs']) == [1, 2, 3, 4]
+
+        filename = str(tmp_path / 'sweep.mat')
+        iterator.save_data_to_matlab(filename)
+        saved = loadmat(filename, simplify_cells=True)['result_cubes']['trace']
+        np.testing.assert_array_equal(saved['data']['trace'], cube['trace'])
+        np.testing.assert_array_equal(saved['axes']['offset'], [0, 10, 20, 30])
+
+    def test_background_save_keeps_cubes(self, tmp_path):
+        experiment = TraceExperiment(name='trace', settings={'path': str(tmp_path)})
+        iterator = TraceSweep(experiments={'trace': experiment}, name='sweep', settings={'path': str(tmp_path)})
+        iterator._abort = False
+        iterator._function()
+        expected = iterator.result_cubes['trace']['trace'].copy()
+
+        saver = BackgroundSaver(formats=['matlab'], log_function=lambda s: None)
+        job = saver.submit(iterator)
+        # the next run of the sweep starts new cubes while the snapshot is written
+        iterator.result_cubes = {}
+        saver.close()
+
+        assert saver.errors == []
+        saved = loadmat(job.filenames['matlab'], simplify_cells=True)['result_cubes']['trace']
+        np.testing.assert_array_equal(saved['data']['trace'], expected)
+
+    def test_loop_running_mean(self, tmp_path):
+        experiment = TraceExperiment(name='trace', settings={'path': str(tmp_path)})
+        iterator = TraceLoop(experiments={'trace': experiment}, name='loop', settings={'path': str(tmp_path)})
+        iterator._abort = False
+        iterator._function()
+
+        np.testing.assert_array_equal(iterator.data['trace'], np.arange(3))
+        assert iterator.data['runs'] == 2.5
+        assert iterator.data['label'] == 'trace'
+        np.testing.assert_allclose(iterator.data_variance['runs'], np.var([1, 2, 3, 4], ddof=1))
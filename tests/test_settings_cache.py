@@ -0,0 +1,138 @@
+"""
+Tests for the write-through settings cache of Device in src/core/settings_cache.py.
+"""
+
+import numpy as np
+import pytest
+
+from src.core import Device, Parameter
+from src.core.settings_cache import changed_settings
+
+
+class CountingDevice(Device):
+    """Device that records the settings that reach its update."""
+    _DEFAULT_SETTINGS = Parameter([
+        Parameter('frequency', 1e9, float, 'frequency in Hz'),
+        Parameter('power', -10.0, float, 'power in dBm'),
+        Parameter('trigger', False, bool, 'sends a trigger on every update'),
+        Parameter('clock', [Parameter('mode', 'low', ['low', 'high'], 'clock mode'),
+                            Parameter('rate', 1.0, float, 'clock rate')]),
+    ])
+    _CACHE_SETTINGS = True
+    _UNCACHED_SETTINGS = ('trigger',)
+    _STATIC_PROBES = ('frequency',)
+
+    def __init__(self, name=None, settings=None):
+        self.writes = []
+        self.reads = 0
+        self.fail = False
+        super().__init__(name, settings)
+
+    def update(self, settings):
+        super().update(settings)
+        if self._settings_initialized:
+            if self.fail:
+                raise RuntimeError('instrument did not answer')
+            self.writes.append(settings)
+
+    @property
+    def _PROBES(self):
+        return {'frequency': 'frequency in Hz', 'power': 'power in dBm'}
+
+    def read_probes(self, key):
+        self.reads += 1
+        return self.settings[key]
+
+
+class SubclassedDevice(CountingDevice):
+    """update is wrapped on both levels, the settings must still arrive"""
+
+    def update(self, settings):
+        super().update(settings)
+
+
+@pytest.fixture
+def device():
+    return CountingDevice('counter', settings={'power': -5.0})
+
+
+class TestSettingsCache:
+
+    def test_first_update_after_init_is_sent_in_full(self, device):
+        assert device.writes == []
+        device.update({'frequency': 1e9, 'power': -5.0})
+        assert device.writes == [{'frequency': 1e9, 'power': -5.0}]
+
+    def test_drops_unchanged_keys_and_no_op_writes(self, device):
+        device.update({'frequency': 2e9, 'power': -5.0})
+        device.update({'frequency': 2e9, 'power': -5.0})
+        device.update({'frequency': 2.1e9, 'power': -5.0})
+        assert device.writes == [{'frequency': 2e9, 'power': -5.0}, {'frequency': 2.1e9}]
+        assert device.settings['frequency'] == 2.1e9
+
+    def test_nested_settings_and_uncached_keys(self, device):
+        device.update({'clock': {'mode': 'low', 'rate': 1.0}, 'trigger': True})
+        device.update({'clock': {'mode': 'high', 'rate': 1.0}, 'trigger': True})
+        assert device.writes[1] == {'clock': {'mode': 'high'}, 'trigger': True}
+        assert device.settings['clock']['rate'] == 1.0
+
+    def test_settings_changed_outside_update_are_resent(self, device):
+        device.update({'frequency': 2e9})
+        device.settings['frequency'] = 3e9  # e.g. set by a setter that talks to the instrument directly
+        device.update({'frequency': 2e9})
+        assert device.writes == [{'frequency': 2e9}, {'frequency': 2e9}]
+
+    def test_invalidation_and_error(self, device):
+        device.update({'frequency': 2e9})
+        device.invalidate_settings_cache(['frequency'])
+        device.update({'frequency': 2e9})
+        assert len(device.writes) == 2
+
+        device.fail = True
+        with pytest.raises(RuntimeError):
+            device.update({'power': 0.0})
+        device.fail = False
+        device.update({'frequency': 2e9, 'power': 0.0})
+        assert device.writes[-1] == {'frequency': 2e9, 'power': 0.0}
+
+    def test_opt_out(self, device):
+        device.enable_settings_cache(False)
+        device.update({'frequency': 2e9})
+        device.update({'frequency': 2e9})
+        assert len(device.writes) == 2
+
+    def test_off_unless_the_device_opts_in(self):
+        class PlainDevice(CountingDevice):
+            _CACHE_SETTINGS = False
+
+        device = PlainDevice('plain')
+        device.update({'frequency': 2e9})
+        device.update({'frequency': 2e9})
+        assert len(device.writes) == 2
+        assert not Device._CACHE_SETTINGS
+
+    def test_static_probes_within_ttl(self, device):
+        assert device.read_probes('frequency') == 1e9
+        assert device.read_probes('frequency') == 1e9
+        device.read_probes('power')
+        device.read_probes('power')
+        assert device.reads == 3
+
+        device.update({'frequency': 2e9})
+        assert device.read_probes('frequency') == 2e9
+        device.probe_cache_ttl = 0
+        device.read_probes('frequency')
+        assert device.reads == 5
+
+    def test_update_of_subclass(self):
+        device = SubclassedDevice('sub')
+        device.update({'power': 1.0})
+        device.update({'power': 1.0, 'frequency': 5e9})
+        assert device.writes == [{'power': 1.0}, {'frequency': 5e9}]
+
+
+def test_changed_settings_compares_arrays():
+    applied = {'waveform': np.arange(3.0), 'level': 1}
+    current = dict(applied)
+    assert changed_settings({'waveform': np.arange(3.0), 'level': 1}, applied, current) == {}
+    assert list(changed_settings({'waveform': np.arange(4.0)}, applied, current)) == ['waveform']
@@ -0,0 +1,53 @@
+"""
+Tests for TiledImage, the chunked HDF5 mosaic store with a display pyramid, and overlap_offset.
+"""
+
+import numpy as np
+import pytest
+
+from src.core.tiled_image import TiledImage, overlap_offset
+
+
+def test_overlap_offset():
+    rng = np.random.default_rng(0)
+    sample = rng.random((60, 60))
+    # the moving image shows the sample two rows further down and one column to the left
+    assert overlap_offset(sample[10:30, 10:30], sample[12:32, 9:29]) == (2, -1)
+    assert overlap_offset(sample[10:30, 10:30], sample[10:30, 10:30]) == (0, 0)
+    # beyond max_shift, without structure and with unwritten pixels there is no offset
+    assert overlap_offset(sample[10:30, 10:30], sample[15:35, 10:30], max_shift=3) is None
+    assert overlap_offset(np.ones((20, 20)), np.ones((20, 20))) is None
+    written = sample[10:30, 10:30].copy()
+    written[0, 0] = np.nan
+    assert overlap_offset(written, sample[10:30, 10:30]) is None
+
+
+def test_overlap_offset_of_structure_along_one_axis():
+    # e.g. a line of NVs: every row is the same, any row shift fits equally well
+    lines = np.tile(np.random.default_rng(1).random(30), (20, 1))
+    assert overlap_offset(lines[:, 5:25], lines[:, 6:26]) == (0, 1)
+
+
+def test_tiles_and_pyramid(tmp_path):
+    with TiledImage(tmp_path / 'mosaic.h5', (50, 70), chunk_shape=(20, 20), levels=3) as image:
+        assert image.write_tile((0, 0), np.ones((20, 20))) == (0, 0, 20, 20)
+        # parts outside the image are dropped
+        assert image.write_tile((45, 60), np.full((20, 20), 2.0)) == (45, 60, 5, 10)
+        assert image.write_tile((60, 0), np.ones((5, 5))) is None
+        image.write_attrs(resolution=0.5)
+        image.write_dataset('tile_origins', [[0, 0], [45, 60]])
+        assert np.all(np.isnan(image.read((20, 20, 5, 5))))
+        level = image.level(3)
+        assert level.shape == (7, 9)
+        assert np.all(level[:3, :3] == 1.0) and np.all(level[5:, 7:] == 2.0)
+        assert np.isnan(level[4, 4])
+        # the block mean of a level ignores unwritten pixels
+        assert image.read((2, 2, 1, 1), level=1)[0, 0] == 1.0
+        assert image.preview_level(10) == 3 and image.preview_level(100) == 0
+    with pytest.raises(RuntimeError):
+        image.write_tile((0, 0), np.ones((2, 2)))
+
+    with TiledImage.open_reader(tmp_path / 'mosaic.h5') as f:
+        assert f['image'].shape == (50, 70) and f['pyramid/2'].shape == (13, 18)
+        assert f.attrs['resolution'] == 0.5
+        assert np.array_equal(f['tile_origins'][...], [[0, 0], [45, 60]])
@@ -0,0 +1,165 @@
+"""
+Tests for the timing spans in src/core/tracing.py and their use in Experiment, ExperimentIterator and Device.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from src.core import tracing
+from src.core.device import Device
+from src.core.experiment import Experiment
+from src.core.experiment_iterator import ExperimentIterator
+from src.core.parameter import Parameter
+
+
+class TracedDevice(Device):
+    """Device with a probe and a public method."""
+    _DEFAULT_SETTINGS = Parameter([Parameter('level', 0.0, float, 'output level')])
+    _PROBES = {'signal': 'measured signal'}
+
+    def read_probes(self, key=None):
+        return 1.0
+
+    def pulse(self, duration):
+        tracing.sleep(duration)
+        return duration
+
+
+class TracedExperiment(Experiment):
+    """Experiment that sleeps and reads the device."""
+    _DEFAULT_SETTINGS = [Parameter('delay', 0.002, float, 'sleep in _function'),
+                         Parameter('trace', True, bool, 'record timing spans')]
+    _DEVICES = {'device': TracedDevice}
+    _EXPERIMENTS = {}
+
+    def _function(self):
+        device = self.devices['device']['instance']
+        tracing.sleep(self.settings['delay'])
+        self.data = {'signal': np.array([device.read_probes('signal'), device.pulse(0.001)])}
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.get_tracer()
+    was_enabled = tracer.enabled
+    tracer.disable()
+    tracer.clear()
+    yield tracer
+    tracer.enabled = was_enabled
+    tracer.clear()
+
+
+def make_experiment(tmp_path, **settings):
+    devices = {'device': {'instance': TracedDevice('device'), 'settings': {}}}
+    experiment = TracedExperiment(devices=devices, name='traced', settings={'path': str(tmp_path), **settings})
+    return experiment
+
+
+def names(events):
+    return [event[0] for event in events]
+
+
+class TestTracer:
+
+    def test_disabled_records_nothing(self, tracer):
+        assert tracing.span('anything') is tracing.span('other')
+        with tracing.span('anything'):
+            pass
+        TracedDevice('device').pulse(0)
+        assert tracer.events == []
+
+    def test_spans_and_chrome_trace(self, tracer):
+        tracer.enable()
+        with tracing.span('outer', category='test', index=3):
+            with tracing.span('inner', category='test'):
+                pass
+        events = tracer.events
+        assert names(events) == ['inner', 'outer']
+        assert events[1][5] == {'index': 3} and events[1][3] >= events[0][3]
+
+        trace = tracer.chrome_trace()
+        complete = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        assert {event['name'] for event in complete} == {'inner', 'outer'}
+        assert all(event['dur'] >= 0 for event in complete)
+        assert any(event['ph'] == 'M' for event in trace['traceEvents'])
+
+    def test_exception_is_recorded(self, tracer):
+        tracer.enable()
+        with pytest.raises(ValueError):
+            with tracing.span('failing'):
+                raise ValueError('no')
+        assert tracer.events[0][5] == {'error': 'ValueError'}
+
+    def test_summary(self, tracer):
+        for duration in [0.1, 0.3]:
+            tracer.record('sleep', 'sleep', 0.0, duration)
+        tracer.record('save_data', 'save', 0.0, 0.05)
+        summary = tracer.summary(tracer.events)
+        assert list(summary) == [('sleep', 'sleep'), ('save', 'save_data')]
+        assert summary[('sleep', 'sleep')]['count'] == 2
+        assert summary[('sleep', 'sleep')]['mean'] == pytest.approx(0.2)
+        lines = tracer.format_summary(tracer.events)
+        assert len(lines) == 3 and 'save_data' in lines[2]
+
+    def test_device_methods_are_traced(self, tracer):
+        tracer.enable()
+        device = TracedDevice('dev')
+        device.read_probes('signal')
+        device.pulse(0)
+        spans = {event[0]: event[5] for event in tracer.events}
+        assert spans['TracedDevice.read_probes'] == {'device': 'dev', 'key': 'signal'}
+        assert 'TracedDevice.pulse' in spans and 'TracedDevice.update' not in spans
+        assert TracedDevice.pulse.__name__ == 'pulse'
+
+
+class TestExperimentTracing:
+
+    def test_run_writes_trace_and_summary(self, tmp_path, tracer):
+        experiment = make_experiment(tmp_path, save=True)
+        experiment.run()
+
+        assert not tracer.enabled  # only enabled for the run by the trace setting
+        trace_files = list(tmp_path.rglob('*-trace.json'))
+        assert len(trace_files) == 1
+        with open(trace_files[0]) as infile:
+            spans = {event['name'] for event in json.load(infile)['traceEvents'] if event['ph'] == 'X'}
+        assert {'traced', '_function', 'sleep', 'TracedDevice.read_probes', 'TracedDevice.pulse',
+                'save_aqs', 'save_data', 'save_data_to_matlab'} <= spans
+
+        info = list(tmp_path.rglob('*-info.txt'))[0].read_text()
+        assert 'timing summary (traced):' in info
+        assert 'save_data_to_matlab' in info
+
+    def test_no_trace_without_setting(self, tmp_path, tracer):
+        experiment = make_experiment(tmp_path, save=True, trace=False)
+        experiment.run()
+        assert not list(tmp_path.rglob('*-trace.json'))
+        assert 'timing summary' not in list(tmp_path.rglob('*-info.txt'))[0].read_text()
+
+
+class TestIteratorTracing:
+
+    def test_sweep_points(self, tmp_path, tracer):
+        default_settings = ExperimentIterator.get_default_settings({'traced': TracedExperiment}, {'traced': 1},
+                                                                   {'traced': 1}, 'sweep')
+
+        class TracedSweep(ExperimentIterator):
+            _EXPERIMENTS = {'traced': TracedExperiment}
+            _DEFAULT_SETTINGS = default_settings + [
+                Parameter('iterator_type', 'Parameter Sweep', ['Loop', 'Parameter Sweep'], '')]
+            _DEVICES = {}
+
+        experiment = make_experiment(tmp_path, trace=False)
+        iterator = TracedSweep(experiments={'traced': experiment}, name='sweep', settings={'path': str(tmp_path)})
+        iterator.settings.update({'sweep_param': 'traced.delay',
+                                  'sweep_range': {'min_value': 0, 'max_value': 0.002, 'N/value_step': 3},
+                                  'trace': True})
+        iterator.run()
+
+        events = tracer.events
+        points = [event for event in events if event[0] == 'point']
+        assert len(points) == 3 and points[2][5]['index'] == [2]
+        assert names(events).count('traced') == 3
+        assert names(events)[-1] == 'sweep'